@@ -1,25 +1,43 @@
 import os
 import sys
+import hmac
+import uuid
 import logging
-import requests
-from flask import Flask, send_from_directory, Response, g, request
+import time
+from flask import Flask, send_from_directory, send_file, redirect, Response, g, request
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 from datetime import datetime
 
 load_dotenv()
 
-# Production Logging Setup
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Production Logging Setup (structured JSON, written off the request thread)
+from services.logging_service import setup_logging, request_id_var, should_sample_static
+setup_logging()
 logger = logging.getLogger(__name__)
 
+from services.metrics_service import registry as metrics_registry, http_request_seconds, http_requests_in_flight
+from services.tracing_service import start_trace, finish_trace, current_trace, slowest_traces
+from services.health_service import LIVENESS_BODY, readiness
+from services.static_assets import (manifest as asset_manifest, asset_url, send_precompressed,
+                                    DIST_DIR, IMMUTABLE_CACHE, REVALIDATE_CACHE)
+
+from services import image_variants
+
 app = Flask(__name__, static_folder='static')
+# request.remote_addr is the client address appended by our own proxy (Render's load balancer),
+# not whatever the client put first in X-Forwarded-For
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '1'))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+app.jinja_env.globals['asset_url'] = asset_url
+app.jinja_env.globals['image_srcset'] = image_variants.image_srcset
+app.jinja_env.globals['image_variant_url'] = image_variants.image_variant_url
+
+# Compression (Brotli/gzip) - registered first so it runs after every other after_request hook
+from services.compression_service import init_compression
+init_compression(app)
 
 # CORS Configuration (프로덕션에서는 allowed_origins 제한 권장)
 cors_origins_env = os.getenv('CORS_ORIGINS', '*')
@@ -37,7 +55,6 @@ else:
          methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
          allow_headers=['Content-Type', 'Authorization'])
 
-# Compression (Brotli/gzip) - gunicorn에서 처리
 # Security Headers
 @app.after_request
 def set_security_headers(response):
@@ -49,20 +66,56 @@ def set_security_headers(response):
     return response
 
 # Request logging
+# High-volume static and probe endpoints are only logged for a sample of requests (errors always)
+SAMPLED_ENDPOINTS = {'serve_static', 'serve_attached_assets', 'serve_built_asset', 'serve_image_variant', 'static',
+                     'health', 'ready'}
+
 @app.before_request
 def log_request():
-    """Log incoming requests"""
+    """Assign a correlation id and log incoming requests"""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    request_id_var.set(g.request_id)
     g.start_time = datetime.utcnow()
-    logger.info(f"→ {request.method} {request.path} from {request.remote_addr}")
+    g.start_perf = time.perf_counter()
+    g.log_request = request.endpoint not in SAMPLED_ENDPOINTS or should_sample_static()
+    if request.endpoint not in SAMPLED_ENDPOINTS:
+        start_trace(f"{request.method} {request.endpoint or 'unmatched'}", request_id=g.request_id)
+    http_requests_in_flight.inc()
+    if g.log_request:
+        logger.info("request started", extra={'method': request.method, 'path': request.path,
+                                              'remote_addr': request.remote_addr})
 
 @app.after_request
 def log_response(response):
     """Log outgoing responses with timing"""
-    if hasattr(g, 'start_time'):
+    if hasattr(g, 'request_id'):
+        response.headers['X-Request-ID'] = g.request_id
+    trace = current_trace()
+    if trace is not None:
+        finish_trace(trace, response.status_code)
+        response.headers['Server-Timing'] = trace.server_timing()
+    if hasattr(g, 'start_time') and (g.get('log_request') or response.status_code >= 400):
         elapsed = (datetime.utcnow() - g.start_time).total_seconds() * 1000
-        logger.info(f"← {request.method} {request.path} {response.status_code} ({elapsed:.2f}ms)")
+        logger.info("request finished", extra={'method': request.method, 'path': request.path,
+                                               'status': response.status_code,
+                                               'elapsed_ms': round(elapsed, 2)})
+    if hasattr(g, 'start_perf'):
+        http_request_seconds.observe(time.perf_counter() - g.start_perf,
+                                     endpoint=request.endpoint or 'unmatched',
+                                     method=request.method,
+                                     status=response.status_code)
     return response
 
+@app.teardown_request
+def release_in_flight(exc):
+    """Always balance the in-flight gauge, even if the request raised"""
+    if hasattr(g, 'start_perf'):
+        http_requests_in_flight.dec()
+    trace = current_trace()
+    if trace is not None:
+        finish_trace(trace)
+    request_id_var.set(None)
+
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -86,68 +139,94 @@ app.register_blueprint(luxury_hall_bp)
 # Objects should be served directly from GCS or configured separately
 
 # Health check endpoints (for monitoring & Render)
+# Liveness: constant body, no I/O - safe to probe every second
 @app.route('/health')
 @app.route('/healthz')
 def health():
-    """
-    Health check endpoint for load balancers and monitoring.
-    Returns 200 if service is healthy.
-    """
-    try:
-        # Check if critical env vars are set
-        required_vars = ['GEMINI_API_KEY', 'STRIPE_SECRET_KEY', 'SESSION_SECRET']
-        missing = [var for var in required_vars if not os.getenv(var)]
-        
-        if missing:
-            return {
-                'status': 'degraded',
-                'missing_env_vars': missing,
-                'timestamp': os.popen('date -u +"%Y-%m-%dT%H:%M:%SZ"').read().strip()
-            }, 200  # Still return 200 to prevent restart loops
-        
-        return {
-            'status': 'ok',
-            'service': 'fitsa-web',
-            'timestamp': os.popen('date -u +"%Y-%m-%dT%H:%M:%SZ"').read().strip()
-        }, 200
-    except Exception as e:
-        return {
-            'status': 'error',
-            'error': str(e),
-            'timestamp': os.popen('date -u +"%Y-%m-%dT%H:%M:%SZ"').read().strip()
-        }, 500
+    return Response(LIVENESS_BODY, mimetype='application/json')
+
+# Readiness: cached deep checks + live queue depth; 503 when this instance should get no traffic
+@app.route('/readyz')
+def ready():
+    return readiness()
+
+# Prometheus metrics (merged across gunicorn workers)
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# Slowest recent requests with their stage breakdown (this worker only)
+# Closed unless TRACE_VIEW_TOKEN is set: traces carry paths, request ids and attributes
+@app.route('/debug/traces/slowest')
+def slowest_requests():
+    token = os.getenv('TRACE_VIEW_TOKEN')
+    if not token or not hmac.compare_digest(request.args.get('token', ''), token):
+        return {'error': 'Forbidden'}, 403
+    return {'pid': os.getpid(), 'traces': slowest_traces.snapshot()}
 
 # Serve frontend
+# Pages are always revalidated (ETag / Last-Modified); the fingerprinted assets
+# they reference never change and are cached for a year.
+def serve_page(filename):
+    if asset_manifest.has_page(filename):
+        return send_precompressed(DIST_DIR, filename, REVALIDATE_CACHE)
+    response = send_from_directory('static', filename)
+    response.headers['Cache-Control'] = REVALIDATE_CACHE
+    return response
+
 @app.route('/')
 def index():
-    response = send_from_directory('static', 'index.html')
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+    return serve_page('index.html')
 
 @app.route('/success')
 def success():
-    return send_from_directory('static', 'success.html')
+    return serve_page('success.html')
+
+# Fingerprinted build output (python -m services.static_assets build)
+@app.route('/assets/<path:filename>')
+def serve_built_asset(filename):
+    if not asset_manifest.is_hashed_asset(filename):
+        return {'error': 'Not found'}, 404
+    return send_precompressed(DIST_DIR, filename, IMMUTABLE_CACHE)
 
 # Serve attached assets (stock images, generated images, etc.)
 @app.route('/attached_assets/<path:path>')
 def serve_attached_assets(path):
     return send_from_directory('attached_assets', path)
 
+# Resized / re-encoded attached asset images (see services/image_variants.py)
+@app.route('/img/<int:width>/<version>/<path:path>')
+def serve_image_variant(width, version, path):
+    try:
+        quality = int(request.args.get('q', image_variants.DEFAULT_QUALITY))
+        for attempt in range(2):
+            variant = image_variants.get_variant(path, width, version, request.headers.get('Accept', ''), quality)
+            if 'redirect' in variant:
+                response = redirect(variant['redirect'])
+                response.headers['Cache-Control'] = REVALIDATE_CACHE
+                return response
+            try:
+                response = send_file(variant['path'], mimetype=variant['mimetype'])
+                break
+            except FileNotFoundError:
+                if attempt:  # evicted between lookup and send twice in a row
+                    raise
+    except (ValueError, image_variants.VariantNotFound):
+        return {'error': 'Not found'}, 404
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE
+    response.vary.add('Accept')
+    return response
+
 @app.route('/<path:path>')
 def serve_static(path):
     response = send_from_directory('static', path)
-    # Add cache control headers for JS files to prevent mobile browser caching
+    # Unversioned JS/HTML must be revalidated so mobile browsers pick up new deploys
     if path.endswith('.js') or path.endswith('.html'):
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
+        response.headers['Cache-Control'] = REVALIDATE_CACHE
     return response
 
-# Self Test routes
+# Self Test routes (tests.SelfTester pulls in requests, so it is imported on demand)
 from flask import render_template_string
-from tests import SelfTester
 
 @app.get("/selftest")
 def selftest_view():
@@ -176,6 +255,7 @@ def selftest_view():
 
 @app.get("/selftest/run")
 def selftest_run():
+    from tests import SelfTester
     st = SelfTester(app)
     report = st.run_all()
     rows = []
@@ -194,23 +274,15 @@ def selftest_run():
 # Error handlers for debugging
 @app.errorhandler(500)
 def internal_error(error):
-    import traceback
-    print("="*80)
-    print("🚨 INTERNAL SERVER ERROR:")
-    print(traceback.format_exc())
-    print("="*80)
+    logger.exception("internal server error")
     return {'error': 'Internal server error', 'message': str(error)}, 500
 
 @app.errorhandler(Exception)
 def handle_exception(e):
-    import traceback
-    print("="*80)
-    print("🚨 UNHANDLED EXCEPTION:")
-    print(traceback.format_exc())
-    print("="*80)
+    logger.exception("unhandled exception")
     return {'error': 'Internal server error', 'message': str(e)}, 500
 
 if __name__ == '__main__':
     PORT = int(os.getenv('PORT', '5000'))
-    print(f"🚀 Starting Flask on 0.0.0.0:{PORT}")
+    logger.info(f"Starting Flask on 0.0.0.0:{PORT}")
     app.run(host='0.0.0.0', port=PORT, debug=False, use_reloader=False, threaded=True)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark for dynamic response compression
+
+Builds representative payloads through the real app (Flask test client, in a
+temporary working directory with seeded saved fits) and reports, per payload
+and encoding level: bytes before/after, ratio, and CPU time per response.
+Also measures end-to-end request time through the middleware with and
+without Accept-Encoding.
+
+Usage:
+    python -m benchmarks.compression_bench
+    python -m benchmarks.compression_bench --iterations 200 --json compression.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LEVELS = [('gzip', 1), ('gzip', 6), ('gzip', 9), ('br', 1), ('br', 4), ('br', 6), ('br', 11)]
+
+
+def seed_saved_fits(user_key: str, count: int):
+    from services.saved_fits_service import save_fit
+    for i in range(count):
+        save_fit(user_key, {
+            'result_image_url': f'https://storage.googleapis.com/fitsa-results/{uuid.uuid4().hex}.png',
+            'thumb_url': f'https://storage.googleapis.com/fitsa-results/thumbs/{uuid.uuid4().hex}.webp',
+            'shop_name': ['MUSINSA', '29CM', 'W Concept', 'ZARA'][i % 4],
+            'product_name': f'오버핏 울 블렌드 코트 {i}',
+            'product_url': f'https://www.musinsa.com/app/goods/{3000000 + i}?color=black&size=M',
+            'price_snapshot': 129000 + i * 1000,
+            'category': 'outer',
+            'tags': ['coat', 'winter', 'overfit'],
+            'note': '어깨 라인이 잘 맞음, 소매 길이 확인 필요',
+        })
+
+
+def ndjson_stream_payload(lines: int = 40) -> bytes:
+    return b''.join(json.dumps({'index': i, 'status': 'done', 'method': 'Gemini 2.5 Flash Image',
+                                'elapsed_ms': 8000 + i * 37, 'request_id': uuid.uuid4().hex}).encode() + b'\n'
+                    for i in range(lines))
+
+
+def cpu_us(func, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        start = time.process_time_ns()
+        func()
+        samples.append((time.process_time_ns() - start) / 1000)
+    return statistics.median(samples)
+
+
+def measure_levels(name: str, payload: bytes, iterations: int) -> list:
+    import services.compression_service as compression
+    from services.compression_service import brotli
+    rows = []
+    for encoding, level in LEVELS:
+        if encoding == 'br' and brotli is None:
+            continue
+        # Levels are read when a compressor is created
+        original = (compression.BROTLI_QUALITY, compression.GZIP_LEVEL)
+        compression.BROTLI_QUALITY = level if encoding == 'br' else compression.BROTLI_QUALITY
+        compression.GZIP_LEVEL = level if encoding == 'gzip' else compression.GZIP_LEVEL
+        try:
+            compressed = compression.compress_bytes(payload, encoding)
+            us = cpu_us(lambda: compression.compress_bytes(payload, encoding), iterations)
+        finally:
+            compression.BROTLI_QUALITY, compression.GZIP_LEVEL = original
+        rows.append({'payload': name, 'encoding': encoding, 'level': level, 'bytes_in': len(payload),
+                     'bytes_out': len(compressed), 'saved_pct': round(100 * (1 - len(compressed) / len(payload)), 1),
+                     'cpu_us': round(us, 1)})
+    return rows
+
+
+def measure_end_to_end(client, path: str, cookies: dict, iterations: int) -> dict:
+    result = {'path': path}
+    for label, accept in (('identity', 'identity'), ('gzip', 'gzip'), ('br', 'br, gzip')):
+        for key, value in cookies.items():
+            client.set_cookie(key, value)
+        response = client.get(path, headers={'Accept-Encoding': accept})
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            client.get(path, headers={'Accept-Encoding': accept})
+            samples.append((time.perf_counter() - start) * 1e6)
+        result[label] = {'bytes': len(response.data), 'encoding': response.headers.get('Content-Encoding'),
+                         'request_us': round(statistics.median(samples), 1)}
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--saved-fits', type=int, default=20, help='saved fits on the benchmark page')
+    parser.add_argument('--json', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # Databases are created in a throwaway directory; the app itself is imported from the repo
+    os.chdir(tempfile.mkdtemp(prefix='fitsa-compression-'))
+    sys.path.insert(0, REPO_ROOT)
+    from app import app
+
+    user_key = uuid.uuid4().hex[:16]
+    seed_saved_fits(user_key, args.saved_fits)
+    client = app.test_client()
+    endpoints = {
+        'saved_fits_page': (f'/api/saved-fits?per_page={args.saved_fits}', {'user_key': user_key}),
+        'luxury_brands': ('/api/luxury/brands', {}),
+    }
+
+    level_rows, end_to_end = [], []
+    for name, (path, cookies) in endpoints.items():
+        for key, value in cookies.items():
+            client.set_cookie(key, value)
+        payload = client.get(path, headers={'Accept-Encoding': 'identity'}).data
+        level_rows += measure_levels(name, payload, args.iterations)
+        end_to_end.append(measure_end_to_end(client, path, cookies, args.iterations))
+    level_rows += measure_levels('ndjson_stream', ndjson_stream_payload(), args.iterations)
+
+    print(f'{"payload":<18} {"enc":<5} {"lvl":>3} {"bytes in":>9} {"bytes out":>9} {"saved":>7} {"cpu us":>8}')
+    for row in level_rows:
+        print(f'{row["payload"]:<18} {row["encoding"]:<5} {row["level"]:>3} {row["bytes_in"]:>9} '
+              f'{row["bytes_out"]:>9} {row["saved_pct"]:>6}% {row["cpu_us"]:>8}')
+    print(f'\n{"end-to-end":<40} {"identity":>18} {"gzip":>18} {"br":>18}')
+    for row in end_to_end:
+        cells = [f'{row[k]["bytes"]}B/{row[k]["request_us"]}us' for k in ('identity', 'gzip', 'br')]
+        print(f'{row["path"]:<40} {cells[0]:>18} {cells[1]:>18} {cells[2]:>18}')
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump({'levels': level_rows, 'end_to_end': end_to_end}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
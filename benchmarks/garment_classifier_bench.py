@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Accuracy and latency of the garment category classifier
+
+Runs services.garment_classifier over a labelled set of garment photos and reports:
+    accuracy     correct / answered (the classifier may abstain)
+    coverage     answered / total
+    false flags  photos whose correct category would be rejected as a mismatch
+                 (wrong answer at or above the mismatch confidence)
+    false mismatch rate
+                 falsely rejected requests / requests: each garment sent with its
+                 own category, each non-garment photo (label None) with all three
+    latency      median / p95 / max ms per photo (decode + features + scoring)
+
+The default set is the product photos in attached_assets/generated_images,
+labelled below. The prototypes were tuned on them, so their accuracy says
+little about real uploads: --held-out evaluates attached_assets/stock_images
+instead (worn garments and unrelated photos, never used for tuning). --dir
+adds a local set laid out as <dir>/<category>/*.{png,jpg,webp}.
+
+Measured on the held-out set (threshold 0.85): the classifier answers for 2
+of 15 photos and both answers are wrong at confidence 1.0 (a worn evening
+dress and a cocktail glass read as lower_body), a false mismatch rate of
+3/37 requests, 1 of the 4 garments. That is why GARMENT_CATEGORY_CHECK is
+off by default; rerun with a held-out set of real uploads before turning it on.
+
+Usage:
+    python -m benchmarks.garment_classifier_bench
+    python -m benchmarks.garment_classifier_bench --held-out --max-false-mismatch-rate 0.01
+    python -m benchmarks.garment_classifier_bench --dir ~/garments --min-accuracy 0.9 --max-false-flags 0
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+from services.garment_classifier import CATEGORIES, MISMATCH_CONFIDENCE, classify
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSETS = os.path.join(REPO_ROOT, 'attached_assets', 'generated_images')
+HELD_OUT_ASSETS = os.path.join(REPO_ROOT, 'attached_assets', 'stock_images')
+
+LABELLED = [
+    ('black_evening_dress_complete_62275feb.png', 'dress'),
+    ('black_evening_dress_gown_d8fb4e08.png', 'dress'),
+    ('black_pants_fully_extended_f0786d3e.png', 'lower_body'),
+    ('black_pants_unfolded_complete_06ad10ca.png', 'lower_body'),
+    ('black_tailored_dress_pants_4016e68c.png', 'lower_body'),
+    ('navy_trousers_fully_extended_5da62e11.png', 'lower_body'),
+    ('navy_trousers_unfolded_complete_8073d58f.png', 'lower_body'),
+    ('navy_wide_leg_trousers_7a120526.png', 'lower_body'),
+    ('cream_shirt_unfolded_complete_e1c04150.png', 'upper_body'),
+    ('cream_silk_luxury_shirt_5e2ade51.png', 'upper_body'),
+    ('white_luxury_silk_blouse_a0ccc8d2.png', 'upper_body'),
+    ('white_silk_blouse_unfolded_92f28411.png', 'upper_body'),
+]
+# Labelled by what the photo shows (several file names don't match their content); None = not a garment
+HELD_OUT = [
+    ('red_t-shirt_clothing_06c793dc.jpg', 'upper_body'),      # folded t-shirt on a wooden table
+    ('white_elegant_blouse_b26ec440.jpg', 'upper_body'),      # worn
+    ('elegant_evening_dres_671ac27b.jpg', 'dress'),           # worn
+    ('blue_jeans_pants_tro_cc7ea367.jpg', 'lower_body'),      # denim close-up with a watch
+    ('baseball_cap_hat_pro_6615fdc1.jpg', None),
+    ('black_skirt_clothing_ddb4a2f9.jpg', None),              # lipstick
+    ('black_tailored_dress_3a36f3c2.jpg', None),              # lipstick
+    ('black_tailored_dress_d5c98295.jpg', None),              # cocktail glass
+    ('black_tailored_pants_021da930.jpg', None),              # lipstick
+    ('black_tailored_pants_4c2d270b.jpg', None),              # buildings
+    ('elegant_evening_dres_f83b6dba.jpg', None),              # lipstick
+    ('person_sitting_with__9a21dc27.jpg', None),
+    ('white_elegant_blouse_9e77eeaf.jpg', None),              # lipstick
+    ('white_elegant_silk_b_2cacd77b.jpg', None),              # lipstick
+    ('white_elegant_silk_b_71e57910.jpg', None),              # street photo
+]
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def load_set(extra_dir=None, held_out=False):
+    """[(path, label)] for the built-in (or held-out) set plus <extra_dir>/<category>/*"""
+    if held_out:
+        samples = [(os.path.join(HELD_OUT_ASSETS, name), label) for name, label in HELD_OUT]
+    else:
+        samples = [(os.path.join(ASSETS, name), label) for name, label in LABELLED]
+    if extra_dir:
+        for label in CATEGORIES:
+            folder = os.path.join(extra_dir, label)
+            if os.path.isdir(folder):
+                samples += [(os.path.join(folder, name), label) for name in sorted(os.listdir(folder))
+                            if name.lower().endswith(EXTENSIONS)]
+    return samples
+
+
+def run(samples, threshold: float = MISMATCH_CONFIDENCE, warmup: int = 1) -> dict:
+    rows, latencies = [], []
+    for path, label in samples:
+        with open(path, 'rb') as f:
+            data = f.read()
+        for _ in range(warmup):
+            classify(data)
+        start = time.perf_counter()
+        result = classify(data)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rows.append({'file': os.path.basename(path), 'label': label, 'predicted': result['category'],
+                     'confidence': result['confidence'], 'reason': result['reason'],
+                     'ms': round(latencies[-1], 2)})
+
+    garments = [r for r in rows if r['label']]
+    answered = [r for r in garments if r['predicted']]
+    correct = [r for r in answered if r['predicted'] == r['label']]
+    false_flags = [r for r in answered if r['predicted'] != r['label'] and r['confidence'] >= threshold]
+    # A confident answer on a non-garment rejects it under the two other categories
+    flagged_others = [r for r in rows if not r['label'] and r['predicted'] and r['confidence'] >= threshold]
+    requests = len(garments) + len(CATEGORIES) * (len(rows) - len(garments))
+    ordered = sorted(latencies)
+    return {
+        'total': len(rows),
+        'accuracy': round(len(correct) / len(answered), 3) if answered else None,
+        'coverage': round(len(answered) / len(garments), 3) if garments else None,
+        'false_flags': len(false_flags),
+        'false_mismatch_rate': round((len(false_flags) + 2 * len(flagged_others)) / requests, 3) if requests else None,
+        'latency_ms': {'median': round(statistics.median(ordered), 2),
+                       'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+                       'max': round(ordered[-1], 2)},
+        'rows': rows,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--held-out', action='store_true', help='evaluate the held-out set instead of the tuning set')
+    parser.add_argument('--dir', help='extra labelled photos in <dir>/<category>/')
+    parser.add_argument('--threshold', type=float, default=MISMATCH_CONFIDENCE, help='mismatch confidence')
+    parser.add_argument('--min-accuracy', type=float, help='exit 1 when accuracy (of answered) is lower')
+    parser.add_argument('--max-false-flags', type=int, help='exit 1 when more photos would be falsely flagged')
+    parser.add_argument('--max-false-mismatch-rate', type=float, help='exit 1 when the false mismatch rate is higher')
+    parser.add_argument('--json', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    report = run(load_set(args.dir, args.held_out), args.threshold)
+
+    print(f'{"file":<46} {"label":<11} {"predicted":<11} {"conf":>5} {"ms":>7}')
+    for r in report['rows']:
+        predicted = r['predicted'] or f'({r["reason"]})'
+        marker = '' if r['predicted'] in (None, r['label']) else '  <-- wrong'
+        print(f'{r["file"][:46]:<46} {str(r["label"]):<11} {predicted:<11} {r["confidence"]:>5} {r["ms"]:>7}{marker}')
+    latency = report['latency_ms']
+    print(f'\naccuracy {report["accuracy"]}  coverage {report["coverage"]}  false flags {report["false_flags"]}'
+          f'  false mismatch rate {report["false_mismatch_rate"]}'
+          f'  latency median {latency["median"]}ms p95 {latency["p95"]}ms max {latency["max"]}ms'
+          f'  ({report["total"]} photos)')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failed = ((args.min_accuracy is not None and (report['accuracy'] or 0) < args.min_accuracy)
+              or (args.max_false_flags is not None and report['false_flags'] > args.max_false_flags)
+              or (args.max_false_mismatch_rate is not None
+                  and report['false_mismatch_rate'] > args.max_false_mismatch_rate))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""
+Gunicorn config for load tests: every worker swaps the AI providers for local stubs
+Used by benchmarks/load_test.py; worker/thread/bind settings come from the command line.
+"""
+
+
+def post_fork(server, worker):
+    # Runs in the worker before the app is imported, so the route's lazy
+    # provider imports resolve to the stub modules
+    from benchmarks.stub_providers import install_stubs
+    install_stubs()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the CPU-side image pipeline
+
+Runs every stage of our own image code over a locally generated corpus of
+phone-photo-like images and reports median time and peak memory per stage:
+    fast_mode_resize   thumbnail + JPEG re-encode of an upload (quality=fast)
+    rembg_prepare      data URI decode, shrink to 800px, PNG encode before rembg
+    rembg_inference    rembg.remove() itself (only with --with-rembg and rembg installed)
+    rembg_restore      resize rembg output back to the original size, PNG encode, data URI
+    replicate_pad      resize-and-pad of a provider result to the person photo size
+    result_encode      PNG encode + base64 data URI of the final result
+
+Usage:
+    python -m benchmarks.image_pipeline_bench
+    python -m benchmarks.image_pipeline_bench --save-baseline
+    python -m benchmarks.image_pipeline_bench --baseline benchmarks/results/image_pipeline_baseline.json --threshold 0.2
+
+With --baseline, exits with status 1 when any stage is slower (best of the
+timed runs) or uses more peak memory than the baseline by more than the threshold.
+"""
+import os
+import io
+import sys
+import json
+import time
+import ctypes
+import argparse
+import platform
+import statistics
+import tracemalloc
+
+from PIL import Image
+
+from services.image_utils import (
+    resize_for_fast_mode, fit_to_size, shrink_to_max_side, encode_png,
+    to_data_uri, from_data_uri, REMBG_MAX_SIDE,
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, 'benchmarks', 'results', 'image_pipeline_baseline.json')
+
+# Typical phone uploads: full-res camera JPEG, downscaled share JPEG, screenshot PNG, Instagram-size WebP
+CORPUS = [
+    ('camera_12mp_jpeg', 3024, 4032, 'JPEG'),
+    ('share_1080_jpeg', 1080, 1440, 'JPEG'),
+    ('screenshot_png', 1170, 2532, 'PNG'),
+    ('portrait_webp', 1080, 1350, 'WEBP'),
+]
+PROVIDER_RESULT_SIZE = (768, 1024)
+
+
+def make_photo(width: int, height: int, fmt: str = 'JPEG') -> bytes:
+    """Photo-like test image (noise over a gradient compresses like a real photo)"""
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buffer = io.BytesIO()
+    Image.blend(noise, gradient, 0.5).save(buffer, format=fmt, quality=90)
+    return buffer.getvalue()
+
+
+# ---- Stages ----
+# Each stage factory does its untimed setup and returns the function to time.
+
+def stage_fast_mode_resize(photo: bytes, size):
+    return lambda: resize_for_fast_mode(photo)
+
+
+def stage_rembg_prepare(photo: bytes, size):
+    data_uri = to_data_uri(photo)
+
+    def run():
+        img = Image.open(io.BytesIO(from_data_uri(data_uri)))
+        return encode_png(shrink_to_max_side(img, REMBG_MAX_SIDE))
+    return run
+
+
+def stage_rembg_inference(photo: bytes, size):
+    from rembg import remove
+    prepared = encode_png(shrink_to_max_side(Image.open(io.BytesIO(photo)), REMBG_MAX_SIDE))
+    return lambda: remove(prepared)
+
+
+def stage_rembg_restore(photo: bytes, size):
+    # Stand-in for rembg output: the shrunk image with an alpha channel
+    shrunk = shrink_to_max_side(Image.open(io.BytesIO(photo)), REMBG_MAX_SIDE).convert('RGBA')
+    output = encode_png(shrunk)
+
+    def run():
+        img = Image.open(io.BytesIO(output))
+        if img.size != size:
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        return to_data_uri(encode_png(img))
+    return run
+
+
+def stage_replicate_pad(photo: bytes, size):
+    result = make_photo(*PROVIDER_RESULT_SIZE, fmt='PNG')
+    return lambda: fit_to_size(Image.open(io.BytesIO(result)).convert('RGB'), size)
+
+
+def stage_result_encode(photo: bytes, size):
+    result = fit_to_size(Image.open(io.BytesIO(make_photo(*PROVIDER_RESULT_SIZE, fmt='PNG'))).convert('RGB'), size)
+    return lambda: to_data_uri(encode_png(result))
+
+
+STAGES = {
+    'fast_mode_resize': stage_fast_mode_resize,
+    'rembg_prepare': stage_rembg_prepare,
+    'rembg_inference': stage_rembg_inference,
+    'rembg_restore': stage_rembg_restore,
+    'replicate_pad': stage_replicate_pad,
+    'result_encode': stage_result_encode,
+}
+
+
+# ---- Measurement ----
+
+def _read_status_kb(field: str) -> int:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def _release_free_memory():
+    """Hand freed heap pages back to the OS so the next peak starts from a clean baseline"""
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _can_reset_peak_rss() -> bool:
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        _read_status_kb('VmHWM')
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory_mb(func, use_rss: bool) -> float:
+    """
+    Peak memory above the starting point while func runs.
+
+    Uses the kernel's peak-RSS counter (reset via /proc/self/clear_refs) so
+    Pillow's native buffers are counted; falls back to tracemalloc, which only
+    sees Python-level allocations.
+    """
+    _release_free_memory()
+    if use_rss:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        start = _read_status_kb('VmRSS')
+        func()
+        return max(0, _read_status_kb('VmHWM') - start) / 1024
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def time_ms(func, repeats: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(samples), 2), 'min_ms': round(min(samples), 2)}
+
+
+def run_benchmarks(stages, corpus, repeats: int) -> dict:
+    use_rss = _can_reset_peak_rss()
+    results = {}
+    for name, width, height, fmt in corpus:
+        photo = make_photo(width, height, fmt)
+        for stage in stages:
+            func = STAGES[stage](photo, (width, height))
+            result = time_ms(func, repeats)
+            result['peak_mb'] = round(peak_memory_mb(func, use_rss), 1)
+            results[f'{stage}/{name}'] = result
+    return {'memory_method': 'peak_rss' if use_rss else 'tracemalloc', 'results': results}
+
+
+def compare(current: dict, baseline: dict, threshold: float, memory_threshold: float,
+            min_ms: float, min_mb: float) -> list:
+    """
+    Regressions beyond the thresholds; small absolute differences are treated as noise.
+    Time is compared on the best run, which is far less sensitive to machine load than the median.
+    """
+    regressions = []
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        if (result['min_ms'] > base['min_ms'] * (1 + threshold)
+                and result['min_ms'] - base['min_ms'] > min_ms):
+            regressions.append(f"{key}: time {base['min_ms']}ms -> {result['min_ms']}ms")
+        if (current.get('memory_method') == baseline.get('memory_method')
+                and result['peak_mb'] > base['peak_mb'] * (1 + memory_threshold)
+                and result['peak_mb'] - base['peak_mb'] > min_mb):
+            regressions.append(f"{key}: peak memory {base['peak_mb']}MB -> {result['peak_mb']}MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5, help='timed runs per stage and image')
+    parser.add_argument('--stages', default=','.join(s for s in STAGES if s != 'rembg_inference'),
+                        help='comma-separated stages to run')
+    parser.add_argument('--with-rembg', action='store_true', help='also time rembg inference (requires rembg)')
+    parser.add_argument('--baseline', help='compare against this baseline JSON and fail on regression')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help='write results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative slowdown (0.25 = 25%%)')
+    parser.add_argument('--memory-threshold', type=float, default=0.25, help='allowed relative peak memory growth')
+    parser.add_argument('--min-ms', type=float, default=2.0, help='ignore time differences below this')
+    parser.add_argument('--min-mb', type=float, default=5.0, help='ignore memory differences below this')
+    parser.add_argument('--json', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    stages = [s for s in args.stages.split(',') if s]
+    if args.with_rembg and 'rembg_inference' not in stages:
+        stages.append('rembg_inference')
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f'unknown stages: {", ".join(unknown)}')
+
+    report = run_benchmarks(stages, CORPUS, args.repeats)
+    report['environment'] = {'python': platform.python_version(), 'pillow': Image.__version__,
+                             'machine': platform.machine()}
+
+    print(f'{"stage/image":<40} {"median ms":>10} {"min ms":>9} {"peak MB":>9}   (memory: {report["memory_method"]})')
+    for key, result in report['results'].items():
+        print(f'{key:<40} {result["median_ms"]:>10} {result["min_ms"]:>9} {result["peak_mb"]:>9}')
+
+    for path in filter(None, (args.json, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {path}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.memory_threshold, args.min_ms, args.min_mb)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) against {args.baseline}:')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print(f'\nNo regressions against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
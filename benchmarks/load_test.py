@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Load test for /api/virtual-fitting with stub AI providers
+
+Starts the Flask app under gunicorn (providers replaced by benchmarks/stub_providers.py),
+drives it at rising concurrency and reports throughput, p50/p95/p99 latency,
+status codes and peak RSS per worker. Nothing is sent to Gemini or Replicate.
+
+Usage:
+    python -m benchmarks.load_test --workers 2 --threads 4 --concurrency 1,4,8,16 --duration 30
+    STUB_GEMINI_LATENCY=lognormal:3000:0.3 STUB_GEMINI_ERROR_RATE=0.1 python -m benchmarks.load_test
+
+The app runs in a temporary working directory, so credits.db / saved_fits.db
+in the repository are never touched.
+"""
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import socket
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+
+import requests
+from PIL import Image
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_photo(width: int, height: int, fmt: str = 'JPEG') -> bytes:
+    """Photo-like test image (noise over a gradient compresses like a real photo)"""
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buffer = io.BytesIO()
+    Image.blend(noise, gradient, 0.5).save(buffer, format=fmt, quality=90)
+    return buffer.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def worker_pids(master_pid: int):
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class GunicornServer:
+    def __init__(self, workers: int, threads: int, timeout: int, env_overrides: dict):
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        self.workdir = tempfile.mkdtemp(prefix='fitsa-loadtest-')
+        self.cmd = [
+            sys.executable, '-m', 'gunicorn',
+            '--config', os.path.join(REPO_ROOT, 'benchmarks', 'gunicorn_stub_conf.py'),
+            '--pythonpath', REPO_ROOT,
+            '--chdir', self.workdir,
+            '--workers', str(workers),
+            '--threads', str(threads),
+            '--timeout', str(timeout),
+            '--bind', f'127.0.0.1:{self.port}',
+            '--log-level', 'warning',
+            'app:app',
+        ]
+        self.env = dict(os.environ, **env_overrides)
+        self.process = None
+
+    def __enter__(self):
+        # Static files are resolved relative to the app; databases/uploads land in the temp dir
+        self.process = subprocess.Popen(self.cmd, env=self.env, stdout=subprocess.DEVNULL)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            try:
+                if requests.get(f'{self.base_url}/healthz', timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError('gunicorn did not become healthy within 60s')
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def run_step(base_url: str, concurrency: int, duration: float, person: bytes, clothing: bytes,
+             master_pid: int, request_timeout: float) -> dict:
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+    peak_rss = {}
+
+    def client():
+        session = requests.Session()
+        while time.time() < stop_at:
+            # A fresh user_key per request: 3 free tries, never a refit, own rate bucket
+            cookies = {'user_key': uuid.uuid4().hex[:16]}
+            files = {
+                'userPhoto': ('person.jpg', person, 'image/jpeg'),
+                'clothingPhoto': ('clothing.jpg', clothing, 'image/jpeg'),
+            }
+            start = time.perf_counter()
+            try:
+                response = session.post(f'{base_url}/api/virtual-fitting', files=files,
+                                        data={'category': 'upper_body'}, cookies=cookies,
+                                        timeout=request_timeout)
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(elapsed)
+
+    def sample_memory():
+        while time.time() < stop_at:
+            for pid in worker_pids(master_pid):
+                peak_rss[pid] = max(peak_rss.get(pid, 0.0), rss_mb(pid))
+            time.sleep(0.5)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    threads.append(threading.Thread(target=sample_memory))
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': sum(statuses.values()),
+        'succeeded': len(latencies),
+        'throughput_rps': round(len(latencies) / wall, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'statuses': {str(k): v for k, v in sorted(statuses.items(), key=lambda kv: str(kv[0]))},
+        'peak_rss_mb_per_worker': {str(pid): round(mb, 1) for pid, mb in sorted(peak_rss.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='comma-separated concurrency steps')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per step')
+    parser.add_argument('--person-size', default='1080x1440', help='uploaded person photo size')
+    parser.add_argument('--clothing-size', default='1080x1080', help='uploaded clothing photo size')
+    parser.add_argument('--request-timeout', type=float, default=150)
+    parser.add_argument('--keep-admission-limits', action='store_true',
+                        help='keep production admission-control limits instead of lifting the global rate')
+    parser.add_argument('--json', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    person = make_photo(*(int(v) for v in args.person_size.split('x')))
+    clothing = make_photo(*(int(v) for v in args.clothing_size.split('x')))
+
+    env = {'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'), 'GEMINI_API_KEY': 'stub', 'REPLICATE_API_TOKEN': 'stub',
+           # The synthetic photos contain no person or recognisable garment, and the stub
+           # providers have no quota to pace against
+           'INPUT_QUALITY_CHECK': 'false', 'GARMENT_CATEGORY_CHECK': 'false', 'PROVIDER_QUOTA': 'false'}
+    if not args.keep_admission_limits:
+        env.update({'FITTING_GLOBAL_RATE_PER_MIN': '1000000', 'FITTING_GLOBAL_BURST': '100000'})
+
+    results = []
+    with GunicornServer(args.workers, args.threads, 120, env) as server:
+        print(f'gunicorn pid={server.process.pid} workers={args.workers} threads={args.threads} url={server.base_url}')
+        print(f'{"conc":>5} {"reqs":>6} {"ok":>6} {"rps":>8} {"p50ms":>9} {"p95ms":>9} {"p99ms":>9}  statuses / peak RSS MB per worker')
+        for concurrency in (int(c) for c in args.concurrency.split(',')):
+            result = run_step(server.base_url, concurrency, args.duration, person, clothing,
+                              server.process.pid, args.request_timeout)
+            results.append(result)
+            print(f'{result["concurrency"]:>5} {result["requests"]:>6} {result["succeeded"]:>6} '
+                  f'{result["throughput_rps"]:>8} {result["p50_ms"]:>9} {result["p95_ms"]:>9} {result["p99_ms"]:>9}  '
+                  f'{result["statuses"]} {result["peak_rss_mb_per_worker"]}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
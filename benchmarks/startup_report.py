@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Cold-start report: import time of app.py and worker warm-up cost
+
+Imports the app in a fresh interpreter with `python -X importtime` and reports
+the total import wall time, the slowest modules (self time) and the heaviest
+top-level packages (cumulative time). With --warmup it also runs the worker
+warm-up (services/warmup_service.py) and reports each step.
+
+Usage:
+    python -m benchmarks.startup_report
+    python -m benchmarks.startup_report --warmup --top 15
+    python -m benchmarks.startup_report --budget-ms 1500     # exit 1 if the import is slower
+
+Runs in a temporary working directory so the repository databases are untouched.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - start) * 1000
+warmup = None
+if {warmup!r}:
+    from services.warmup_service import warm_up
+    start = time.perf_counter()
+    warmup = warm_up()
+    warmup_total = (time.perf_counter() - start) * 1000
+    warmup = {{'total_ms': round(warmup_total, 1), 'steps': warmup}}
+print('@@' + json.dumps({{'import_ms': round(import_ms, 1), 'warmup': warmup}}))
+"""
+
+
+def parse_importtime(stderr: str):
+    """Parse `-X importtime` lines into (name, depth, self_us, cumulative_us)"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|', 2)
+        name = name[1:]  # drop the separator space, keep the indentation
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        modules.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def run_probe(warmup: bool) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.getenv('PYTHONPATH')])),
+               LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING'))
+    with tempfile.TemporaryDirectory(prefix='fitsa-startup-') as workdir:
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(warmup=warmup)],
+                                   cwd=workdir, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'app import failed:\n{completed.stderr[-4000:]}')
+    result_line = next(line for line in completed.stdout.splitlines() if line.startswith('@@'))
+    result = json.loads(result_line[2:])
+    result['modules'] = parse_importtime(completed.stderr)
+    return result
+
+
+def summarize(result: dict, top: int) -> dict:
+    modules = result['modules']
+    slowest = sorted(modules, key=lambda m: m[2], reverse=True)[:top]
+    packages = defaultdict(int)
+    for name, depth, self_us, cumulative_us in modules:
+        packages[name.split('.')[0]] += self_us
+    heaviest = sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    app_module = next((m for m in modules if m[0] == 'app'), None)
+    return {
+        'import_ms': result['import_ms'],
+        'importtime_app_ms': round(app_module[3] / 1000, 1) if app_module else None,
+        'modules_imported': len(modules),
+        'slowest_modules': [{'module': n, 'self_ms': round(s / 1000, 1), 'cumulative_ms': round(c / 1000, 1)}
+                            for n, _, s, c in slowest],
+        'heaviest_packages': [{'package': n, 'ms': round(us / 1000, 1)} for n, us in heaviest],
+        'warmup': result['warmup'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--warmup', action='store_true', help='also run the worker warm-up steps')
+    parser.add_argument('--budget-ms', type=float, help='fail (exit 1) if importing the app takes longer')
+    parser.add_argument('--json', help='write the report to this JSON file')
+    args = parser.parse_args(argv)
+
+    report = summarize(run_probe(args.warmup), args.top)
+
+    print(f'import app: {report["import_ms"]}ms wall, {report["modules_imported"]} modules')
+    print(f'\n{"slowest modules (self)":<50} {"self ms":>8} {"cum ms":>8}')
+    for m in report['slowest_modules']:
+        print(f'{m["module"]:<50} {m["self_ms"]:>8} {m["cumulative_ms"]:>8}')
+    print(f'\n{"heaviest packages":<50} {"ms":>8}')
+    for p in report['heaviest_packages']:
+        print(f'{p["package"]:<50} {p["ms"]:>8}')
+    if report['warmup']:
+        print(f'\nwarm-up: {report["warmup"]["total_ms"]}ms')
+        for name, step in report['warmup']['steps'].items():
+            status = 'ok' if step['ok'] else f'failed: {step["error"]}'
+            print(f'  {name:<20} {step["ms"]:>8}ms  {status}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.budget_ms is not None and report['import_ms'] > args.budget_ms:
+        print(f'\nImport time {report["import_ms"]}ms exceeds budget {args.budget_ms}ms')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
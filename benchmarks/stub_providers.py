@@ -0,0 +1,158 @@
+"""
+Stub AI Providers
+Local stand-ins for Gemini, Replicate (IDM-VTON) and rembg, for load testing without API costs
+
+Behaviour is configured per provider through environment variables
+(PROVIDER is GEMINI, REPLICATE or REMBG):
+    STUB_<PROVIDER>_LATENCY       latency distribution, e.g. "fixed:2000", "uniform:500:3000",
+                                  "normal:8000:2000", "lognormal:8000:0.5" (milliseconds)
+    STUB_<PROVIDER>_ERROR_RATE    fraction of calls that raise an error (0-1)
+    STUB_<PROVIDER>_TIMEOUT_RATE  fraction of calls that hang until the timeout and raise TimeoutError
+    STUB_<PROVIDER>_TIMEOUT_MS    how long a timed-out call hangs (default 90000, as Gemini)
+    STUB_RESULT_SIZE              result image size, e.g. "768x1024"
+"""
+import os
+import io
+import sys
+import time
+import types
+import random
+import base64
+import logging
+from typing import Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY = {
+    'GEMINI': 'lognormal:12000:0.4',
+    'REPLICATE': 'lognormal:25000:0.3',
+    'REMBG': 'uniform:300:900',
+}
+
+
+class StubProviderError(Exception):
+    """Simulated provider failure"""
+
+
+class StubBehaviour:
+    def __init__(self, provider: str):
+        prefix = f'STUB_{provider}_'
+        self.provider = provider
+        self.latency_spec = os.getenv(prefix + 'LATENCY', DEFAULT_LATENCY[provider])
+        self.error_rate = float(os.getenv(prefix + 'ERROR_RATE', '0'))
+        self.timeout_rate = float(os.getenv(prefix + 'TIMEOUT_RATE', '0'))
+        self.timeout_ms = float(os.getenv(prefix + 'TIMEOUT_MS', '90000'))
+
+    def sample_latency_ms(self) -> float:
+        kind, *params = self.latency_spec.split(':')
+        params = [float(p) for p in params]
+        if kind == 'fixed':
+            return params[0]
+        if kind == 'uniform':
+            return random.uniform(params[0], params[1])
+        if kind == 'normal':
+            return max(0.0, random.gauss(params[0], params[1]))
+        if kind == 'lognormal':
+            # params: median_ms, sigma
+            return params[0] * random.lognormvariate(0, params[1])
+        raise ValueError(f'Unknown latency distribution: {self.latency_spec}')
+
+    def simulate(self):
+        """Sleep like the real provider and raise its failure modes"""
+        roll = random.random()
+        if roll < self.timeout_rate:
+            time.sleep(self.timeout_ms / 1000)
+            raise TimeoutError(f'{self.provider} stub timed out after {self.timeout_ms:.0f}ms')
+        time.sleep(self.sample_latency_ms() / 1000)
+        if roll < self.timeout_rate + self.error_rate:
+            raise StubProviderError(f'{self.provider} stub simulated failure')
+
+
+_result_cache = {}
+
+
+def result_data_uri(size: Optional[str] = None) -> str:
+    """A photo-like PNG data URI of the configured size (generated once per size)"""
+    size = size or os.getenv('STUB_RESULT_SIZE', '768x1024')
+    if size not in _result_cache:
+        width, height = (int(v) for v in size.lower().split('x'))
+        noise = Image.effect_noise((width, height), 48).convert('RGB')
+        gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+        img = Image.blend(noise, gradient, 0.6)
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        _result_cache[size] = f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+    return _result_cache[size]
+
+
+class StubGeminiVirtualFittingService:
+    behaviour = None
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+
+    def virtual_try_on(self, person_image_bytes: bytes, clothing_image_bytes: bytes, category: str = 'upper_body') -> Optional[str]:
+        self.behaviour.simulate()
+        return result_data_uri()
+
+
+class StubReplicateService:
+    behaviour = None
+
+    def __init__(self, api_token: str):
+        self.api_token = api_token
+
+    def virtual_try_on(self, person_image_bytes: bytes, clothing_image_bytes: bytes, category: str = "upper_body") -> Optional[str]:
+        self.behaviour.simulate()
+        return result_data_uri()
+
+
+class StubBackgroundRemovalService:
+    behaviour = None
+
+    def __init__(self, api_token: str = None):
+        pass
+
+    def remove_background(self, image_data_url: str) -> Optional[str]:
+        self.behaviour.simulate()
+        return image_data_url
+
+
+def install_stubs():
+    """
+    Replace the provider service modules with stub modules.
+
+    Must run before the first fitting request imports them (e.g. from a
+    gunicorn post_fork hook). Stub modules are installed even when the real
+    SDKs (google-genai, replicate, rembg) are not installed.
+    """
+    StubGeminiVirtualFittingService.behaviour = StubBehaviour('GEMINI')
+    StubReplicateService.behaviour = StubBehaviour('REPLICATE')
+    StubBackgroundRemovalService.behaviour = StubBehaviour('REMBG')
+
+    stubs = {
+        'services.gemini_virtual_fitting_service': {
+            'GeminiVirtualFittingService': StubGeminiVirtualFittingService,
+            'GeminiTimeoutError': TimeoutError,
+        },
+        'services.replicate_service': {'ReplicateService': StubReplicateService},
+        'services.background_removal_service': {'BackgroundRemovalService': StubBackgroundRemovalService},
+    }
+    import services
+    for module_name, attributes in stubs.items():
+        module = types.ModuleType(module_name, 'Stub provider module installed by benchmarks.stub_providers')
+        for name, value in attributes.items():
+            setattr(module, name, value)
+        sys.modules[module_name] = module
+        setattr(services, module_name.rsplit('.', 1)[1], module)
+
+    # Make sure the route takes the Gemini-first path
+    os.environ.setdefault('GEMINI_API_KEY', 'stub')
+    os.environ.setdefault('REPLICATE_API_TOKEN', 'stub')
+    logger.info("Stub AI providers installed", extra={
+        'gemini_latency': StubGeminiVirtualFittingService.behaviour.latency_spec,
+        'replicate_latency': StubReplicateService.behaviour.latency_spec,
+        'rembg_latency': StubBackgroundRemovalService.behaviour.latency_spec,
+    })
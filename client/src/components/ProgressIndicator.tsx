@@ -4,14 +4,26 @@ import { Loader2 } from "lucide-react";
 interface ProgressIndicatorProps {
   message?: string;
   estimatedTime?: string;
+  previewUrl?: string | null;
 }
 
 export function ProgressIndicator({
   message = "AI가 이미지를 합성하고 있습니다...",
   estimatedTime = "약 10-15초 소요",
+  previewUrl,
 }: ProgressIndicatorProps) {
   return (
     <div className="space-y-6 py-8">
+      {previewUrl && (
+        <div className="flex justify-center">
+          <img
+            src={previewUrl}
+            alt="미리보기"
+            className="max-h-96 rounded-md opacity-90"
+            data-testid="img-fitting-preview"
+          />
+        </div>
+      )}
       <div className="flex items-center justify-center gap-3">
         <Loader2 className="h-6 w-6 animate-spin text-primary" />
         <p className="text-base font-medium text-foreground">{message}</p>
@@ -11,12 +11,13 @@ export async function apiRequest(
   method: string,
   url: string,
   data?: unknown | undefined,
+  headers: Record<string, string> = {},
 ): Promise<Response> {
   const isFormData = data instanceof FormData;
   
   const res = await fetch(url, {
     method,
-    headers: data && !isFormData ? { "Content-Type": "application/json" } : {},
+    headers: data && !isFormData ? { "Content-Type": "application/json", ...headers } : headers,
     body: isFormData ? data : (data ? JSON.stringify(data) : undefined),
     credentials: "include",
   });
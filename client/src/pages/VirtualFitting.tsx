@@ -1,4 +1,4 @@
-import { useState, useCallback } from "react";
+import { useState, useCallback, useEffect, useRef } from "react";
 import { useMutation } from "@tanstack/react-query";
 import { ImageUploadZone } from "@/components/ImageUploadZone";
 import { BeforeAfterComparison } from "@/components/BeforeAfterComparison";
@@ -9,6 +9,43 @@ import { useToast } from "@/hooks/use-toast";
 import { Sparkles, Download, RotateCcw } from "lucide-react";
 import { apiRequest } from "@/lib/queryClient";
 
+interface FittingJobStatus {
+  job_id: string;
+  status: "running" | "completed" | "failed" | "cancelled";
+  version: number;
+  previewUrl: string | null;
+  resultUrl: string | null;
+  resultFormat: string | null;
+  degraded: boolean;
+  queuePosition: number | null;
+  estimatedWaitSeconds: number | null;
+  error: string | null;
+}
+
+interface FittingError {
+  error?: string;
+  message?: string;
+  category_mismatch?: boolean;
+  skippable?: boolean;
+}
+
+// Server checks the user may override after confirming: the field to resend with and the question to ask
+function fittingOverride(status: number, body: FittingError): { field: string; question: string } | null {
+  if (status === 409 && body.category_mismatch) {
+    return { field: "confirmCategory", question: `${body.message}\n\n그대로 진행할까요?` };
+  }
+  if (status === 422 && body.skippable) {
+    return { field: "skipQualityCheck", question: `${body.message}\n\n이 사진으로 그대로 진행할까요?` };
+  }
+  return null;
+}
+
+// File extension for a result's mimetype (the server may answer with AVIF, WebP, JPEG or PNG)
+function resultExtension(resultFormat: string | null): string {
+  const subtype = resultFormat?.split("/")[1];
+  return subtype === "jpeg" ? "jpg" : subtype || "png";
+}
+
 export default function VirtualFitting() {
   const { toast } = useToast();
   const [userPhoto, setUserPhoto] = useState<File | null>(null);
@@ -16,6 +53,25 @@ export default function VirtualFitting() {
   const [clothingPhoto, setClothingPhoto] = useState<File | null>(null);
   const [clothingPhotoPreview, setClothingPhotoPreview] = useState<string | null>(null);
   const [resultImage, setResultImage] = useState<string | null>(null);
+  const [resultFormat, setResultFormat] = useState<string | null>(null);
+  const [previewImage, setPreviewImage] = useState<string | null>(null);
+  const [queueStatus, setQueueStatus] = useState<{ position: number; waitSeconds: number } | null>(null);
+  const jobIdRef = useRef<string | null>(null);
+
+  // Leaving the page cancels a running job, so the server stops before its fallback
+  useEffect(() => {
+    const cancelJob = () => {
+      if (jobIdRef.current) {
+        navigator.sendBeacon(`/api/fitting-jobs/${jobIdRef.current}/cancel`);
+        jobIdRef.current = null;
+      }
+    };
+    window.addEventListener("pagehide", cancelJob);
+    return () => {
+      window.removeEventListener("pagehide", cancelJob);
+      cancelJob();
+    };
+  }, []);
 
   const handleUserPhotoSelect = useCallback((file: File) => {
     setUserPhoto(file);
@@ -54,16 +110,77 @@ export default function VirtualFitting() {
       const formData = new FormData();
       formData.append("userPhoto", userPhoto);
       formData.append("clothingPhoto", clothingPhoto);
+      formData.append("progressive", "true");
+      // No garment type picker on this page: the server detects it from the photo
+      formData.append("category", "auto");
 
-      const response = await apiRequest("POST", "/api/virtual-fitting", formData);
-      const data = await response.json();
-      return data as { id: string; resultUrl: string; status: string };
+      // One key per try-on: a retry after a dropped connection gets the same job instead of a new charge
+      const headers = { "Idempotency-Key": crypto.randomUUID() };
+      const submit = async () => {
+        const init: RequestInit = { method: "POST", body: formData, headers, credentials: "include" };
+        try {
+          return await fetch("/api/virtual-fitting", init);
+        } catch (error) {
+          if (!(error instanceof TypeError)) {
+            throw error;
+          }
+          return await fetch("/api/virtual-fitting", init);
+        }
+      };
+      let response = await submit();
+      // A rejected check the user may override: ask, then resend (errors are never stored under the key)
+      while (!response.ok) {
+        const body = (await response.json().catch(() => ({}))) as FittingError;
+        const override = fittingOverride(response.status, body);
+        if (!override || formData.has(override.field) || !window.confirm(override.question)) {
+          throw new Error(body.message || body.error || `${response.status}: ${response.statusText}`);
+        }
+        formData.set(override.field, "true");
+        response = await submit();
+      }
+      const job = (await response.json()) as { job_id: string; status_url: string };
+      jobIdRef.current = job.job_id;
+
+      // Short long-polls (each holds a server request thread) with a pause whenever nothing changed
+      let version = -1;
+      try {
+        while (true) {
+          const statusResponse = await apiRequest("GET", `${job.status_url}?since=${version}&wait=2`);
+          const status = (await statusResponse.json()) as FittingJobStatus;
+          const changed = status.version !== version;
+          version = status.version;
+          if (status.previewUrl) {
+            setPreviewImage(status.previewUrl);
+          }
+          setQueueStatus(
+            status.queuePosition
+              ? { position: status.queuePosition, waitSeconds: status.estimatedWaitSeconds ?? 0 }
+              : null,
+          );
+          if (status.status === "completed" && status.resultUrl) {
+            return status;
+          }
+          if (status.status === "failed" || status.status === "cancelled") {
+            throw new Error(status.error || "이미지 합성에 실패했습니다. 다시 시도해주세요.");
+          }
+          if (!changed) {
+            await new Promise((resolve) => setTimeout(resolve, 1500));
+          }
+        }
+      } finally {
+        jobIdRef.current = null;
+        setPreviewImage(null);
+        setQueueStatus(null);
+      }
     },
-    onSuccess: (data: { id: string; resultUrl: string; status: string }) => {
+    onSuccess: (data: FittingJobStatus) => {
       setResultImage(data.resultUrl);
+      setResultFormat(data.resultFormat);
       toast({
         title: "피팅 완료!",
-        description: "가상 피팅 결과가 생성되었습니다.",
+        description: data.degraded
+          ? "고화질 생성에 실패해 미리보기 결과를 보여드립니다."
+          : "가상 피팅 결과가 생성되었습니다.",
       });
     },
     onError: (error: Error) => {
@@ -80,7 +197,7 @@ export default function VirtualFitting() {
 
     const link = document.createElement("a");
     link.href = resultImage;
-    link.download = `virtual-fitting-${Date.now()}.png`;
+    link.download = `virtual-fitting-${Date.now()}.${resultExtension(resultFormat)}`;
     document.body.appendChild(link);
     link.click();
     document.body.removeChild(link);
@@ -89,7 +206,7 @@ export default function VirtualFitting() {
       title: "다운로드 완료",
       description: "이미지가 저장되었습니다.",
     });
-  }, [resultImage, toast]);
+  }, [resultImage, resultFormat, toast]);
 
   const handleReset = useCallback(() => {
     setUserPhoto(null);
@@ -97,6 +214,7 @@ export default function VirtualFitting() {
     setClothingPhoto(null);
     setClothingPhotoPreview(null);
     setResultImage(null);
+    setResultFormat(null);
   }, []);
 
   const canGenerate = userPhoto && clothingPhoto && !generateFittingMutation.isPending;
@@ -147,7 +265,16 @@ export default function VirtualFitting() {
 
                 {/* Progress or Generate Button */}
                 {generateFittingMutation.isPending ? (
-                  <ProgressIndicator />
+                  <ProgressIndicator
+                    previewUrl={previewImage}
+                    message={
+                      previewImage
+                        ? "미리보기를 고화질로 다듬고 있습니다..."
+                        : queueStatus
+                          ? `대기 중입니다 (앞에 ${queueStatus.position}건, 약 ${Math.ceil(queueStatus.waitSeconds)}초)`
+                          : undefined
+                    }
+                  />
                 ) : (
                   <div className="flex justify-center pt-4">
                     <Button
@@ -0,0 +1,43 @@
+"""
+Gunicorn configuration (production)
+
+Startup profile:
+- preload_app imports the app once in the master so workers fork with Flask,
+  Stripe and the routes already loaded. Nothing fork-unsafe is created at
+  import time: SQLite connections are opened per call, the rembg ONNX session
+  and background threads (metrics flusher, log listener) start per process.
+- post_worker_init warms each worker (provider SDKs, rembg model, DB schemas)
+  before it accepts connections; see services/warmup_service.py.
+
+Every setting can be overridden with an environment variable.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+
+def on_starting(server):
+    # Metric snapshots from a previous master run would be merged into /metrics forever
+    from services.metrics_service import registry
+    if registry.directory and os.path.isdir(registry.directory):
+        for name in os.listdir(registry.directory):
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(registry.directory, name))
+                except OSError:
+                    pass
+
+
+def post_worker_init(worker):
+    from services.warmup_service import warm_up
+    from services.maintenance_service import maintenance_scheduler
+    from services.stripe_inbox_service import inbox_worker
+    warm_up()
+    # Picks up webhook events left pending by a previous worker
+    inbox_worker.start()
+    # Only the worker that wins the host-wide lock actually schedules it
+    maintenance_scheduler.start()
@@ -1,20 +1,57 @@
+import logging
 import os
-import base64
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
+from services.admission_service import admission_controlled, detach_admission, get_client_id
+from services.idempotency_service import CoalesceTimeout, fitting_coalescer, idempotent
+from services.metrics_service import (
+    stage_timer, record_provider_result, classify_provider_error, fitting_inputs_rejected_total,
+)
+from services.tracing_service import span, set_attribute
+
+logger = logging.getLogger(__name__)
 
 api_bp = Blueprint('api', __name__)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
 
+# Reject blurry / tiny / dark / person-less uploads (422; skipQualityCheck=true skips the heuristic checks)
+INPUT_QUALITY_CHECK = os.getenv('INPUT_QUALITY_CHECK', 'true').lower() == 'true'
+# Reject uploads whose garment clearly isn't the requested category (409; resend with confirmCategory=true to override).
+# Off by default: on held-out photos the classifier is confidently wrong too often (see benchmarks/garment_classifier_bench.py);
+# category=auto uses it either way
+GARMENT_CATEGORY_CHECK = os.getenv('GARMENT_CATEGORY_CHECK', 'false').lower() == 'true'
+CATEGORY_MISMATCH_MESSAGES = {
+    'upper_body': '상의 사진으로 보입니다. 카테고리를 확인해주세요.',
+    'lower_body': '하의 사진으로 보입니다. 카테고리를 확인해주세요.',
+    'dress': '원피스 사진으로 보입니다. 카테고리를 확인해주세요.',
+}
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _credit_identity():
+    """(ip, user_agent) for CreditsService: the user_key cookie if set (user_agent ''), else IP + UA"""
+    # Prefer cookie-based user_key for consistency
+    user_key = request.cookies.get('user_key')
+    if user_key:
+        # Use cookie user_key directly (bypass IP+UA hashing)
+        logger.info(f"[virtual-fitting] Using cookie user_key: {user_key}")
+        return user_key, ''
+    # Fallback to IP + UA
+    ip = request.headers.get('X-Forwarded-For', request.remote_addr or '127.0.0.1')
+    logger.info(f"[virtual-fitting] No cookie - using IP+UA: {ip}")
+    return ip, request.headers.get('User-Agent', '')
+
 @api_bp.route('/virtual-fitting', methods=['POST'])
+@admission_controlled
+@idempotent('virtual_fitting')
 def virtual_fitting():
     """
     Optimized AI pipeline for virtual fashion fitting
     With monetization: 3 free tries/day, then paid credits
+    Admission control (rate limits / in-flight cap) runs before the body is read;
+    a retry with the same Idempotency-Key gets the stored response
     """
     # Initialize variables for exception handler
     credits_service = None
@@ -23,6 +60,10 @@ def virtual_fitting():
     info = None
     
     try:
+        # Parse the multipart body (the upload itself) in its own span
+        with span('upload'):
+            request.files
+        
         # Check if files are present (validate first before credit check)
         if 'userPhoto' not in request.files or 'clothingPhoto' not in request.files:
             return jsonify({'error': 'Both userPhoto and clothingPhoto are required'}), 400
@@ -45,22 +86,68 @@ def virtual_fitting():
             from PIL import Image
             import io
             
-            # Test if images can be opened
-            user_img = Image.open(io.BytesIO(user_photo_bytes))
-            clothing_img = Image.open(io.BytesIO(clothing_photo_bytes))
-            
-            # Verify images are valid
-            user_img.verify()
-            clothing_img.verify()
+            with stage_timer('validation'):
+                # Test if images can be opened
+                user_img = Image.open(io.BytesIO(user_photo_bytes))
+                clothing_img = Image.open(io.BytesIO(clothing_photo_bytes))
+                
+                # Verify images are valid
+                user_img.verify()
+                clothing_img.verify()
             
-            print(f"✓ Image validation passed: user={user_img.format}, clothing={clothing_img.format}")
+            logger.info(f"Image validation passed: user={user_img.format}, clothing={clothing_img.format}")
         except Exception as e:
-            print(f"✗ Image validation failed: {str(e)}")
+            logger.warning(f"Image validation failed: {str(e)}")
             return jsonify({
                 'error': 'Invalid image format',
                 'message': '이미지 형식이 올바르지 않습니다. 다른 사진을 시도해주세요.'
             }), 400
         
+        # Reject hopeless inputs in milliseconds instead of after a provider timeout
+        if INPUT_QUALITY_CHECK:
+            from services.input_quality import check_inputs, HEURISTIC_CODES
+            skip_heuristics = request.form.get('skipQualityCheck', 'false').lower() == 'true'
+            with stage_timer('quality_gate'):
+                issues = check_inputs(user_photo_bytes, clothing_photo_bytes, skip_heuristics=skip_heuristics)
+            if issues:
+                for issue in issues:
+                    fitting_inputs_rejected_total.inc(reason=issue['code'])
+                logger.info("Input quality gate rejected upload", extra={'issues': [i['code'] for i in issues]})
+                return jsonify({
+                    'error': 'Input quality too low',
+                    'quality_issues': issues,
+                    # Only heuristic findings: the client may offer to resend with skipQualityCheck=true
+                    'skippable': all(issue['code'] in HEURISTIC_CODES for issue in issues),
+                    'message': issues[0]['message']
+                }), 422
+        
+        # Determine clothing category (default to upper_body; 'auto' uses the detected one)
+        category = request.form.get('category', 'upper_body')
+        if category not in ('upper_body', 'lower_body', 'dress', 'auto'):
+            return jsonify({'error': f'Unsupported category: {category}. Only upper_body, lower_body, dress are supported.'}), 400
+        
+        # Check the garment silhouette against the category before any credit or provider time is spent
+        if GARMENT_CATEGORY_CHECK or category == 'auto':
+            from services.garment_classifier import check_category
+            with stage_timer('classify'):
+                garment = check_category(clothing_photo_bytes, category)
+            set_attribute('fitting.detected_category', garment['category'] or 'unknown')
+            if category == 'auto':
+                category = garment['category'] or 'upper_body'
+            elif garment['mismatch'] and request.form.get('confirmCategory', 'false').lower() != 'true':
+                fitting_inputs_rejected_total.inc(reason='category_mismatch')
+                logger.info("Garment category mismatch", extra={'requested': category,
+                                                                 'detected': garment['category'],
+                                                                 'confidence': garment['confidence']})
+                return jsonify({
+                    'error': 'Category mismatch',
+                    'category_mismatch': True,
+                    'requested_category': category,
+                    'detected_category': garment['category'],
+                    'confidence': garment['confidence'],
+                    'message': CATEGORY_MISMATCH_MESSAGES[garment['category']]
+                }), 409
+        
         # Import credits service
         from services.credits_service import CreditsService
         credits_service = CreditsService()
@@ -69,23 +156,10 @@ def virtual_fitting():
         request_hash = credits_service.calculate_request_hash(user_photo_bytes, clothing_photo_bytes)
         
         # Check user's credit status with refitting detection
-        # Prefer cookie-based user_key for consistency
-        user_key = request.cookies.get('user_key')
+        ip, user_agent = _credit_identity()
         
-        if user_key:
-            # Use cookie user_key directly (bypass IP+UA hashing)
-            print(f"[virtual-fitting] Using cookie user_key: {user_key}")
-            # We need to pass something to check_and_consume, but we'll modify it to accept user_key
-            # For now, let's use a placeholder
-            ip = user_key  # Use user_key as "ip" parameter
-            user_agent = ''
-        else:
-            # Fallback to IP + UA
-            ip = request.headers.get('X-Forwarded-For', request.remote_addr or '127.0.0.1')
-            user_agent = request.headers.get('User-Agent', '')
-            print(f"[virtual-fitting] No cookie - using IP+UA: {ip}")
-        
-        allowed, info = credits_service.check_and_consume(ip, user_agent, request_hash)
+        with stage_timer('credit_check'):
+            allowed, info = credits_service.check_and_consume(ip, user_agent, request_hash)
         
         if not allowed:
             # Check if it's a refit limit error
@@ -109,139 +183,109 @@ def virtual_fitting():
         
         # Log credit usage
         if info.get('is_refitting'):
-            print(f"✓ REFITTING (no charge): remaining_free={info['remaining_free']}, credits={info['credits']}")
+            logger.info("Refitting (no charge)", extra={'remaining_free': info['remaining_free'], 'credits': info['credits']})
         else:
-            print(f"✓ Credit consumed ({info['used_type']}): remaining_free={info['remaining_free']}, credits={info['credits']}")
-        
-        print(f"User photo size: {len(user_photo_bytes)} bytes")
-        print(f"Clothing photo size: {len(clothing_photo_bytes)} bytes")
+            logger.info("Credit consumed", extra={'used_type': info['used_type'],
+                                                  'remaining_free': info['remaining_free'], 'credits': info['credits']})
         
-        # Lazy import heavy AI packages (only when endpoint is called)
-        from services.replicate_service import ReplicateService
-        from services.background_removal_service import BackgroundRemovalService
+        logger.debug("Input photos received", extra={'user_photo_bytes': len(user_photo_bytes),
+                                                     'clothing_photo_bytes': len(clothing_photo_bytes)})
         
-        # Initialize services
-        replicate_service = ReplicateService(current_app.config['REPLICATE_API_TOKEN'])
-        background_removal_service = BackgroundRemovalService(current_app.config['REPLICATE_API_TOKEN'])
-        
-        # Check if background removal is requested
         remove_bg = request.form.get('removeBackground', 'false').lower() == 'true'
-        
-        # Prepare clothing image bytes (with optional background removal)
-        clothing_final_bytes = clothing_photo_bytes
-        
-        # Optional: Remove background from clothing image
-        if remove_bg:
-            try:
-                print("Removing background from clothing image...")
-                clothing_data_url = f"data:image/png;base64,{base64.b64encode(clothing_photo_bytes).decode('utf-8')}"
-                
-                bg_removed_url = background_removal_service.remove_background(clothing_data_url)
-                if bg_removed_url:
-                    # Convert data URL back to bytes
-                    bg_removed_b64 = bg_removed_url.split(',')[1]
-                    clothing_final_bytes = base64.b64decode(bg_removed_b64)
-                    print(f"✓ Background removed successfully, new size: {len(clothing_final_bytes)} bytes")
-            except Exception as e:
-                print(f"✗ Background removal failed, using original image: {e}")
-        
-        # Determine clothing category (default to upper_body)
-        category = request.form.get('category', 'upper_body')
-        
-        # Get quality setting (fast or high)
         quality = request.form.get('quality', 'high')
-        print(f"Quality mode: {quality}")
-        
-        # Resize images for fast mode
-        if quality == 'fast':
-            print("⚡ Fast mode: Resizing images to 600x800...")
-            from PIL import Image
-            import io
-            
-            # Resize user photo
-            user_img = Image.open(io.BytesIO(user_photo_bytes))
-            # Convert RGBA to RGB if necessary
-            if user_img.mode in ('RGBA', 'LA', 'P'):
-                user_img = user_img.convert('RGB')
-            user_img.thumbnail((600, 800), Image.Resampling.LANCZOS)
-            user_buffer = io.BytesIO()
-            user_img.save(user_buffer, format='JPEG', quality=85)
-            user_photo_bytes = user_buffer.getvalue()
-            print(f"User photo resized: {len(user_photo_bytes)} bytes")
-            
-            # Resize clothing photo
-            clothing_img = Image.open(io.BytesIO(clothing_final_bytes))
-            # Convert RGBA to RGB if necessary
-            if clothing_img.mode in ('RGBA', 'LA', 'P'):
-                clothing_img = clothing_img.convert('RGB')
-            clothing_img.thumbnail((600, 800), Image.Resampling.LANCZOS)
-            clothing_buffer = io.BytesIO()
-            clothing_img.save(clothing_buffer, format='JPEG', quality=85)
-            clothing_final_bytes = clothing_buffer.getvalue()
-            print(f"Clothing photo resized: {len(clothing_final_bytes)} bytes")
-        
-        # Smart Category-Based AI Routing
-        stage1_result = None
-        method_used = "unknown"
-        
-        # Support only: upper_body, lower_body, dress
-        if category in ['upper_body', 'lower_body', 'dress']:
+        logger.info(f"Quality mode: {quality}")
+        provider_config = {'gemini_api_key': current_app.config.get('GEMINI_API_KEY'),
+                           'replicate_api_token': current_app.config.get('REPLICATE_API_TOKEN')}
+        
+        # Progressive mode: fast preview + high-quality result as a background job on this one credit
+        if request.form.get('progressive', 'false').lower() == 'true':
+            from services.fitting_jobs import start_progressive_job
+            job = start_progressive_job(
+                client_id=get_client_id(),
+                charge={'ip': ip, 'user_agent': user_agent, 'used_type': info.get('used_type', 'free'),
+                        'is_refitting': bool(info.get('is_refitting')), 'client_id': get_client_id()},
+                user_photo_bytes=user_photo_bytes, clothing_bytes=clothing_photo_bytes, category=category,
+                remove_bg=remove_bg, accept=request.headers.get('Accept', ''),
+                result_format=request.form.get('resultFormat'), provider_config=provider_config,
+                release=detach_admission())
+            set_attribute('fitting.job_id', job['job_id'])
+            return jsonify({
+                'success': True,
+                'status': 'running',
+                'job_id': job['job_id'],
+                'status_url': f"/api/fitting-jobs/{job['job_id']}",
+                'credits_info': {
+                    'remaining_free': info['remaining_free'],
+                    'credits': info['credits'],
+                    'is_refitting': info.get('is_refitting', False),
+                    'refit_count': info.get('refit_count', 0)
+                }
+            }), 202
+        
+        from services.fitting_pipeline import remove_background, generate
+        
+        # A result pre-generated while the user browsed the brand room (see services/speculative_fitting.py)
+        generated = None
+        catalog_item_id = request.form.get('catalogItemId')
+        if catalog_item_id and not remove_bg:
+            from services.speculative_fitting import claim
+            generated = claim(get_client_id(), user_photo_bytes, catalog_item_id, category, quality)
+            set_attribute('fitting.speculative_hit', generated is not None)
+        
+        if generated is None:
+            from services.fitting_scheduler import lane_for
             
-            # 1st Priority: Gemini 2.5 Flash (Best quality, preserves hands/objects)
-            gemini_api_key = current_app.config.get('GEMINI_API_KEY')
-            if gemini_api_key:
-                print(f"\n=== {category}: Using Gemini 2.5 Flash (quality-first) ===")
-                try:
-                    from services.gemini_virtual_fitting_service import GeminiVirtualFittingService
-                    gemini_service = GeminiVirtualFittingService(gemini_api_key)
-                    stage1_result = gemini_service.virtual_try_on(
-                        user_photo_bytes,
-                        clothing_final_bytes,
-                        category=category
-                    )
-                    if stage1_result:
-                        method_used = "Gemini 2.5 Flash Image"
-                        print(f"✓ Gemini succeeded for {category}")
-                except Exception as e:
-                    print(f"✗ Gemini failed: {str(e)}")
+            def run_providers():
+                # Optional: Remove background from clothing image
+                clothing_final_bytes = remove_background(clothing_photo_bytes) if remove_bg else clothing_photo_bytes
+                
+                # Smart Category-Based AI Routing (paid credits queue ahead of free tries)
+                return generate(user_photo_bytes, clothing_final_bytes, category, quality,
+                                lane=lane_for(info.get('used_type')), user_key=get_client_id(), **provider_config)
             
-            # 2nd Priority: IDM-VTON (Fallback)
-            if not stage1_result:
-                print(f"\n=== Fallback: IDM-VTON for {category} ===")
-                replicate_category = 'dresses' if category == 'dress' else category
-                try:
-                    stage1_result = replicate_service.virtual_try_on(
-                        user_photo_bytes, 
-                        clothing_final_bytes,
-                        category=replicate_category
-                    )
-                    if stage1_result:
-                        method_used = "Replicate IDM-VTON"
-                        print(f"✓ IDM-VTON fallback succeeded")
-                except Exception as e:
-                    print(f"✗ IDM-VTON also failed: {str(e)}")
-        else:
-            return jsonify({'error': f'Unsupported category: {category}. Only upper_body, lower_body, dress are supported.'}), 400
-        
-        if not stage1_result:
+            # A double-tap or retry still running on this worker shares the first request's generation
+            try:
+                generated = fitting_coalescer.run((get_client_id(), request_hash, category, quality, remove_bg),
+                                                  run_providers)
+            except CoalesceTimeout as e:
+                if not info.get('is_refitting'):
+                    credits_service.refund_credit(ip, user_agent, info.get('used_type', 'free'))
+                response = jsonify({'error': 'An identical request is still running, please retry'})
+                response.status_code = 503
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+            queue = generated.get('queue') if generated else None
+            set_attribute('fitting.queue_wait_seconds', queue['waited_seconds'] if queue else None)
+        
+        if not generated:
             # AI generation failed - refund credit
             if not info.get('is_refitting'):
                 # Only refund if it was not a refitting (refitting doesn't consume credits)
                 credits_service.refund_credit(ip, user_agent, info.get('used_type', 'free'))
-                print(f"💔 AI generation failed - credit refunded")
+                logger.warning(f"AI generation failed - credit refunded")
             return jsonify({'error': f'All virtual fitting methods failed for category: {category}'}), 500
         
-        print(f"✓ Virtual fitting completed using: {method_used}")
+        stage1_result, method_used = generated['result'], generated['method']
+        logger.info("Virtual fitting completed", extra={'method': method_used, 'category': category, 'quality': quality})
+        set_attribute('fitting.method', method_used)
+        set_attribute('fitting.category', category)
+        set_attribute('fitting.quality', quality)
         
         # No Stage 2 enhancement needed - CatVTON results are already optimal
-        final_result = stage1_result
+        # Encode once for the client: resultFormat field, then Accept, then WebP
+        from services.result_encoding import encode_result
+        with stage_timer('result_encode'):
+            final_result, encoding = encode_result(stage1_result, request.headers.get('Accept', ''),
+                                                   request.form.get('resultFormat'))
+        set_attribute('fitting.result_format', encoding.get('format', 'url'))
         
         return jsonify({
             'success': True,
             'resultUrl': final_result,
-            'stage1_url': stage1_result,
+            'resultFormat': encoding.get('mimetype'),
             'method': method_used,
             'status': 'completed',
+            'queue': generated.get('queue'),
             'credits_info': {
                 'remaining_free': info['remaining_free'],
                 'credits': info['credits'],
@@ -254,9 +298,207 @@ def virtual_fitting():
         # Unexpected error - refund credit
         if credits_service and ip and info and not info.get('is_refitting'):
             credits_service.refund_credit(ip, user_agent or '', info.get('used_type', 'free'))
-            print(f"💔 Unexpected error - credit refunded")
+            logger.warning(f"Unexpected error - credit refunded")
         return jsonify({'error': str(e)}), 500
 
+def _prepare_batch_garment(index, clothing_bytes, category, skip_heuristics, confirm_category):
+    """A batch item for an uploaded garment, with 'rejected' set when it fails the pre-flight checks"""
+    item = {'index': index, 'category': category, 'clothing_bytes': clothing_bytes}
+    try:
+        from PIL import Image
+        import io
+        Image.open(io.BytesIO(clothing_bytes)).verify()
+    except Exception:
+        return dict(item, category=category if category != 'auto' else None,
+                    rejected={'error': 'Invalid image format', 'message': '이미지 형식이 올바르지 않습니다.'})
+    if INPUT_QUALITY_CHECK:
+        from services.input_quality import check_image, HEURISTIC_CODES
+        issues = [issue for issue in check_image(clothing_bytes, 'garment')
+                  if not (skip_heuristics and issue['code'] in HEURISTIC_CODES)]
+        if issues:
+            for issue in issues:
+                fitting_inputs_rejected_total.inc(reason=issue['code'])
+            return dict(item, category=category if category != 'auto' else None,
+                        rejected={'error': 'Input quality too low', 'quality_issues': issues,
+                                  'message': issues[0]['message']})
+    if GARMENT_CATEGORY_CHECK or category == 'auto':
+        from services.garment_classifier import check_category
+        garment = check_category(clothing_bytes, category)
+        if category == 'auto':
+            item['category'] = garment['category'] or 'upper_body'
+        elif garment['mismatch'] and not confirm_category:
+            fitting_inputs_rejected_total.inc(reason='category_mismatch')
+            item['rejected'] = {'error': 'Category mismatch', 'category_mismatch': True,
+                                'detected_category': garment['category'], 'confidence': garment['confidence'],
+                                'message': CATEGORY_MISMATCH_MESSAGES[garment['category']]}
+    return item
+
+@api_bp.route('/virtual-fitting/batch', methods=['POST'])
+@admission_controlled
+def virtual_fitting_batch():
+    """
+    One person photo against several garments, streamed as NDJSON as each finishes
+    Garments: clothingPhoto files (+ categories, one per file, default auto)
+    and/or itemId catalog items; credits are charged per successful item
+    """
+    from services.fitting_batch import BATCH_MAX_ITEMS, load_catalog_garment, run_batch, ndjson
+
+    with span('upload'):
+        request.files
+
+    user_photo = request.files.get('userPhoto')
+    if user_photo is None or user_photo.filename == '' or not allowed_file(user_photo.filename):
+        return jsonify({'error': 'A valid userPhoto is required'}), 400
+    user_photo_bytes = user_photo.read()
+    try:
+        from PIL import Image
+        import io
+        Image.open(io.BytesIO(user_photo_bytes)).verify()
+    except Exception:
+        return jsonify({'error': 'Invalid image format',
+                        'message': '이미지 형식이 올바르지 않습니다. 다른 사진을 시도해주세요.'}), 400
+
+    skip_heuristics = request.form.get('skipQualityCheck', 'false').lower() == 'true'
+    if INPUT_QUALITY_CHECK:
+        from services.input_quality import check_image, HEURISTIC_CODES
+        with stage_timer('quality_gate'):
+            issues = [issue for issue in check_image(user_photo_bytes, 'person')
+                      if not (skip_heuristics and issue['code'] in HEURISTIC_CODES)]
+        if issues:
+            for issue in issues:
+                fitting_inputs_rejected_total.inc(reason=issue['code'])
+            return jsonify({'error': 'Input quality too low', 'quality_issues': issues,
+                            'message': issues[0]['message']}), 422
+
+    clothing_photos = [f for f in request.files.getlist('clothingPhoto') if f.filename]
+    categories = request.form.getlist('categories')
+    item_ids = [i for value in request.form.getlist('itemId') for i in value.split(',') if i.strip()]
+    if not clothing_photos and not item_ids:
+        return jsonify({'error': 'At least one clothingPhoto or itemId is required'}), 400
+    if len(clothing_photos) + len(item_ids) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {BATCH_MAX_ITEMS} garments per batch'}), 400
+
+    confirm_category = request.form.get('confirmCategory', 'false').lower() == 'true'
+    items = []
+    with stage_timer('validation'):
+        for index, clothing_photo in enumerate(clothing_photos):
+            category = categories[index] if index < len(categories) and categories[index] else 'auto'
+            if category not in ('upper_body', 'lower_body', 'dress', 'auto'):
+                return jsonify({'error': f'Unsupported category: {category}. Only upper_body, lower_body, dress are supported.'}), 400
+            if not allowed_file(clothing_photo.filename):
+                return jsonify({'error': 'Invalid file type'}), 400
+            items.append(_prepare_batch_garment(index, clothing_photo.read(), category,
+                                                skip_heuristics, confirm_category))
+        for item_id in item_ids:
+            index = len(items)
+            garment = load_catalog_garment(item_id.strip())
+            if garment is None:
+                items.append({'index': index, 'item_id': item_id.strip(), 'category': None,
+                              'rejected': {'error': 'Item not found', 'message': '상품을 찾을 수 없습니다.'}})
+            elif garment['clothing_bytes'] is None:
+                items.append(dict(garment, index=index, rejected={'error': 'Item image unavailable',
+                                                                  'message': '이 상품은 아직 피팅할 수 없습니다.'}))
+            else:
+                items.append(dict(garment, index=index))
+    set_attribute('fitting.batch_items', len(items))
+
+    ip, user_agent = _credit_identity()
+    events = run_batch(
+        user_photo_bytes, items, {'ip': ip, 'user_agent': user_agent, 'client_id': get_client_id()},
+        quality=request.form.get('quality', 'high'),
+        remove_bg=request.form.get('removeBackground', 'false').lower() == 'true',
+        accept=request.headers.get('Accept', ''), result_format=request.form.get('resultFormat'),
+        provider_config={'gemini_api_key': current_app.config.get('GEMINI_API_KEY'),
+                         'replicate_api_token': current_app.config.get('REPLICATE_API_TOKEN')})
+    # The stream outlives this view: keep the admission slot until it ends
+    release = detach_admission()
+    response = current_app.response_class(ndjson(events, on_close=release), mimetype='application/x-ndjson')
+    response.call_on_close(release)
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_bp.route('/speculative-fittings', methods=['POST'])
+@admission_controlled
+def speculative_fittings():
+    """
+    Opt-in: pre-generate the first items of a brand room with the user's saved photo
+    Low priority and budgeted per user and deployment-wide; results are only charged when tried on
+    """
+    from services import speculative_fitting
+    if not speculative_fitting.ENABLED:
+        return jsonify({'error': 'Speculative fitting is disabled'}), 404
+    
+    user_photo = request.files.get('userPhoto')
+    brand_id = request.form.get('brandId', '')
+    if user_photo is None or not allowed_file(user_photo.filename) or not brand_id:
+        return jsonify({'error': 'userPhoto and brandId are required'}), 400
+    user_photo_bytes = user_photo.read()
+    try:
+        from PIL import Image
+        import io
+        Image.open(io.BytesIO(user_photo_bytes)).verify()
+    except Exception:
+        return jsonify({'error': 'Invalid image format'}), 400
+    if INPUT_QUALITY_CHECK:
+        # Only hard failures: the user never sees this request, so no warnings to confirm
+        from services.input_quality import check_image, HEURISTIC_CODES
+        if [issue for issue in check_image(user_photo_bytes, 'person') if issue['code'] not in HEURISTIC_CODES]:
+            return jsonify({'scheduled': [], 'skipped': 'input_quality'}), 200
+    
+    from services.catalog_service import get_brand
+    if get_brand(brand_id) is None:
+        return jsonify({'error': 'Brand not found'}), 404
+    
+    result = speculative_fitting.schedule(
+        get_client_id(), user_photo_bytes, brand_id,
+        {'gemini_api_key': current_app.config.get('GEMINI_API_KEY'),
+         'replicate_api_token': current_app.config.get('REPLICATE_API_TOKEN')})
+    return jsonify(result), 202 if result['scheduled'] else 200
+
+@api_bp.route('/fitting-queue', methods=['GET'])
+def fitting_queue():
+    """
+    Where this client's next try-on would queue on the worker answering:
+    its lane (paid once the free tries are used up), position and estimated wait
+    """
+    from services.credits_service import CreditsService
+    from services.fitting_scheduler import fitting_scheduler
+    ip, user_agent = _credit_identity()
+    credits_service = CreditsService()
+    user_key = ip if user_agent == '' else credits_service.get_user_key(ip, user_agent)
+    balance = credits_service.get_balance(user_key)
+    # check_and_consume spends free tries before paid credits
+    lane = 'paid' if balance.get('remaining_free', 0) == 0 and balance.get('credits', 0) > 0 else 'free'
+    response = jsonify(dict(fitting_scheduler.estimate(lane, get_client_id()), scheduler=fitting_scheduler.snapshot()))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@api_bp.route('/fitting-jobs/<job_id>', methods=['GET'])
+def fitting_job_status(job_id):
+    """
+    Progressive fitting job status; ?since=<version>&wait=<seconds> long-polls
+    until the job changes (preview ready, result ready, finished)
+    """
+    from services.fitting_jobs import wait_for_job, public_view
+    job = wait_for_job(job_id, get_client_id(), since=request.args.get('since', -1, type=int),
+                       timeout=request.args.get('wait', 0, type=float))
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    response = jsonify(public_view(job))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@api_bp.route('/fitting-jobs/<job_id>', methods=['DELETE'])
+@api_bp.route('/fitting-jobs/<job_id>/cancel', methods=['POST'])
+def cancel_fitting_job(job_id):
+    """Cancel a progressive fitting job (POST form for navigator.sendBeacon on page leave)"""
+    from services.fitting_jobs import cancel_job, public_view
+    job = cancel_job(job_id, get_client_id())
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(public_view(job)), 202
+
 @api_bp.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok'})
@@ -290,7 +532,7 @@ def save_fit():
             return jsonify(result), 400
             
     except Exception as e:
-        print(f'Error in save_fit endpoint: {e}')
+        logger.warning(f'Error in save_fit endpoint: {e}')
         return jsonify({'ok': False, 'error': str(e)}), 500
 
 @api_bp.route('/saved-fits', methods=['GET'])
@@ -301,10 +543,10 @@ def get_saved_fits():
         
         # Get user_key from cookie
         user_key = request.cookies.get('user_key')
-        print(f'[/api/saved-fits] user_key from cookie: {user_key}')
+        logger.info(f'[/api/saved-fits] user_key from cookie: {user_key}')
         
         if not user_key:
-            print('[/api/saved-fits] No user_key cookie found, returning empty result')
+            logger.info('[/api/saved-fits] No user_key cookie found, returning empty result')
             return jsonify({'items': [], 'total': 0, 'page': 1, 'per_page': 20}), 200
         
         # Get query parameters
@@ -312,19 +554,17 @@ def get_saved_fits():
         per_page = int(request.args.get('per_page', 20))
         query = request.args.get('q')
         
-        print(f'[/api/saved-fits] Fetching saved fits: user_key={user_key}, page={page}, per_page={per_page}, query={query}')
+        logger.info(f'[/api/saved-fits] Fetching saved fits: user_key={user_key}, page={page}, per_page={per_page}, query={query}')
         
         # Get saved fits
         result = get_fits_service(user_key, page, per_page, query)
         
-        print(f'[/api/saved-fits] Result: total={result.get("total", 0)}, items_count={len(result.get("items", []))}')
+        logger.info(f'[/api/saved-fits] Result: total={result.get("total", 0)}, items_count={len(result.get("items", []))}')
         
         return jsonify(result), 200
         
     except Exception as e:
-        print(f'Error in get_saved_fits endpoint: {e}')
-        import traceback
-        traceback.print_exc()
+        logger.exception(f'Error in get_saved_fits endpoint: {e}')
         return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/saved-fits/<fit_id>', methods=['GET'])
@@ -347,7 +587,7 @@ def get_fit_detail(fit_id):
             return jsonify({'error': 'Fit not found'}), 404
             
     except Exception as e:
-        print(f'Error in get_fit_detail endpoint: {e}')
+        logger.warning(f'Error in get_fit_detail endpoint: {e}')
         return jsonify({'error': str(e)}), 500
 
 @api_bp.route('/saved-fits/<fit_id>', methods=['DELETE'])
@@ -370,7 +610,7 @@ def delete_saved_fit(fit_id):
             return jsonify(result), 404
             
     except Exception as e:
-        print(f'Error in delete_saved_fit endpoint: {e}')
+        logger.warning(f'Error in delete_saved_fit endpoint: {e}')
         return jsonify({'ok': False, 'error': str(e)}), 500
 
 @api_bp.route('/share-reward', methods=['POST'])
@@ -380,9 +620,7 @@ def share_reward():
     Rewards +5 credits per share (max 1 reward per day per platform)
     """
     try:
-        from services.credits_service import CreditsService
-        from datetime import datetime, timedelta
-        import sqlite3
+        from services.credits_service import CreditsService, SHARE_REWARD_CREDITS
         
         # Validate request body
         data = request.get_json()
@@ -404,41 +642,16 @@ def share_reward():
         
         # Get user identification
         user_key = request.cookies.get('user_key')
+        credits_service = CreditsService()
         
         # Fallback to IP + UA if no cookie
         if not user_key:
             ip = request.headers.get('X-Forwarded-For', request.remote_addr or '127.0.0.1')
             user_agent = request.headers.get('User-Agent', '')
-            credits_service = CreditsService()
             user_key = credits_service.get_user_key(ip, user_agent)
         
-        # Initialize share tracking DB
-        conn = sqlite3.connect('credits.db')
-        c = conn.cursor()
-        
-        # Create share_log table if not exists
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS share_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_key TEXT NOT NULL,
-                platform TEXT NOT NULL,
-                shared_at TEXT NOT NULL,
-                credits_rewarded INTEGER DEFAULT 5
-            )
-        ''')
-        conn.commit()
-        
-        # Check if user already shared on this platform today
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-        c.execute('''
-            SELECT COUNT(*) FROM share_log 
-            WHERE user_key = ? AND platform = ? AND shared_at >= ?
-        ''', (user_key, platform, today_start))
-        
-        share_count_today = c.fetchone()[0]
-        
-        if share_count_today > 0:
-            conn.close()
+        # Log the share and add credits in one transaction (once per platform per day)
+        if not credits_service.reward_share(user_key, platform, SHARE_REWARD_CREDITS):
             return jsonify({
                 'success': False,
                 'message': '오늘 이미 이 플랫폼에서 보상을 받으셨습니다',
@@ -446,32 +659,15 @@ def share_reward():
                 'already_rewarded': True
             }), 200
         
-        # Log the share
-        now = datetime.now().isoformat()
-        c.execute('''
-            INSERT INTO share_log (user_key, platform, shared_at, credits_rewarded)
-            VALUES (?, ?, ?, 5)
-        ''', (user_key, platform, now))
-        conn.commit()
-        conn.close()
-        
-        # Add credits
-        credits_service = CreditsService()
-        credits_service.add_credits(user_key, 5)
-        
-        print(f"✅ Share reward: user={user_key}, platform={platform}, +5 credits")
-        
         return jsonify({
             'success': True,
             'message': '공유 감사합니다! +5 크레딧이 지급되었습니다',
-            'credits_added': 5,
+            'credits_added': SHARE_REWARD_CREDITS,
             'platform': platform
         }), 200
         
     except Exception as e:
-        print(f'Error in share_reward endpoint: {e}')
-        import traceback
-        traceback.print_exc()
+        logger.exception(f'Error in share_reward endpoint: {e}')
         return jsonify({
             'success': False,
             'error': str(e),
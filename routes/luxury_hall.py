@@ -1,102 +1,36 @@
 """
 Luxury Hall Routes - Premium Brand Virtual Fitting Rooms
 """
-from flask import Blueprint, render_template, jsonify, request
-import os
+from flask import Blueprint, render_template, jsonify, request, current_app
+from services import catalog_service as catalog
+from services.image_variants import image_srcset, image_variant_url
 
 luxury_hall_bp = Blueprint('luxury_hall', __name__)
 
-# Brand configuration
-BRANDS = {
-    # Youth Category
-    'miu_miu': {
-        'name': 'Miu Miu',
-        'description': '젊고 감각적인 프라다의 세컨드 라인',
-        'category': 'youth',
-        'theme_color': '#FF69B4'
-    },
-    'off_white': {
-        'name': 'Off-White',
-        'description': '스트리트 럭셔리의 대명사',
-        'category': 'youth',
-        'theme_color': '#FF69B4'
-    },
-    'diesel': {
-        'name': 'Diesel',
-        'description': '이탈리아 감성의 데님 전문 브랜드',
-        'category': 'youth',
-        'theme_color': '#FF69B4'
-    },
-    
-    # Modern Category
-    'dior': {
-        'name': 'Dior',
-        'description': '프랑스 오트 쿠튀르의 상징',
-        'category': 'modern',
-        'theme_color': '#C9A961'
-    },
-    'chanel': {
-        'name': 'Chanel',
-        'description': '영원한 우아함의 대명사',
-        'category': 'modern',
-        'theme_color': '#C9A961'
-    },
-    'gucci': {
-        'name': 'Gucci',
-        'description': '이탈리아 장인정신의 결정체',
-        'category': 'modern',
-        'theme_color': '#C9A961'
-    },
-    
-    # Classic Category
-    'hermes': {
-        'name': 'Hermès',
-        'description': '프랑스 최고급 가죽 명가',
-        'category': 'classic',
-        'theme_color': '#8B7355'
-    },
-    'max_mara': {
-        'name': 'Max Mara',
-        'description': '이탈리아 정통 럭셔리 패션',
-        'category': 'classic',
-        'theme_color': '#8B7355'
-    },
-    'burberry': {
-        'name': 'Burberry',
-        'description': '영국 전통의 트렌치코트 명가',
-        'category': 'classic',
-        'theme_color': '#8B7355'
-    }
-}
+# Items rendered per category on a room page; the rest load from the items API
+ROOM_ITEMS_PER_CATEGORY = 24
+# Clothing cards: two columns on phones, ~300px wide otherwise
+ROOM_IMAGE_SIZES = '(max-width: 640px) 45vw, 300px'
 
-def get_sample_items(brand_id, category):
-    """
-    Get sample clothing items for a brand category.
-    Uses stock images for demonstration - will be expanded with more items.
-    """
-    items = []
-    
-    # Sample items with AI-generated clothing images (fully unfolded, not cropped, no models)
-    if category == 'tops':
-        items = [
-            {'name': '엘레강스 블라우스', 'category': '상의', 'image': '/attached_assets/generated_images/white_silk_blouse_unfolded_92f28411.png'},
-            {'name': '실크 셔츠', 'category': '상의', 'image': '/attached_assets/generated_images/cream_shirt_unfolded_complete_e1c04150.png'},
-            {'name': '클래식 탑', 'category': '상의', 'image': 'https://via.placeholder.com/300x400/FFFFFF/000000?text=Coming+Soon'},
-        ]
-    elif category == 'bottoms':
-        items = [
-            {'name': '테일러드 팬츠', 'category': '하의', 'image': '/attached_assets/generated_images/black_pants_fully_extended_f0786d3e.png'},
-            {'name': '슬랙스 팬츠', 'category': '하의', 'image': '/attached_assets/generated_images/navy_trousers_fully_extended_5da62e11.png'},
-            {'name': '데님 진', 'category': '하의', 'image': 'https://via.placeholder.com/300x400/FFFFFF/000000?text=Coming+Soon'},
-        ]
-    elif category == 'dresses':
-        items = [
-            {'name': '이브닝 드레스', 'category': '원피스', 'image': '/attached_assets/generated_images/black_evening_dress_complete_62275feb.png'},
-            {'name': '캐주얼 원피스', 'category': '원피스', 'image': 'https://via.placeholder.com/300x400/FFFFFF/000000?text=Coming+Soon'},
-            {'name': '트렌치 코트', 'category': '코트', 'image': 'https://via.placeholder.com/300x400/FFFFFF/000000?text=Coming+Soon'},
-        ]
-    
-    return items
+def _cached_response(key, render, mimetype):
+    """Serve a body from the catalog page cache with a weak ETag (304 when unchanged)"""
+    body, etag = catalog.page_cache.get(key, render)
+    response = current_app.response_class(body, mimetype=mimetype)
+    # Weak: the same entity whether or not it is compressed on the way out
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
+
+def _cached_json(key, build):
+    return _cached_response(key, lambda: current_app.json.dumps(build()), 'application/json')
+
+def _page_args():
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 24))
+    except ValueError:
+        page, per_page = 1, 24
+    return max(1, page), max(1, min(per_page, catalog.MAX_PER_PAGE))
 
 @luxury_hall_bp.route('/luxury_hall')
 def luxury_hall():
@@ -105,36 +39,69 @@ def luxury_hall():
 
 @luxury_hall_bp.route('/room/<brand_id>')
 def brand_room(brand_id):
-    """Render a specific brand's room page"""
-    if brand_id not in BRANDS:
+    """Render a specific brand's room page (cached per catalog version)"""
+    brand = catalog.get_brand(brand_id)
+    if brand is None:
         return jsonify({'error': 'Brand not found'}), 404
     
-    brand = BRANDS[brand_id]
-    
-    # Get sample items for each category
-    tops = get_sample_items(brand_id, 'tops')
-    bottoms = get_sample_items(brand_id, 'bottoms')
-    dresses = get_sample_items(brand_id, 'dresses')
+    def render():
+        sections = []
+        for category in catalog.list_categories():
+            page = catalog.get_items(brand_id, category['category_id'], per_page=ROOM_ITEMS_PER_CATEGORY)
+            if page['total']:
+                sections.append(dict(category, items=page['items'], total=page['total'],
+                                     has_more=page['total_pages'] > 1))
+        return render_template(
+            'rooms/base_room.html',
+            brand_id=brand_id,
+            brand_name=brand['name'],
+            brand_description=brand['description'],
+            theme_color=brand['theme_color'],
+            sections=sections,
+            per_page=ROOM_ITEMS_PER_CATEGORY,
+            image_sizes=ROOM_IMAGE_SIZES
+        )
     
-    return render_template(
-        'rooms/base_room.html',
-        brand_name=brand['name'],
-        brand_description=brand['description'],
-        theme_color=brand['theme_color'],
-        tops=tops,
-        bottoms=bottoms,
-        dresses=dresses
-    )
+    return _cached_response(('room', brand_id), render, 'text/html')
 
 @luxury_hall_bp.route('/api/luxury/brands')
 def get_brands():
-    """API endpoint to get all brands"""
-    return jsonify(BRANDS)
+    """API endpoint to get all brands (?category=youth|modern|classic for one tab)"""
+    style = request.args.get('category') or None
+    return _cached_json(('brands', style), lambda: catalog.list_brands(style))
 
 @luxury_hall_bp.route('/api/luxury/brand/<brand_id>')
 def get_brand(brand_id):
     """API endpoint to get a specific brand"""
-    if brand_id not in BRANDS:
+    brand = catalog.get_brand(brand_id)
+    if brand is None:
         return jsonify({'error': 'Brand not found'}), 404
     
-    return jsonify(BRANDS[brand_id])
+    return _cached_json(('brand', brand_id), lambda: brand)
+
+@luxury_hall_bp.route('/api/luxury/categories')
+def get_categories():
+    """API endpoint to get clothing categories"""
+    return _cached_json(('categories',), catalog.list_categories)
+
+@luxury_hall_bp.route('/api/luxury/brand/<brand_id>/items')
+def get_brand_items(brand_id):
+    """
+    API endpoint to get a page of a brand's items
+    Query: category (optional), page (1-indexed), per_page (max 100)
+    """
+    if catalog.get_brand(brand_id) is None:
+        return jsonify({'error': 'Brand not found'}), 404
+    
+    category_id = request.args.get('category') or None
+    page, per_page = _page_args()
+    
+    def build():
+        result = catalog.get_items(brand_id, category_id, page, per_page)
+        for item in result['items']:
+            # Responsive variants for attached asset images (see services/image_variants.py)
+            item['srcset'] = image_srcset(item['image'])
+            item['image_480'] = image_variant_url(item['image'], 480)
+        return result
+    
+    return _cached_json(('items', brand_id, category_id, page, per_page), build)
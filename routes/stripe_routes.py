@@ -1,7 +1,14 @@
+import logging
 import os
 import stripe
 from flask import Blueprint, request, jsonify
 from services.credits_service import CreditsService
+from services.metrics_service import db_query_seconds
+from services import stripe_inbox_service as stripe_inbox
+from services.balance_cache import balance_etag
+from services.tracing_service import span
+
+logger = logging.getLogger(__name__)
 
 stripe_bp = Blueprint('stripe', __name__)
 
@@ -13,7 +20,7 @@ credits_service = CreditsService()
 
 # Stripe Configuration
 PRICE_AMOUNT = 200  # $2.00 in cents
-CREDITS_PER_PURCHASE = 10
+CREDITS_PER_PURCHASE = stripe_inbox.CREDITS_PER_PURCHASE
 PRODUCT_NAME = "Virtual Try-On Credits"
 
 @stripe_bp.route('/create-checkout-session', methods=['POST'])
@@ -33,7 +40,7 @@ def create_checkout_session():
         # Use request.url_root which includes the protocol and host
         domain = request.url_root.rstrip('/')  # Remove trailing slash
         
-        print(f"[Stripe] Using domain: {domain}")
+        logger.info(f"[Stripe] Using domain: {domain}")
         
         # Create Stripe Checkout Session
         session = stripe.checkout.Session.create(
@@ -55,9 +62,9 @@ def create_checkout_session():
             client_reference_id=user_key,  # Store user_key for webhook
         )
         
-        print(f"[Stripe] Session created: {session.id}")
-        print(f"[Stripe] Success URL: {domain}/success")
-        print(f"[Stripe] Cancel URL: {domain}/")
+        logger.info(f"[Stripe] Session created: {session.id}")
+        logger.debug(f"[Stripe] Success URL: {domain}/success")
+        logger.debug(f"[Stripe] Cancel URL: {domain}/")
         
         return jsonify({
             'sessionId': session.id,
@@ -69,44 +76,36 @@ def create_checkout_session():
 
 @stripe_bp.route('/webhook', methods=['POST'])
 def stripe_webhook():
-    """Handle Stripe webhooks (payment completion)"""
-    payload = request.data
+    """
+    Receive Stripe webhooks (payment completion)
+    Verified events are stored in the inbox and acknowledged immediately;
+    the inbox worker applies them in the background (see stripe_inbox_service)
+    """
+    payload = request.get_data()
     sig_header = request.headers.get('Stripe-Signature')
     
-    # For testing, if no webhook secret is set, process anyway
-    webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
-    
     try:
-        if webhook_secret:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, webhook_secret
-            )
-        else:
-            # For testing without webhook signature verification
-            import json
-            event = json.loads(payload)
-        
-        # Handle checkout.session.completed
-        if event['type'] == 'checkout.session.completed':
-            session = event['data']['object']
-            user_key = session.get('client_reference_id')
-            
-            if user_key:
-                # Add credits to user
-                credits_service.add_credits(user_key, CREDITS_PER_PURCHASE)
-                print(f"✓ Webhook: Added {CREDITS_PER_PURCHASE} credits to user {user_key}")
-            else:
-                print("✗ Webhook: No user_key in session")
-        
-        return jsonify({'status': 'success'})
+        event = stripe_inbox.construct_event(payload, sig_header)
+    except stripe_inbox.WebhookNotConfigured as e:
+        # Non-2xx makes Stripe redeliver once the secret is configured
+        logger.error(f"Webhook rejected: {e}")
+        return jsonify({'error': 'Webhook not configured'}), 503
+    except (stripe.SignatureVerificationError, ValueError) as e:
+        logger.warning(f"Webhook error: {str(e)}")
+        return jsonify({'error': 'Invalid webhook'}), 400
     
-    except Exception as e:
-        print(f"Webhook error: {str(e)}")
-        return jsonify({'error': str(e)}), 400
+    new = stripe_inbox.record_event(event)
+    if new:
+        stripe_inbox.inbox_worker.notify()
+    
+    return jsonify({'status': 'received', 'duplicate': not new})
 
 @stripe_bp.route('/user-status', methods=['GET'])
 def get_user_status():
-    """Get current user's credit status"""
+    """
+    Get current user's credit status
+    Served from the balance cache; answers 304 when If-None-Match matches the balance
+    """
     try:
         # Check if user_key cookie exists
         user_key_cookie = request.cookies.get('user_key')
@@ -114,34 +113,26 @@ def get_user_status():
         if user_key_cookie:
             # Use cookie-based user_key
             user_key = user_key_cookie
-            print(f"[/stripe/user-status] Using cookie user_key: {user_key}")
+            logger.info(f"[/stripe/user-status] Using cookie user_key: {user_key}")
         else:
             # Generate new user_key from IP + UA
             ip = request.headers.get('X-Forwarded-For', request.remote_addr)
             user_agent = request.headers.get('User-Agent', '')
             user_key = credits_service.get_user_key(ip, user_agent)
-            print(f"[/stripe/user-status] New user - IP: {ip}, UA: {user_agent[:50]}..., user_key: {user_key}")
+            logger.info(f"[/stripe/user-status] New user - IP: {ip}, UA: {user_agent[:50]}..., user_key: {user_key}")
         
-        # Get status directly from DB using user_key
-        import sqlite3
-        conn = sqlite3.connect(credits_service.db_path)
-        c = conn.cursor()
-        c.execute('SELECT free_used_today, credits FROM users WHERE user_key = ?', (user_key,))
-        result = c.fetchone()
-        
-        if result:
-            free_used, credits = result
-            remaining_free = max(0, 3 - free_used)
-            status = {'remaining_free': remaining_free, 'credits': credits}
-        else:
-            status = {'remaining_free': 3, 'credits': 0}
+        with span('db.credits.user_status'), db_query_seconds.time(db='credits', op='user_status'):
+            status = credits_service.get_balance(user_key)
         
-        conn.close()
-        
-        print(f"[/stripe/user-status] user_key={user_key}, status: {status}")
+        logger.info(f"[/stripe/user-status] user_key={user_key}, status: {status}")
         
         # Create response with cookie
         response = jsonify(status)
+        response.set_etag(balance_etag(status))
+        # Per user (cookie) and must be revalidated: balances change after every fitting
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        response.make_conditional(request)
         
         # Set user_key cookie (30 days expiration)
         if not user_key_cookie:
@@ -154,62 +145,44 @@ def get_user_status():
 
 @stripe_bp.route('/complete-purchase', methods=['POST'])
 def complete_purchase():
-    """Complete purchase after Stripe checkout (called from /success page)"""
+    """
+    Complete purchase after Stripe checkout (called from /success page)
+    Answers from the local checkout_sessions table; Stripe is only asked when
+    the webhook hasn't recorded the session yet
+    """
     try:
-        import sqlite3
-        
         data = request.get_json()
         session_id = data.get('session_id')
         
         if not session_id:
             return jsonify({'error': 'No session_id provided'}), 400
         
-        print(f"[/stripe/complete-purchase] Processing session: {session_id}")
+        logger.info(f"[/stripe/complete-purchase] Processing session: {session_id}")
+        
+        session = stripe_inbox.lookup_checkout_session(session_id)
+        credited = False
         
-        # Retrieve the session from Stripe
-        session = stripe.checkout.Session.retrieve(session_id)
+        if stripe_inbox.needs_refresh(session):
+            # Webhook not processed yet: fulfill from the Stripe API (idempotent with the webhook)
+            credited = stripe_inbox.fulfill_checkout_session(stripe_inbox.retrieve_checkout_session(session_id))
+            session = stripe_inbox.lookup_checkout_session(session_id)
         
-        print(f"[/stripe/complete-purchase] Payment status: {session.payment_status}")
+        logger.info(f"[/stripe/complete-purchase] Payment status: {session['payment_status']}")
         
         # Check if payment was successful
-        if session.payment_status != 'paid':
+        if session['payment_status'] != 'paid':
             return jsonify({'error': 'Payment not completed'}), 400
         
-        # Get user_key from session metadata
-        user_key = session.client_reference_id
+        user_key = session['user_key']
         
         if not user_key:
             return jsonify({'error': 'No user_key in session'}), 400
         
-        print(f"[/stripe/complete-purchase] User key: {user_key}")
+        status = credits_service.get_balance(user_key)
         
-        # Check if credits were already added for this session
-        # (to prevent double-adding if user refreshes /success page)
-        conn = sqlite3.connect(credits_service.db_path)
-        c = conn.cursor()
-        c.execute('SELECT completed_sessions FROM users WHERE user_key = ?', (user_key,))
-        result = c.fetchone()
-        
-        completed_sessions = set()
-        if result and result[0]:
-            completed_sessions = set(result[0].split(','))
-        
-        if session_id in completed_sessions:
-            print(f"✓ Session {session_id} already processed - skipping credit addition")
-            
-            # Get status directly from DB for THIS user
-            c.execute('SELECT free_used_today, credits FROM users WHERE user_key = ?', (user_key,))
-            result = c.fetchone()
-            
-            if result:
-                free_used, credits = result
-                remaining_free = max(0, 3 - free_used)
-                status = {'remaining_free': remaining_free, 'credits': credits}
-            else:
-                status = {'remaining_free': 3, 'credits': 0}
-            
-            conn.close()
-            
+        if not credited:
+            # Credits were already added (webhook, or a refresh of /success page)
+            logger.info(f"Session {session_id} already processed - skipping credit addition")
             return jsonify({
                 'success': True,
                 'message': '크레딧이 이미 추가되었습니다',
@@ -217,33 +190,8 @@ def complete_purchase():
                 'new_balance': status
             })
         
-        # Add credits
-        credits_service.add_credits(user_key, CREDITS_PER_PURCHASE)
-        
-        # Mark session as completed
-        completed_sessions.add(session_id)
-        c.execute('''
-            UPDATE users 
-            SET completed_sessions = ? 
-            WHERE user_key = ?
-        ''', (','.join(completed_sessions), user_key))
-        conn.commit()
-        
-        # Get updated status directly from DB for THIS user (not request IP/UA)
-        c.execute('SELECT free_used_today, credits FROM users WHERE user_key = ?', (user_key,))
-        result = c.fetchone()
-        
-        if result:
-            free_used, credits = result
-            remaining_free = max(0, 3 - free_used)
-            status = {'remaining_free': remaining_free, 'credits': credits}
-        else:
-            status = {'remaining_free': 3, 'credits': 0}
-        
-        conn.close()
-        
-        print(f"✓ Added {CREDITS_PER_PURCHASE} credits for session {session_id}")
-        print(f"✓ User {user_key} new balance: {status}")
+        logger.info(f"Added {CREDITS_PER_PURCHASE} credits for session {session_id}")
+        logger.info(f"User {user_key} new balance: {status}")
         
         return jsonify({
             'success': True,
@@ -253,9 +201,7 @@ def complete_purchase():
         })
     
     except Exception as e:
-        print(f"❌ Error completing purchase: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error completing purchase: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @stripe_bp.route('/simulate-purchase', methods=['POST'])
@@ -266,14 +212,14 @@ def simulate_purchase():
         user_agent = request.headers.get('User-Agent', '')
         user_key = credits_service.get_user_key(ip, user_agent)
         
-        print(f"[/stripe/simulate-purchase] IP: {ip}, UA: {user_agent[:50]}..., user_key: {user_key}")
+        logger.info(f"[/stripe/simulate-purchase] IP: {ip}, UA: {user_agent[:50]}..., user_key: {user_key}")
         
         # Add credits to user
         credits_service.add_credits(user_key, CREDITS_PER_PURCHASE)
         
         status = credits_service.get_user_status(ip, user_agent)
         
-        print(f"[/stripe/simulate-purchase] Added {CREDITS_PER_PURCHASE} credits, new status: {status}")
+        logger.info(f"[/stripe/simulate-purchase] Added {CREDITS_PER_PURCHASE} credits, new status: {status}")
         
         return jsonify({
             'success': True,
@@ -295,7 +241,7 @@ def reset_credits():
         user_agent = request.headers.get('User-Agent', '')
         user_key = credits_service.get_user_key(ip, user_agent)
         
-        print(f"[/stripe/reset-credits] Resetting credits for user {user_key}")
+        logger.debug(f"[/stripe/reset-credits] Resetting credits for user {user_key}")
         
         # Reset all credits and free tries (INSERT OR REPLACE for new users)
         conn = sqlite3.connect(credits_service.db_path)
@@ -315,7 +261,7 @@ def reset_credits():
         
         status = credits_service.get_user_status(ip, user_agent)
         
-        print(f"[/stripe/reset-credits] Reset complete, new status: {status}")
+        logger.info(f"[/stripe/reset-credits] Reset complete, new status: {status}")
         
         return jsonify({
             'success': True,
@@ -0,0 +1,221 @@
+"""
+Admission Control Service
+Sheds /api/virtual-fitting overload cheaply, before request bodies are read
+"""
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Optional, Tuple
+
+from flask import request, jsonify, g
+
+from services.metrics_service import fittings_in_flight, admission_rejected_total
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now if now is not None else time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if self.rate <= 0:
+            return float('inf')
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class AdmissionController:
+    """
+    Per-user and global token buckets plus a per-worker in-flight cap.
+
+    All three limits are checked under one lock and consumed together, so a
+    request rejected by one limit never burns tokens from the others.
+    """
+
+    def __init__(self,
+                 user_rate_per_min: float = 6,
+                 user_burst: int = 3,
+                 global_rate_per_min: float = 120,
+                 global_burst: int = 20,
+                 max_in_flight: int = 4,
+                 max_tracked_users: int = 10000,
+                 clock=time.monotonic):
+        self.user_rate = user_rate_per_min / 60.0
+        self.user_burst = user_burst
+        self.max_in_flight = max_in_flight
+        self.max_tracked_users = max_tracked_users
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate_per_min / 60.0, global_burst, now=clock())
+        self.user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.in_flight = 0
+        self.rejected = {'user_rate': 0, 'global_rate': 0, 'in_flight': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            user_rate_per_min=float(os.getenv('FITTING_USER_RATE_PER_MIN', '6')),
+            user_burst=int(os.getenv('FITTING_USER_BURST', '3')),
+            global_rate_per_min=float(os.getenv('FITTING_GLOBAL_RATE_PER_MIN', '120')),
+            global_burst=int(os.getenv('FITTING_GLOBAL_BURST', '20')),
+            max_in_flight=int(os.getenv('FITTING_MAX_IN_FLIGHT', '4')),
+        )
+
+    def _user_bucket(self, user_id: str, now: float) -> TokenBucket:
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst, now=now)
+            self.user_buckets[user_id] = bucket
+            # Drop least recently seen users; their buckets have long since refilled
+            while len(self.user_buckets) > self.max_tracked_users:
+                self.user_buckets.popitem(last=False)
+        else:
+            self.user_buckets.move_to_end(user_id)
+        return bucket
+
+    def try_admit(self, user_id: str) -> Tuple[bool, Optional[dict]]:
+        """
+        Try to admit one request for `user_id`
+
+        Returns:
+            (admitted, rejection) where rejection is
+            {status: 429|503, reason: str, retry_after: int} when not admitted
+        """
+        with self._lock:
+            now = self.clock()
+
+            if self.in_flight >= self.max_in_flight:
+                self.rejected['in_flight'] += 1
+                return False, {'status': 503, 'reason': 'in_flight', 'retry_after': 5}
+
+            user_bucket = self._user_bucket(user_id, now)
+            user_wait = user_bucket.wait_time(now)
+            if user_wait > 0:
+                self.rejected['user_rate'] += 1
+                return False, {'status': 429, 'reason': 'user_rate', 'retry_after': max(1, math.ceil(user_wait))}
+
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait > 0:
+                self.rejected['global_rate'] += 1
+                return False, {'status': 503, 'reason': 'global_rate', 'retry_after': max(1, math.ceil(global_wait))}
+
+            user_bucket.consume(now)
+            self.global_bucket.consume(now)
+            self.in_flight += 1
+            return True, None
+
+    def try_acquire_slot(self) -> bool:
+        """
+        Take one more in-flight slot for work already admitted (e.g. the
+        second and later concurrent items of a batch); no rate tokens
+        """
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'tracked_users': len(self.user_buckets),
+                'rejected': dict(self.rejected),
+            }
+
+
+admission_controller = AdmissionController.from_env()
+
+REJECTION_MESSAGES = {
+    'user_rate': '요청이 너무 많습니다. 잠시 후 다시 시도해주세요.',
+    'global_rate': '현재 이용자가 많아 처리할 수 없습니다. 잠시 후 다시 시도해주세요.',
+    'in_flight': '현재 처리 중인 요청이 많습니다. 잠시 후 다시 시도해주세요.',
+}
+
+
+def get_client_id() -> str:
+    """
+    Identify the caller from cookie or connection only (never touches the body)
+
+    Without a cookie the id is request.remote_addr, which app.py's ProxyFix
+    takes from the X-Forwarded-For hop our proxy appended. The leftmost entry
+    is whatever the client sent, and rotating it would give a fresh bucket
+    (and idempotency scope, and scheduler turn) on every request.
+    """
+    user_key = request.cookies.get('user_key')
+    if user_key:
+        return f'user:{user_key}'
+    return f"ip:{request.remote_addr or '127.0.0.1'}"
+
+
+def detach_admission() -> Callable[[], None]:
+    """
+    Keep the current request's in-flight slot after the view returns
+
+    For work handed off to a background job: the job calls the returned
+    function when it finishes (extra calls are ignored).
+    """
+    g.admission_detached = True
+    lock = threading.Lock()
+    released = []
+
+    def release():
+        with lock:
+            if released:
+                return
+            released.append(True)
+        fittings_in_flight.dec()
+        admission_controller.release()
+    return release
+
+
+def admission_controlled(view):
+    """Route decorator: admit or shed the request with 429/503 + Retry-After"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        admitted, rejection = admission_controller.try_admit(get_client_id())
+        if not admitted:
+            admission_rejected_total.inc(reason=rejection['reason'])
+            response = jsonify({
+                'error': 'Too many requests' if rejection['status'] == 429 else 'Server busy',
+                'reason': rejection['reason'],
+                'retry_after': rejection['retry_after'],
+                'message': REJECTION_MESSAGES[rejection['reason']],
+            })
+            response.status_code = rejection['status']
+            response.headers['Retry-After'] = str(rejection['retry_after'])
+            return response
+
+        fittings_in_flight.inc()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            if not g.pop('admission_detached', False):
+                fittings_in_flight.dec()
+                admission_controller.release()
+
+    return wrapper
@@ -1,8 +1,37 @@
-import base64
-from rembg import remove
+import os
+import logging
+import threading
 from typing import Optional
 from io import BytesIO
 from PIL import Image
+from services.tracing_service import span
+from services.image_utils import shrink_to_max_side, encode_png, to_data_uri, from_data_uri, REMBG_MAX_SIDE
+
+logger = logging.getLogger(__name__)
+
+REMBG_MODEL = os.getenv('REMBG_MODEL', 'u2net')
+
+# One ONNX session per worker process. rembg (and onnxruntime) are imported on
+# first use, and the session is never shared across fork: a process that
+# inherits one from its parent (gunicorn preload) builds its own.
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return this process's rembg session, loading the model on first use"""
+    global _session, _session_pid
+    if _session_pid != os.getpid():
+        with _session_lock:
+            if _session_pid != os.getpid():
+                from rembg import new_session
+                logger.info(f"Loading rembg model '{REMBG_MODEL}'...")
+                with span('rembg.load_model'):
+                    _session = new_session(REMBG_MODEL)
+                _session_pid = os.getpid()
+    return _session
+
 
 class BackgroundRemovalService:
     def __init__(self, api_token: str = None):
@@ -21,57 +50,42 @@ class BackgroundRemovalService:
             Base64 data URL of the image with background removed
         """
         try:
-            # Extract base64 data from data URL
-            if image_data_url.startswith('data:image'):
-                # Split "data:image/png;base64,XXXXX"
-                base64_data = image_data_url.split(',')[1]
-            else:
-                base64_data = image_data_url
-            
-            # Decode base64 to bytes
-            input_data = base64.b64decode(base64_data)
+            # Decode base64 data URL to bytes
+            input_data = from_data_uri(image_data_url)
             
-            # Open image and resize for faster processing
+            # Open image and resize to max 800px on longest side for speed
             img = Image.open(BytesIO(input_data))
             original_size = img.size
-            
-            # Resize to max 800px on longest side for speed
-            max_size = 800
-            if max(img.size) > max_size:
-                ratio = max_size / max(img.size)
-                new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-                print(f"Resized from {original_size} to {img.size} for faster processing")
+            img = shrink_to_max_side(img, REMBG_MAX_SIDE)
+            if img.size != original_size:
+                logger.debug(f"Resized from {original_size} to {img.size} for faster processing")
             
             # Convert to bytes for rembg
-            img_byte_arr = BytesIO()
-            img.save(img_byte_arr, format='PNG')
-            img_bytes = img_byte_arr.getvalue()
+            img_bytes = encode_png(img)
             
             # Remove background using local rembg with fast model
-            print("Removing background locally with rembg (fast mode)...")
-            output_data = remove(
-                img_bytes,
-                alpha_matting=False,  # Disable for speed
-                alpha_matting_foreground_threshold=240,
-                alpha_matting_background_threshold=10,
-                alpha_matting_erode_size=10
-            )
+            logger.info("Removing background locally with rembg (fast mode)...")
+            from rembg import remove
+            session = get_session()
+            with span('rembg.inference'):
+                output_data = remove(
+                    img_bytes,
+                    session=session,
+                    alpha_matting=False,  # Disable for speed
+                    alpha_matting_foreground_threshold=240,
+                    alpha_matting_background_threshold=10,
+                    alpha_matting_erode_size=10
+                )
             
             # Resize back to original size
             output_img = Image.open(BytesIO(output_data))
             if output_img.size != original_size:
                 output_img = output_img.resize(original_size, Image.Resampling.LANCZOS)
-                output_byte_arr = BytesIO()
-                output_img.save(output_byte_arr, format='PNG')
-                output_data = output_byte_arr.getvalue()
-            
-            # Encode result back to base64
-            output_base64 = base64.b64encode(output_data).decode('utf-8')
+                output_data = encode_png(output_img)
             
             # Return as data URL
-            return f"data:image/png;base64,{output_base64}"
+            return to_data_uri(output_data)
                 
         except Exception as e:
-            print(f"Background removal error: {str(e)}")
+            logger.warning(f"Background removal error: {str(e)}")
             raise
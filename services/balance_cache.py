@@ -0,0 +1,128 @@
+"""
+Balance Cache
+In-process cache of users' credit balances (credits.db)
+
+Invalidation:
+- every change to a users row is logged by SQLite triggers into
+  balance_changes, in the same transaction as the change itself (see
+  CreditsService._init_db), so consume, refund, purchase, share reward and
+  any raw SQL all invalidate without the callers doing anything
+- before answering from memory, the cache runs PRAGMA data_version on its
+  own long-lived connection. It changes whenever any other connection (this
+  worker or another process) committed to the file; only then are the new
+  balance_changes rows read and those users evicted
+
+The daily free-attempt reset is applied when a balance is read (from the
+cached last_reset), so reading a balance never writes.
+"""
+import os
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from services.metrics_service import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+FREE_ATTEMPTS_PER_DAY = 3
+MAX_ENTRIES = int(os.getenv('BALANCE_CACHE_SIZE', '10000'))
+
+
+def _last_reset_day(value) -> Optional[str]:
+    # isoformat ('2024-01-01T10:00:00') and CURRENT_TIMESTAMP ('2024-01-01 10:00:00') alike
+    return value[:10] if value else None
+
+
+def effective_balance(row: Optional[tuple], today: Optional[str] = None) -> dict:
+    """{'remaining_free', 'credits'} for a (free_used_today, credits, last_reset) row"""
+    if row is None:
+        return {'remaining_free': FREE_ATTEMPTS_PER_DAY, 'credits': 0}
+    free_used, credits, last_reset = row
+    today = today or datetime.now().date().isoformat()
+    if _last_reset_day(last_reset) is not None and _last_reset_day(last_reset) < today:
+        free_used = 0  # not reset in the table until the next consume
+    return {'remaining_free': max(0, FREE_ATTEMPTS_PER_DAY - (free_used or 0)), 'credits': credits or 0}
+
+
+def balance_etag(balance: dict) -> str:
+    # Derived from the value, so every worker produces the same tag
+    return f"b{balance['remaining_free']}-{balance['credits']}"
+
+
+class BalanceCache:
+    def __init__(self, db_path: str, max_entries: int = MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Optional[tuple]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._data_version = None
+        self._last_seq = 0
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            # Never share a connection across fork
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._pid = os.getpid()
+            self._entries.clear()
+            self._data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            self._last_seq = self._conn.execute('SELECT COALESCE(MAX(seq), 0) FROM balance_changes').fetchone()[0]
+        return self._conn
+
+    def _sync(self, conn):
+        """Evict users changed by other connections since the last check"""
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        changes = conn.execute('SELECT seq, user_key FROM balance_changes WHERE seq > ? ORDER BY seq',
+                               (self._last_seq,)).fetchall()
+        if changes and changes[0][0] > self._last_seq + 1:
+            # The change log was pruned past our position: start over
+            self._entries.clear()
+        else:
+            for _, user_key in changes:
+                self._entries.pop(user_key, None)
+        if changes:
+            self._last_seq = changes[-1][0]
+
+    def get(self, user_key: str) -> dict:
+        with self._lock:
+            conn = self._connection()
+            self._sync(conn)
+            hit = user_key in self._entries
+            if hit:
+                self._entries.move_to_end(user_key)
+                row = self._entries[user_key]
+            else:
+                row = conn.execute('SELECT free_used_today, credits, last_reset FROM users WHERE user_key = ?',
+                                   (user_key,)).fetchone()
+                self._entries[user_key] = row
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        record_cache_lookup('balance', hit)
+        return effective_balance(row)
+
+    def invalidate(self, user_key: Optional[str] = None):
+        with self._lock:
+            if user_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_key, None)
+
+
+_caches: Dict[str, BalanceCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_balance_cache(db_path: str = 'credits.db') -> BalanceCache:
+    path = os.path.abspath(db_path)
+    cache = _caches.get(path)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(path, BalanceCache(path))
+    return cache
@@ -0,0 +1,449 @@
+"""
+Catalog Service
+Luxury Hall catalog store (brands, categories, items, image variants) in catalog.db
+
+- items are indexed by (brand, category, sort order) and by (category, sort
+  order), so a room's page of items is an index range scan however large
+  the partner catalog is
+- every change to the catalog bumps catalog_meta.version (triggers), which
+  keys the rendered page cache: pages and API responses are rendered once
+  per catalog version and served with a weak ETag (304 when unchanged)
+- the built-in demo catalog is seeded into an empty database; partner
+  catalogs are loaded from JSON:
+    python -m services.catalog_service import partner_catalog.json
+"""
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from services.metrics_service import record_cache_lookup, timed_db
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv('CATALOG_DB_PATH', 'catalog.db')
+PAGE_CACHE_SIZE = int(os.getenv('CATALOG_PAGE_CACHE_SIZE', '256'))
+MAX_PER_PAGE = 100
+
+_initialized_path = None
+_init_lock = threading.Lock()
+
+CATALOG_TABLES = ('brands', 'categories', 'items', 'item_images')
+
+SEED_CATEGORIES = [
+    # category_id, label, heading, fitting_category (try-on garment type)
+    ('tops', '상의', '👕 상의', 'upper_body'),
+    ('bottoms', '하의', '👖 하의', 'lower_body'),
+    ('dresses', '원피스 / 코트', '👗 원피스 / 코트', 'dress'),
+]
+
+SEED_BRANDS = [
+    # brand_id, name, description, style (Luxury Hall tab), theme_color
+    ('miu_miu', 'Miu Miu', '젊고 감각적인 프라다의 세컨드 라인', 'youth', '#FF69B4'),
+    ('off_white', 'Off-White', '스트리트 럭셔리의 대명사', 'youth', '#FF69B4'),
+    ('diesel', 'Diesel', '이탈리아 감성의 데님 전문 브랜드', 'youth', '#FF69B4'),
+    ('dior', 'Dior', '프랑스 오트 쿠튀르의 상징', 'modern', '#C9A961'),
+    ('chanel', 'Chanel', '영원한 우아함의 대명사', 'modern', '#C9A961'),
+    ('gucci', 'Gucci', '이탈리아 장인정신의 결정체', 'modern', '#C9A961'),
+    ('hermes', 'Hermès', '프랑스 최고급 가죽 명가', 'classic', '#8B7355'),
+    ('max_mara', 'Max Mara', '이탈리아 정통 럭셔리 패션', 'classic', '#8B7355'),
+    ('burberry', 'Burberry', '영국 전통의 트렌치코트 명가', 'classic', '#8B7355'),
+]
+
+_COMING_SOON = 'https://via.placeholder.com/300x400/FFFFFF/000000?text=Coming+Soon'
+
+# Demo items (AI-generated clothing images, fully unfolded, no models), shown in every room
+SEED_ITEMS = [
+    # category_id, name, display_category, image
+    ('tops', '엘레강스 블라우스', '상의', '/attached_assets/generated_images/white_silk_blouse_unfolded_92f28411.png'),
+    ('tops', '실크 셔츠', '상의', '/attached_assets/generated_images/cream_shirt_unfolded_complete_e1c04150.png'),
+    ('tops', '클래식 탑', '상의', _COMING_SOON),
+    ('bottoms', '테일러드 팬츠', '하의', '/attached_assets/generated_images/black_pants_fully_extended_f0786d3e.png'),
+    ('bottoms', '슬랙스 팬츠', '하의', '/attached_assets/generated_images/navy_trousers_fully_extended_5da62e11.png'),
+    ('bottoms', '데님 진', '하의', _COMING_SOON),
+    ('dresses', '이브닝 드레스', '원피스', '/attached_assets/generated_images/black_evening_dress_complete_62275feb.png'),
+    ('dresses', '캐주얼 원피스', '원피스', _COMING_SOON),
+    ('dresses', '트렌치 코트', '코트', _COMING_SOON),
+]
+
+
+def init_db(conn):
+    """Create the catalog schema (and its version triggers)"""
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS brands (
+            brand_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            style TEXT,
+            theme_color TEXT,
+            sort_order INTEGER DEFAULT 0
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            category_id TEXT PRIMARY KEY,
+            label TEXT NOT NULL,
+            heading TEXT,
+            fitting_category TEXT NOT NULL,
+            sort_order INTEGER DEFAULT 0
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS items (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            brand_id TEXT NOT NULL REFERENCES brands(brand_id) ON DELETE CASCADE,
+            category_id TEXT NOT NULL REFERENCES categories(category_id),
+            sku TEXT,
+            name TEXT NOT NULL,
+            display_category TEXT,
+            image_url TEXT NOT NULL,
+            sort_order INTEGER DEFAULT 0
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_items_brand_category ON items (brand_id, category_id, sort_order, item_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_items_category ON items (category_id, sort_order, item_id)')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_items_brand_sku ON items (brand_id, sku) WHERE sku IS NOT NULL')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS item_images (
+            item_id INTEGER NOT NULL REFERENCES items(item_id) ON DELETE CASCADE,
+            variant TEXT NOT NULL,
+            url TEXT NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            PRIMARY KEY (item_id, variant)
+        )
+    ''')
+    c.execute('CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+    c.execute("INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('version', 1)")
+    for table in CATALOG_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table}
+                BEGIN UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'; END
+            ''')
+    conn.commit()
+
+
+def seed_demo_catalog(conn):
+    """Load the built-in demo brands and items into an empty catalog"""
+    if conn.execute('SELECT 1 FROM brands LIMIT 1').fetchone():
+        return
+    import_catalog({
+        'categories': [{'category_id': cid, 'label': label, 'heading': heading, 'fitting_category': fitting,
+                        'sort_order': i} for i, (cid, label, heading, fitting) in enumerate(SEED_CATEGORIES)],
+        'brands': [{'brand_id': bid, 'name': name, 'description': description, 'style': style,
+                    'theme_color': color, 'sort_order': i,
+                    'items': [{'category_id': cid, 'name': item_name, 'display_category': display,
+                               'image_url': image, 'sort_order': j}
+                              for j, (cid, item_name, display, image) in enumerate(SEED_ITEMS)]}
+                   for i, (bid, name, description, style, color) in enumerate(SEED_BRANDS)],
+    }, conn=conn)
+    logger.info("Seeded demo catalog")
+
+
+def _connect() -> sqlite3.Connection:
+    """Open a connection, creating (and seeding) the schema on first use"""
+    global _initialized_path
+    if _initialized_path != DB_PATH:
+        with _init_lock:
+            if _initialized_path != DB_PATH:
+                conn = sqlite3.connect(DB_PATH)
+                try:
+                    init_db(conn)
+                    seed_demo_catalog(conn)
+                finally:
+                    conn.close()
+                _initialized_path = DB_PATH
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA foreign_keys = ON')
+    return conn
+
+
+# ---- Writes ----
+
+def import_catalog(data: Dict, conn: Optional[sqlite3.Connection] = None) -> Dict:
+    """
+    Upsert categories, brands and their items in one transaction
+
+    data: {'categories': [...], 'brands': [{..., 'items': [{..., 'images': [...]}]}]}
+    Items with a sku are matched on (brand_id, sku); without a sku they're
+    appended. replace_items=True on a brand deletes its items not in the import.
+    """
+    own_conn = conn is None
+    conn = conn or _connect()
+    counts = {'categories': 0, 'brands': 0, 'items': 0}
+    try:
+        c = conn.cursor()
+        for category in data.get('categories', []):
+            c.execute('''
+                INSERT INTO categories (category_id, label, heading, fitting_category, sort_order) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(category_id) DO UPDATE SET label = excluded.label, heading = excluded.heading,
+                    fitting_category = excluded.fitting_category, sort_order = excluded.sort_order
+            ''', (category['category_id'], category['label'], category.get('heading', category['label']),
+                  category['fitting_category'], category.get('sort_order', 0)))
+            counts['categories'] += 1
+
+        for brand in data.get('brands', []):
+            brand_id = brand['brand_id']
+            c.execute('''
+                INSERT INTO brands (brand_id, name, description, style, theme_color, sort_order) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(brand_id) DO UPDATE SET name = excluded.name, description = excluded.description,
+                    style = excluded.style, theme_color = excluded.theme_color, sort_order = excluded.sort_order
+            ''', (brand_id, brand['name'], brand.get('description'), brand.get('style'),
+                  brand.get('theme_color'), brand.get('sort_order', 0)))
+            counts['brands'] += 1
+
+            kept = []
+            for item in brand.get('items', []):
+                row = (item['category_id'], item.get('sku'), item['name'], item.get('display_category'),
+                       item['image_url'], item.get('sort_order', 0))
+                existing = None
+                if item.get('sku'):
+                    existing = c.execute('SELECT item_id FROM items WHERE brand_id = ? AND sku = ?',
+                                         (brand_id, item['sku'])).fetchone()
+                if existing:
+                    item_id = existing[0]
+                    c.execute('''UPDATE items SET category_id = ?, sku = ?, name = ?, display_category = ?,
+                                 image_url = ?, sort_order = ? WHERE item_id = ?''', row + (item_id,))
+                else:
+                    c.execute('''INSERT INTO items (category_id, sku, name, display_category, image_url, sort_order, brand_id)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)''', row + (brand_id,))
+                    item_id = c.lastrowid
+                kept.append(item_id)
+                for image in item.get('images', []):
+                    c.execute('''
+                        INSERT INTO item_images (item_id, variant, url, width, height) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(item_id, variant) DO UPDATE SET url = excluded.url,
+                            width = excluded.width, height = excluded.height
+                    ''', (item_id, image['variant'], image['url'], image.get('width'), image.get('height')))
+                counts['items'] += 1
+
+            if brand.get('replace_items'):
+                placeholders = ','.join('?' * len(kept)) or 'NULL'
+                c.execute(f'DELETE FROM items WHERE brand_id = ? AND item_id NOT IN ({placeholders})',
+                          [brand_id] + kept)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+    return counts
+
+
+# ---- Reads ----
+
+def _brand_dict(row) -> Dict:
+    return {'name': row['name'], 'description': row['description'], 'category': row['style'],
+            'theme_color': row['theme_color']}
+
+
+@timed_db('catalog', 'list_brands')
+def list_brands(style: Optional[str] = None) -> Dict[str, Dict]:
+    """{brand_id: brand} in display order, optionally one Luxury Hall tab (youth/modern/classic)"""
+    conn = _connect()
+    try:
+        query = 'SELECT * FROM brands'
+        params = []
+        if style:
+            query += ' WHERE style = ?'
+            params.append(style)
+        rows = conn.execute(query + ' ORDER BY sort_order, brand_id', params).fetchall()
+    finally:
+        conn.close()
+    return {row['brand_id']: _brand_dict(row) for row in rows}
+
+
+@timed_db('catalog', 'get_brand')
+def get_brand(brand_id: str) -> Optional[Dict]:
+    conn = _connect()
+    try:
+        row = conn.execute('SELECT * FROM brands WHERE brand_id = ?', (brand_id,)).fetchone()
+    finally:
+        conn.close()
+    return _brand_dict(row) if row else None
+
+
+@timed_db('catalog', 'list_categories')
+def list_categories() -> List[Dict]:
+    conn = _connect()
+    try:
+        rows = conn.execute('SELECT * FROM categories ORDER BY sort_order, category_id').fetchall()
+    finally:
+        conn.close()
+    return [{'category_id': row['category_id'], 'label': row['label'], 'heading': row['heading'],
+             'fitting_category': row['fitting_category']} for row in rows]
+
+
+@timed_db('catalog', 'get_items')
+def get_items(brand_id: str, category_id: Optional[str] = None, page: int = 1, per_page: int = 24) -> Dict:
+    """
+    One page of a brand's items (optionally one category)
+
+    Returns:
+        Dict with {items: List[Dict], total: int, page: int, per_page: int, total_pages: int}
+    """
+    page = max(1, page)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    where, params = 'i.brand_id = ?', [brand_id]
+    if category_id:
+        where += ' AND i.category_id = ?'
+        params.append(category_id)
+
+    conn = _connect()
+    try:
+        total = conn.execute(f'SELECT COUNT(*) FROM items i WHERE {where}', params).fetchone()[0]
+        rows = conn.execute(f'''
+            SELECT i.*, c.fitting_category FROM items i JOIN categories c ON c.category_id = i.category_id
+            WHERE {where} ORDER BY i.sort_order, i.item_id LIMIT ? OFFSET ?
+        ''', params + [per_page, (page - 1) * per_page]).fetchall()
+        images = {}
+        if rows:
+            ids = [row['item_id'] for row in rows]
+            for image in conn.execute(
+                    f'SELECT * FROM item_images WHERE item_id IN ({",".join("?" * len(ids))})', ids):
+                images.setdefault(image['item_id'], []).append(
+                    {'variant': image['variant'], 'url': image['url'], 'width': image['width'], 'height': image['height']})
+    finally:
+        conn.close()
+
+    items = [{
+        'item_id': row['item_id'],
+        'sku': row['sku'],
+        'name': row['name'],
+        'category': row['display_category'],
+        'category_id': row['category_id'],
+        'fitting_category': row['fitting_category'],
+        'image': row['image_url'],
+        'images': images.get(row['item_id'], []),
+    } for row in rows]
+    return {
+        'items': items,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'total_pages': (total + per_page - 1) // per_page,
+    }
+
+
+@timed_db('catalog', 'get_item')
+def get_item(item_id: int) -> Optional[Dict]:
+    """One item with its brand and fitting category (None if unknown)"""
+    conn = _connect()
+    try:
+        row = conn.execute('''
+            SELECT i.*, c.fitting_category FROM items i JOIN categories c ON c.category_id = i.category_id
+            WHERE i.item_id = ?
+        ''', (item_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {
+        'item_id': row['item_id'],
+        'brand_id': row['brand_id'],
+        'sku': row['sku'],
+        'name': row['name'],
+        'category_id': row['category_id'],
+        'fitting_category': row['fitting_category'],
+        'image': row['image_url'],
+    }
+
+
+# ---- Rendered page cache ----
+
+class CatalogPageCache:
+    """
+    Rendered pages and API bodies, valid for one catalog version
+
+    The version is re-read only when PRAGMA data_version says another
+    connection (any worker, the import CLI) committed to catalog.db.
+    """
+
+    def __init__(self, max_entries: int = PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_key = None
+        self._data_version = None
+        self._version = None
+
+    def version(self) -> int:
+        with self._lock:
+            key = (os.getpid(), DB_PATH)
+            if self._conn_key != key:
+                _connect().close()  # schema
+                self._conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+                self._conn_key = key
+                self._data_version = None
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._version = self._conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()[0]
+            return self._version
+
+    def get(self, key: tuple, render: Callable[[], bytes]) -> tuple:
+        """(body, etag) for key, rendering it if the catalog changed since it was cached"""
+        version = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(key)
+        hit = bool(entry and entry[0] == version)
+        record_cache_lookup('catalog_page', hit)
+        if hit:
+            return entry[1], entry[2]
+
+        body = render()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        etag = f'c{version}-{hashlib.sha1(body).hexdigest()[:12]}'
+        with self._lock:
+            self._entries[key] = (version, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body, etag
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+page_cache = CatalogPageCache()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Luxury Hall catalog store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    import_parser = sub.add_parser('import', help='upsert brands/items from a JSON file')
+    import_parser.add_argument('path')
+    sub.add_parser('stats', help='print row counts')
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        with open(args.path, encoding='utf-8') as f:
+            counts = import_catalog(json.load(f))
+        print(json.dumps(counts))
+    else:
+        conn = _connect()
+        try:
+            print(json.dumps({table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                              for table in CATALOG_TABLES}))
+        finally:
+            conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
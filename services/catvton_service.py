@@ -1,7 +1,10 @@
+import logging
 import replicate
 import os
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 class CatVTONService:
     def __init__(self, api_token: str):
         self.api_token = api_token
@@ -22,10 +25,10 @@ class CatVTONService:
         try:
             import base64
             
-            print(f"\n=== Starting CatVTON-Flux Virtual Try-On ===")
-            print(f"Person image size: {len(person_image_bytes)} bytes ({len(person_image_bytes)/1024:.1f}KB)")
-            print(f"Clothing image size: {len(clothing_image_bytes)} bytes ({len(clothing_image_bytes)/1024:.1f}KB)")
-            print(f"Category: {category}")
+            logger.debug(f"Starting CatVTON-Flux Virtual Try-On")
+            logger.debug(f"Person image size: {len(person_image_bytes)} bytes ({len(person_image_bytes)/1024:.1f}KB)")
+            logger.debug(f"Clothing image size: {len(clothing_image_bytes)} bytes ({len(clothing_image_bytes)/1024:.1f}KB)")
+            logger.debug(f"Category: {category}")
             
             # Convert to base64 data URIs
             person_b64 = base64.b64encode(person_image_bytes).decode('utf-8')
@@ -45,7 +48,7 @@ class CatVTONService:
             
             cloth_type = cloth_type_mapping.get(category, "upper")
             
-            print(f"Using CatVTON cloth_type: {cloth_type}")
+            logger.debug(f"Using CatVTON cloth_type: {cloth_type}")
             
             # Optimized parameters for best quality
             input_params = {
@@ -57,7 +60,7 @@ class CatVTONService:
                 "seed": 42  # Consistent results
             }
             
-            print(f"✓ Parameters: steps={input_params['num_inference_steps']}, guidance={input_params['guidance_scale']}")
+            logger.debug(f"Parameters: steps={input_params['num_inference_steps']}, guidance={input_params['guidance_scale']}")
             
             # Use CatVTON-Flux model (best performance)
             output = replicate.run(
@@ -65,34 +68,32 @@ class CatVTONService:
                 input=input_params
             )
             
-            print(f"✓ CatVTON API call completed")
-            print(f"Output type: {type(output)}")
+            logger.info(f"CatVTON API call completed")
+            logger.debug(f"Output type: {type(output)}")
             
             # Handle different output formats
             if isinstance(output, str):
-                print(f"✓ Got URL result: {output[:100]}...")
+                logger.debug(f"Got URL result: {output[:100]}...")
                 return output
             elif isinstance(output, list) and len(output) > 0:
                 first_item = output[0]
                 if isinstance(first_item, str):
-                    print(f"✓ Got URL from list: {first_item[:100]}...")
+                    logger.debug(f"Got URL from list: {first_item[:100]}...")
                     return first_item
                 elif hasattr(first_item, 'url'):
-                    print(f"✓ Got URL from object: {first_item.url[:100]}...")
+                    logger.debug(f"Got URL from object: {first_item.url[:100]}...")
                     return first_item.url
                 else:
                     result_str = str(first_item)
-                    print(f"✓ Converted to string: {result_str[:100]}...")
+                    logger.info(f"Converted to string: {result_str[:100]}...")
                     return result_str
             elif hasattr(output, 'url'):
-                print(f"✓ Got URL from FileOutput: {output.url[:100]}...")
+                logger.debug(f"Got URL from FileOutput: {output.url[:100]}...")
                 return output.url
             else:
-                print(f"✗ Unexpected output format: {output}")
+                logger.warning(f"Unexpected output format: {output}")
                 return None
                 
         except Exception as e:
-            print(f"CatVTON error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"CatVTON error: {str(e)}")
             raise
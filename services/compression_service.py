@@ -0,0 +1,142 @@
+"""
+Compression Service
+Brotli/gzip compression of dynamic responses
+
+Registered as the outermost after_request hook, so it sees the final body.
+A response is compressed when:
+- the client accepts br or gzip (br preferred; brotli is optional)
+- its mimetype is in the allowlist (COMPRESSION_TYPES)
+- it is not already encoded, not a file passthrough (static files are
+  precompressed at build time) and not marked Cache-Control: no-transform
+- a buffered body is at least COMPRESSION_MIN_SIZE bytes; streamed bodies
+  are compressed chunk by chunk and flushed so streaming is preserved
+"""
+import os
+import zlib
+import logging
+
+from flask import request
+
+from services.metrics_service import compression_bytes_total
+from services.static_assets import negotiate_encoding
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSIBLE_TYPES = frozenset(t.strip() for t in os.getenv(
+    'COMPRESSION_TYPES',
+    'application/json,application/x-ndjson,text/html,text/plain,text/css,'
+    'text/javascript,application/javascript,image/svg+xml').split(',') if t.strip())
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class _Compressor:
+    """Incremental br/gzip compressor with a common interface"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._impl = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._impl = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self._impl.process(data)
+        return self._impl.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == 'br':
+            return self._impl.flush()
+        return self._impl.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._impl.finish()
+        return self._impl.flush(zlib.Z_FINISH)
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    compressor = _Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def _compress_stream(chunks, encoding: str):
+    compressor = _Compressor(encoding)
+    raw = out = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            raw += len(chunk)
+            # Flush every chunk: streamed responses (NDJSON progress, etc.) must not be held back
+            data = compressor.compress(chunk) + compressor.flush()
+            out += len(data)
+            yield data
+        tail = compressor.finish()
+        out += len(tail)
+        yield tail
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        compression_bytes_total.inc(raw, encoding=encoding, stage='in')
+        compression_bytes_total.inc(out, encoding=encoding, stage='out')
+
+
+def _is_candidate(response) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.mimetype in COMPRESSIBLE_TYPES
+
+
+def compress_response(response):
+    """after_request hook: compress eligible responses in place"""
+    if request.method == 'HEAD' or not _is_candidate(response):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''), available_encodings())
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        compressed = compress_bytes(data, encoding)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        compression_bytes_total.inc(len(data), encoding=encoding, stage='in')
+        compression_bytes_total.inc(len(compressed), encoding=encoding, stage='out')
+
+    response.headers['Content-Encoding'] = encoding
+    # A strong ETag names one exact byte sequence; the compressed body is a different one
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+
+def init_compression(app):
+    """Register the hook; call before any other after_request hook so it runs last"""
+    app.after_request(compress_response)
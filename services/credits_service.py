@@ -1,12 +1,31 @@
+import os
+import logging
 import sqlite3
 import hashlib
+import threading
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
+from services.metrics_service import timed_db
+from services.balance_cache import get_balance_cache
+
+logger = logging.getLogger(__name__)
+
+SHARE_REWARD_CREDITS = 5
+
+# Schema/migrations run once per database file per process, not per CreditsService()
+_initialized_paths = set()
+_init_lock = threading.Lock()
 
 class CreditsService:
     def __init__(self, db_path='credits.db'):
         self.db_path = db_path
-        self._init_db()
+        path = os.path.abspath(db_path)
+        # A deleted file (tests, manual reset) is recreated with its schema
+        if path not in _initialized_paths or not os.path.exists(path):
+            with _init_lock:
+                if path not in _initialized_paths or not os.path.exists(path):
+                    self._init_db()
+                    _initialized_paths.add(path)
     
     def _init_db(self):
         """Initialize database schema"""
@@ -35,10 +54,60 @@ class CreditsService:
         for column_name, column_type in migrations:
             try:
                 c.execute(f'ALTER TABLE users ADD COLUMN {column_name} {column_type}')
-                print(f"Added {column_name} column to database")
+                logger.info(f"Added {column_name} column to database")
             except sqlite3.OperationalError:
                 pass  # Column already exists
         
+        # One share reward per user, platform and day
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS share_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_key TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                shared_at TEXT NOT NULL,
+                credits_rewarded INTEGER DEFAULT 5,
+                share_day TEXT
+            )
+        ''')
+        try:
+            c.execute('ALTER TABLE share_log ADD COLUMN share_day TEXT')
+            # Tables created by the old route: backfill the day and drop same-day duplicates
+            c.execute('UPDATE share_log SET share_day = substr(shared_at, 1, 10) WHERE share_day IS NULL')
+            c.execute('''
+                DELETE FROM share_log WHERE id NOT IN (
+                    SELECT MIN(id) FROM share_log GROUP BY user_key, platform, share_day
+                )
+            ''')
+            logger.info("Added share_day column to share_log")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+        c.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_share_log_user_platform_day
+            ON share_log (user_key, platform, share_day)
+        ''')
+        
+        # Balance change log for cache invalidation (services/balance_cache.py),
+        # written by triggers in the same transaction as the change
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS balance_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_key TEXT NOT NULL,
+                changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS users_balance_insert AFTER INSERT ON users
+            BEGIN INSERT INTO balance_changes (user_key) VALUES (NEW.user_key); END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS users_balance_update AFTER UPDATE OF free_used_today, credits, last_reset ON users
+            BEGIN INSERT INTO balance_changes (user_key) VALUES (NEW.user_key); END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS users_balance_delete AFTER DELETE ON users
+            BEGIN INSERT INTO balance_changes (user_key) VALUES (OLD.user_key); END
+        ''')
+        
         conn.commit()
         conn.close()
     
@@ -53,7 +122,7 @@ class CreditsService:
         return hashlib.sha256(combined).hexdigest()
     
     def _reset_daily_if_needed(self, conn, user_key: str):
-        """Reset free_used_today if last_reset was yesterday or earlier"""
+        """Reset free_used_today if last_reset was yesterday or earlier (inside the caller's transaction)"""
         c = conn.cursor()
         c.execute('SELECT last_reset FROM users WHERE user_key = ?', (user_key,))
         result = c.fetchone()
@@ -68,9 +137,9 @@ class CreditsService:
                     'UPDATE users SET free_used_today = 0, last_reset = ? WHERE user_key = ?',
                     (now.isoformat(), user_key)
                 )
-                conn.commit()
-                print(f"Daily reset applied for user {user_key}")
+                logger.info(f"Daily reset applied for user {user_key}")
     
+    @timed_db('credits', 'check_and_consume')
     def check_and_consume(self, ip_or_user_key: str, user_agent: str = '', request_hash: Optional[str] = None) -> Tuple[bool, dict]:
         """
         Check if user can make a try-on and consume 1 credit/free attempt
@@ -94,10 +163,13 @@ class CreditsService:
         conn = sqlite3.connect(self.db_path)
         
         try:
-            self._reset_daily_if_needed(conn, user_key)
-            
             c = conn.cursor()
-            
+            # Daily reset, check and consume in one write transaction, committed once per outcome:
+            # concurrent requests (batch items, other workers) must not both create the user or
+            # both spend the last credit
+            c.execute('BEGIN IMMEDIATE')
+            self._reset_daily_if_needed(conn, user_key)
+
             # Get or create user
             c.execute('SELECT free_used_today, credits, last_request_hash, refit_count, last_refit_reset FROM users WHERE user_key = ?', (user_key,))
             result = c.fetchone()
@@ -109,7 +181,6 @@ class CreditsService:
                     'INSERT INTO users (user_key, free_used_today, credits, last_request_hash, refit_count, last_refit_reset) VALUES (?, 0, 0, ?, 0, ?)',
                     (user_key, request_hash, now)
                 )
-                conn.commit()
                 free_used = 0
                 credits = 0
                 last_hash = None
@@ -134,12 +205,12 @@ class CreditsService:
                         'UPDATE users SET refit_count = 0, last_refit_reset = ? WHERE user_key = ?',
                         (now.isoformat(), user_key)
                     )
-                    conn.commit()
-                    print(f"Refit counter reset for user {user_key} (1 hour passed)")
+                    logger.info(f"Refit counter reset for user {user_key} (1 hour passed)")
                 
                 # Check if refit limit exceeded (5 per hour)
                 if refit_count >= 5:
-                    print(f"Refit limit exceeded for user {user_key}: {refit_count}/5 per hour")
+                    logger.warning(f"Refit limit exceeded for user {user_key}: {refit_count}/5 per hour")
+                    conn.commit()
                     remaining_free = max(0, 3 - free_used)
                     return False, {
                         'remaining_free': remaining_free,
@@ -157,7 +228,7 @@ class CreditsService:
                 )
                 conn.commit()
                 
-                print(f"Refitting ({refit_count + 1}/5 per hour) for user {user_key} - no charge")
+                logger.info(f"Refitting ({refit_count + 1}/5 per hour) for user {user_key} - no charge")
                 remaining_free = max(0, 3 - free_used)
                 return True, {
                     'remaining_free': remaining_free,
@@ -168,20 +239,21 @@ class CreditsService:
                     'used_type': 'refitting'
                 }
             
-            # New generation (not a refit) - update hash and reset refit counter
-            if request_hash:
-                now = datetime.now().isoformat()
-                c.execute(
-                    'UPDATE users SET last_request_hash = ?, refit_count = 0, last_refit_reset = ? WHERE user_key = ?',
-                    (request_hash, now, user_key)
-                )
-                print(f"New generation for user {user_key} - refit counter reset")
+            def start_new_generation():
+                # New generation (not a refit) - update hash and reset refit counter
+                if request_hash:
+                    c.execute(
+                        'UPDATE users SET last_request_hash = ?, refit_count = 0, last_refit_reset = ? WHERE user_key = ?',
+                        (request_hash, datetime.now().isoformat(), user_key)
+                    )
+                    logger.debug(f"New generation for user {user_key} - refit counter reset")
             
             # Check if can proceed
             remaining_free = max(0, 3 - free_used)
             
             # Try to use free attempt first
             if free_used < 3:
+                start_new_generation()
                 c.execute(
                     'UPDATE users SET free_used_today = free_used_today + 1 WHERE user_key = ?',
                     (user_key,)
@@ -197,6 +269,7 @@ class CreditsService:
             
             # Check paid credits
             if credits > 0:
+                start_new_generation()
                 c.execute(
                     'UPDATE users SET credits = credits - 1 WHERE user_key = ?',
                     (user_key,)
@@ -210,7 +283,9 @@ class CreditsService:
                     'used_type': 'credit'
                 }
             
-            # No free or paid credits left
+            # No free or paid credits left: keep the daily reset / new user, but not the photos'
+            # hash, so the same request after paying is charged rather than taken for a refit
+            conn.commit()
             return False, {
                 'remaining_free': 0,
                 'credits': 0,
@@ -221,35 +296,19 @@ class CreditsService:
         finally:
             conn.close()
     
+    @timed_db('credits', 'get_user_status')
     def get_user_status(self, ip: str, user_agent: str) -> dict:
         """Get user's current credit status without consuming"""
         user_key = self.get_user_key(ip, user_agent)
-        conn = sqlite3.connect(self.db_path)
-        
-        try:
-            self._reset_daily_if_needed(conn, user_key)
-            
-            c = conn.cursor()
-            c.execute('SELECT free_used_today, credits FROM users WHERE user_key = ?', (user_key,))
-            result = c.fetchone()
-            
-            if not result:
-                print(f"[get_user_status] New user {user_key}: 3 free, 0 credits")
-                return {'remaining_free': 3, 'credits': 0}
-            
-            free_used, credits = result
-            remaining_free = max(0, 3 - free_used)
-            
-            print(f"[get_user_status] user_key={user_key}: free_used={free_used}, credits={credits}, remaining_free={remaining_free}")
-            
-            return {
-                'remaining_free': remaining_free,
-                'credits': credits
-            }
-        
-        finally:
-            conn.close()
+        status = self.get_balance(user_key)
+        logger.info(f"[get_user_status] user_key={user_key}: {status}")
+        return status
+    
+    def get_balance(self, user_key: str) -> dict:
+        """{'remaining_free', 'credits'} from the balance cache (no write; daily reset applied on read)"""
+        return get_balance_cache(self.db_path).get(user_key)
     
+    @timed_db('credits', 'add_credits')
     def add_credits(self, user_key: str, amount: int):
         """Add credits to user (called after successful payment)"""
         conn = sqlite3.connect(self.db_path)
@@ -271,11 +330,49 @@ class CreditsService:
                 )
             
             conn.commit()
-            print(f"Added {amount} credits to user {user_key}")
+            logger.info(f"Added {amount} credits to user {user_key}")
+        
+        finally:
+            conn.close()
+    
+    @timed_db('credits', 'reward_share')
+    def reward_share(self, user_key: str, platform: str, amount: int = SHARE_REWARD_CREDITS) -> bool:
+        """
+        Reward a share with credits, at most once per user, platform and day
+        
+        The share_log row and the credit grant are written in one transaction:
+        the unique (user_key, platform, share_day) index decides, so concurrent
+        requests can't both be rewarded.
+        
+        Returns:
+            True if credits were added, False if already rewarded today
+        """
+        now = datetime.now()
+        conn = sqlite3.connect(self.db_path)
+        
+        try:
+            c = conn.cursor()
+            c.execute(
+                'INSERT OR IGNORE INTO share_log (user_key, platform, shared_at, credits_rewarded, share_day) VALUES (?, ?, ?, ?, ?)',
+                (user_key, platform, now.isoformat(), amount, now.date().isoformat())
+            )
+            if c.rowcount == 0:
+                conn.rollback()
+                return False
+            
+            c.execute(
+                '''INSERT INTO users (user_key, free_used_today, credits) VALUES (?, 0, ?)
+                   ON CONFLICT(user_key) DO UPDATE SET credits = credits + excluded.credits''',
+                (user_key, amount)
+            )
+            conn.commit()
+            logger.info(f"Share reward: user={user_key}, platform={platform}, +{amount} credits")
+            return True
         
         finally:
             conn.close()
     
+    @timed_db('credits', 'refund_credit')
     def refund_credit(self, ip_or_user_key: str, user_agent: str = '', used_type: str = 'free'):
         """
         Refund a credit when virtual fitting fails
@@ -301,14 +398,14 @@ class CreditsService:
                     'UPDATE users SET free_used_today = MAX(0, free_used_today - 1) WHERE user_key = ?',
                     (user_key,)
                 )
-                print(f"🔄 Refunded 1 free attempt to user {user_key}")
+                logger.info(f"Refunded 1 free attempt to user {user_key}")
             elif used_type == 'credit':
                 # Refund paid credit
                 c.execute(
                     'UPDATE users SET credits = credits + 1 WHERE user_key = ?',
                     (user_key,)
                 )
-                print(f"🔄 Refunded 1 paid credit to user {user_key}")
+                logger.info(f"Refunded 1 paid credit to user {user_key}")
             
             conn.commit()
         
@@ -0,0 +1,200 @@
+"""
+Fitting Batch
+One person photo against several garments, streamed back as each try-on finishes
+
+POST /api/virtual-fitting/batch validates the person photo and every garment
+(uploads and Luxury Hall catalog items) up front, then hands the accepted
+items to run_batch(). Items run on a per-process pool, at most
+BATCH_CONCURRENCY of one batch at a time; provider calls across all requests
+queue in the fitting scheduler's lane for their credit type and are further
+capped per provider (services/fitting_pipeline.py). The request holds one admission slot for
+its first running item; every further item running at the same time takes
+another in-flight slot from the admission controller, so a batch counts
+against the worker's in-flight cap like that many single try-ons and
+waits for slots rather than going past it.
+
+Credits are settled per item: an item consumes its credit when it starts and
+is refunded if it produces nothing, so a batch is charged for exactly its
+successful items. Once the balance runs out the remaining items come back as
+payment_required.
+
+The response is NDJSON, one event per line:
+    {"type": "accepted", "items": [...]}
+    {"type": "item", "index": 2, "status": "completed", "resultUrl": ..., ...}
+    {"type": "done", "completed": 2, "failed": 1, "credits_info": {...}}
+A client that disconnects stops the batch: items not started yet are
+skipped, running ones stop before their IDM-VTON fallback and are refunded.
+"""
+import os
+import json
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Iterator, List, Optional
+
+from services.admission_service import admission_controller
+from services.fitting_jobs import JobRunner
+from services.metrics_service import fitting_batch_items_total
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_ITEMS = int(os.getenv('FITTING_BATCH_MAX_ITEMS', '8'))
+BATCH_CONCURRENCY = int(os.getenv('FITTING_BATCH_CONCURRENCY', '3'))
+BATCH_THREADS = int(os.getenv('FITTING_BATCH_THREADS', '8'))
+
+batch_runner = JobRunner(max_workers=BATCH_THREADS, name='fitting-batch')
+
+
+def load_catalog_garment(item_id) -> Optional[dict]:
+    """
+    A catalog item as a batch garment: {'item_id', 'name', 'category', 'clothing_bytes'}
+
+    None for unknown items; clothing_bytes is None when the item's image is
+    not a local attached asset (e.g. a "coming soon" placeholder).
+    """
+    from services import catalog_service
+    from services.image_variants import SOURCE_URL_PREFIX, VariantNotFound, source_path
+    try:
+        item = catalog_service.get_item(int(item_id))
+    except (TypeError, ValueError):
+        return None
+    if item is None:
+        return None
+    clothing_bytes = None
+    if item['image'].startswith(SOURCE_URL_PREFIX):
+        try:
+            with open(source_path(item['image'][len(SOURCE_URL_PREFIX):]), 'rb') as f:
+                clothing_bytes = f.read()
+        except (VariantNotFound, OSError):
+            pass
+    return {'item_id': item['item_id'], 'name': item['name'], 'category': item['fitting_category'],
+            'clothing_bytes': clothing_bytes}
+
+
+def _credits_info(info: dict) -> dict:
+    return {
+        'remaining_free': info['remaining_free'],
+        'credits': info['credits'],
+        'is_refitting': info.get('is_refitting', False),
+        'refit_count': info.get('refit_count', 0),
+    }
+
+
+def _run_item(user_photo_bytes: bytes, item: dict, charge: dict, options: dict, stop: threading.Event) -> dict:
+    """Charge, generate and encode one item; returns its 'item' event"""
+    from services.credits_service import CreditsService
+    from services.fitting_pipeline import generate, remove_background
+    from services.fitting_scheduler import lane_for
+    from services.result_encoding import encode_result
+
+    event = {'type': 'item', 'index': item['index'], 'item_id': item.get('item_id'), 'category': item['category']}
+    if stop.is_set():
+        return dict(event, status='cancelled')
+
+    credits_service = CreditsService()
+    request_hash = credits_service.calculate_request_hash(user_photo_bytes, item['clothing_bytes'])
+    allowed, info = credits_service.check_and_consume(charge['ip'], charge['user_agent'], request_hash)
+    if not allowed:
+        return dict(event, status='payment_required', refit_limit_exceeded=bool(info.get('refit_limit_exceeded')),
+                    credits_info=_credits_info(info))
+
+    try:
+        clothing_bytes = item['clothing_bytes']
+        if options['remove_bg']:
+            clothing_bytes = remove_background(clothing_bytes)
+        generated = generate(user_photo_bytes, clothing_bytes, item['category'], options['quality'],
+                             should_stop=stop.is_set, lane=lane_for(info.get('used_type')),
+                             user_key=charge.get('client_id'), **options['provider_config'])
+        if generated and not stop.is_set():
+            result, encoding = encode_result(generated['result'], options['accept'], options['result_format'])
+            return dict(event, status='completed', resultUrl=result, resultFormat=encoding.get('mimetype'),
+                        method=generated['method'], credits_info=_credits_info(info))
+    except Exception as e:
+        logger.exception(f"[fitting_batch] item {item['index']} failed: {e}")
+
+    if not info.get('is_refitting'):
+        credits_service.refund_credit(charge['ip'], charge['user_agent'], info.get('used_type', 'free'))
+        logger.warning(f"[fitting_batch] item {item['index']} produced nothing - credit refunded")
+    if stop.is_set():
+        return dict(event, status='cancelled')
+    return dict(event, status='failed', error=f"All virtual fitting methods failed for category: {item['category']}")
+
+
+def run_batch(user_photo_bytes: bytes, items: List[dict], charge: dict, quality: str = 'high',
+              remove_bg: bool = False, accept: str = '', result_format: Optional[str] = None,
+              provider_config: Optional[dict] = None, concurrency: int = BATCH_CONCURRENCY) -> Iterator[dict]:
+    """
+    Events of a batch, in completion order
+
+    items are {'index', 'category', 'clothing_bytes', 'item_id'?, 'name'?},
+    plus 'rejected' (an error dict) for garments that failed validation;
+    charge is {'ip', 'user_agent'} as passed to CreditsService, plus
+    'client_id' to queue the items under in the fitting scheduler.
+    """
+    options = {'quality': quality, 'remove_bg': remove_bg, 'accept': accept, 'result_format': result_format,
+               'provider_config': provider_config or {}}
+    stop = threading.Event()
+    pending = [item for item in items if not item.get('rejected')]
+    running = set()
+    extra_slots = set()
+    counts = {'completed': 0, 'failed': 0}
+
+    yield {'type': 'accepted', 'items': [
+        {'index': item['index'], 'item_id': item.get('item_id'), 'name': item.get('name'),
+         'category': item['category'], 'status': 'rejected' if item.get('rejected') else 'queued'}
+        for item in items]}
+
+    try:
+        for item in items:
+            if item.get('rejected'):
+                fitting_batch_items_total.inc(status='rejected')
+                counts['failed'] += 1
+                yield dict(item['rejected'], type='item', index=item['index'], item_id=item.get('item_id'),
+                           status='rejected')
+
+        while pending or running:
+            while pending and len(running) < max(1, concurrency):
+                # The request's own admission slot covers one item; the others need their own
+                extra_slot = bool(running)
+                if extra_slot and not admission_controller.try_acquire_slot():
+                    break
+                future = batch_runner.submit(_run_item, user_photo_bytes, pending.pop(0), charge, options, stop)
+                if extra_slot:
+                    extra_slots.add(future)
+                running.add(future)
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in extra_slots:
+                    extra_slots.discard(future)
+                    admission_controller.release()
+                event = future.result()
+                fitting_batch_items_total.inc(status=event['status'])
+                counts['completed' if event['status'] == 'completed' else 'failed'] += 1
+                yield event
+
+        from services.credits_service import CreditsService
+        credits_service = CreditsService()
+        user_key = charge['ip'] if charge['user_agent'] == '' else credits_service.get_user_key(
+            charge['ip'], charge['user_agent'])
+        yield dict(counts, type='done', credits_info=credits_service.get_balance(user_key))
+    finally:
+        if pending or running:
+            # The client went away: don't start the rest, stop the running ones before their fallback
+            stop.set()
+            for future in running:
+                future.cancel()
+            logger.info(f"[fitting_batch] stopped with {len(pending)} queued and {len(running)} running items")
+        for future in extra_slots:
+            # Freed once the item's thread is done, not when the stream closes
+            future.add_done_callback(lambda _: admission_controller.release())
+
+
+def ndjson(events: Iterator[dict], on_close=None) -> Iterator[bytes]:
+    """Serialise events as NDJSON lines; on_close() runs when the stream ends or is closed"""
+    try:
+        for event in events:
+            yield (json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8')
+    finally:
+        events.close()
+        if on_close:
+            on_close()
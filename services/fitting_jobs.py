@@ -0,0 +1,362 @@
+"""
+Fitting Jobs
+Progressive try-ons: a fast low-resolution preview, then the high-quality result, on one credit
+
+POST /api/virtual-fitting with progressive=true consumes the credit as
+usual, hands the work to a job and answers 202 with a job_id. The job runs
+two generations of the same request side by side:
+- preview: quality=fast (600x800 inputs)
+- final: quality=high
+The preview is stored as soon as it is ready (unless the final beat it) and
+is replaced by the final result. Clients poll
+GET /api/fitting-jobs/<id>?since=<version>&wait=<seconds>, which answers as
+soon as the job changes or after at most FITTING_JOB_MAX_WAIT seconds; while the final generation waits for a fitting scheduler slot,
+the job carries its queue position and estimated wait.
+
+Jobs live in SQLite (FITTING_JOBS_DB_PATH), so any gunicorn worker can answer
+a poll or a cancel. Cancelling (DELETE, or POST .../cancel for sendBeacon)
+stops both generations before their IDM-VTON fallback. A provider call that
+is already running finishes, but its result is thrown away.
+
+Credit settlement once both generations are done:
+- final succeeded: charged
+- final failed, preview succeeded: completed with the preview (degraded), charged
+- nothing produced (failed, or cancelled first): refunded (free refits cost nothing anyway)
+"""
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from services.metrics_service import timed_db
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv('FITTING_JOBS_DB_PATH', 'fitting_jobs.db')
+JOB_THREADS = int(os.getenv('FITTING_JOB_THREADS', '8'))
+# A running job not updated for this long belonged to a worker that died
+JOB_TIMEOUT_SECONDS = float(os.getenv('FITTING_JOB_TIMEOUT', '300'))
+# A long-poll holds one of the worker's few request threads: keep it short and let the
+# client pause between polls instead
+MAX_WAIT_SECONDS = float(os.getenv('FITTING_JOB_MAX_WAIT', '3'))
+POLL_INTERVAL = 0.5
+
+FINISHED = ('completed', 'failed', 'cancelled')
+
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+def init_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fitting_jobs (
+            job_id TEXT PRIMARY KEY,
+            client_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            version INTEGER NOT NULL DEFAULT 0,
+            preview TEXT,
+            preview_method TEXT,
+            result TEXT,
+            method TEXT,
+            result_format TEXT,
+            degraded INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            queue_position INTEGER,
+            queue_wait_seconds REAL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    for column_name, column_type in (('queue_position', 'INTEGER'), ('queue_wait_seconds', 'REAL')):
+        try:
+            conn.execute(f'ALTER TABLE fitting_jobs ADD COLUMN {column_name} {column_type}')
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+    conn.commit()
+
+
+def _connect(db_path: Optional[str] = None):
+    db_path = db_path or DB_PATH
+    path = os.path.abspath(db_path)
+    if path not in _initialized_paths or not os.path.exists(path):
+        with _init_lock:
+            if path not in _initialized_paths or not os.path.exists(path):
+                conn = sqlite3.connect(db_path)
+                try:
+                    init_schema(conn)
+                finally:
+                    conn.close()
+                _initialized_paths.add(path)
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# ---- Job rows ----
+
+@timed_db('fitting_jobs', 'create')
+def create_job(client_id: str) -> str:
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute('INSERT INTO fitting_jobs (job_id, client_id, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                     (job_id, client_id, now, now))
+        conn.commit()
+    finally:
+        conn.close()
+    return job_id
+
+
+@timed_db('fitting_jobs', 'create')
+def record_result(client_id: str, result: str, method: Optional[str], result_format: Optional[str]) -> str:
+    """A completed job holding a synchronous try-on's result, so other records can point at it"""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute('''
+            INSERT INTO fitting_jobs (job_id, client_id, status, version, result, method, result_format,
+                                      created_at, updated_at)
+            VALUES (?, ?, 'completed', 1, ?, ?, ?, ?, ?)
+        ''', (job_id, client_id, result, method, result_format, now, now))
+        conn.commit()
+    finally:
+        conn.close()
+    return job_id
+
+
+@timed_db('fitting_jobs', 'update')
+def update_job(job_id: str, **fields) -> bool:
+    """Update a running job (bumping its version); False once it has finished"""
+    assignments = ''.join(f'{name} = ?, ' for name in fields)
+    conn = _connect()
+    try:
+        c = conn.execute(
+            f"UPDATE fitting_jobs SET {assignments}version = version + 1, updated_at = ? "
+            f"WHERE job_id = ? AND status = 'running'",
+            (*fields.values(), time.time(), job_id))
+        conn.commit()
+        return c.rowcount == 1
+    finally:
+        conn.close()
+
+
+def get_job(job_id: str, client_id: Optional[str] = None) -> Optional[dict]:
+    """The job as a dict (None if unknown or owned by another client)"""
+    conn = _connect()
+    try:
+        row = conn.execute('SELECT * FROM fitting_jobs WHERE job_id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None or (client_id is not None and row['client_id'] != client_id):
+        return None
+    job = dict(row)
+    if job['status'] == 'running' and time.time() - job['updated_at'] > JOB_TIMEOUT_SECONDS:
+        job.update(status='failed', error='expired')
+    return job
+
+
+def wait_for_job(job_id: str, client_id: str, since: int = -1, timeout: float = 0) -> Optional[dict]:
+    """The job once its version is past `since` or it has finished, or after `timeout` seconds"""
+    deadline = time.monotonic() + min(max(timeout, 0), MAX_WAIT_SECONDS)
+    while True:
+        job = get_job(job_id, client_id)
+        if job is None or job['version'] > since or job['status'] in FINISHED or time.monotonic() >= deadline:
+            return job
+        time.sleep(POLL_INTERVAL)
+
+
+@timed_db('fitting_jobs', 'cancel')
+def cancel_job(job_id: str, client_id: str) -> Optional[dict]:
+    """Ask a running job to stop; returns the job (None if unknown)"""
+    if get_job(job_id, client_id) is None:
+        return None
+    update_job(job_id, cancel_requested=1)
+    return get_job(job_id, client_id)
+
+
+def cancel_requested(job_id: str) -> bool:
+    conn = _connect()
+    try:
+        row = conn.execute('SELECT cancel_requested FROM fitting_jobs WHERE job_id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return bool(row and row['cancel_requested'])
+
+
+def public_view(job: dict) -> dict:
+    """JSON body of GET /api/fitting-jobs/<id>"""
+    return {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'version': job['version'],
+        'previewUrl': job['preview'],
+        'resultUrl': job['result'],
+        'resultFormat': job['result_format'],
+        'method': job['method'] or job['preview_method'],
+        'degraded': bool(job['degraded']),
+        'cancel_requested': bool(job['cancel_requested']),
+        'queuePosition': job['queue_position'],
+        'estimatedWaitSeconds': job['queue_wait_seconds'],
+        'error': job['error'],
+    }
+
+
+# ---- Execution ----
+
+class JobRunner:
+    """Per-process thread pool for job work (never shared across fork)"""
+
+    def __init__(self, max_workers: int = JOB_THREADS, name: str = 'fitting-job'):
+        self.max_workers = max_workers
+        self.name = name
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=self.name)
+                    self._pid = os.getpid()
+        return self._executor.submit(fn, *args, **kwargs)
+
+
+job_runner = JobRunner()
+
+
+def _generate_encoded(job_id: str, kind: str, user_photo_bytes: bytes, clothing_bytes: bytes, category: str,
+                      accept: str, result_format: Optional[str], provider_config: dict,
+                      should_stop: Callable[[], bool], lane: str = 'free',
+                      user_key: Optional[str] = None) -> Optional[dict]:
+    from services.fitting_pipeline import generate
+    from services.result_encoding import encode_result
+    from services.tracing_service import start_trace, finish_trace, set_attribute
+
+    trace = start_trace(f'fitting_job.{kind}')
+    set_attribute('fitting.job_id', job_id)
+    def on_wait(queue):
+        # The final generation's place in the fitting scheduler, for the polling client
+        update_job(job_id, queue_position=queue['position'], queue_wait_seconds=queue['estimated_wait_seconds'])
+
+    try:
+        generated = generate(user_photo_bytes, clothing_bytes, category,
+                             'fast' if kind == 'preview' else 'high', should_stop=should_stop,
+                             lane=lane, user_key=user_key, on_wait=on_wait if kind == 'final' else None,
+                             **provider_config)
+        if generated:
+            generated['result'], encoding = encode_result(generated['result'], accept, result_format)
+            generated['mimetype'] = encoding.get('mimetype')
+        return generated
+    except Exception as e:
+        logger.exception(f"[fitting_jobs] {kind} generation failed: {e}")
+        return None
+    finally:
+        finish_trace(trace)
+
+
+def _refund(job_id: str, charge: dict):
+    """Give back the job's credit (once; free refits cost nothing)"""
+    if charge.get('is_refitting') or charge.get('refunded'):
+        return
+    from services.credits_service import CreditsService
+    CreditsService().refund_credit(charge['ip'], charge['user_agent'], charge.get('used_type', 'free'))
+    charge['refunded'] = True
+    logger.warning(f"[fitting_jobs] {job_id}: nothing generated - credit refunded")
+
+
+def run_progressive_job(job_id: str, charge: dict, user_photo_bytes: bytes, clothing_bytes: bytes, category: str,
+                        remove_bg: bool, accept: str, result_format: Optional[str], provider_config: dict):
+    """Preview and final generation of one job, then settlement (runs on a job thread)"""
+    final_done = threading.Event()
+    preview_outcome = {}
+
+    def stop_final():
+        return cancel_requested(job_id)
+
+    def stop_preview():
+        return final_done.is_set() or cancel_requested(job_id)
+
+    if remove_bg:
+        from services.fitting_pipeline import remove_background
+        clothing_bytes = remove_background(clothing_bytes)
+    args = (user_photo_bytes, clothing_bytes, category, accept, result_format, provider_config)
+    from services.fitting_scheduler import lane_for
+    queue = {'lane': lane_for(charge.get('used_type')), 'user_key': charge.get('client_id')}
+
+    def run_preview():
+        generated = _generate_encoded(job_id, 'preview', *args, should_stop=stop_preview, **queue)
+        preview_outcome['generated'] = generated
+        if generated and not final_done.is_set():
+            update_job(job_id, preview=generated['result'], preview_method=generated['method'],
+                       result_format=generated['mimetype'])
+
+    preview_thread = threading.Thread(target=run_preview, name=f'fitting-preview-{job_id[:8]}', daemon=True)
+    preview_thread.start()
+    final = None if stop_final() else _generate_encoded(job_id, 'final', *args, should_stop=stop_final, **queue)
+    final_done.set()
+    if final:
+        update_job(job_id, status='completed', result=final['result'], method=final['method'],
+                   result_format=final['mimetype'])
+    preview_thread.join()
+
+    if final:
+        return
+    preview = preview_outcome.get('generated')
+    if preview:
+        update_job(job_id, status='completed', result=preview['result'], method=preview['method'],
+                   result_format=preview['mimetype'], degraded=1)
+        return
+    # Refund before finishing the job, so a client that sees the final status sees the balance too
+    _refund(job_id, charge)
+    cancelled = cancel_requested(job_id)
+    update_job(job_id, status='cancelled' if cancelled else 'failed',
+               error=None if cancelled else f'All virtual fitting methods failed for category: {category}')
+
+
+def start_progressive_job(client_id: str, charge: dict, release: Callable[[], None] = lambda: None,
+                          **job_args) -> dict:
+    """
+    Create a job and run it in the background
+
+    charge is {'ip', 'user_agent', 'used_type', 'is_refitting'} of the consumed
+    credit, plus the 'client_id' its generations queue under in the fitting
+    scheduler; release() is called when the job's threads are done.
+    """
+    try:
+        job_id = create_job(client_id)
+    except Exception:
+        release()
+        raise
+
+    def run():
+        try:
+            run_progressive_job(job_id, charge, **job_args)
+        except Exception as e:
+            logger.exception(f"[fitting_jobs] {job_id} crashed: {e}")
+            job = get_job(job_id)
+            if job and job['status'] == 'running' and not job['result']:
+                # Settle like run_progressive_job would have: a stored preview is the result, else refund
+                if job['preview']:
+                    update_job(job_id, status='completed', result=job['preview'], method=job['preview_method'],
+                               degraded=1)
+                    return
+                _refund(job_id, charge)
+            update_job(job_id, status='failed', error='internal error')
+        finally:
+            release()
+
+    try:
+        job_runner.submit(run)
+    except Exception:
+        release()
+        raise
+    return get_job(job_id)
@@ -0,0 +1,165 @@
+"""
+Fitting Pipeline
+Provider execution of one try-on, shared by /api/virtual-fitting and background fitting jobs
+
+Everything after the credit check: optional background removal of the
+garment, the fast-mode resize, then Gemini with IDM-VTON as the fallback.
+Nothing here touches the Flask request, so it runs the same inside a
+request and on a job thread; provider credentials are passed in.
+
+Calls into each provider are capped per process (GEMINI_MAX_CONCURRENCY,
+REPLICATE_MAX_CONCURRENCY), so batches and background jobs can't open more
+provider connections than the provider tolerates, and paced against each
+provider's quota across all workers (services/provider_quota.py): when
+Gemini's budget won't free up within a few seconds the try-on goes straight
+to IDM-VTON instead of collecting a 429. Time spent waiting for a slot is
+the provider_wait stage. Before that, every try-on queues for one
+of the fitting scheduler's slots (services/fitting_scheduler.py), which
+serves paid requests before free ones before speculative work and rotates
+between users within a lane.
+"""
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from services.fitting_scheduler import QueueCancelled, fitting_scheduler
+from services.metrics_service import stage_timer, record_provider_result, classify_provider_error
+from services.provider_quota import QuotaExhausted, provider_quota
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_CATEGORIES = ('upper_body', 'lower_body', 'dress')
+
+PROVIDER_CONCURRENCY = {
+    'gemini': int(os.getenv('GEMINI_MAX_CONCURRENCY', '4')),
+    'replicate': int(os.getenv('REPLICATE_MAX_CONCURRENCY', '4')),
+}
+_provider_slots = {name: threading.BoundedSemaphore(limit) for name, limit in PROVIDER_CONCURRENCY.items()}
+
+
+@contextmanager
+def provider_slot(provider: str):
+    """
+    Hold one of the provider's concurrent call slots on this worker and a
+    lease on its shared quota; raises QuotaExhausted if the quota stays
+    unavailable for longer than the provider's max wait
+    """
+    slot = _provider_slots[provider]
+    with stage_timer('provider_wait'):
+        slot.acquire()
+        try:
+            lease = provider_quota.acquire(provider)
+        except BaseException:
+            slot.release()
+            raise
+    try:
+        yield
+    finally:
+        provider_quota.release(lease)
+        slot.release()
+
+
+def _record_provider_error(provider: str, error: Exception):
+    outcome = classify_provider_error(error)
+    record_provider_result(provider, outcome)
+    if outcome == 'rate_limited':
+        provider_quota.penalize(provider)
+
+
+def remove_background(clothing_bytes: bytes) -> bytes:
+    """Garment bytes with the background removed (the original bytes if rembg fails)"""
+    from services.background_removal_service import BackgroundRemovalService
+    from services.image_utils import to_data_uri, from_data_uri
+    try:
+        logger.info("Removing background from clothing image...")
+        with stage_timer('rembg'):
+            bg_removed_url = BackgroundRemovalService().remove_background(to_data_uri(clothing_bytes))
+        if bg_removed_url:
+            clothing_bytes = from_data_uri(bg_removed_url)
+            logger.debug(f"Background removed successfully, new size: {len(clothing_bytes)} bytes")
+    except Exception as e:
+        logger.warning(f"Background removal failed, using original image: {e}")
+    return clothing_bytes
+
+
+def generate(user_photo_bytes: bytes, clothing_bytes: bytes, category: str, quality: str = 'high',
+             gemini_api_key: Optional[str] = None, replicate_api_token: Optional[str] = None,
+             should_stop: Optional[Callable[[], bool]] = None, lane: str = 'free',
+             user_key: Optional[str] = None, on_wait: Optional[Callable[[dict], None]] = None) -> Optional[dict]:
+    """
+    Run the providers for one try-on
+
+    Waits for a scheduler slot in `lane` first (on_wait gets the queue
+    position while queued). Returns {'result': data URI, 'method': str,
+    'queue': {'lane', 'waited_seconds', 'position'}}, or None when every
+    provider failed or should_stop() turned true before a slot was granted
+    or before the fallback started.
+    """
+    try:
+        with fitting_scheduler.slot(lane, user_key or 'anonymous', should_stop, on_wait) as queue:
+            generated = _run_providers(user_photo_bytes, clothing_bytes, category, quality,
+                                       gemini_api_key, replicate_api_token, should_stop)
+    except QueueCancelled:
+        logger.info("Fitting stopped while queued")
+        return None
+    if generated:
+        generated['queue'] = queue
+    return generated
+
+
+def _run_providers(user_photo_bytes: bytes, clothing_bytes: bytes, category: str, quality: str,
+                   gemini_api_key: Optional[str], replicate_api_token: Optional[str],
+                   should_stop: Optional[Callable[[], bool]]) -> Optional[dict]:
+    if quality == 'fast':
+        logger.debug("Fast mode: Resizing images to 600x800...")
+        from services.image_utils import resize_for_fast_mode
+        with stage_timer('resize'):
+            user_photo_bytes = resize_for_fast_mode(user_photo_bytes)
+            clothing_bytes = resize_for_fast_mode(clothing_bytes)
+        logger.debug("Photos resized", extra={'user_photo_bytes': len(user_photo_bytes),
+                                              'clothing_photo_bytes': len(clothing_bytes)})
+
+    # 1st Priority: Gemini 2.5 Flash (Best quality, preserves hands/objects)
+    if gemini_api_key:
+        logger.debug(f"{category}: Using Gemini 2.5 Flash (quality-first)")
+        try:
+            from services.gemini_virtual_fitting_service import GeminiVirtualFittingService
+            gemini_service = GeminiVirtualFittingService(gemini_api_key)
+            with provider_slot('gemini'), stage_timer('gemini'):
+                result = gemini_service.virtual_try_on(user_photo_bytes, clothing_bytes, category=category)
+            if result:
+                record_provider_result('gemini', 'success')
+                logger.info(f"Gemini succeeded for {category}")
+                return {'result': result, 'method': "Gemini 2.5 Flash Image"}
+            record_provider_result('gemini', 'failure')
+        except QuotaExhausted as e:
+            logger.info(f"Gemini skipped: {e} - routing to IDM-VTON")
+        except Exception as e:
+            _record_provider_error('gemini', e)
+            logger.warning(f"Gemini failed: {str(e)}")
+
+    if should_stop and should_stop():
+        logger.info("Fitting stopped before the IDM-VTON fallback")
+        return None
+
+    # 2nd Priority: IDM-VTON (Fallback)
+    logger.debug(f"Fallback: IDM-VTON for {category}")
+    replicate_category = 'dresses' if category == 'dress' else category
+    try:
+        from services.replicate_service import ReplicateService
+        with provider_slot('replicate'), stage_timer('replicate'):
+            result = ReplicateService(replicate_api_token).virtual_try_on(
+                user_photo_bytes, clothing_bytes, category=replicate_category)
+        if result:
+            record_provider_result('replicate', 'success')
+            logger.info(f"IDM-VTON fallback succeeded")
+            return {'result': result, 'method': "Replicate IDM-VTON"}
+        record_provider_result('replicate', 'failure')
+    except QuotaExhausted as e:
+        logger.warning(f"IDM-VTON skipped: {e}")
+    except Exception as e:
+        _record_provider_error('replicate', e)
+        logger.warning(f"IDM-VTON also failed: {str(e)}")
+    return None
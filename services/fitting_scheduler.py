@@ -0,0 +1,198 @@
+"""
+Fitting Scheduler
+Priority lanes and per-user fair queuing in front of provider execution
+
+Every try-on (request threads, progressive jobs, batch items, speculative
+pre-generation) takes one of FITTING_SCHEDULER_SLOTS slots per worker before
+it calls a provider (services/fitting_pipeline.generate). When all slots
+are busy, waiters queue in lanes:
+
+    paid         the request consumed a paid credit
+    free         free tries and refits
+    speculative  background pre-generation
+
+A freed slot goes to the highest non-empty lane; within a lane, users are
+served round-robin (one ticket per user_key per round), so one user firing
+many requests waits behind their own queue instead of everybody else's.
+
+A queued ticket reports its position (tickets served first) and an
+estimated wait through on_wait, and estimate() answers the same for a
+client about to submit; waits are derived from an EWMA of recent slot hold
+times. Wait time per lane goes to
+fitsa_fitting_queue_wait_seconds, queue depth to fitsa_fitting_queue_depth.
+"""
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from services.metrics_service import fitting_queue_depth, fitting_queue_wait_seconds
+
+LANES = ('paid', 'free', 'speculative')
+SLOTS = int(os.getenv('FITTING_SCHEDULER_SLOTS', '4'))
+# Initial guess of one try-on's duration, refined from observed slot hold times
+EXPECTED_SECONDS = float(os.getenv('FITTING_EXPECTED_SECONDS', '30'))
+EWMA_ALPHA = 0.2
+WAIT_POLL = 0.25
+
+
+class QueueCancelled(Exception):
+    """should_stop() turned true while the ticket was still queued"""
+
+
+def lane_for(used_type: Optional[str]) -> str:
+    """Lane of a request from CreditsService's used_type ('credit', 'free', 'refitting')"""
+    return 'paid' if used_type == 'credit' else 'free'
+
+
+class _Ticket:
+    __slots__ = ('lane', 'user_key', 'granted', 'enqueued_at')
+
+    def __init__(self, lane: str, user_key: str):
+        self.lane = lane
+        self.user_key = user_key
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+class FairScheduler:
+    """Per-process slots with strict-priority lanes and round-robin users inside a lane"""
+
+    def __init__(self, slots: int = SLOTS, expected_seconds: float = EXPECTED_SECONDS):
+        self.slots = slots
+        self.running = 0
+        self.service_seconds = expected_seconds
+        # lane -> user_key -> deque of tickets; dict order is the round-robin order
+        self._lanes = {lane: OrderedDict() for lane in LANES}
+        self._cond = threading.Condition()
+
+    # ---- Queue state (callers hold self._cond) ----
+
+    def _waiting(self, lane: str) -> int:
+        return sum(len(tickets) for tickets in self._lanes[lane].values())
+
+    def _grant_next(self):
+        while self.running < self.slots:
+            lane = next((name for name in LANES if self._lanes[name]), None)
+            if lane is None:
+                return
+            users = self._lanes[lane]
+            user_key, tickets = next(iter(users.items()))
+            ticket = tickets.popleft()
+            del users[user_key]
+            if tickets:
+                users[user_key] = tickets  # back of the round
+            ticket.granted = True
+            self.running += 1
+            fitting_queue_depth.set(self._waiting(lane), lane=lane)
+        self._cond.notify_all()
+
+    def _ahead(self, lane: str, user_key: str, index: Optional[int] = None) -> int:
+        """Tickets served before a user's index-th queued ticket (index None: one they would add now)"""
+        ahead = sum(self._waiting(name) for name in LANES[:LANES.index(lane)])
+        users = self._lanes[lane]
+        own = users.get(user_key)
+        if own is None:
+            # A new user joins at the end of the round: every queued user gets a turn first
+            return ahead + len(users)
+        if index is None:
+            index = len(own)
+        before = True
+        for other, tickets in users.items():
+            if other == user_key:
+                before = False
+                continue
+            # Users earlier in the round get index + 1 turns before ours, later ones index turns
+            ahead += min(len(tickets), index + (1 if before else 0))
+        return ahead + index
+
+    def _estimate(self, ahead: int) -> float:
+        if self.running < self.slots and ahead == 0:
+            return 0.0
+        # Everyone ahead (and the running set) drains `slots` at a time
+        return math.ceil((ahead + 1) / max(1, self.slots)) * self.service_seconds
+
+    # ---- Public API ----
+
+    def estimate(self, lane: str, user_key: str) -> dict:
+        """Where a new ticket of this user would queue: {'lane', 'position', 'estimated_wait_seconds'}"""
+        with self._cond:
+            ahead = self._ahead(lane, user_key)
+            return {'lane': lane, 'position': ahead, 'estimated_wait_seconds': round(self._estimate(ahead), 1)}
+
+    @contextmanager
+    def slot(self, lane: str, user_key: str, should_stop: Optional[Callable[[], bool]] = None,
+             on_wait: Optional[Callable[[dict], None]] = None):
+        """
+        Hold a provider slot for the duration of the block
+
+        on_wait({'lane', 'position', 'estimated_wait_seconds'}) is called when
+        the ticket has to queue, whenever its position changes and once more
+        (position 0) when the slot is granted; raises QueueCancelled if
+        should_stop() turns true while queued.
+        """
+        ticket = _Ticket(lane, user_key)
+        with self._cond:
+            self._lanes[lane].setdefault(user_key, deque()).append(ticket)
+            fitting_queue_depth.set(self._waiting(lane), lane=lane)
+            self._grant_next()
+            first_position = last_position = None
+            while not ticket.granted:
+                if should_stop and should_stop():
+                    self._remove(ticket)
+                    raise QueueCancelled()
+                tickets = self._lanes[lane][user_key]
+                position = self._ahead(lane, user_key, next(i for i, t in enumerate(tickets) if t is ticket))
+                if first_position is None:
+                    first_position = position
+                if on_wait and position != last_position:
+                    last_position = position
+                    info = {'lane': lane, 'position': position,
+                            'estimated_wait_seconds': round(self._estimate(position), 1)}
+                    self._cond.release()
+                    try:
+                        on_wait(info)
+                    finally:
+                        self._cond.acquire()
+                    continue
+                self._cond.wait(WAIT_POLL)
+        if on_wait and last_position is not None:
+            on_wait({'lane': lane, 'position': 0, 'estimated_wait_seconds': 0.0})
+        waited = time.monotonic() - ticket.enqueued_at
+        fitting_queue_wait_seconds.observe(waited, lane=lane)
+        started = time.monotonic()
+        try:
+            yield {'lane': lane, 'waited_seconds': round(waited, 3), 'position': first_position or 0}
+        finally:
+            with self._cond:
+                self.running -= 1
+                held = time.monotonic() - started
+                self.service_seconds += EWMA_ALPHA * (held - self.service_seconds)
+                self._grant_next()
+
+    def _remove(self, ticket: _Ticket):
+        users = self._lanes[ticket.lane]
+        tickets = users.get(ticket.user_key)
+        if tickets is not None:
+            try:
+                tickets.remove(ticket)
+            except ValueError:
+                pass
+            if not tickets:
+                del users[ticket.user_key]
+        fitting_queue_depth.set(self._waiting(ticket.lane), lane=ticket.lane)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'running': self.running,
+                'waiting': {lane: self._waiting(lane) for lane in LANES},
+                'service_seconds': round(self.service_seconds, 1),
+            }
+
+
+fitting_scheduler = FairScheduler()
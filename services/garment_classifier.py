@@ -0,0 +1,170 @@
+"""
+Garment Classifier
+Fast CPU check of the garment photo's category (upper_body / lower_body / dress)
+
+/api/virtual-fitting trusts the category form field, and a wrong one costs a
+full provider call (30-90 s) and a credit or refit. This looks at the
+garment's silhouette before any of that is spent:
+
+- mask: the alpha channel when the upload has one (rembg output, cut-outs),
+  else pixels that differ from the border colour (product shots on a plain
+  background). Only the largest column-connected segment is kept, so a photo
+  of two garments side by side is read as one.
+- features (NumPy over a <= MAX_SIDE px copy):
+    aspect    height / width of the silhouette
+    top       width of the top 20% relative to the widest row
+              (waistbands are wide, necklines and shoulders narrower)
+    flare     hem width minus chest width (dresses widen, shirts narrow)
+    leg_gap   background showing between the legs in the bottom 30%
+- each category is a Gaussian prototype over those features; the result is
+  the softmax over their log-likelihoods.
+
+classify() abstains (category None) when the mask is unreliable (e.g. a white
+shirt on a white background) or the silhouette is far from every prototype,
+so callers only act on confident answers. benchmarks/garment_classifier_bench.py
+measures accuracy and latency on the labelled attached_assets photos. The
+prototypes were tuned on those same photos; on the held-out set (--held-out)
+confident answers are often wrong, so the route's mismatch check
+(GARMENT_CATEGORY_CHECK) is off by default.
+"""
+import io
+import os
+import logging
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ('upper_body', 'lower_body', 'dress')
+FEATURES = ('aspect', 'top', 'flare', 'leg_gap')
+MAX_SIDE = 160
+MISMATCH_CONFIDENCE = float(os.getenv('GARMENT_MISMATCH_CONFIDENCE', '0.85'))
+
+# Per category: mean and spread of each feature (FEATURES order)
+PROTOTYPE_MEANS = np.array([
+    [1.2, 0.50, -0.25, 0.00],   # upper_body: about square, sleeves wider than the hem
+    [1.7, 0.68, -0.05, 0.15],   # lower_body: tall, full-width waistband, legs apart
+    [2.6, 0.40, 0.15, 0.00],    # dress: very tall, narrow top, widening skirt
+])
+PROTOTYPE_SPREADS = np.array([
+    [0.30, 0.12, 0.15, 0.06],
+    [0.40, 0.10, 0.20, 0.10],
+    [0.50, 0.12, 0.15, 0.06],
+])
+
+MIN_COVERAGE = 0.05        # silhouette share of the image below this: nothing found
+MAX_UPPER_HOLES = 0.15     # holes inside the top half: the mask missed parts of the garment
+MAX_DISTANCE = 25.0        # squared normalised distance to the nearest prototype
+BACKGROUND_THRESHOLD = 12  # min per-channel difference from the background colour
+
+
+def _mask(img: Image.Image) -> np.ndarray:
+    """Boolean foreground mask of an image"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        alpha = np.asarray(img.convert('RGBA'))[:, :, 3]
+        if alpha.min() < 128:
+            return alpha >= 128
+
+    pixels = np.asarray(img.convert('RGB'), dtype=np.int16)
+    border = np.concatenate([pixels[:2].reshape(-1, 3), pixels[-2:].reshape(-1, 3),
+                             pixels[:, :2].reshape(-1, 3), pixels[:, -2:].reshape(-1, 3)])
+    background = np.median(border, axis=0)
+    noise = np.percentile(np.abs(border - background).max(axis=1), 95)
+    return np.abs(pixels - background).max(axis=2) > max(BACKGROUND_THRESHOLD, 2 * noise)
+
+
+def _main_segment(mask: np.ndarray) -> Optional[np.ndarray]:
+    """Mask cropped to the heaviest run of occupied columns, then to its occupied rows"""
+    columns = mask.mean(axis=0) > 0.02
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], columns.astype(np.int8), [0]])))
+    if not len(edges):
+        return None
+    starts, ends = edges[::2], edges[1::2]
+    cumulative = np.concatenate([[0], np.cumsum(mask.sum(axis=0))])
+    best = int(np.argmax(cumulative[ends] - cumulative[starts]))
+    segment = mask[:, starts[best]:ends[best]]
+    rows = np.flatnonzero(segment.mean(axis=1) > 0.02)
+    return segment[rows[0]:rows[-1] + 1] if len(rows) else None
+
+
+def _band(values: np.ndarray, start: float, end: float) -> float:
+    n = len(values)
+    lo = min(int(n * start), n - 1)
+    return float(values[lo:max(int(n * end), lo + 1)].mean())
+
+
+def extract_features(image_bytes: bytes) -> Optional[dict]:
+    """Silhouette features (FEATURES plus mask quality), or None when no garment is found"""
+    img = Image.open(io.BytesIO(image_bytes))
+    img.draft('RGB', (MAX_SIDE * 2, MAX_SIDE * 2))  # JPEG: decode at reduced scale
+    img.thumbnail((MAX_SIDE, MAX_SIDE))
+    mask = _mask(img)
+    segment = _main_segment(mask)
+    if segment is None:
+        return None
+
+    height, width = segment.shape
+    filled = segment.any(axis=1)
+    first = np.argmax(segment, axis=1)
+    last = width - 1 - np.argmax(segment[:, ::-1], axis=1)
+    span = np.where(filled, (last - first + 1) / width, 0.0)
+    holes = np.where(span > 0, 1 - segment.mean(axis=1) / np.maximum(span, 1e-6), 0.0)
+    bands = np.array([_band(span, i / 10, (i + 1) / 10) for i in range(10)])
+
+    return {
+        'aspect': height / width,
+        'top': float(bands[:2].mean()),
+        'flare': float(bands[7:].mean() - bands[2:6].max()),
+        'leg_gap': _band(holes, 0.7, 1.0) - _band(holes, 0.1, 0.4),
+        'coverage': float(segment.sum() / mask.size),
+        'upper_holes': _band(holes, 0.0, 0.5),
+    }
+
+
+def classify(image_bytes: bytes) -> dict:
+    """
+    {'category', 'confidence', 'scores', 'features', 'reason'}
+
+    category is None (with a reason) when the classifier abstains.
+    """
+    try:
+        features = extract_features(image_bytes)
+    except Exception as e:
+        logger.warning(f"[garment_classifier] could not read image: {e}")
+        return {'category': None, 'confidence': 0.0, 'scores': {}, 'features': None, 'reason': 'unreadable'}
+
+    if features is None or features['coverage'] < MIN_COVERAGE:
+        return {'category': None, 'confidence': 0.0, 'scores': {}, 'features': features, 'reason': 'no_garment'}
+
+    x = np.array([features[name] for name in FEATURES])
+    distances = (((x - PROTOTYPE_MEANS) / PROTOTYPE_SPREADS) ** 2).sum(axis=1)
+    likelihoods = np.exp(-0.5 * (distances - distances.min()))
+    probabilities = likelihoods / likelihoods.sum()
+    best = int(np.argmax(probabilities))
+    result = {
+        'category': CATEGORIES[best],
+        'confidence': round(float(probabilities[best]), 3),
+        'scores': {category: round(float(p), 3) for category, p in zip(CATEGORIES, probabilities)},
+        'features': {name: round(value, 3) for name, value in features.items()},
+        'reason': None,
+    }
+    if features['upper_holes'] > MAX_UPPER_HOLES:
+        result.update(category=None, confidence=0.0, reason='unreliable_mask')
+    elif distances.min() > MAX_DISTANCE:
+        result.update(category=None, confidence=0.0, reason='unrecognized_shape')
+    return result
+
+
+def check_category(image_bytes: bytes, requested: str, threshold: float = MISMATCH_CONFIDENCE) -> dict:
+    """
+    Compare the requested category with the detected one
+
+    Returns classify()'s result plus 'mismatch': True only when the classifier
+    is at least `threshold` confident in a different category.
+    """
+    result = classify(image_bytes)
+    result['mismatch'] = (result['category'] is not None and result['category'] != requested
+                          and result['confidence'] >= threshold)
+    return result
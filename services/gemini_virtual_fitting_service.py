@@ -1,3 +1,4 @@
+import logging
 import os
 import base64
 import requests
@@ -6,6 +7,16 @@ from google import genai
 from google.genai import types
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import time
+import contextvars
+from services.metrics_service import stage_timer
+from services.tracing_service import span
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiTimeoutError(TimeoutError):
+    """Raised when the Gemini call exceeds its deadline"""
+
 
 class GeminiVirtualFittingService:
     def __init__(self, api_key: str):
@@ -28,10 +39,10 @@ class GeminiVirtualFittingService:
             from PIL import Image
             from io import BytesIO
             
-            print(f"\n=== Gemini 2.5 Flash Image Virtual Try-On ===")
-            print(f"Category: {category}")
-            print(f"Person image: {len(person_image_bytes)} bytes ({len(person_image_bytes)/1024:.1f}KB)")
-            print(f"Clothing image: {len(clothing_image_bytes)} bytes ({len(clothing_image_bytes)/1024:.1f}KB)")
+            logger.debug(f"Gemini 2.5 Flash Image Virtual Try-On")
+            logger.debug(f"Category: {category}")
+            logger.debug(f"Person image: {len(person_image_bytes)} bytes ({len(person_image_bytes)/1024:.1f}KB)")
+            logger.debug(f"Clothing image: {len(clothing_image_bytes)} bytes ({len(clothing_image_bytes)/1024:.1f}KB)")
             
             # Convert bytes to PIL Images
             person_img = Image.open(BytesIO(person_image_bytes))
@@ -39,9 +50,9 @@ class GeminiVirtualFittingService:
             
             # Store original size to restore later
             original_size = person_img.size
-            print(f"Original person image size: {original_size}")
+            logger.debug(f"Original person image size: {original_size}")
             
-            print("Converting images to RGB...")
+            logger.debug("Converting images to RGB...")
             person_img = person_img.convert('RGB')
             clothing_img = clothing_img.convert('RGB')
             
@@ -197,14 +208,14 @@ STEP 3 - NATURAL INTEGRATION:
 
 OUTPUT: SAME person (identical body) with ONLY upper clothing changed + CORRECT sleeve length - ZERO body modification."""
 
-            print("Calling Gemini 2.5 Flash Image API...")
+            logger.debug("Calling Gemini 2.5 Flash Image API...")
             
             # Add critical size preservation to prompt
             size_instruction = f"\n\nCRITICAL: Output image MUST be EXACTLY {original_size[0]}x{original_size[1]} pixels (width x height). DO NOT change dimensions - this will distort body proportions."
             final_prompt = prompt + size_instruction
             
             # Configure for IMAGE generation with new API
-            print("📸 Requesting IMAGE generation from Gemini (new API)...")
+            logger.debug("Requesting IMAGE generation from Gemini (new API)...")
             
             config = types.GenerateContentConfig(
                 temperature=0.1,  # Minimal creativity, maximum preservation
@@ -214,7 +225,7 @@ OUTPUT: SAME person (identical body) with ONLY upper clothing changed + CORRECT
             )
             
             # Generate with Gemini using new API with 90-second timeout
-            print("⏱️ Setting 90-second timeout for Gemini API call...")
+            logger.debug("Setting 90-second timeout for Gemini API call...")
             
             def call_gemini():
                 return self.client.models.generate_content(
@@ -225,15 +236,17 @@ OUTPUT: SAME person (identical body) with ONLY upper clothing changed + CORRECT
             
             # Use ThreadPoolExecutor for reliable timeout in production
             with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(call_gemini)
+                # Carry the request context (trace, request id) into the worker thread
+                future = executor.submit(contextvars.copy_context().run, call_gemini)
                 try:
-                    response = future.result(timeout=90)
+                    with span('gemini.generate_content'):
+                        response = future.result(timeout=90)
                 except FutureTimeoutError:
-                    print(f"❌ Gemini API timeout after 90 seconds")
-                    raise Exception(f"요청 시간이 초과되었습니다 (90초). Gemini API가 응답하지 않습니다. 잠시 후 다시 시도해주세요.")
+                    logger.warning(f"Gemini API timeout after 90 seconds")
+                    raise GeminiTimeoutError(f"요청 시간이 초과되었습니다 (90초). Gemini API가 응답하지 않습니다. 잠시 후 다시 시도해주세요.")
             
-            print(f"✓ Gemini API call completed (new API)")
-            print(f"🔍 Response has {len(response.parts) if response.parts else 0} parts")
+            logger.info(f"Gemini API call completed (new API)")
+            logger.debug(f"Response has {len(response.parts) if response.parts else 0} parts")
             
             # Extract image from response (new API format)
             if response.parts:
@@ -245,32 +258,31 @@ OUTPUT: SAME person (identical body) with ONLY upper clothing changed + CORRECT
                         # Convert to PIL Image to check size
                         result_img = Image.open(BytesIO(image_bytes))
                         generated_size = result_img.size
-                        print(f"Generated image size: {generated_size}, Original: {original_size}")
+                        logger.debug(f"Generated image size: {generated_size}, Original: {original_size}")
                         
                         if generated_size != original_size:
-                            print(f"⚠️ WARNING: Size mismatch detected - this may distort body proportions")
-                            print(f"⚠️ Using generated size AS-IS to preserve body shape")
+                            logger.warning(f"Size mismatch detected - this may distort body proportions")
+                            logger.warning(f"Using generated size AS-IS to preserve body shape")
                         
-                        # Convert to base64 data URI
-                        b64_data = base64.b64encode(image_bytes).decode('utf-8')
-                        data_uri = f"data:image/png;base64,{b64_data}"
+                        # Convert to base64 data URI, labelled with the format Gemini actually returned
+                        mime_type = Image.MIME.get(result_img.format, part.inline_data.mime_type or 'image/png')
+                        with stage_timer('encode'):
+                            b64_data = base64.b64encode(image_bytes).decode('utf-8')
+                            data_uri = f"data:{mime_type};base64,{b64_data}"
                         
-                        print(f"✓ Generated image: {len(image_bytes)} bytes (size: {generated_size})")
+                        logger.debug(f"Generated image: {len(image_bytes)} bytes (size: {generated_size})")
                         return data_uri
             
-            print("✗ No image data in response")
+            logger.warning("No image data in response")
             return None
             
         except Exception as e:
             error_str = str(e).lower()
-            print(f"Gemini virtual try-on error: {str(e)}")
+            logger.exception(f"Gemini virtual try-on error: {str(e)}")
             
             # Detect rate limit errors
             if 'rate' in error_str and ('limit' in error_str or 'exceeded' in error_str):
-                print("⚠️ Gemini API rate limit exceeded - fallback will be triggered")
+                logger.warning("Gemini API rate limit exceeded - fallback will be triggered")
             elif 'quota' in error_str:
-                print("⚠️ Gemini API quota exceeded - fallback will be triggered")
-            
-            import traceback
-            traceback.print_exc()
+                logger.warning("Gemini API quota exceeded - fallback will be triggered")
             raise
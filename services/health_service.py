@@ -0,0 +1,226 @@
+"""
+Health Service
+Liveness and readiness for load balancers
+
+- /healthz (liveness) answers from a constant: no I/O, no subprocesses, no
+  allocation beyond the response object. It only proves the worker is
+  scheduling requests.
+- /readyz (readiness) serves checks cached by a per-worker background
+  thread (SQLite writable, rembg model loaded, provider circuit state,
+  config), plus live queue depth. It returns 503 when the instance should
+  not get traffic: a failed critical check, or "shed load" (fitting
+  requests at the in-flight cap, more than SHED_QUEUE_DEPTH user try-ons
+  waiting for a fitting scheduler slot, or an operator drain via
+  SHED_LOAD_FILE).
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = float(os.getenv('READINESS_REFRESH_SECONDS', '5'))
+SHED_LOAD_FILE = os.getenv('SHED_LOAD_FILE', '/tmp/fitsa_shed_load')
+# Paid + free generations queued for a provider slot (progressive jobs and batch items
+# hand back their admission slot while they wait, so the in-flight cap alone misses them)
+SHED_QUEUE_DEPTH = int(os.getenv('SHED_QUEUE_DEPTH', '8'))
+REQUIRED_ENV_VARS = ('GEMINI_API_KEY', 'STRIPE_SECRET_KEY', 'STRIPE_WEBHOOK_SECRET', 'SESSION_SECRET')
+
+CIRCUIT_WINDOW = int(os.getenv('PROVIDER_CIRCUIT_WINDOW', '20'))
+CIRCUIT_WINDOW_SECONDS = float(os.getenv('PROVIDER_CIRCUIT_WINDOW_SECONDS', '300'))
+CIRCUIT_MIN_FAILURES = int(os.getenv('PROVIDER_CIRCUIT_MIN_FAILURES', '5'))
+CIRCUIT_FAILURE_RATIO = float(os.getenv('PROVIDER_CIRCUIT_FAILURE_RATIO', '0.5'))
+
+LIVENESS_BODY = b'{"status":"ok"}'
+
+
+# ---- Provider circuit state ----
+
+class ProviderCircuits:
+    """
+    Recent outcomes per AI provider (this worker).
+
+    A provider's circuit is 'open' when, within the window, at least
+    CIRCUIT_MIN_FAILURES calls failed and they are CIRCUIT_FAILURE_RATIO of
+    all calls; 'closed' otherwise, 'unknown' without recent calls.
+    """
+
+    def __init__(self, window: int = CIRCUIT_WINDOW, window_seconds: float = CIRCUIT_WINDOW_SECONDS,
+                 min_failures: int = CIRCUIT_MIN_FAILURES, failure_ratio: float = CIRCUIT_FAILURE_RATIO,
+                 clock=time.monotonic):
+        self.window = window
+        self.window_seconds = window_seconds
+        self.min_failures = min_failures
+        self.failure_ratio = failure_ratio
+        self.clock = clock
+        self._outcomes: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, outcome: str):
+        with self._lock:
+            self._outcomes.setdefault(provider, deque(maxlen=self.window)).append((self.clock(), outcome == 'success'))
+
+    def state(self, provider: str) -> dict:
+        cutoff = self.clock() - self.window_seconds
+        with self._lock:
+            recent = [ok for ts, ok in self._outcomes.get(provider, ()) if ts >= cutoff]
+        failures = recent.count(False)
+        if not recent:
+            state = 'unknown'
+        elif failures >= self.min_failures and failures / len(recent) >= self.failure_ratio:
+            state = 'open'
+        else:
+            state = 'closed'
+        return {'state': state, 'recent_calls': len(recent), 'recent_failures': failures}
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            providers = list(self._outcomes)
+        return {provider: self.state(provider) for provider in providers}
+
+
+provider_circuits = ProviderCircuits()
+
+
+# ---- Checks ----
+
+def check_sqlite(path: str) -> dict:
+    """Writable means we can take the write lock (BEGIN IMMEDIATE) within a second"""
+    try:
+        conn = sqlite3.connect(path, timeout=1.0)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('ROLLBACK')
+        finally:
+            conn.close()
+        return {'ok': True}
+    except sqlite3.Error as e:
+        return {'ok': False, 'error': str(e)}
+
+
+def check_rembg() -> dict:
+    """Model loaded in this worker; not critical, the first request loads it lazily"""
+    import sys
+    module = sys.modules.get('services.background_removal_service')
+    loaded = module is not None and getattr(module, '_session_pid', None) == os.getpid()
+    return {'ok': True, 'loaded': loaded}
+
+
+def check_providers() -> dict:
+    circuits = provider_circuits.snapshot()
+    all_open = bool(circuits) and all(c['state'] == 'open' for c in circuits.values())
+    # Upstream outages hit every instance alike, so they degrade rather than unready this one
+    return {'ok': True, 'degraded': all_open, 'circuits': circuits}
+
+
+def check_config() -> dict:
+    missing = [var for var in REQUIRED_ENV_VARS if not os.getenv(var)]
+    return {'ok': True, 'degraded': bool(missing), 'missing_env_vars': missing}
+
+
+def _database_paths():
+    from services import saved_fits_service
+    return {'credits': 'credits.db', 'saved_fits': saved_fits_service.DB_PATH}
+
+
+def run_checks() -> Dict[str, dict]:
+    checks = {f'sqlite_{name}': check_sqlite(path) for name, path in _database_paths().items()}
+    checks['rembg'] = check_rembg()
+    checks['providers'] = check_providers()
+    checks['config'] = check_config()
+    return checks
+
+
+# ---- Readiness ----
+
+class ReadinessChecker:
+    """Runs run_checks() in a background thread per worker and serves the cached result"""
+
+    def __init__(self, interval: float = REFRESH_INTERVAL, checks=run_checks):
+        self.interval = interval
+        self.checks = checks
+        self._result: Optional[dict] = None
+        self._checked_at = 0.0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            result = self.checks()
+        except Exception as e:
+            logger.exception("Readiness checks failed")
+            result = {'checks': {'ok': False, 'error': str(e)}}
+        self._result, self._checked_at = result, time.time()
+
+    def _loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.interval)
+            self._refresh()
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._result = None
+                    self._refresh()
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._loop, name='readiness-checks', daemon=True).start()
+
+    def cached(self) -> tuple:
+        self._ensure_started()
+        return self._result, self._checked_at
+
+
+readiness_checker = ReadinessChecker()
+
+
+def shed_load_state() -> dict:
+    """Live (uncached) load signals: fitting queue depth and operator drain flag"""
+    from services.admission_service import admission_controller
+    from services.fitting_scheduler import fitting_scheduler
+    admission = admission_controller.snapshot()
+    scheduler = fitting_scheduler.snapshot()
+    # Speculative work only gets a slot when no user try-on is waiting, so it doesn't count
+    waiting = scheduler['waiting']['paid'] + scheduler['waiting']['free']
+    saturated = admission['in_flight'] >= admission['max_in_flight']
+    backlogged = SHED_QUEUE_DEPTH > 0 and waiting > SHED_QUEUE_DEPTH
+    draining = bool(SHED_LOAD_FILE) and os.path.exists(SHED_LOAD_FILE)
+    return {
+        'shed_load': saturated or backlogged or draining,
+        'draining': draining,
+        'queue': {'fittings_in_flight': admission['in_flight'], 'max_in_flight': admission['max_in_flight'],
+                  'fittings_waiting': waiting, 'max_waiting': SHED_QUEUE_DEPTH,
+                  'generations_running': scheduler['running'], 'generation_slots': scheduler['slots']},
+    }
+
+
+def readiness() -> tuple:
+    """(body, status) for /readyz"""
+    checks, checked_at = readiness_checker.cached()
+    load = shed_load_state()
+    failed = [name for name, check in checks.items() if not check.get('ok')]
+    degraded = [name for name, check in checks.items() if check.get('degraded')]
+    if failed:
+        status = 'not_ready'
+    elif load['shed_load']:
+        status = 'shedding'
+    elif degraded:
+        status = 'degraded'
+    else:
+        status = 'ready'
+    body = {
+        'status': status,
+        'shed_load': load['shed_load'],
+        'draining': load['draining'],
+        'queue': load['queue'],
+        'checks': checks,
+        'checked_at': checked_at,
+        'age_seconds': round(time.time() - checked_at, 2),
+        'pid': os.getpid(),
+    }
+    return body, 503 if status in ('not_ready', 'shedding') else 200
@@ -0,0 +1,297 @@
+"""
+Idempotency Service
+Idempotency-Key replay and in-flight coalescing for try-on requests
+
+Mobile clients double-tap and retry after a dropped connection. Two layers
+keep a retry from running (and charging) a try-on twice:
+
+1. Idempotency-Key header (@idempotent on the view): the first request with
+   a key runs and its response is stored in SQLite (IDEMPOTENCY_DB_PATH), so
+   any worker replays it for a retry with the same key (header
+   Idempotent-Replayed: true). While the first request is still running a
+   retry gets 409 with Retry-After; a key reused for a different request
+   (other photos or options) gets 422. Only 2xx responses are stored; an
+   error (a 5xx whose credit was refunded, 402, 429, ...) leaves the key
+   free, so the client may retry it. The result image is not copied into
+   the stored body: it is kept as a completed fitting job (see
+   services/fitting_jobs.py) and the body holds its resultRef, which a
+   replay swaps back. Keys are per client and kept for IDEMPOTENCY_TTL
+   seconds.
+
+2. Coalescing (fitting_coalescer): identical requests that are in flight at
+   the same time on a worker (same client, same photos, same options) share
+   one provider execution; followers wait for the leader and get a copy of
+   its result. The duplicate is already a free refit in CreditsService, so
+   only one credit is used. A follower waits at most IDEMPOTENCY_COALESCE_WAIT
+   seconds (CoalesceTimeout, answered with 503 + Retry-After) rather than
+   holding its request thread for as long as the leader's call hangs.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from functools import wraps
+from typing import Callable, Optional, Tuple
+
+from flask import current_app, jsonify, request
+
+from services.metrics_service import fitting_coalesced_total, idempotency_requests_total, timed_db
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv('IDEMPOTENCY_DB_PATH', 'idempotency.db')
+TTL_SECONDS = float(os.getenv('IDEMPOTENCY_TTL', '86400'))
+# An in-progress key not finished after this long belonged to a worker that died
+IN_PROGRESS_TIMEOUT = float(os.getenv('IDEMPOTENCY_IN_PROGRESS_TIMEOUT', '300'))
+MAX_KEY_LENGTH = 255
+RETRY_AFTER_SECONDS = 2
+# How long an identical request waits for the in-flight one before giving up
+COALESCE_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_COALESCE_WAIT', '120'))
+
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+def init_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            scope TEXT NOT NULL,
+            client_id TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'in_progress',
+            status_code INTEGER,
+            mimetype TEXT,
+            body BLOB,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (scope, client_id, idempotency_key)
+        )
+    ''')
+    conn.commit()
+
+
+def _connect(db_path: Optional[str] = None):
+    db_path = db_path or DB_PATH
+    path = os.path.abspath(db_path)
+    if path not in _initialized_paths or not os.path.exists(path):
+        with _init_lock:
+            if path not in _initialized_paths or not os.path.exists(path):
+                conn = sqlite3.connect(db_path)
+                try:
+                    init_schema(conn)
+                finally:
+                    conn.close()
+                _initialized_paths.add(path)
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# ---- Stored responses ----
+
+@timed_db('idempotency', 'begin')
+def begin(scope: str, client_id: str, key: str, fingerprint: str) -> Tuple[str, Optional[dict]]:
+    """
+    Claim a key for a new request
+
+    Returns ('new', None) when the caller should run the request,
+    ('replay', {'status_code', 'mimetype', 'body'}) for a finished one,
+    ('in_progress', None) while another request holds the key, or
+    ('mismatch', None) when the key was used for a different request.
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT * FROM idempotency_keys WHERE scope = ? AND client_id = ? AND idempotency_key = ?',
+                           (scope, client_id, key)).fetchone()
+        abandoned = row is not None and (
+            row['expires_at'] < now
+            or (row['status'] == 'in_progress' and now - row['created_at'] > IN_PROGRESS_TIMEOUT))
+        if row is None or abandoned:
+            conn.execute('''
+                INSERT OR REPLACE INTO idempotency_keys
+                    (scope, client_id, idempotency_key, fingerprint, status, created_at, expires_at)
+                VALUES (?, ?, ?, ?, 'in_progress', ?, ?)
+            ''', (scope, client_id, key, fingerprint, now, now + TTL_SECONDS))
+            conn.commit()
+            return 'new', None
+        conn.commit()
+    finally:
+        conn.close()
+    if row['fingerprint'] != fingerprint:
+        return 'mismatch', None
+    if row['status'] == 'in_progress':
+        return 'in_progress', None
+    return 'replay', {'status_code': row['status_code'], 'mimetype': row['mimetype'], 'body': row['body']}
+
+
+@timed_db('idempotency', 'complete')
+def complete(scope: str, client_id: str, key: str, status_code: int, mimetype: str, body: bytes):
+    conn = _connect()
+    try:
+        conn.execute('''
+            UPDATE idempotency_keys SET status = 'done', status_code = ?, mimetype = ?, body = ?
+            WHERE scope = ? AND client_id = ? AND idempotency_key = ?
+        ''', (status_code, mimetype, body, scope, client_id, key))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def forget(scope: str, client_id: str, key: str):
+    """Release a key whose request failed, so a retry runs again"""
+    conn = _connect()
+    try:
+        conn.execute('DELETE FROM idempotency_keys WHERE scope = ? AND client_id = ? AND idempotency_key = ?',
+                     (scope, client_id, key))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _store_body(client_id: str, response) -> bytes:
+    """Body to store for a response: a result image is replaced by a reference to a fitting job holding it"""
+    data = response.get_json(silent=True) if response.is_json else None
+    result = data.get('resultUrl') if isinstance(data, dict) else None
+    if not (isinstance(result, str) and result.startswith('data:')):
+        return response.get_data()
+    from services.fitting_jobs import record_result
+    data['resultRef'] = record_result(client_id, result, data.get('method'), data.get('resultFormat'))
+    del data['resultUrl']
+    return json.dumps(data).encode('utf-8')
+
+
+def _replay_body(client_id: str, stored: dict) -> Optional[bytes]:
+    """The stored body with its result image put back (None when the referenced job is gone)"""
+    body = stored['body']
+    if stored['mimetype'] != 'application/json' or b'"resultRef"' not in body:
+        return body
+    data = json.loads(body)
+    from services.fitting_jobs import get_job
+    job = get_job(data.pop('resultRef'), client_id)
+    if job is None or not job['result']:
+        return None
+    data['resultUrl'] = job['result']
+    return json.dumps(data).encode('utf-8')
+
+
+def request_fingerprint() -> str:
+    """Hash of the current request's form fields and uploaded files"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(sorted(request.form.items(multi=True))).encode('utf-8'))
+    for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+        digest.update(name.encode('utf-8'))
+        digest.update(hashlib.sha256(upload.read()).digest())
+        upload.seek(0)
+    return digest.hexdigest()
+
+
+def idempotent(scope: str):
+    """Replay the stored response for a repeated Idempotency-Key (requests without the header run as usual)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({'error': f'Idempotency-Key longer than {MAX_KEY_LENGTH} characters'}), 400
+
+            from services.admission_service import get_client_id
+            client_id = get_client_id()
+            fingerprint = request_fingerprint()
+            state, stored = begin(scope, client_id, key, fingerprint)
+            body = _replay_body(client_id, stored) if state == 'replay' else None
+            if state == 'replay' and body is None:
+                # The result was cleaned up before the key expired: run the request again
+                forget(scope, client_id, key)
+                state, stored = begin(scope, client_id, key, fingerprint)
+            idempotency_requests_total.inc(outcome=state)
+            if state == 'mismatch':
+                return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+            if state == 'in_progress':
+                response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+                response.status_code = 409
+                response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+                return response
+            if state == 'replay':
+                response = current_app.response_class(body, status=stored['status_code'],
+                                                      mimetype=stored['mimetype'])
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                forget(scope, client_id, key)
+                raise
+            if 200 <= response.status_code < 300 and not response.is_streamed:
+                complete(scope, client_id, key, response.status_code, response.mimetype,
+                         _store_body(client_id, response))
+            else:
+                forget(scope, client_id, key)
+            return response
+        return wrapper
+    return decorator
+
+
+# ---- In-flight coalescing ----
+
+class CoalesceTimeout(Exception):
+    """The identical in-flight call did not finish within the follower's wait"""
+
+    def __init__(self, waited: float):
+        super().__init__(f'identical request still running after {waited:.0f}s')
+        self.retry_after = RETRY_AFTER_SECONDS
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InFlightCoalescer:
+    """Per-process single flight: concurrent calls with the same key share the first caller's execution"""
+
+    def __init__(self, max_wait: float = COALESCE_WAIT_SECONDS):
+        self.max_wait = max_wait
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: tuple, fn: Callable[[], Optional[dict]]) -> Optional[dict]:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            fitting_coalesced_total.inc()
+            logger.info("Coalesced an identical in-flight fitting")
+            if not call.done.wait(self.max_wait):
+                logger.warning(f"Identical in-flight fitting still running after {self.max_wait:.0f}s - giving up")
+                raise CoalesceTimeout(self.max_wait)
+            if call.error is not None:
+                raise call.error
+            return dict(call.result) if call.result else call.result
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+fitting_coalescer = InFlightCoalescer()
@@ -0,0 +1,78 @@
+"""
+Image Utilities
+CPU-side image steps of the fitting pipeline, shared by routes, services and benchmarks
+"""
+import base64
+from io import BytesIO
+from typing import Tuple
+
+from PIL import Image
+
+FAST_MODE_SIZE = (600, 800)
+REMBG_MAX_SIDE = 800
+
+
+def resize_for_fast_mode(image_bytes: bytes, max_size: Tuple[int, int] = FAST_MODE_SIZE, quality: int = 85) -> bytes:
+    """Thumbnail an upload to fit max_size and re-encode as JPEG (quality=fast path)"""
+    img = Image.open(BytesIO(image_bytes))
+    # Convert RGBA to RGB if necessary
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    img.thumbnail(max_size, Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def fit_to_size(img: Image.Image, target_size: Tuple[int, int]) -> Image.Image:
+    """
+    Resize keeping aspect ratio, then pad onto a white canvas of target_size
+    (used to restore provider output to the original person photo dimensions)
+    """
+    if img.size == target_size:
+        return img
+
+    result_ratio = img.size[0] / img.size[1]
+    target_ratio = target_size[0] / target_size[1]
+
+    if result_ratio > target_ratio:
+        # Result is wider - fit to width
+        new_width = target_size[0]
+        new_height = int(new_width / result_ratio)
+    else:
+        # Result is taller - fit to height
+        new_height = target_size[1]
+        new_width = int(new_height * result_ratio)
+
+    resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    # Create canvas with target size and paste centered
+    canvas = Image.new('RGB', target_size, (255, 255, 255))
+    canvas.paste(resized, ((target_size[0] - new_width) // 2, (target_size[1] - new_height) // 2))
+    return canvas
+
+
+def shrink_to_max_side(img: Image.Image, max_side: int = REMBG_MAX_SIDE) -> Image.Image:
+    """Downscale so the longest side is at most max_side (no-op for small images)"""
+    if max(img.size) <= max_side:
+        return img
+    ratio = max_side / max(img.size)
+    new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
+    return img.resize(new_size, Image.Resampling.LANCZOS)
+
+
+def encode_png(img: Image.Image, compress_level: int = 6) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, format='PNG', compress_level=compress_level)
+    return buffer.getvalue()
+
+
+def to_data_uri(image_bytes: bytes, mime_type: str = 'image/png') -> str:
+    return f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+
+
+def from_data_uri(data_uri: str) -> bytes:
+    """Decode a data URI (or bare base64 string) back to bytes"""
+    if data_uri.startswith('data:'):
+        data_uri = data_uri.split(',', 1)[1]
+    return base64.b64decode(data_uri)
@@ -0,0 +1,295 @@
+"""
+Image Variants
+Resized, re-encoded variants of attached_assets images, cached on disk
+
+    /img/<width>/<version>/<path>?q=<quality>
+
+- width is one of VARIANT_WIDTHS (never upscaled); version is the source
+  file's content hash, so a URL always names the same bytes and is served
+  with an immutable Cache-Control. A stale version redirects to the
+  current one.
+- the format follows the Accept header: AVIF, then WebP when the browser
+  lists them explicitly (and Pillow can encode them), else the source
+  format (Vary: Accept).
+- variants are rendered on first request and stored in IMAGE_CACHE_DIR
+  under a hash of (source hash, width, format, quality). The directory is
+  shared by all workers and kept under IMAGE_CACHE_MAX_BYTES by evicting
+  the least recently used files (a hit refreshes the file's mtime).
+
+Templates use image_srcset(url) / image_variant_url(url, width); URLs that
+are not attached assets (external placeholders) are returned unchanged.
+"""
+import os
+import io
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+from services.metrics_service import record_cache_lookup
+from services.static_assets import APP_ROOT
+from services.tracing_service import span
+
+logger = logging.getLogger(__name__)
+
+SOURCE_DIR = os.path.join(APP_ROOT, 'attached_assets')
+SOURCE_URL_PREFIX = '/attached_assets/'
+VARIANT_URL_PREFIX = '/img'
+CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fitsa_image_cache'))
+CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+VARIANT_WIDTHS = tuple(sorted(int(w) for w in os.getenv('IMAGE_VARIANT_WIDTHS', '160,320,480,640,960,1280').split(',')))
+QUALITIES = (50, 75, 90)
+DEFAULT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', '75'))
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+VERSION_LENGTH = 10
+
+# format -> (mimetype, extension); PIL format names
+FORMATS = {
+    'AVIF': ('image/avif', '.avif'),
+    'WEBP': ('image/webp', '.webp'),
+    'PNG': ('image/png', '.png'),
+    'JPEG': ('image/jpeg', '.jpg'),
+}
+
+
+# Preferred first; only those this Pillow build can encode
+NEGOTIABLE_FORMATS = tuple(fmt for fmt, feature in (('AVIF', 'avif'), ('WEBP', 'webp')) if features.check(feature))
+
+
+class VariantNotFound(Exception):
+    pass
+
+
+# ---- Sources ----
+
+_sources: Dict[str, tuple] = {}
+_sources_lock = threading.Lock()
+
+
+def source_path(path: str) -> str:
+    """Absolute path of an attached asset image; VariantNotFound outside SOURCE_DIR or not an image"""
+    full = os.path.realpath(os.path.join(SOURCE_DIR, path))
+    if not full.startswith(os.path.realpath(SOURCE_DIR) + os.sep) or not full.lower().endswith(SOURCE_EXTENSIONS):
+        raise VariantNotFound(path)
+    if not os.path.isfile(full):
+        raise VariantNotFound(path)
+    return full
+
+
+def source_info(full_path: str) -> Tuple[str, str, int]:
+    """(content hash, PIL format, width) of a source image, re-read only when its mtime/size change"""
+    stat = os.stat(full_path)
+    cached = _sources.get(full_path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    with open(full_path, 'rb') as f:
+        data = f.read()
+    with Image.open(io.BytesIO(data)) as img:
+        info = (hashlib.sha256(data).hexdigest()[:VERSION_LENGTH], img.format, img.width)
+    with _sources_lock:
+        _sources[full_path] = (stat.st_mtime_ns, stat.st_size, info)
+    return info
+
+
+def source_version(full_path: str) -> str:
+    return source_info(full_path)[0]
+
+
+def parse_accept(accept: str) -> Dict[str, float]:
+    """{mimetype: q} of an Accept header"""
+    listed = {}
+    for part in (accept or '').split(','):
+        mimetype, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        listed[mimetype.strip().lower()] = q
+    return listed
+
+
+def negotiate_format(accept: str, source_format: str) -> str:
+    """AVIF/WebP if listed in Accept with q > 0 (wildcards don't count), else the source format"""
+    listed = parse_accept(accept)
+    for fmt in NEGOTIABLE_FORMATS:
+        if listed.get(FORMATS[fmt][0], 0) > 0:
+            return fmt
+    return source_format if source_format in FORMATS else 'PNG'
+
+
+# ---- Rendering ----
+
+def render_variant(source_bytes: bytes, width: int, fmt: str, quality: int) -> bytes:
+    img = Image.open(io.BytesIO(source_bytes))
+    img = ImageOps.exif_transpose(img)
+    if width < img.width:
+        img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+    if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        img = img.convert('RGBA')
+
+    out = io.BytesIO()
+    if fmt == 'WEBP':
+        img.save(out, 'WEBP', quality=quality, method=4)
+    elif fmt == 'AVIF':
+        img.save(out, 'AVIF', quality=quality, speed=6)
+    elif fmt == 'JPEG':
+        img.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(out, 'PNG', optimize=True)
+    return out.getvalue()
+
+
+# ---- Disk cache ----
+
+class VariantCache:
+    """Content-addressed variant files with an LRU size limit (shared by all workers)"""
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._total = None  # bytes on disk, estimated between scans
+        self._lock = threading.Lock()
+        self._render_locks: Dict[str, threading.Lock] = {}
+
+    def path_for(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, key[:2], key + FORMATS[fmt][1])
+
+    def get_or_render(self, key: str, fmt: str, render) -> str:
+        """Path of the cached variant, rendering it first on a miss"""
+        path = self.path_for(key, fmt)
+        try:
+            os.utime(path)  # LRU: a hit makes the file recent
+            record_cache_lookup('image_variant', True)
+            return path
+        except FileNotFoundError:
+            pass
+        record_cache_lookup('image_variant', False)
+
+        # One render per variant in this worker; other workers may race, os.replace keeps it atomic
+        with self._lock:
+            lock = self._render_locks.setdefault(key, threading.Lock())
+        with lock:
+            if not os.path.exists(path):
+                with span('image_variant.render'):
+                    data = render()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._added(len(data))
+        with self._lock:
+            self._render_locks.pop(key, None)
+        return path
+
+    def _scan(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue  # being written
+                full = os.path.join(root, name)
+                try:
+                    stat = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, full))
+        return files
+
+    def _added(self, size: int):
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._scan())
+            else:
+                self._total += size
+            over = self._total > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self, target_ratio: float = 0.9) -> int:
+        """Delete least recently used variants until under target_ratio of the limit; returns bytes freed"""
+        files = sorted(self._scan())
+        total = sum(size for _, size, _ in files)
+        freed = 0
+        for _, size, full in files:
+            if total - freed <= self.max_bytes * target_ratio:
+                break
+            try:
+                os.remove(full)
+                freed += size
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._total = total - freed
+        if freed:
+            logger.info(f"[image_variants] evicted {freed} bytes from {self.directory}")
+        return freed
+
+
+variant_cache = VariantCache()
+
+
+def get_variant(path: str, width: int, version: str, accept: str, quality: int = DEFAULT_QUALITY) -> dict:
+    """
+    Resolve a variant request
+
+    Returns {'path', 'mimetype'} for the current version, or {'redirect': url}
+    when the version is stale. Raises VariantNotFound for unknown sources,
+    widths or qualities.
+    """
+    if width not in VARIANT_WIDTHS or quality not in QUALITIES:
+        raise VariantNotFound(path)
+    full = source_path(path)
+    current, source_format, source_width = source_info(full)
+    if version != current:
+        return {'redirect': variant_url(path, width, quality, current)}
+
+    fmt = negotiate_format(accept, source_format)
+    # Never upscale: widths above the source collapse onto one file
+    effective_width = min(width, source_width)
+    key = hashlib.sha256(f'{current}:{effective_width}:{fmt}:{quality}'.encode()).hexdigest()[:32]
+
+    def render():
+        with open(full, 'rb') as f:
+            return render_variant(f.read(), effective_width, fmt, quality)
+
+    return {'path': variant_cache.get_or_render(key, fmt, render), 'mimetype': FORMATS[fmt][0]}
+
+
+# ---- URLs ----
+
+def variant_url(path: str, width: int, quality: int = DEFAULT_QUALITY, version: Optional[str] = None) -> str:
+    version = version or source_version(source_path(path))
+    url = f'{VARIANT_URL_PREFIX}/{width}/{version}/{path}'
+    return url if quality == DEFAULT_QUALITY else f'{url}?q={quality}'
+
+
+def image_variant_url(url: str, width: int) -> str:
+    """Variant URL for an attached asset image URL; other URLs unchanged"""
+    if not url or not url.startswith(SOURCE_URL_PREFIX):
+        return url
+    try:
+        return variant_url(url[len(SOURCE_URL_PREFIX):], width)
+    except (VariantNotFound, OSError):
+        return url
+
+
+def image_srcset(url: str, widths=(320, 480, 640, 960)) -> str:
+    """srcset attribute value for an attached asset image URL ('' for other URLs)"""
+    if not url or not url.startswith(SOURCE_URL_PREFIX):
+        return ''
+    try:
+        version = source_version(source_path(url[len(SOURCE_URL_PREFIX):]))
+    except (VariantNotFound, OSError):
+        return ''
+    path = url[len(SOURCE_URL_PREFIX):]
+    return ', '.join(f'{variant_url(path, w, version=version)} {w}w' for w in widths if w in VARIANT_WIDTHS)
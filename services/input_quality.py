@@ -0,0 +1,111 @@
+"""
+Input Quality Gate
+Cheap local checks of the uploaded photos before a credit or provider call is spent
+
+A blurry, tiny, dark or person-less photo still costs a Gemini call (up to
+90 s) and the IDM-VTON fallback before the request fails and is refunded.
+These checks run on a <= ANALYSIS_SIDE px grayscale copy with NumPy and take
+milliseconds:
+
+    too_small      shorter side below INPUT_MIN_SIDE (person) / INPUT_MIN_GARMENT_SIDE
+    blurry         variance of the Laplacian below INPUT_BLUR_MIN_VARIANCE
+    too_dark       mean luminance low and no bright areas at all
+    overexposed    almost every pixel clipped to white
+    no_person      (person photo) practically no skin-tone pixels (YCbCr range)
+    no_garment     (garment photo) an almost uniform image
+
+Each issue carries a Korean message the client can show as is. too_small is
+always enforced; the others are heuristics (HEURISTIC_CODES) and can be
+skipped by the client (skipQualityCheck=true) after showing the warning.
+"""
+import io
+import os
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+ANALYSIS_SIDE = 512
+MIN_PERSON_SIDE = int(os.getenv('INPUT_MIN_SIDE', '256'))
+MIN_GARMENT_SIDE = int(os.getenv('INPUT_MIN_GARMENT_SIDE', '128'))
+BLUR_MIN_VARIANCE = float(os.getenv('INPUT_BLUR_MIN_VARIANCE', '15'))
+DARK_MEAN = 40
+DARK_HIGHLIGHT = 120       # 99th percentile luminance below this: no bright areas at all
+CLIPPED_FRACTION = 0.85
+MIN_SKIN_FRACTION = 0.002
+MIN_GARMENT_CONTRAST = 4.0
+
+HEURISTIC_CODES = frozenset({'blurry', 'too_dark', 'overexposed', 'no_person', 'no_garment'})
+
+MESSAGES = {
+    'too_small': '사진 해상도가 너무 낮습니다. 최소 {min_side}px 이상의 사진을 사용해주세요.',
+    'blurry': '사진이 흐립니다. 초점이 맞은 선명한 사진을 사용해주세요.',
+    'too_dark': '사진이 너무 어둡습니다. 밝은 곳에서 찍은 사진을 사용해주세요.',
+    'overexposed': '사진이 너무 밝습니다 (빛 번짐). 다른 사진을 사용해주세요.',
+    'no_person': '사진에서 사람을 찾지 못했습니다. 전신 또는 상반신이 보이는 사진을 사용해주세요.',
+    'no_garment': '의류 사진에서 옷을 찾지 못했습니다. 옷이 잘 보이는 사진을 사용해주세요.',
+}
+
+
+def _issue(image: str, code: str, **params) -> dict:
+    return {'image': image, 'code': code, 'message': MESSAGES[code].format(**params)}
+
+
+def measure(image_bytes: bytes) -> dict:
+    """Raw measurements of an image (original size, sharpness, exposure, skin fraction)"""
+    img = Image.open(io.BytesIO(image_bytes))
+    width, height = img.size
+    img.draft('RGB', (ANALYSIS_SIDE * 2, ANALYSIS_SIDE * 2))  # JPEG: decode at reduced scale
+    img = img.convert('RGB')
+    img.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+
+    ycbcr = np.asarray(img.convert('YCbCr'), dtype=np.float32)
+    luma, cb, cr = ycbcr[..., 0], ycbcr[..., 1], ycbcr[..., 2]
+    laplacian = (4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1]
+                 - luma[1:-1, :-2] - luma[1:-1, 2:])
+    skin = (cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173) & (luma > 40)
+    return {
+        'width': width,
+        'height': height,
+        'sharpness': float(laplacian.var()) if laplacian.size else 0.0,
+        'mean': float(luma.mean()),
+        'contrast': float(luma.std()),
+        'highlight': float(np.percentile(luma, 99)),
+        'clipped': float((luma >= 250).mean()),
+        'skin': float(skin.mean()),
+    }
+
+
+def check_image(image_bytes: bytes, role: str) -> List[dict]:
+    """Issues with one upload; role is 'person' or 'garment'"""
+    image = 'userPhoto' if role == 'person' else 'clothingPhoto'
+    m = measure(image_bytes)
+    min_side = MIN_PERSON_SIDE if role == 'person' else MIN_GARMENT_SIDE
+    if min(m['width'], m['height']) < min_side:
+        return [_issue(image, 'too_small', min_side=min_side)]  # the rest is meaningless at this size
+
+    issues = []
+    if role == 'garment' and m['contrast'] < MIN_GARMENT_CONTRAST:
+        return [_issue(image, 'no_garment')]
+    if m['sharpness'] < BLUR_MIN_VARIANCE:
+        issues.append(_issue(image, 'blurry'))
+    if m['mean'] < DARK_MEAN and m['highlight'] < DARK_HIGHLIGHT:
+        issues.append(_issue(image, 'too_dark'))
+    elif role == 'person' and m['clipped'] > CLIPPED_FRACTION:
+        issues.append(_issue(image, 'overexposed'))
+    if role == 'person' and m['skin'] < MIN_SKIN_FRACTION and not issues:
+        # A dark or blurry photo already explains a missing person
+        issues.append(_issue(image, 'no_person'))
+    return issues
+
+
+def check_inputs(person_bytes: bytes, garment_bytes: bytes, skip_heuristics: bool = False) -> List[dict]:
+    """
+    Issues with a fitting request's uploads ([] when both look usable)
+
+    With skip_heuristics only hard failures (too_small) are returned.
+    """
+    issues = check_image(person_bytes, 'person') + check_image(garment_bytes, 'garment')
+    if skip_heuristics:
+        issues = [issue for issue in issues if issue['code'] not in HEURISTIC_CODES]
+    return issues
@@ -0,0 +1,144 @@
+"""
+Logging Service
+Structured (JSON) logging written off the request thread
+
+Request threads only enqueue log records; a per-process QueueListener thread
+formats and writes them. Each record carries the current request id so all
+lines of one fitting can be correlated.
+
+Environment:
+    LOG_FORMAT   json (default) | text
+    LOG_LEVEL    root level, default INFO
+    LOG_LEVELS   per-module overrides, e.g. "services.replicate_service=DEBUG,werkzeug=WARNING"
+    LOG_STATIC_SAMPLE_RATE   fraction of static-file requests to log (default 0.01)
+"""
+import os
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a field
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'request_id'}
+
+STATIC_SAMPLE_RATE = float(os.getenv('LOG_STATIC_SAMPLE_RATE', '0.01'))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id plus any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp the current request id on the record (runs on the calling thread)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _ProcessLocalQueueHandler(QueueHandler):
+    """
+    QueueHandler whose listener thread is (re)started lazily in each process,
+    so logging keeps working in gunicorn workers forked from a preloaded master.
+    """
+
+    def __init__(self, target: logging.Handler):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.SimpleQueue()
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only freeze the message here; JSON encoding and traceback
+        # formatting happen on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        self._ensure_listener()
+        super().enqueue(record)
+
+    def stop(self):
+        if self._listener and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+_configured = False
+
+
+def setup_logging():
+    """Install the queue-backed handler on the root logger (idempotent)"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'json').lower() == 'text':
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s [%(request_id)s]: %(message)s'))
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = _ProcessLocalQueueHandler(stream_handler)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    apply_module_levels(os.getenv('LOG_LEVELS', ''))
+
+    atexit.register(queue_handler.stop)
+
+
+def apply_module_levels(spec: str):
+    """Apply "module=LEVEL,module2=LEVEL" overrides"""
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        name, level = item.split('=', 1)
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+
+def should_sample_static() -> bool:
+    """Decide whether a high-volume static request gets logged"""
+    return random.random() < STATIC_SAMPLE_RATE
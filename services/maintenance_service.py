@@ -0,0 +1,294 @@
+"""
+Maintenance Service
+Scheduled housekeeping for the SQLite databases (credits.db, saved_fits.db, catalog.db, fitting_jobs.db,
+speculative.db, idempotency.db)
+
+Each run, per database:
+1. retention: old rows are archived (optional JSONL) and deleted in bounded
+   batches, with a pause between batches so request threads get the write
+   lock back quickly
+2. WAL: journal_mode=WAL is enabled (persistent, lets readers run during
+   writes) and the WAL is checkpointed and truncated
+3. statistics: PRAGMA optimize refreshes the query planner's statistics
+4. space: PRAGMA incremental_vacuum returns free pages to the filesystem
+   (only once the file uses auto_vacuum=INCREMENTAL; switching requires a
+   one-off full VACUUM: --enable-incremental-vacuum)
+and reports what it deleted and reclaimed.
+
+Runs in-process (one gunicorn worker per host holds a lock file and runs it
+daily at MAINTENANCE_HOUR) or from the CLI:
+    python -m services.maintenance_service run [--dry-run] [--enable-incremental-vacuum]
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '500'))
+BATCH_PAUSE_SECONDS = float(os.getenv('MAINTENANCE_BATCH_PAUSE', '0.05'))
+MAX_BATCHES = int(os.getenv('MAINTENANCE_MAX_BATCHES', '200'))
+INCREMENTAL_VACUUM_PAGES = int(os.getenv('MAINTENANCE_VACUUM_PAGES', '2000'))
+ARCHIVE_DIR = os.getenv('MAINTENANCE_ARCHIVE_DIR', '')
+MAINTENANCE_HOUR = int(os.getenv('MAINTENANCE_HOUR', '4'))
+LOCK_FILE = os.getenv('MAINTENANCE_LOCK_FILE', '/tmp/fitsa_maintenance.lock')
+ENABLE_WAL = os.getenv('SQLITE_WAL', '1') == '1'
+
+SHARE_LOG_RETENTION_DAYS = int(os.getenv('SHARE_LOG_RETENTION_DAYS', '90'))
+STRIPE_EVENT_RETENTION_DAYS = int(os.getenv('STRIPE_EVENT_RETENTION_DAYS', '30'))
+STALE_USER_DAYS = int(os.getenv('STALE_USER_DAYS', '30'))
+# Saved fits are user data: kept forever unless a retention is configured
+SAVED_FITS_RETENTION_DAYS = int(os.getenv('SAVED_FITS_RETENTION_DAYS', '0'))
+
+
+class RetentionPolicy:
+    """Rows of `table` matching `where` (with one cutoff parameter) are archived and deleted"""
+
+    def __init__(self, name: str, table: str, where: str, days: int):
+        self.name = name
+        self.table = table
+        self.where = where
+        self.days = days
+
+    def cutoff(self, now: datetime) -> str:
+        # Date-only cutoff compares correctly with both isoformat and CURRENT_TIMESTAMP values
+        return (now - timedelta(days=self.days)).strftime('%Y-%m-%d')
+
+
+def default_policies() -> Dict[str, List[RetentionPolicy]]:
+    credits = []
+    if SHARE_LOG_RETENTION_DAYS > 0:
+        # Share rewards are deduplicated per day; older rows are history only
+        credits.append(RetentionPolicy('share_log', 'share_log', 'shared_at < ?', SHARE_LOG_RETENTION_DAYS))
+    if STRIPE_EVENT_RETENTION_DAYS > 0:
+        # Handled webhook events only; failed ones stay for investigation
+        credits.append(RetentionPolicy(
+            'stripe_events', 'stripe_events',
+            "status IN ('processed', 'ignored') AND received_at < CAST(strftime('%s', ?) AS INTEGER)",
+            STRIPE_EVENT_RETENTION_DAYS))
+    # Balance caches only need changes since their last check
+    credits.append(RetentionPolicy('balance_changes', 'balance_changes', 'changed_at < ?', 1))
+    if STALE_USER_DAYS > 0:
+        # Idle free-tier keys (mostly one-off IP+UA hashes); anyone who ever paid is kept
+        credits.append(RetentionPolicy(
+            'stale_users', 'users',
+            'last_reset < ? AND COALESCE(credits, 0) = 0 AND completed_sessions IS NULL',
+            STALE_USER_DAYS))
+    saved_fits = []
+    if SAVED_FITS_RETENTION_DAYS > 0:
+        saved_fits.append(RetentionPolicy('saved_fits', 'saved_fits', "created_at < CAST(strftime('%s', ?) AS INTEGER)",
+                                          SAVED_FITS_RETENTION_DAYS))
+    from services import saved_fits_service, catalog_service, fitting_jobs, speculative_fitting, idempotency_service
+    # Progressive job rows (with their result images) are only polled while the user waits
+    jobs = [RetentionPolicy('fitting_jobs', 'fitting_jobs', "updated_at < CAST(strftime('%s', ?) AS INTEGER)", 1)]
+    # Speculative rows only matter for their TTL and the hourly budget; unclaimed results
+    # past their TTL go even when no one has scheduled anything since
+    speculative = [RetentionPolicy('speculative_expired', 'speculative_fittings',
+                                   "status IN ('ready', 'expired') AND expires_at < CAST(strftime('%s', ?) AS INTEGER)",
+                                   0),
+                   RetentionPolicy('speculative_fittings', 'speculative_fittings',
+                                   "created_at < CAST(strftime('%s', ?) AS INTEGER)", 1)]
+    # Stored responses are only replayed within IDEMPOTENCY_TTL
+    idempotency = [RetentionPolicy('idempotency_keys', 'idempotency_keys',
+                                   "expires_at < CAST(strftime('%s', ?) AS INTEGER)", 0)]
+    # The catalog has no retention, but still gets WAL, statistics and vacuum
+    return {'credits.db': credits, saved_fits_service.DB_PATH: saved_fits, catalog_service.DB_PATH: [],
+            fitting_jobs.DB_PATH: jobs, speculative_fitting.DB_PATH: speculative,
+            idempotency_service.DB_PATH: idempotency}
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _table_exists(conn, table: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def _file_bytes(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def _archive(policy: RetentionPolicy, db_path: str, rows):
+    if not ARCHIVE_DIR or not rows:
+        return
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    name = f"{os.path.splitext(os.path.basename(db_path))[0]}.{policy.name}.{datetime.now():%Y%m}.jsonl"
+    with open(os.path.join(ARCHIVE_DIR, name), 'a') as f:
+        for row in rows:
+            f.write(json.dumps(dict(row), ensure_ascii=False, default=str) + '\n')
+
+
+def apply_retention(conn, db_path: str, policy: RetentionPolicy, now: datetime, dry_run: bool = False) -> dict:
+    """Delete expired rows in batches of BATCH_SIZE, releasing the write lock between batches"""
+    if not _table_exists(conn, policy.table):
+        return {'deleted': 0, 'skipped': 'table missing'}
+    cutoff = policy.cutoff(now)
+    if dry_run:
+        count = conn.execute(f'SELECT COUNT(*) FROM {policy.table} WHERE {policy.where}', (cutoff,)).fetchone()[0]
+        return {'would_delete': count, 'cutoff': cutoff}
+
+    deleted = batches = 0
+    while batches < MAX_BATCHES:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(f'SELECT rowid AS _rowid, * FROM {policy.table} WHERE {policy.where} LIMIT ?',
+                                (cutoff, BATCH_SIZE)).fetchall()
+            _archive(policy, db_path, [{k: row[k] for k in row.keys() if k != '_rowid'} for row in rows])
+            conn.executemany(f'DELETE FROM {policy.table} WHERE rowid = ?', [(row['_rowid'],) for row in rows])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        deleted += len(rows)
+        batches += 1
+        if len(rows) < BATCH_SIZE:
+            break
+        time.sleep(BATCH_PAUSE_SECONDS)
+    return {'deleted': deleted, 'batches': batches, 'cutoff': cutoff, 'complete': batches < MAX_BATCHES}
+
+
+def maintain_database(db_path: str, policies: List[RetentionPolicy], now: Optional[datetime] = None,
+                      dry_run: bool = False, enable_incremental_vacuum: bool = False) -> dict:
+    now = now or datetime.now()
+    started = time.perf_counter()
+    report = {'db': db_path, 'bytes_before': _file_bytes(db_path)}
+    if not os.path.exists(db_path):
+        return dict(report, skipped='database missing')
+
+    conn = _connect(db_path)
+    try:
+        report['freelist_before'] = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        report['retention'] = {p.name: apply_retention(conn, db_path, p, now, dry_run) for p in policies}
+        if dry_run:
+            return report
+
+        if ENABLE_WAL:
+            report['journal_mode'] = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        if enable_incremental_vacuum and conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            # One-off: the mode change only takes effect through a full VACUUM (blocks writers)
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+            report['full_vacuum'] = True
+
+        conn.execute('PRAGMA analysis_limit=1000')
+        conn.execute('PRAGMA optimize')
+
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            conn.execute(f'PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})').fetchall()
+        else:
+            report['incremental_vacuum'] = 'disabled (run with --enable-incremental-vacuum once)'
+
+        if conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            busy, log_frames, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+            report['wal_checkpoint'] = {'busy': bool(busy), 'log_frames': log_frames, 'checkpointed': checkpointed}
+
+        report['freelist_after'] = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    finally:
+        conn.close()
+
+    report['bytes_after'] = _file_bytes(db_path)
+    report['bytes_reclaimed'] = report['bytes_before'] - report['bytes_after']
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+def run_maintenance(dry_run: bool = False, enable_incremental_vacuum: bool = False,
+                    policies: Optional[Dict[str, List[RetentionPolicy]]] = None) -> List[dict]:
+    from services.metrics_service import maintenance_rows_deleted_total, db_file_bytes
+    reports = []
+    for db_path, db_policies in (policies or default_policies()).items():
+        try:
+            report = maintain_database(db_path, db_policies, dry_run=dry_run,
+                                       enable_incremental_vacuum=enable_incremental_vacuum)
+        except sqlite3.Error as e:
+            logger.exception(f"SQLite maintenance failed for {db_path}")
+            report = {'db': db_path, 'error': str(e)}
+        reports.append(report)
+        if not dry_run and 'error' not in report:
+            for name, result in report.get('retention', {}).items():
+                maintenance_rows_deleted_total.inc(result.get('deleted', 0), db=db_path, policy=name)
+            db_file_bytes.set(report.get('bytes_after', 0), db=db_path)
+        logger.info("SQLite maintenance finished", extra={'report': report, 'dry_run': dry_run})
+    return reports
+
+
+# ---- In-process scheduler ----
+
+class MaintenanceScheduler:
+    """
+    Daily maintenance at MAINTENANCE_HOUR (local time) in a background thread.
+
+    Every worker calls start(), but only the one holding the host-wide lock
+    file runs the schedule; the others return immediately.
+    """
+
+    def __init__(self, hour: int = MAINTENANCE_HOUR, lock_file: str = LOCK_FILE, poll_seconds: float = 60):
+        self.hour = hour
+        self.lock_file = lock_file
+        self.poll_seconds = poll_seconds
+        self.last_run_date = None
+        self._lock_fd = None
+
+    def _acquire_host_lock(self) -> bool:
+        try:
+            import fcntl
+        except ImportError:  # non-POSIX: no cross-process coordination, run everywhere
+            return True
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd  # held for the life of the process
+        return True
+
+    def start(self) -> bool:
+        if os.getenv('MAINTENANCE_ENABLED', '1') != '1' or not self._acquire_host_lock():
+            return False
+        threading.Thread(target=self._loop, name='sqlite-maintenance', daemon=True).start()
+        logger.info(f"SQLite maintenance scheduled daily at {self.hour:02d}:00", extra={'pid': os.getpid()})
+        return True
+
+    def due(self, now: datetime) -> bool:
+        return now.hour == self.hour and self.last_run_date != now.date()
+
+    def _loop(self):
+        while True:
+            now = datetime.now()
+            if self.due(now):
+                self.last_run_date = now.date()
+                try:
+                    run_maintenance()
+                except Exception:
+                    logger.exception("Scheduled SQLite maintenance failed")
+            time.sleep(self.poll_seconds)
+
+
+maintenance_scheduler = MaintenanceScheduler()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQLite maintenance (retention, WAL checkpoint, ANALYZE, vacuum)')
+    parser.add_argument('command', choices=['run'])
+    parser.add_argument('--dry-run', action='store_true', help='only count the rows retention would delete')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='switch databases to auto_vacuum=INCREMENTAL (one blocking VACUUM; run off-peak)')
+    args = parser.parse_args(argv)
+    reports = run_maintenance(dry_run=args.dry_run, enable_incremental_vacuum=args.enable_incremental_vacuum)
+    print(json.dumps(reports, indent=2, ensure_ascii=False))
+    return 1 if any('error' in r for r in reports) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+Metrics Service
+Prometheus-style counters, gauges and histograms, aggregated across gunicorn workers
+
+Each worker process keeps its metrics in memory and periodically writes a
+snapshot to METRICS_MULTIPROC_DIR/<pid>.json. The /metrics endpoint merges
+the snapshots of every worker: counters and histograms are summed (including
+those of workers that have exited), gauges are summed over live workers only.
+"""
+import logging
+import os
+import json
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterable, Tuple
+from services.tracing_service import span
+from services.health_service import provider_circuits
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv('METRICS_MULTIPROC_DIR') or os.path.join(tempfile.gettempdir(), 'fitsa_metrics')
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '2'))
+
+# Gemini calls are allowed 90s, so latency buckets reach well past that
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry, name: str, documentation: str):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+
+    def _touch(self):
+        self.registry.mark_dirty()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self._touch()
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self.registry.lock:
+            self.values[_label_key(labels)] = value
+        self._touch()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self._touch()
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name: str, documentation: str, buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.registry.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self.values[key] = entry
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+        self._touch()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class MetricsRegistry:
+    def __init__(self, directory: str = METRICS_DIR):
+        self.directory = directory
+        self.metrics: Dict[str, _Metric] = {}
+        self.lock = threading.Lock()
+        self._dirty = False
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+
+    def counter(self, name, documentation) -> Counter:
+        return self._register(Counter(self, name, documentation))
+
+    def gauge(self, name, documentation) -> Gauge:
+        return self._register(Gauge(self, name, documentation))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, buckets))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    # ---- cross-worker snapshots ----
+
+    def mark_dirty(self):
+        self._dirty = True
+        # Start (or restart after fork) the background flusher for this process
+        if self._flusher_pid != os.getpid() and self.directory:
+            with self._flusher_lock:
+                if self._flusher_pid == os.getpid():
+                    return
+                self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush()
+
+    def _snapshot(self) -> dict:
+        with self.lock:
+            self._dirty = False
+            return {
+                name: [[list(key), value if not isinstance(value, dict) else dict(value, buckets=list(value['buckets']))]
+                       for key, value in metric.values.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self):
+        """Write this process' snapshot atomically to the shared directory"""
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f'[metrics] snapshot flush failed: {e}')
+
+    def _load_snapshots(self) -> Iterable[Tuple[bool, dict]]:
+        """Yield (is_live, snapshot) for every worker snapshot on disk"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                pid = int(filename[:-5])
+            except ValueError:
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            yield _pid_alive(pid), snapshot
+
+    def collect(self) -> Dict[str, dict]:
+        """Merge snapshots of all workers into {name: {label_key: value}}"""
+        self.flush()
+        merged: Dict[str, dict] = {name: {} for name in self.metrics}
+        snapshots = list(self._load_snapshots()) if self.directory else []
+        if not snapshots:
+            snapshots = [(True, self._snapshot())]
+
+        for is_live, snapshot in snapshots:
+            for name, entries in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == 'gauge' and not is_live):
+                    continue
+                target = merged[name]
+                for key, value in entries:
+                    key = tuple(tuple(pair) for pair in key)
+                    if metric.kind == 'histogram':
+                        entry = target.setdefault(key, {'buckets': [0] * len(metric.buckets), 'sum': 0.0, 'count': 0})
+                        entry['buckets'] = [a + b for a, b in zip(entry['buckets'], value['buckets'])]
+                        entry['sum'] += value['sum']
+                        entry['count'] += value['count']
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text exposition format (0.0.4)"""
+        merged = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, value in sorted(merged[name].items()):
+                if metric.kind == 'histogram':
+                    # Bucket counts are stored cumulatively (observe() bumps every bound >= value)
+                    for bound, count in zip(metric.buckets, value['buckets']):
+                        lines.append(f'{name}_bucket{_format_labels(key, le=_format_float(bound))} {count}')
+                    lines.append(f'{name}_bucket{_format_labels(key, le="+Inf")} {value["count"]}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {_format_float(value["sum"])}')
+                    lines.append(f'{name}_count{_format_labels(key)} {value["count"]}')
+                else:
+                    lines.append(f'{name}{_format_labels(key)} {_format_float(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _format_float(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, **extra) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label_value(v)}"' for k, v in pairs) + '}'
+
+
+registry = MetricsRegistry()
+
+# ---- Metric definitions ----
+
+http_request_seconds = registry.histogram(
+    'fitsa_http_request_duration_seconds', 'HTTP request latency by endpoint')
+fitting_stage_seconds = registry.histogram(
+    'fitsa_fitting_stage_seconds', 'Latency of each virtual fitting pipeline stage')
+provider_requests_total = registry.counter(
+    'fitsa_provider_requests_total', 'AI provider calls by outcome (success/failure/timeout/rate_limited)')
+cache_requests_total = registry.counter(
+    'fitsa_cache_requests_total', 'Cache lookups by cache and result (hit/miss)')
+db_query_seconds = registry.histogram(
+    'fitsa_db_query_seconds', 'SQLite operation latency by database and operation', buckets=DB_BUCKETS)
+fittings_in_flight = registry.gauge(
+    'fitsa_fittings_in_flight', 'Virtual fittings currently being processed')
+http_requests_in_flight = registry.gauge(
+    'fitsa_http_requests_in_flight', 'HTTP requests currently being processed')
+admission_rejected_total = registry.counter(
+    'fitsa_admission_rejected_total', 'Fitting requests shed by admission control')
+maintenance_rows_deleted_total = registry.counter(
+    'fitsa_maintenance_rows_deleted_total', 'Rows removed by SQLite retention policies')
+db_file_bytes = registry.gauge(
+    'fitsa_db_file_bytes', 'SQLite database size (main file + WAL) after the last maintenance run')
+compression_bytes_total = registry.counter(
+    'fitsa_compression_bytes_total', 'Response bytes before (stage=in) and after (stage=out) compression')
+stripe_events_total = registry.counter(
+    'fitsa_stripe_events_total', 'Stripe webhook events by type and inbox outcome')
+result_image_bytes_total = registry.counter(
+    'fitsa_result_image_bytes_total', 'Try-on result bytes from the provider (stage=in) and as sent (stage=out), by format')
+fitting_inputs_rejected_total = registry.counter(
+    'fitsa_fitting_inputs_rejected_total', 'Fitting requests rejected before any provider call, by reason')
+fitting_batch_items_total = registry.counter(
+    'fitsa_fitting_batch_items_total', 'Batch try-on items by outcome (completed/failed/rejected/payment_required/cancelled)')
+speculative_fittings_total = registry.counter(
+    'fitsa_speculative_fittings_total', 'Speculative room try-ons by outcome (scheduled/generated/failed/dropped/claimed)')
+fitting_queue_wait_seconds = registry.histogram(
+    'fitsa_fitting_queue_wait_seconds', 'Time try-ons waited for a provider slot, by priority lane')
+fitting_queue_depth = registry.gauge(
+    'fitsa_fitting_queue_depth', 'Try-ons waiting for a provider slot, by priority lane')
+idempotency_requests_total = registry.counter(
+    'fitsa_idempotency_requests_total', 'Requests with an Idempotency-Key by outcome (new/replay/in_progress/mismatch)')
+fitting_coalesced_total = registry.counter(
+    'fitsa_fitting_coalesced_total', 'Try-ons served by an identical in-flight request instead of a provider call')
+provider_quota_remaining = registry.gauge(
+    'fitsa_provider_quota_remaining', 'Calls left in the shared provider budget (limit=rpm|concurrency); take max across workers')
+provider_quota_throttled_total = registry.counter(
+    'fitsa_provider_quota_throttled_total', 'Provider calls not made because the provider budget was exhausted')
+
+
+# ---- Helpers ----
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time one fitting pipeline stage (histogram + request trace span)"""
+    with span(stage), fitting_stage_seconds.time(stage=stage):
+        yield
+
+
+def record_provider_result(provider: str, outcome: str):
+    provider_requests_total.inc(provider=provider, outcome=outcome)
+    provider_circuits.record(provider, outcome)
+
+
+def classify_provider_error(error: Exception) -> str:
+    """Map a provider exception to a provider_requests_total outcome"""
+    if isinstance(error, TimeoutError) or 'timeout' in type(error).__name__.lower():
+        return 'timeout'
+    message = str(error).lower()
+    if ('429' in message or 'quota' in message or 'resource_exhausted' in message
+            or ('rate' in message and ('limit' in message or 'exceeded' in message))):
+        return 'rate_limited'
+    return 'failure'
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    cache_requests_total.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def timed_db(db: str, operation: str):
+    """Decorator recording the latency of a SQLite operation"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(f'db.{db}.{operation}'), db_query_seconds.time(db=db, op=operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,8 +1,11 @@
+import logging
 import os
 import base64
 import requests
 from openai import OpenAI
 
+logger = logging.getLogger(__name__)
+
 class NanoService:
     def __init__(self, api_key: str, base_url: str):
         self.client = OpenAI(api_key=api_key, base_url=base_url)
@@ -18,7 +21,7 @@ class NanoService:
             Enhanced image URL or base64 data URI
         """
         try:
-            print(f"Downloading image from: {image_url[:100]}...")
+            logger.debug(f"Downloading image from: {image_url[:100]}...")
             
             # Download the image from stage 1
             response = requests.get(image_url, timeout=30)
@@ -26,10 +29,10 @@ class NanoService:
             image_bytes = response.content
             image_base64 = base64.b64encode(image_bytes).decode('utf-8')
             
-            print(f"Image downloaded: {len(image_bytes)} bytes")
+            logger.debug(f"Image downloaded: {len(image_bytes)} bytes")
             
             # Step 1: Use gpt-5-nano to analyze the image
-            print("Analyzing image with GPT-5-nano...")
+            logger.info("Analyzing image with GPT-5-nano...")
             completion = self.client.chat.completions.create(
                 model="gpt-5-nano",
                 messages=[
@@ -53,21 +56,19 @@ class NanoService:
             )
             
             analysis = completion.choices[0].message.content or ""
-            print(f"Analysis: {analysis[:200]}...")
+            logger.info(f"Analysis: {analysis[:200]}...")
             
             # Step 2: Use DALL-E to enhance based on analysis
-            print("Enhancing image with DALL-E edit...")
+            logger.info("Enhancing image with DALL-E edit...")
             
             # Create enhancement prompt
             enhancement_prompt = f"Enhance this fashion photo: make hands and arms clearly visible with natural skin tones, restore vibrant accurate colors, add realistic fabric textures, improve lighting and shadows for photorealistic quality. Keep the person's face and pose exactly the same. {analysis[:100]}"
             
             # Use DALL-E edit (requires transparency mask, so we'll use variation instead)
             # Or return the original URL since DALL-E edit is complex
-            print("Returning Replicate URL (DALL-E enhancement requires complex mask setup)")
+            logger.debug("Returning Replicate URL (DALL-E enhancement requires complex mask setup)")
             return image_url
             
         except Exception as e:
-            print(f"Nano service error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Nano service error: {str(e)}")
             raise
@@ -1,7 +1,10 @@
+import logging
 import requests
 import os
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 class ObjectStorageService:
     def __init__(self, node_api_url: str = None):
         self.node_api_url = node_api_url or os.getenv('NODE_API_URL', 'http://127.0.0.1:5001')
@@ -32,10 +35,10 @@ class ObjectStorageService:
                     'signedUrl': data.get('signedUrl')
                 }
             else:
-                print(f"Upload failed: {response.status_code} - {response.text}")
+                logger.warning(f"Upload failed: {response.status_code} - {response.text}")
                 return None
         except Exception as e:
-            print(f"Upload error: {e}")
+            logger.warning(f"Upload error: {e}")
             return None
     
     def get_public_url(self, object_path: str) -> str:
@@ -1,7 +1,10 @@
+import logging
 import base64
 from openai import OpenAI
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 class OpenAIVirtualFittingService:
     def __init__(self, api_key: str, base_url: str):
         self.client = OpenAI(api_key=api_key, base_url=base_url)
@@ -18,14 +21,14 @@ class OpenAIVirtualFittingService:
             Base64 data URL of the result image
         """
         try:
-            print(f"\n=== Using OpenAI Virtual Fitting (Fallback) ===")
+            logger.debug(f"Using OpenAI Virtual Fitting (Fallback)")
             
             # Convert to base64
             person_b64 = base64.b64encode(person_image_bytes).decode('utf-8')
             clothing_b64 = base64.b64encode(clothing_image_bytes).decode('utf-8')
             
             # Use gpt-4o to analyze both images and generate a fitting description
-            print("Analyzing images with gpt-4o...")
+            logger.info("Analyzing images with gpt-4o...")
             completion = self.client.chat.completions.create(
                 model="gpt-4o",
                 messages=[
@@ -55,10 +58,10 @@ class OpenAIVirtualFittingService:
             )
             
             description = completion.choices[0].message.content or "Person wearing the clothing item"
-            print(f"Generated description: {description[:150]}...")
+            logger.info(f"Generated description: {description[:150]}...")
             
             # Use DALL-E to generate the virtual fitting image
-            print("Generating virtual fitting image with DALL-E 3...")
+            logger.info("Generating virtual fitting image with DALL-E 3...")
             image_prompt = f"Professional photo of {description}. High quality, realistic, studio lighting, full body shot, fashion photography style."
             
             response = self.client.images.generate(
@@ -70,12 +73,10 @@ class OpenAIVirtualFittingService:
             )
             
             result_url = response.data[0].url
-            print(f"✓ OpenAI virtual fitting completed: {result_url[:80]}...")
+            logger.debug(f"OpenAI virtual fitting completed: {result_url[:80]}...")
             
             return result_url
             
         except Exception as e:
-            print(f"✗ OpenAI virtual fitting error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"OpenAI virtual fitting error: {str(e)}")
             raise
@@ -0,0 +1,262 @@
+"""
+Provider Quota
+Client-side pacing of Gemini and Replicate calls, shared by every gunicorn worker
+
+Each provider has a requests-per-minute budget (a token bucket holding up to
+<PROVIDER>_BURST calls) and a cap on calls running at once. Both live in
+SQLite (PROVIDER_QUOTA_DB_PATH), so the limits hold for the whole
+deployment rather than per worker:
+- provider_buckets: tokens left and when they were last refilled
+- provider_leases: one row per running call; a lease not released within
+  PROVIDER_QUOTA_LEASE_SECONDS (a worker died mid-call) stops counting
+
+acquire() waits up to the provider's max wait for a token and a free
+concurrency slot and raises QuotaExhausted otherwise (immediately, if the
+budget can't recover in time), so the pipeline can route the try-on to the
+next provider instead of collecting a 429. When a provider answers with a
+rate limit anyway, penalize() empties its bucket and pauses it for
+PROVIDER_QUOTA_COOLDOWN seconds.
+
+Remaining budget per provider is exported as fitsa_provider_quota_remaining
+(limit=rpm|concurrency). Every worker reports the shared value under its own
+worker label, so aggregate with max rather than sum.
+"""
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+from services.metrics_service import provider_quota_remaining, provider_quota_throttled_total, timed_db
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('PROVIDER_QUOTA', 'true').lower() == 'true'
+DB_PATH = os.getenv('PROVIDER_QUOTA_DB_PATH', 'provider_quota.db')
+LEASE_SECONDS = float(os.getenv('PROVIDER_QUOTA_LEASE_SECONDS', '300'))
+COOLDOWN_SECONDS = float(os.getenv('PROVIDER_QUOTA_COOLDOWN', '30'))
+POLL_INTERVAL = 0.25
+
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+class QuotaExhausted(Exception):
+    """The provider's rate or concurrency budget was not available within the max wait"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f'{provider} quota exhausted (retry in {retry_after:.1f}s)')
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class ProviderLimits:
+    """rpm / concurrency of 0 mean unlimited; max_wait is how long a call may queue for its turn"""
+
+    def __init__(self, rpm: float, burst: float, concurrency: int, max_wait: float):
+        self.rpm = rpm
+        self.burst = max(1.0, burst)
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+
+    @classmethod
+    def from_env(cls, prefix: str, rpm: str, concurrency: str, max_wait: str):
+        return cls(
+            rpm=float(os.getenv(f'{prefix}_RPM', rpm)),
+            burst=float(os.getenv(f'{prefix}_BURST', '5')),
+            concurrency=int(os.getenv(f'{prefix}_QUOTA_CONCURRENCY', concurrency)),
+            max_wait=float(os.getenv(f'{prefix}_QUOTA_MAX_WAIT', max_wait)),
+        )
+
+
+def init_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS provider_buckets (
+            provider TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            blocked_until REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS provider_leases (
+            lease_id TEXT PRIMARY KEY,
+            provider TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_provider_leases_provider ON provider_leases (provider, expires_at)')
+    conn.commit()
+
+
+def _connect(db_path: Optional[str] = None):
+    db_path = db_path or DB_PATH
+    path = os.path.abspath(db_path)
+    if path not in _initialized_paths or not os.path.exists(path):
+        with _init_lock:
+            if path not in _initialized_paths or not os.path.exists(path):
+                conn = sqlite3.connect(db_path)
+                try:
+                    init_schema(conn)
+                finally:
+                    conn.close()
+                _initialized_paths.add(path)
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ProviderQuota:
+    """Token buckets and concurrency leases per provider, in SQLite shared across workers"""
+
+    def __init__(self, limits: Dict[str, ProviderLimits], clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.limits = limits
+        self.clock = clock
+        self.sleep = sleep
+
+    @classmethod
+    def from_env(cls):
+        return cls({
+            # Gemini waits briefly, then the pipeline falls back to IDM-VTON
+            'gemini': ProviderLimits.from_env('GEMINI', rpm='60', concurrency='8', max_wait='5'),
+            # Replicate is the last resort, so it may queue longer
+            'replicate': ProviderLimits.from_env('REPLICATE', rpm='120', concurrency='8', max_wait='30'),
+        })
+
+    @staticmethod
+    def _read(conn, provider: str, limits: ProviderLimits, now: float) -> tuple:
+        """(tokens, blocked_until, running leases, expired leases) as of `now`"""
+        row = conn.execute('SELECT tokens, updated_at, blocked_until FROM provider_buckets WHERE provider = ?',
+                           (provider,)).fetchone()
+        tokens, updated_at, blocked_until = (row['tokens'], row['updated_at'], row['blocked_until']) if row \
+            else (limits.burst, now, 0.0)
+        tokens = min(limits.burst, tokens + max(0.0, now - updated_at) * limits.rpm / 60.0)
+        running, expired = conn.execute(
+            'SELECT COALESCE(SUM(expires_at >= ?), 0), COALESCE(SUM(expires_at < ?), 0) '
+            'FROM provider_leases WHERE provider = ?', (now, now, provider)).fetchone()
+        return tokens, blocked_until, running, expired
+
+    @staticmethod
+    def _wait(limits: ProviderLimits, tokens: float, blocked_until: float, running: int, now: float) -> float:
+        """Seconds until a call could be granted (0 = now)"""
+        if blocked_until > now:
+            return blocked_until - now
+        if limits.rpm > 0 and tokens < 1:
+            return (1 - tokens) / (limits.rpm / 60.0)
+        if 0 < limits.concurrency <= running:
+            return POLL_INTERVAL  # released by another call, whenever that finishes
+        return 0.0
+
+    @timed_db('provider_quota', 'take')
+    def _take(self, provider: str, limits: ProviderLimits) -> tuple:
+        """One attempt: (lease_id, 0) when granted, else (None, seconds until worth retrying)"""
+        now = self.clock()
+        conn = _connect()
+        try:
+            # Read-only first: workers polling a spent budget don't queue on the write lock
+            tokens, blocked_until, running, expired = self._read(conn, provider, limits, now)
+            wait = self._wait(limits, tokens, blocked_until, running, now)
+            lease_id = None
+            if wait <= 0 or expired:
+                conn.execute('BEGIN IMMEDIATE')
+                if expired:
+                    conn.execute('DELETE FROM provider_leases WHERE provider = ? AND expires_at < ?', (provider, now))
+                # Another worker may have taken the budget since the read
+                tokens, blocked_until, running, _ = self._read(conn, provider, limits, now)
+                wait = self._wait(limits, tokens, blocked_until, running, now)
+                if wait <= 0:
+                    lease_id = uuid.uuid4().hex
+                    conn.execute('INSERT INTO provider_leases (lease_id, provider, expires_at) VALUES (?, ?, ?)',
+                                 (lease_id, provider, now + LEASE_SECONDS))
+                    running += 1
+                    if limits.rpm > 0:
+                        tokens -= 1
+                        conn.execute('INSERT OR REPLACE INTO provider_buckets '
+                                     '(provider, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)',
+                                     (provider, tokens, now, blocked_until))
+                conn.commit()
+        finally:
+            conn.close()
+        self._report(provider, limits, tokens, running)
+        return lease_id, wait
+
+    def _report(self, provider: str, limits: ProviderLimits, tokens: float, running: int):
+        worker = str(os.getpid())
+        if limits.rpm > 0:
+            provider_quota_remaining.set(max(0, int(tokens)), provider=provider, limit='rpm', worker=worker)
+        if limits.concurrency > 0:
+            provider_quota_remaining.set(max(0, limits.concurrency - running), provider=provider,
+                                         limit='concurrency', worker=worker)
+
+    def acquire(self, provider: str, max_wait: Optional[float] = None) -> Optional[str]:
+        """
+        Wait for a call slot; returns a lease to pass to release()
+
+        Raises QuotaExhausted after max_wait seconds (the provider's default),
+        or at once when the budget can't recover within it. Returns None for
+        providers without limits or while pacing is disabled.
+        """
+        limits = self.limits.get(provider)
+        if not ENABLED or limits is None or (limits.rpm <= 0 and limits.concurrency <= 0):
+            return None
+        deadline = self.clock() + (limits.max_wait if max_wait is None else max_wait)
+        while True:
+            lease_id, wait = self._take(provider, limits)
+            if lease_id:
+                return lease_id
+            remaining = deadline - self.clock()
+            if wait > remaining:
+                provider_quota_throttled_total.inc(provider=provider)
+                logger.info(f"[provider_quota] {provider} budget unavailable for {wait:.1f}s - not waiting")
+                raise QuotaExhausted(provider, wait)
+            self.sleep(min(wait, POLL_INTERVAL * 4))
+
+    def release(self, lease_id: Optional[str]):
+        if not lease_id:
+            return
+        conn = _connect()
+        try:
+            conn.execute('DELETE FROM provider_leases WHERE lease_id = ?', (lease_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def penalize(self, provider: str, cooldown: float = COOLDOWN_SECONDS):
+        """The provider rate-limited us anyway: empty its bucket and hold calls for `cooldown` seconds"""
+        limits = self.limits.get(provider)
+        if not ENABLED or limits is None:
+            return
+        now = self.clock()
+        conn = _connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO provider_buckets (provider, tokens, updated_at, blocked_until) '
+                         'VALUES (?, 0, ?, ?)', (provider, now, now + cooldown))
+            conn.commit()
+        finally:
+            conn.close()
+        logger.warning(f"[provider_quota] {provider} rate-limited us - pausing it for {cooldown:.0f}s")
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Remaining budget per provider, as seen by every worker"""
+        now = self.clock()
+        conn = _connect()
+        try:
+            result = {}
+            for provider, limits in self.limits.items():
+                tokens, blocked_until, running, _ = self._read(conn, provider, limits, now)
+                result[provider] = {
+                    'rpm': limits.rpm,
+                    'tokens': round(tokens, 2),
+                    'running': running,
+                    'concurrency': limits.concurrency,
+                    'blocked_for': round(max(0.0, blocked_until - now), 1),
+                }
+            return result
+        finally:
+            conn.close()
+
+
+provider_quota = ProviderQuota.from_env()
@@ -1,6 +1,12 @@
+import logging
 import replicate
 import os
 from typing import Optional
+from services.metrics_service import stage_timer
+from services.tracing_service import span
+from services.image_utils import fit_to_size, encode_png, to_data_uri
+
+logger = logging.getLogger(__name__)
 
 class ReplicateService:
     def __init__(self, api_token: str):
@@ -25,15 +31,15 @@ class ReplicateService:
             from PIL import Image
             import requests
             
-            print(f"\n=== Starting IDM-VTON Virtual Try-On ===")
-            print(f"Person image size: {len(person_image_bytes)} bytes ({len(person_image_bytes)/1024:.1f}KB)")
-            print(f"Clothing image size: {len(clothing_image_bytes)} bytes ({len(clothing_image_bytes)/1024:.1f}KB)")
-            print(f"Category: {category}")
+            logger.debug(f"Starting IDM-VTON Virtual Try-On")
+            logger.debug(f"Person image size: {len(person_image_bytes)} bytes ({len(person_image_bytes)/1024:.1f}KB)")
+            logger.debug(f"Clothing image size: {len(clothing_image_bytes)} bytes ({len(clothing_image_bytes)/1024:.1f}KB)")
+            logger.debug(f"Category: {category}")
             
             # Store original person image size to restore later
             person_img = Image.open(BytesIO(person_image_bytes))
             original_size = person_img.size
-            print(f"Original person image size: {original_size}")
+            logger.debug(f"Original person image size: {original_size}")
             
             # Method 1: Try with base64 data URIs (works for images < 1MB, most reliable)
             person_b64 = base64.b64encode(person_image_bytes).decode('utf-8')
@@ -42,7 +48,7 @@ class ReplicateService:
             person_data_uri = f"data:image/png;base64,{person_b64}"
             clothing_data_uri = f"data:image/png;base64,{clothing_b64}"
             
-            print("Using base64 data URIs with optimized parameters...")
+            logger.debug("Using base64 data URIs with optimized parameters...")
             
             # Category-specific garment descriptions for accurate fitting
             # CRITICAL: Preserve clothing length and proportions
@@ -53,7 +59,7 @@ class ReplicateService:
             }
             
             garment_des = garment_descriptions.get(category, garment_descriptions["upper_body"])
-            print(f"Using garment description: {garment_des[:80]}...")
+            logger.debug(f"Using garment description: {garment_des[:80]}...")
             
             # Optimized parameters for preserving hands, background, and CLOTHING LENGTH
             # Higher steps = more accurate clothing region detection
@@ -68,98 +74,74 @@ class ReplicateService:
                 "seed": 42  # Consistent results
             }
             
-            print(f"✓ Parameters: steps={input_params['n_steps']}, guidance={input_params['guidance_scale']}")
+            logger.debug(f"Parameters: steps={input_params['n_steps']}, guidance={input_params['guidance_scale']}")
             
             # Use the correct IDM-VTON model version (verified working 2025)
-            output = replicate.run(
-                "cuuupid/idm-vton:c871bb9b046607b680449ecbae55fd8c6d945e0a1948644bf2361b3d021d3ff4",
-                input=input_params
-            )
-            print(f"✓ Replicate API call completed")
+            with span('replicate.predict'):
+                output = replicate.run(
+                    "cuuupid/idm-vton:c871bb9b046607b680449ecbae55fd8c6d945e0a1948644bf2361b3d021d3ff4",
+                    input=input_params
+                )
+            logger.info(f"Replicate API call completed")
             
-            print(f"Output type: {type(output)}")
+            logger.debug(f"Output type: {type(output)}")
             
             # Extract URL from various output formats
             result_url = None
             if isinstance(output, str):
                 result_url = output
-                print(f"✓ Got URL result: {result_url[:100]}...")
+                logger.debug(f"Got URL result: {result_url[:100]}...")
             elif isinstance(output, list) and len(output) > 0:
                 first_item = output[0]
                 if isinstance(first_item, str):
                     result_url = first_item
-                    print(f"✓ Got URL from list: {result_url[:100]}...")
+                    logger.debug(f"Got URL from list: {result_url[:100]}...")
                 elif hasattr(first_item, 'url'):
                     result_url = first_item.url
-                    print(f"✓ Got URL from object: {result_url[:100]}...")
+                    logger.debug(f"Got URL from object: {result_url[:100]}...")
                 else:
                     result_url = str(first_item)
-                    print(f"✓ Converted to string: {result_url[:100]}...")
+                    logger.debug(f"Converted to string: {result_url[:100]}...")
             elif hasattr(output, 'url'):
                 result_url = output.url
-                print(f"✓ Got URL from FileOutput: {result_url[:100]}...")
+                logger.debug(f"Got URL from FileOutput: {result_url[:100]}...")
             else:
-                print(f"✗ Unexpected output format: {output}")
+                logger.warning(f"Unexpected output format: {output}")
                 return None
             
             if not result_url:
-                print(f"✗ No URL extracted from output")
+                logger.warning(f"No URL extracted from output")
                 return None
             
             # Download the result image
-            print(f"Downloading result image from: {result_url[:80]}...")
-            response = requests.get(result_url, timeout=30)
-            response.raise_for_status()
-            result_bytes = response.content
-            print(f"✓ Downloaded: {len(result_bytes)} bytes ({len(result_bytes)/1024:.1f}KB)")
+            logger.debug(f"Downloading result image from: {result_url[:80]}...")
+            with stage_timer('download'):
+                response = requests.get(result_url, timeout=30)
+                response.raise_for_status()
+                result_bytes = response.content
+            logger.debug(f"Downloaded: {len(result_bytes)} bytes ({len(result_bytes)/1024:.1f}KB)")
             
             # Process result image to match original dimensions
             result_img = Image.open(BytesIO(result_bytes))
-            print(f"IDM-VTON output size: {result_img.size}")
+            logger.debug(f"IDM-VTON output size: {result_img.size}")
             
             if result_img.size != original_size:
-                # Calculate aspect ratios
-                result_ratio = result_img.size[0] / result_img.size[1]
-                original_ratio = original_size[0] / original_size[1]
-                
-                print(f"Result ratio: {result_ratio:.2f}, Original ratio: {original_ratio:.2f}")
-                
-                # Resize maintaining aspect ratio, then pad
-                if result_ratio > original_ratio:
-                    # Result is wider - fit to width
-                    new_width = original_size[0]
-                    new_height = int(new_width / result_ratio)
-                else:
-                    # Result is taller - fit to height
-                    new_height = original_size[1]
-                    new_width = int(new_height * result_ratio)
-                
-                print(f"Resizing from {result_img.size} to ({new_width}, {new_height}) maintaining ratio")
-                result_img = result_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # Create canvas with original size and paste centered
-                canvas = Image.new('RGB', original_size, (255, 255, 255))
-                paste_x = (original_size[0] - new_width) // 2
-                paste_y = (original_size[1] - new_height) // 2
-                canvas.paste(result_img, (paste_x, paste_y))
-                result_img = canvas
-                print(f"Padded to original size: {original_size}")
-            
-            # Convert to base64 data URI (same format as Gemini)
-            output_buffer = BytesIO()
-            result_img.save(output_buffer, format='PNG')
-            resized_data = output_buffer.getvalue()
-            
-            b64_data = base64.b64encode(resized_data).decode('utf-8')
-            data_uri = f"data:image/png;base64,{b64_data}"
-            
-            print(f"✓ Final image: {len(resized_data)} bytes (size: {original_size})")
+                # Resize maintaining aspect ratio, then pad to the original size
+                with stage_timer('resize'):
+                    result_img = fit_to_size(result_img, original_size)
+                logger.debug(f"Padded to original size: {original_size}")
+            
+            # Convert to base64 data URI (same format as Gemini); lossless and fast, since
+            # the route re-encodes the result for the client (services/result_encoding.py)
+            with stage_timer('encode'):
+                resized_data = encode_png(result_img, compress_level=1)
+                data_uri = to_data_uri(resized_data)
+            
+            logger.debug(f"Final image: {len(resized_data)} bytes (size: {original_size})")
             return data_uri
                 
         except Exception as e:
-            print(f"Replicate error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"Replicate error: {str(e)}")
             raise
     
     def enhance_face_and_hands(self, image_url: str) -> Optional[str]:
@@ -173,8 +155,8 @@ class ReplicateService:
             URL of the enhanced image
         """
         try:
-            print(f"\n=== CodeFormer Face & Hand Enhancement ===")
-            print(f"Input URL: {image_url[:100]}...")
+            logger.debug(f"CodeFormer Face & Hand Enhancement")
+            logger.debug(f"Input URL: {image_url[:100]}...")
             
             output = replicate.run(
                 "sczhou/codeformer:7de2ea26c616d5bf2245ad0d5e24f0ff9a6204578a5c876db53142edd9d2cd56",
@@ -187,15 +169,15 @@ class ReplicateService:
                 }
             )
             
-            print(f"✓ CodeFormer completed")
-            print(f"Output type: {type(output)}")
+            logger.info(f"CodeFormer completed")
+            logger.debug(f"Output type: {type(output)}")
             
             # Handle different output formats
             if isinstance(output, str):
-                print(f"✓ Enhanced URL: {output[:100]}...")
+                logger.debug(f"Enhanced URL: {output[:100]}...")
                 return output
             elif hasattr(output, 'url'):
-                print(f"✓ Enhanced URL from object: {output.url[:100]}...")
+                logger.debug(f"Enhanced URL from object: {output.url[:100]}...")
                 return output.url
             elif isinstance(output, list) and len(output) > 0:
                 first = output[0]
@@ -204,11 +186,9 @@ class ReplicateService:
                 elif hasattr(first, 'url'):
                     return first.url
             
-            print(f"✗ Unexpected output format: {output}")
+            logger.warning(f"Unexpected output format: {output}")
             return None
             
         except Exception as e:
-            print(f"CodeFormer error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"CodeFormer error: {str(e)}")
             raise
@@ -0,0 +1,160 @@
+"""
+Result Encoding
+Re-encodes try-on results for the client, once per result, with an in-process cache
+
+Gemini returns whatever its model produced and IDM-VTON results are padded
+and saved losslessly, so the data URI in /api/virtual-fitting used to be a
+multi-megabyte PNG for photographic content. encode_result() picks the format:
+
+1. the request's resultFormat field (avif / webp / jpeg / png), if this
+   Pillow build can encode it
+2. RESULT_IMAGE_FORMAT, when set to anything but 'auto'
+3. image types listed in the Accept header, in RESULT_PREFERENCE order
+   (wildcards don't count)
+4. WebP (JPEG if Pillow lacks WebP)
+
+JPEG is swapped for PNG only when the result has real transparency.
+Encoded data URIs are cached by (source hash, format, quality) in a
+byte-limited LRU, so identical results (IDM-VTON is seeded, retries,
+replays) are encoded once. Bytes in/out per format go to
+fitsa_result_image_bytes_total.
+"""
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image, features
+
+from services.image_utils import from_data_uri, to_data_uri
+from services.image_variants import parse_accept
+from services.metrics_service import record_cache_lookup, result_image_bytes_total
+
+MIMETYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+RESULT_PREFERENCE = ('AVIF', 'WEBP', 'JPEG', 'PNG')
+QUALITY = {
+    'AVIF': int(os.getenv('RESULT_AVIF_QUALITY', '60')),
+    'WEBP': int(os.getenv('RESULT_WEBP_QUALITY', '82')),
+    'JPEG': int(os.getenv('RESULT_JPEG_QUALITY', '85')),
+    'PNG': None,
+}
+DEFAULT_FORMAT = os.getenv('RESULT_IMAGE_FORMAT', 'auto').upper()
+CACHE_MAX_BYTES = int(os.getenv('RESULT_ENCODE_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+SUPPORTED = tuple(fmt for fmt in RESULT_PREFERENCE
+                  if fmt not in ('AVIF', 'WEBP') or features.check(fmt.lower()))
+ALIASES = {'JPG': 'JPEG'}
+
+
+def _supported(name: Optional[str]) -> Optional[str]:
+    fmt = ALIASES.get((name or '').upper(), (name or '').upper())
+    return fmt if fmt in SUPPORTED else None
+
+
+def choose_format(accept: str = '', requested: Optional[str] = None, has_alpha: bool = False) -> str:
+    """PIL format name for a result (see the module docstring for the order)"""
+    fmt = _supported(requested) or _supported(DEFAULT_FORMAT)
+    if fmt is None:
+        listed = {mimetype: q for mimetype, q in parse_accept(accept).items() if q > 0}
+        fmt = next((f for f in SUPPORTED if MIMETYPES[f] in listed), None)
+    if fmt is None:
+        fmt = 'WEBP' if 'WEBP' in SUPPORTED else 'JPEG'
+    if fmt == 'JPEG' and has_alpha:
+        fmt = 'PNG'
+    return fmt
+
+
+def _has_alpha(img: Image.Image) -> bool:
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        return img.convert('RGBA').getchannel('A').getextrema()[0] < 255
+    return False
+
+
+def encode_image(img: Image.Image, fmt: str) -> bytes:
+    quality = QUALITY[fmt]
+    if fmt == 'JPEG':
+        img = img.convert('RGB')
+    elif img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if _has_alpha(img) else 'RGB')
+    out = io.BytesIO()
+    if fmt == 'AVIF':
+        img.save(out, 'AVIF', quality=quality, speed=8)
+    elif fmt == 'WEBP':
+        img.save(out, 'WEBP', quality=quality, method=4)
+    elif fmt == 'JPEG':
+        img.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(out, 'PNG')  # optimize=True costs seconds on a full-size result
+    return out.getvalue()
+
+
+class EncodedResultCache:
+    """Byte-limited LRU of encoded data URIs (per worker)"""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[tuple, str]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        record_cache_lookup('result_encoding', value is not None)
+        return value
+
+    def put(self, key: tuple, value: str):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+encoded_cache = EncodedResultCache()
+
+
+def encode_result(result: str, accept: str = '', requested: Optional[str] = None) -> Tuple[str, dict]:
+    """
+    (data URI, info) of a provider result re-encoded for the client
+
+    info is {'format', 'mimetype', 'source_bytes', 'bytes'}. Results that are
+    not data URIs (remote URLs) are returned unchanged with an empty info.
+    """
+    if not result or not result.startswith('data:'):
+        return result, {}
+    source = from_data_uri(result)
+    img = Image.open(io.BytesIO(source))
+    fmt = choose_format(accept, requested, _has_alpha(img))
+    key = (hashlib.sha256(source).hexdigest(), fmt, QUALITY[fmt])
+
+    data_uri = encoded_cache.get(key)
+    if data_uri is None:
+        source_mimetype = Image.MIME.get(img.format)
+        if source_mimetype == MIMETYPES[fmt] and fmt != 'PNG':
+            encoded = source  # already a lossy encode in this format; re-encoding only loses quality
+        else:
+            encoded = encode_image(img, fmt)
+            if fmt == 'PNG' and len(encoded) >= len(source) and source_mimetype == 'image/png':
+                encoded = source
+        data_uri = to_data_uri(encoded, MIMETYPES[fmt])
+        encoded_cache.put(key, data_uri)
+        result_image_bytes_total.inc(len(source), format=fmt.lower(), stage='in')
+        result_image_bytes_total.inc(len(encoded), format=fmt.lower(), stage='out')
+    size = len(data_uri.split(',', 1)[1]) * 3 // 4
+    return data_uri, {'format': fmt.lower(), 'mimetype': MIMETYPES[fmt], 'source_bytes': len(source), 'bytes': size}
@@ -2,15 +2,23 @@
 Saved Fits Service
 Manages saved virtual fitting results with shopping information
 """
+import logging
 import sqlite3
 import uuid
 import time
+import threading
 from typing import List, Dict, Optional
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 import re
+from services.metrics_service import timed_db
+
+logger = logging.getLogger(__name__)
 
 DB_PATH = 'saved_fits.db'
 
+_initialized_path = None
+_init_lock = threading.Lock()
+
 def init_db():
     """Initialize saved_fits database table"""
     conn = sqlite3.connect(DB_PATH)
@@ -42,6 +50,16 @@ def init_db():
     conn.commit()
     conn.close()
 
+def _connect() -> sqlite3.Connection:
+    """Open a connection, creating the schema on first use rather than at import"""
+    global _initialized_path
+    if _initialized_path != DB_PATH:
+        with _init_lock:
+            if _initialized_path != DB_PATH:
+                init_db()
+                _initialized_path = DB_PATH
+    return sqlite3.connect(DB_PATH)
+
 def validate_url(url: str) -> bool:
     """Validate that URL is HTTPS and from allowed domains"""
     try:
@@ -81,6 +99,7 @@ def add_utm_params(url: str) -> str:
     except:
         return url
 
+@timed_db('saved_fits', 'save_fit')
 def save_fit(user_key: str, data: Dict) -> Dict:
     """
     Save a virtual fitting result
@@ -112,7 +131,7 @@ def save_fit(user_key: str, data: Dict) -> Dict:
     # Prepare tags (convert list to comma-separated string)
     tags_str = ','.join(data.get('tags', [])) if 'tags' in data else None
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     c = conn.cursor()
     
     try:
@@ -143,11 +162,12 @@ def save_fit(user_key: str, data: Dict) -> Dict:
         return {'ok': True, 'id': fit_id}
         
     except Exception as e:
-        print(f'Error saving fit: {e}')
+        logger.warning(f'Error saving fit: {e}')
         return {'ok': False, 'error': str(e)}
     finally:
         conn.close()
 
+@timed_db('saved_fits', 'get_saved_fits')
 def get_saved_fits(user_key: str, page: int = 1, per_page: int = 20, query: Optional[str] = None) -> Dict:
     """
     Get saved fits for a user with pagination
@@ -161,7 +181,7 @@ def get_saved_fits(user_key: str, page: int = 1, per_page: int = 20, query: Opti
     Returns:
         Dict with {items: List[Dict], total: int, page: int, per_page: int}
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -210,9 +230,10 @@ def get_saved_fits(user_key: str, page: int = 1, per_page: int = 20, query: Opti
         'total_pages': (total + per_page - 1) // per_page
     }
 
+@timed_db('saved_fits', 'get_fit_by_id')
 def get_fit_by_id(user_key: str, fit_id: str) -> Optional[Dict]:
     """Get a single saved fit by ID"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -229,9 +250,10 @@ def get_fit_by_id(user_key: str, fit_id: str) -> Optional[Dict]:
         return item
     return None
 
+@timed_db('saved_fits', 'delete_fit')
 def delete_fit(user_key: str, fit_id: str) -> Dict:
     """Delete a saved fit"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = _connect()
     c = conn.cursor()
     
     try:
@@ -246,10 +268,7 @@ def delete_fit(user_key: str, fit_id: str) -> Dict:
         return {'ok': True}
         
     except Exception as e:
-        print(f'Error deleting fit: {e}')
+        logger.warning(f'Error deleting fit: {e}')
         return {'ok': False, 'error': str(e)}
     finally:
         conn.close()
-
-# Initialize database on module load
-init_db()
@@ -0,0 +1,235 @@
+"""
+Speculative Fitting
+Opt-in pre-generation of brand room try-ons while the user browses
+
+A user who opted in on /room/<brand_id> and has a saved person photo posts
+it to /api/speculative-fittings. schedule() picks the first
+SPECULATIVE_ITEMS_PER_ROOM items of the room (one per section in turn, as
+the room shows them) and pre-generates them on a low-priority per-process
+thread:
+- a generation starts only while this worker is idle (fittings in flight
+  below SPECULATIVE_IDLE_MAX_IN_FLIGHT) and is dropped if it stays busy
+  for SPECULATIVE_IDLE_WAIT seconds
+- it queues in the fitting scheduler's speculative lane, behind every paid
+  and free try-on
+- each user gets SPECULATIVE_BUDGET_PER_HOUR generations per hour and the
+  whole deployment SPECULATIVE_GLOBAL_BUDGET_PER_HOUR (scheduled rows
+  count, so re-opening rooms or new client ids can't exceed them)
+
+Off unless SPECULATIVE_FITTING=true: every generation is a provider call
+nobody may pay for.
+
+Results are stored in SQLite (SPECULATIVE_DB_PATH), keyed by the client,
+the person photo's hash, the catalog item and the quality, so any worker can
+serve them. When the user then tries the item on, /api/virtual-fitting (with
+catalogItemId) claims the result instead of calling a provider; the request
+is charged as usual. Results nobody claims expire after SPECULATIVE_TTL
+seconds (dropped by the next schedule() or the maintenance sweep) and are
+never charged.
+"""
+import os
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from typing import List, Optional
+
+from services.fitting_jobs import JobRunner
+from services.metrics_service import record_cache_lookup, speculative_fittings_total, timed_db
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('SPECULATIVE_FITTING', 'false').lower() == 'true'
+DB_PATH = os.getenv('SPECULATIVE_DB_PATH', 'speculative.db')
+ITEMS_PER_ROOM = int(os.getenv('SPECULATIVE_ITEMS_PER_ROOM', '3'))
+BUDGET_PER_HOUR = int(os.getenv('SPECULATIVE_BUDGET_PER_HOUR', '6'))
+GLOBAL_BUDGET_PER_HOUR = int(os.getenv('SPECULATIVE_GLOBAL_BUDGET_PER_HOUR', '60'))
+TTL_SECONDS = float(os.getenv('SPECULATIVE_TTL', '1800'))
+IDLE_MAX_IN_FLIGHT = int(os.getenv('SPECULATIVE_IDLE_MAX_IN_FLIGHT', '1'))
+IDLE_WAIT_SECONDS = float(os.getenv('SPECULATIVE_IDLE_WAIT', '60'))
+IDLE_POLL = 0.5
+QUALITY = 'high'
+
+speculative_runner = JobRunner(max_workers=int(os.getenv('SPECULATIVE_THREADS', '1')), name='speculative-fitting')
+
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+def init_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS speculative_fittings (
+            client_id TEXT NOT NULL,
+            person_hash TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            quality TEXT NOT NULL,
+            category TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            result TEXT,
+            method TEXT,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (client_id, person_hash, item_id, quality)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_speculative_client_created ON speculative_fittings (client_id, created_at)')
+    conn.commit()
+
+
+def _connect(db_path: Optional[str] = None):
+    db_path = db_path or DB_PATH
+    path = os.path.abspath(db_path)
+    if path not in _initialized_paths or not os.path.exists(path):
+        with _init_lock:
+            if path not in _initialized_paths or not os.path.exists(path):
+                conn = sqlite3.connect(db_path)
+                try:
+                    init_schema(conn)
+                finally:
+                    conn.close()
+                _initialized_paths.add(path)
+    conn = sqlite3.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def person_hash(user_photo_bytes: bytes) -> str:
+    return hashlib.sha256(user_photo_bytes).hexdigest()
+
+
+def room_items(brand_id: str, limit: int = ITEMS_PER_ROOM) -> List[dict]:
+    """The first `limit` fittable items of a room, taking one per section in turn"""
+    from services import catalog_service
+    from services.image_variants import SOURCE_URL_PREFIX
+    sections = [catalog_service.get_items(brand_id, category['category_id'], per_page=limit)['items']
+                for category in catalog_service.list_categories()]
+    sections = [[item for item in items if item['image'].startswith(SOURCE_URL_PREFIX)] for items in sections]
+    picked = []
+    for rank in range(limit):
+        for items in sections:
+            if rank < len(items) and len(picked) < limit:
+                picked.append(items[rank])
+    return picked
+
+
+def schedule(client_id: str, user_photo_bytes: bytes, brand_id: str, provider_config: dict) -> dict:
+    """
+    Queue pre-generation of a room's first items for this client
+
+    Returns {'scheduled': [item_id, ...], 'budget_remaining': int}; items
+    pre-generated (in progress, or already tried on) for this photo within
+    the TTL are not repeated.
+    """
+    from services.fitting_batch import load_catalog_garment
+    now = time.time()
+    digest = person_hash(user_photo_bytes)
+    scheduled = []
+    conn = _connect()
+    try:
+        # Drop unclaimed results past their TTL; the rows stay for the hourly budget
+        conn.execute("UPDATE speculative_fittings SET status = 'expired', result = NULL "
+                     "WHERE status = 'ready' AND expires_at < ?", (now,))
+        conn.commit()
+        used = conn.execute("SELECT COUNT(*) FROM speculative_fittings WHERE client_id = ? AND created_at > ? "
+                            "AND status != 'dropped'", (client_id, now - 3600)).fetchone()[0]
+        used_globally = conn.execute("SELECT COUNT(*) FROM speculative_fittings WHERE created_at > ? "
+                                     "AND status != 'dropped'", (now - 3600,)).fetchone()[0]
+        budget = max(0, min(BUDGET_PER_HOUR - used, GLOBAL_BUDGET_PER_HOUR - used_globally))
+        for item in room_items(brand_id):
+            if len(scheduled) >= budget:
+                break
+            existing = conn.execute(
+                "SELECT 1 FROM speculative_fittings WHERE client_id = ? AND person_hash = ? AND item_id = ? "
+                "AND quality = ? AND status IN ('pending', 'ready', 'claimed') AND expires_at >= ?",
+                (client_id, digest, item['item_id'], QUALITY, now)).fetchone()
+            if existing:
+                continue
+            garment = load_catalog_garment(item['item_id'])
+            if garment is None or garment['clothing_bytes'] is None:
+                continue
+            conn.execute('''
+                INSERT OR REPLACE INTO speculative_fittings
+                    (client_id, person_hash, item_id, quality, category, status, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)
+            ''', (client_id, digest, item['item_id'], QUALITY, garment['category'], now, now + TTL_SECONDS))
+            conn.commit()
+            speculative_runner.submit(_pregenerate, (client_id, digest, item['item_id'], QUALITY),
+                                      user_photo_bytes, garment, provider_config)
+            speculative_fittings_total.inc(outcome='scheduled')
+            scheduled.append(item['item_id'])
+    finally:
+        conn.close()
+    return {'scheduled': scheduled, 'budget_remaining': budget - len(scheduled)}
+
+
+def _finish(key: tuple, **fields):
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    conn = _connect()
+    try:
+        conn.execute(f"UPDATE speculative_fittings SET {assignments} WHERE client_id = ? AND person_hash = ? "
+                     f"AND item_id = ? AND quality = ? AND status = 'pending'", (*fields.values(), *key))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _wait_until_idle(deadline: float) -> bool:
+    """True once this worker has fewer than IDLE_MAX_IN_FLIGHT fittings running; False at the deadline"""
+    from services.admission_service import admission_controller
+    while admission_controller.in_flight >= IDLE_MAX_IN_FLIGHT:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(IDLE_POLL)
+    return True
+
+
+def _pregenerate(key: tuple, user_photo_bytes: bytes, garment: dict, provider_config: dict):
+    """Generate one speculative result (runs on the speculative thread)"""
+    from services.fitting_pipeline import generate
+    if not _wait_until_idle(time.monotonic() + IDLE_WAIT_SECONDS):
+        speculative_fittings_total.inc(outcome='dropped')
+        _finish(key, status='dropped')
+        return
+    try:
+        generated = generate(user_photo_bytes, garment['clothing_bytes'], garment['category'], key[3],
+                             lane='speculative', user_key=key[0], **provider_config)
+    except Exception as e:
+        logger.warning(f"[speculative] generation failed for item {key[2]}: {e}")
+        generated = None
+    if generated:
+        speculative_fittings_total.inc(outcome='generated')
+        _finish(key, status='ready', result=generated['result'], method=generated['method'])
+    else:
+        speculative_fittings_total.inc(outcome='failed')
+        _finish(key, status='failed')
+
+
+@timed_db('speculative', 'claim')
+def claim(client_id: str, user_photo_bytes: bytes, item_id, category: str, quality: str) -> Optional[dict]:
+    """
+    Take a ready pre-generated result ({'result', 'method'}), or None
+
+    A claimed result is removed, so it is served (and charged) once.
+    """
+    try:
+        item_id = int(item_id)
+    except (TypeError, ValueError):
+        return None
+    key = (client_id, person_hash(user_photo_bytes), item_id, quality)
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT result, method, category FROM speculative_fittings WHERE client_id = ? AND person_hash = ? "
+            "AND item_id = ? AND quality = ? AND status = 'ready' AND expires_at >= ?", (*key, time.time())).fetchone()
+        claimed = row is not None and row['category'] == category and conn.execute(
+            "UPDATE speculative_fittings SET status = 'claimed', result = NULL WHERE client_id = ? "
+            "AND person_hash = ? AND item_id = ? AND quality = ? AND status = 'ready'", key).rowcount == 1
+        conn.commit()
+    finally:
+        conn.close()
+    record_cache_lookup('speculative', claimed)
+    if not claimed:
+        return None
+    speculative_fittings_total.inc(outcome='claimed')
+    return {'result': row['result'], 'method': row['method']}
@@ -0,0 +1,449 @@
+"""
+Static Assets
+Build step and runtime helpers for fingerprinted, precompressed static files
+
+Build (run once per deploy, see Dockerfile):
+    python -m services.static_assets build [--tailwind]
+
+- every static/**/*.js and *.css is minified, written to static/dist/ under a
+  content-hashed name (script3.js -> script3.3f9c1a2b7d.js) and precompressed
+  as .br and .gz next to it
+- static/*.html is copied to static/dist/ with asset references rewritten to
+  the hashed URLs (HTML keeps its name: it is always revalidated)
+- with --tailwind, the Tailwind CDN runtime is replaced by a compiled,
+  purged stylesheet (requires the tailwindcss CLI via npx)
+- static/dist/manifest.json maps logical names to hashed files
+
+Runtime:
+- asset_url('script3.js') returns '/assets/script3.<hash>.js' when a build
+  exists, else the plain '/script3.js' (development without a build)
+- send_precompressed() picks the .br/.gz variant the client accepts
+"""
+import os
+import re
+import sys
+import json
+import gzip
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Dict, Optional
+
+from flask import request, send_from_directory
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(APP_ROOT, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_NAME = 'manifest.json'
+ASSET_URL_PREFIX = '/assets/'
+
+ASSET_EXTENSIONS = ('.js', '.css')
+HASH_LENGTH = 10
+TAILWIND_CDN_TAG = '<script src="https://cdn.tailwindcss.com"></script>'
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+# Preferred first when the client accepts several
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+# ---- Minifiers ----
+# Conservative on purpose: comments and indentation go, newlines stay, so
+# automatic semicolon insertion behaves exactly as in the source.
+
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void', 'throw')
+
+
+def _skip_string(src: str, i: int) -> int:
+    """Index just past the quoted string starting at src[i]"""
+    quote = src[i]
+    i += 1
+    while i < len(src):
+        c = src[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == quote or c == '\n':
+            return i + 1
+        i += 1
+    return i
+
+
+def _skip_template(src: str, i: int) -> int:
+    """Index just past the template literal starting at src[i], including ${...} expressions"""
+    i += 1
+    while i < len(src):
+        c = src[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '`':
+            return i + 1
+        if c == '$' and src.startswith('${', i):
+            i = _skip_expression(src, i + 2)
+            continue
+        i += 1
+    return i
+
+
+def _skip_expression(src: str, i: int) -> int:
+    """Index just past the '}' closing a template ${ expression that starts at src[i]"""
+    depth = 0
+    while i < len(src):
+        c = src[i]
+        if c in '\'"':
+            i = _skip_string(src, i)
+            continue
+        if c == '`':
+            i = _skip_template(src, i)
+            continue
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            if depth == 0:
+                return i + 1
+            depth -= 1
+        i += 1
+    return i
+
+
+def _skip_regex(src: str, i: int) -> int:
+    """Index just past the regex literal body starting at src[i] (flags are copied as code)"""
+    i += 1
+    in_class = False
+    while i < len(src):
+        c = src[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '\n':
+            return i
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            return i + 1
+        i += 1
+    return i
+
+
+def _regex_allowed(out: list) -> bool:
+    j = len(out) - 1
+    while j >= 0 and out[j] in ' \n':
+        j -= 1
+    if j < 0 or out[j] in _REGEX_PRECEDERS:
+        return True
+    tail = ''.join(out[max(0, j - 7):j + 1])
+    return any(tail.endswith(k) and (len(tail) == len(k) or not (tail[-len(k) - 1].isalnum() or tail[-len(k) - 1] in '_$'))
+               for k in _REGEX_KEYWORDS)
+
+
+def _trim_trailing_spaces(out: list):
+    while out and out[-1] == ' ':
+        out.pop()
+
+
+def minify_js(src: str) -> str:
+    out = []
+    i, n = 0, len(src)
+    while i < n:
+        c = src[i]
+        if c in '\'"':
+            end = _skip_string(src, i)
+            out.append(src[i:end])
+            i = end
+        elif c == '`':
+            end = _skip_template(src, i)
+            out.append(src[i:end])
+            i = end
+        elif c == '/' and src.startswith('//', i):
+            end = src.find('\n', i)
+            i = n if end == -1 else end
+        elif c == '/' and src.startswith('/*', i):
+            end = src.find('*/', i + 2)
+            comment = src[i:] if end == -1 else src[i:end + 2]
+            i = n if end == -1 else end + 2
+            # A comment that spans lines may be acting as a line break for ASI
+            if '\n' in comment:
+                _trim_trailing_spaces(out)
+                if out and out[-1] != '\n':
+                    out.append('\n')
+            elif out and out[-1] not in ' \n':
+                out.append(' ')
+        elif c == '/' and _regex_allowed(out):
+            end = _skip_regex(src, i)
+            out.append(src[i:end])
+            i = end
+        elif c == '\n' or c == '\r':
+            _trim_trailing_spaces(out)
+            if out and out[-1] != '\n':
+                out.append('\n')
+            i += 1
+        elif c in ' \t':
+            if out and out[-1] not in ' \n':
+                out.append(' ')
+            i += 1
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css(src: str) -> str:
+    out = []
+    i, n = 0, len(src)
+    while i < n:
+        c = src[i]
+        if c in '\'"':
+            end = _skip_string(src, i)
+            out.append(src[i:end])
+            i = end
+        elif src.startswith('/*', i):
+            end = src.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+        elif c.isspace():
+            if out and out[-1] not in ' {};,' and not out[-1].endswith((' ', '{', '}', ';', ',')):
+                out.append(' ')
+            i += 1
+        elif c in '{};,':
+            _trim_trailing_spaces(out)
+            if c == '}' and out and out[-1] == ';':
+                out.pop()
+            out.append(c)
+            i += 1
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+MINIFIERS = {'.js': minify_js, '.css': minify_css}
+
+
+# ---- Build ----
+
+def _precompress(path: str, data: bytes) -> dict:
+    sizes = {}
+    try:
+        import brotli
+        compressed = brotli.compress(data, quality=11)
+        with open(path + '.br', 'wb') as f:
+            f.write(compressed)
+        sizes['br'] = len(compressed)
+    except ImportError:
+        logger.warning("brotli not installed - skipping .br variants")
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    with open(path + '.gz', 'wb') as f:
+        f.write(compressed)
+    sizes['gzip'] = len(compressed)
+    return sizes
+
+
+def _hashed_name(logical: str, data: bytes) -> str:
+    stem, ext = os.path.splitext(logical)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}'
+
+
+def _write_asset(out_dir: str, logical: str, data: bytes, hashed: bool = True) -> tuple:
+    name = _hashed_name(logical, data) if hashed else logical
+    path = os.path.join(out_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return name, _precompress(path, data)
+
+
+def _rewrite_html(html: str, assets: Dict[str, str], tailwind: Optional[str]) -> str:
+    def replace(match):
+        logical = match.group(2)
+        if logical in assets:
+            return f'{match.group(1)}="{ASSET_URL_PREFIX}{assets[logical]}"'
+        return match.group(0)
+    html = re.sub(r'\b(src|href)="/([^"?#]+)"', replace, html)
+    if tailwind:
+        html = html.replace(TAILWIND_CDN_TAG, f'<link rel="stylesheet" href="{ASSET_URL_PREFIX}{tailwind}">')
+    return html
+
+
+def _build_tailwind(static_dir: str) -> Optional[bytes]:
+    """Compile a purged Tailwind stylesheet for the pages that use the CDN runtime"""
+    content = ','.join([os.path.join(static_dir, '*.html'), os.path.join(static_dir, '*.js'),
+                        os.path.join(APP_ROOT, 'templates', '**', '*.html')])
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'input.css')
+        output = os.path.join(tmp, 'tailwind.css')
+        with open(source, 'w') as f:
+            f.write('@tailwind base;\n@tailwind components;\n@tailwind utilities;\n')
+        try:
+            subprocess.run(['npx', '--no-install', 'tailwindcss', '-i', source, '-o', output,
+                            '--content', content, '--minify'],
+                           cwd=APP_ROOT, check=True, capture_output=True, timeout=300)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Tailwind build unavailable, keeping the CDN runtime: {e}")
+            return None
+        with open(output, 'rb') as f:
+            return f.read()
+
+
+def build(static_dir: str = STATIC_DIR, out_dir: str = DIST_DIR, tailwind: bool = False) -> dict:
+    """Build static/dist and its manifest; returns the manifest"""
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+    assets, sizes = {}, {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != out_dir]
+        for filename in sorted(files):
+            ext = os.path.splitext(filename)[1]
+            if ext not in ASSET_EXTENSIONS:
+                continue
+            path = os.path.join(root, filename)
+            logical = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            with open(path, encoding='utf-8') as f:
+                source = f.read()
+            minified = MINIFIERS[ext](source).encode('utf-8')
+            assets[logical], compressed = _write_asset(out_dir, logical, minified)
+            sizes[logical] = dict(compressed, original=len(source.encode('utf-8')), minified=len(minified))
+
+    tailwind_name = None
+    if tailwind:
+        css = _build_tailwind(static_dir)
+        if css is not None:
+            tailwind_name, compressed = _write_asset(out_dir, 'tailwind.css', css)
+            assets['tailwind.css'] = tailwind_name
+            sizes['tailwind.css'] = dict(compressed, original=len(css), minified=len(css))
+
+    pages = []
+    for filename in sorted(os.listdir(static_dir)):
+        if not filename.endswith('.html'):
+            continue
+        with open(os.path.join(static_dir, filename), encoding='utf-8') as f:
+            html = _rewrite_html(f.read(), assets, tailwind_name).encode('utf-8')
+        _, compressed = _write_asset(out_dir, filename, html, hashed=False)
+        sizes[filename] = dict(compressed, original=len(html), minified=len(html))
+        pages.append(filename)
+
+    manifest = {'assets': assets, 'pages': pages, 'sizes': sizes}
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+# ---- Runtime ----
+
+class AssetManifest:
+    """Lazily loaded static/dist/manifest.json (reloaded when the file changes)"""
+
+    def __init__(self, dist_dir: str = DIST_DIR):
+        self.dist_dir = dist_dir
+        self.path = os.path.join(dist_dir, MANIFEST_NAME)
+        self._mtime = None
+        self._data = {'assets': {}, 'pages': []}
+        self._lock = threading.Lock()
+
+    def _current(self) -> dict:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return {'assets': {}, 'pages': []}
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        with open(self.path) as f:
+                            self._data = json.load(f)
+                        self._mtime = mtime
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Could not load asset manifest: {e}")
+        return self._data
+
+    def url(self, logical: str, default: Optional[str] = '') -> Optional[str]:
+        hashed = self._current()['assets'].get(logical)
+        if hashed:
+            return ASSET_URL_PREFIX + hashed
+        return f'/{logical}' if default == '' else default
+
+    def has_page(self, filename: str) -> bool:
+        return filename in self._current()['pages']
+
+    def is_hashed_asset(self, filename: str) -> bool:
+        return filename in set(self._current()['assets'].values())
+
+
+manifest = AssetManifest()
+
+
+def asset_url(logical: str, default: Optional[str] = '') -> Optional[str]:
+    """URL for a static asset: the fingerprinted build when present, else the plain file"""
+    return manifest.url(logical, default)
+
+
+def negotiate_encoding(accept_encoding: str, available=('br', 'gzip')) -> Optional[str]:
+    """Best content-coding the client accepts (q > 0), preferring br over gzip"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            accepted[coding] = q
+    for coding in available:
+        q = accepted[coding] if coding in accepted else accepted.get('*', 0.0)
+        if q > 0:
+            return coding
+    return None
+
+
+def send_precompressed(directory: str, filename: str, cache_control: str):
+    """Serve filename from directory, using a precompressed variant when the client accepts one"""
+    import mimetypes
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    available = [coding for coding, suffix in ENCODINGS
+                 if os.path.isfile(os.path.join(directory, filename + suffix))]
+    coding = negotiate_encoding(request.headers.get('Accept-Encoding', ''), available)
+    suffix = dict(ENCODINGS).get(coding, '')
+
+    response = send_from_directory(directory, filename + suffix, mimetype=mimetype)
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets')
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--tailwind', action='store_true',
+                        help='compile Tailwind instead of loading the CDN runtime (needs tailwindcss via npx)')
+    args = parser.parse_args(argv)
+
+    result = build(tailwind=args.tailwind)
+    print(f'{"asset":<28} {"hashed name":<36} {"original":>9} {"minified":>9} {"gzip":>8} {"br":>8}')
+    for logical, size in sorted(result['sizes'].items()):
+        hashed = result['assets'].get(logical, logical)
+        print(f'{logical:<28} {hashed:<36} {size["original"]:>9} {size["minified"]:>9} '
+              f'{size.get("gzip", "-"):>8} {size.get("br", "-"):>8}')
+    print(f'Manifest written to {os.path.join(DIST_DIR, MANIFEST_NAME)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""
+Stripe Inbox Service
+Durable webhook inbox and local checkout session status
+
+- /stripe/webhook verifies the signature, stores the event in the
+  stripe_events table (keyed by Stripe's event id, so redeliveries are
+  no-ops) and answers 200 immediately.
+- A per-worker background thread (InboxWorker) processes stored events with
+  exponential backoff retries. Workers claim events with a short lease, so
+  several gunicorn workers can share the inbox; a crashed claim is retried
+  once the lease expires.
+- Fulfillment is idempotent per checkout session: the checkout_sessions row,
+  the credit grant and users.completed_sessions are written in one
+  transaction in credits.db. The webhook and the /success page can both
+  fulfill a session; whichever comes first grants the credits.
+- /stripe/complete-purchase reads checkout_sessions instead of calling
+  Stripe; it only asks Stripe when the webhook hasn't arrived yet.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional
+
+import stripe
+
+from services.credits_service import CreditsService
+from services.metrics_service import stripe_events_total, timed_db
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'credits.db'
+CREDITS_PER_PURCHASE = 10
+
+MAX_ATTEMPTS = int(os.getenv('STRIPE_INBOX_MAX_ATTEMPTS', '8'))
+RETRY_BASE_SECONDS = float(os.getenv('STRIPE_INBOX_RETRY_BASE', '5'))
+RETRY_MAX_SECONDS = float(os.getenv('STRIPE_INBOX_RETRY_MAX', '3600'))
+LEASE_SECONDS = float(os.getenv('STRIPE_INBOX_LEASE_SECONDS', '60'))
+POLL_SECONDS = float(os.getenv('STRIPE_INBOX_POLL_SECONDS', '30'))
+# An unpaid session (async payment method) is re-checked with Stripe at most this often
+SESSION_REFRESH_SECONDS = float(os.getenv('STRIPE_SESSION_REFRESH_SECONDS', '10'))
+
+FULFILLMENT_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+SESSION_STATUS_EVENTS = ('checkout.session.async_payment_failed', 'checkout.session.expired')
+
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+class WebhookNotConfigured(Exception):
+    """STRIPE_WEBHOOK_SECRET is missing and unsigned webhooks are not allowed"""
+
+
+def init_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stripe_events (
+            event_id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            received_at REAL NOT NULL,
+            processed_at REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_stripe_events_due ON stripe_events (status, next_attempt_at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS checkout_sessions (
+            session_id TEXT PRIMARY KEY,
+            user_key TEXT,
+            payment_status TEXT,
+            status TEXT,
+            credits_granted INTEGER DEFAULT 0,
+            fulfilled_at REAL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def _connect(db_path: str = DB_PATH):
+    path = os.path.abspath(db_path)
+    if path not in _initialized_paths or not os.path.exists(path):
+        with _init_lock:
+            if path not in _initialized_paths or not os.path.exists(path):
+                CreditsService(db_path)  # users table
+                conn = sqlite3.connect(db_path)
+                try:
+                    init_schema(conn)
+                finally:
+                    conn.close()
+                _initialized_paths.add(path)
+    return sqlite3.connect(db_path)
+
+
+# ---- Webhook intake ----
+
+def construct_event(payload: bytes, sig_header: Optional[str]) -> dict:
+    """
+    Verify and parse a webhook payload
+
+    Raises stripe.SignatureVerificationError or ValueError for a bad request,
+    WebhookNotConfigured when no secret is set (STRIPE_WEBHOOK_ALLOW_UNSIGNED=1
+    accepts unsigned payloads for local testing).
+    """
+    secret = os.getenv('STRIPE_WEBHOOK_SECRET')
+    if secret:
+        stripe.WebhookSignature.verify_header(payload, sig_header, secret, stripe.Webhook.DEFAULT_TOLERANCE)
+    elif os.getenv('STRIPE_WEBHOOK_ALLOW_UNSIGNED') != '1':
+        raise WebhookNotConfigured('STRIPE_WEBHOOK_SECRET is not set')
+    event = json.loads(payload)
+    if not isinstance(event, dict) or not event.get('id') or not event.get('type'):
+        raise ValueError('Not a Stripe event')
+    return event
+
+
+@timed_db('credits', 'record_stripe_event')
+def record_event(event: dict, db_path: str = DB_PATH) -> bool:
+    """Store an event in the inbox; False if this event id was already received"""
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        c = conn.execute(
+            'INSERT OR IGNORE INTO stripe_events (event_id, type, payload, next_attempt_at, received_at) VALUES (?, ?, ?, ?, ?)',
+            (event['id'], event['type'], json.dumps(event), now, now)
+        )
+        conn.commit()
+        new = c.rowcount == 1
+    finally:
+        conn.close()
+    stripe_events_total.inc(type=event['type'], outcome='received' if new else 'duplicate')
+    return new
+
+
+# ---- Checkout sessions ----
+
+@timed_db('credits', 'fulfill_checkout_session')
+def fulfill_checkout_session(session: dict, db_path: str = DB_PATH, credits: int = CREDITS_PER_PURCHASE) -> bool:
+    """
+    Record a checkout session's status and, if paid, grant its credits once
+
+    Returns True if this call granted the credits.
+    """
+    session_id = session['id']
+    user_key = session.get('client_reference_id')
+    payment_status = session.get('payment_status')
+    now = time.time()
+    conn = _connect(db_path)
+
+    try:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('''
+            INSERT INTO checkout_sessions (session_id, user_key, payment_status, status, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                user_key = COALESCE(checkout_sessions.user_key, excluded.user_key),
+                payment_status = excluded.payment_status,
+                status = excluded.status,
+                updated_at = excluded.updated_at
+        ''', (session_id, user_key, payment_status, session.get('status'), now))
+
+        if payment_status != 'paid' or not user_key:
+            conn.commit()
+            return False
+
+        c.execute(
+            'UPDATE checkout_sessions SET fulfilled_at = ?, credits_granted = ? WHERE session_id = ? AND fulfilled_at IS NULL',
+            (now, credits, session_id)
+        )
+        if c.rowcount == 0:
+            conn.commit()
+            return False
+
+        c.execute('SELECT completed_sessions FROM users WHERE user_key = ?', (user_key,))
+        row = c.fetchone()
+        completed = row[0].split(',') if row and row[0] else []
+        if session_id in completed:
+            # Credited by /complete-purchase before checkout_sessions existed
+            c.execute('UPDATE checkout_sessions SET credits_granted = 0 WHERE session_id = ?', (session_id,))
+            conn.commit()
+            return False
+
+        completed.append(session_id)
+        c.execute('''
+            INSERT INTO users (user_key, free_used_today, credits, completed_sessions) VALUES (?, 0, ?, ?)
+            ON CONFLICT(user_key) DO UPDATE SET
+                credits = credits + excluded.credits,
+                completed_sessions = excluded.completed_sessions
+        ''', (user_key, credits, ','.join(completed)))
+        conn.commit()
+        logger.info(f"Stripe: added {credits} credits to user {user_key} for session {session_id}")
+        return True
+
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+@timed_db('credits', 'lookup_checkout_session')
+def lookup_checkout_session(session_id: str, db_path: str = DB_PATH) -> Optional[dict]:
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(
+            'SELECT user_key, payment_status, status, fulfilled_at, credits_granted, updated_at FROM checkout_sessions WHERE session_id = ?',
+            (session_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    user_key, payment_status, status, fulfilled_at, credits_granted, updated_at = row
+    return {
+        'session_id': session_id,
+        'user_key': user_key,
+        'payment_status': payment_status,
+        'status': status,
+        'fulfilled': fulfilled_at is not None,
+        'credits_granted': credits_granted,
+        'updated_at': updated_at,
+    }
+
+
+def retrieve_checkout_session(session_id: str) -> dict:
+    """Fetch a checkout session from the Stripe API"""
+    session = stripe.checkout.Session.retrieve(session_id)
+    return {
+        'id': session.id,
+        'client_reference_id': session.client_reference_id,
+        'payment_status': session.payment_status,
+        'status': session.status,
+    }
+
+
+def needs_refresh(local: Optional[dict], now: Optional[float] = None) -> bool:
+    """Whether /complete-purchase has to ask Stripe about this session"""
+    if local is None:
+        return True
+    if local['fulfilled'] or local['status'] == 'expired':
+        return False
+    return (now or time.time()) - local['updated_at'] >= SESSION_REFRESH_SECONDS
+
+
+# ---- Processing ----
+
+def process_event(event: dict, db_path: str = DB_PATH) -> str:
+    """Apply one event; returns the final inbox status ('processed' or 'ignored')"""
+    event_type = event['type']
+    if event_type in FULFILLMENT_EVENTS or event_type in SESSION_STATUS_EVENTS:
+        session = event['data']['object']
+        if event_type in FULFILLMENT_EVENTS and not session.get('client_reference_id'):
+            logger.warning(f"Stripe event {event['id']}: no user_key in session {session.get('id')}")
+        fulfill_checkout_session(session, db_path)
+        return 'processed'
+    return 'ignored'
+
+
+def retry_delay(attempts: int) -> float:
+    return min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+
+class InboxWorker:
+    """Processes due inbox events in a background thread per worker process"""
+
+    def __init__(self, db_path: str = DB_PATH, handler=process_event, clock=time.time):
+        self.db_path = db_path
+        self.handler = handler
+        self.clock = clock
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def _claim(self, conn, event_id: str, now: float) -> bool:
+        c = conn.execute('''
+            UPDATE stripe_events SET status = 'processing', attempts = attempts + 1, next_attempt_at = ?
+            WHERE event_id = ? AND status IN ('pending', 'processing') AND next_attempt_at <= ?
+        ''', (now + LEASE_SECONDS, event_id, now))
+        conn.commit()
+        return c.rowcount == 1
+
+    def process_due(self, limit: int = 50) -> int:
+        """Process events that are due now; returns how many were attempted"""
+        now = self.clock()
+        conn = _connect(self.db_path)
+        attempted = 0
+        try:
+            due = [row[0] for row in conn.execute('''
+                SELECT event_id FROM stripe_events
+                WHERE status IN ('pending', 'processing') AND next_attempt_at <= ?
+                ORDER BY received_at LIMIT ?
+            ''', (now, limit))]
+            for event_id in due:
+                if not self._claim(conn, event_id, now):
+                    continue  # another worker got it
+                attempted += 1
+                payload, attempts = conn.execute(
+                    'SELECT payload, attempts FROM stripe_events WHERE event_id = ?', (event_id,)).fetchone()
+                event = json.loads(payload)
+                try:
+                    outcome = self.handler(event, self.db_path)
+                except Exception as e:
+                    failed = attempts >= MAX_ATTEMPTS
+                    conn.execute(
+                        'UPDATE stripe_events SET status = ?, next_attempt_at = ?, last_error = ? WHERE event_id = ?',
+                        ('failed' if failed else 'pending', self.clock() + retry_delay(attempts), str(e), event_id)
+                    )
+                    conn.commit()
+                    stripe_events_total.inc(type=event['type'], outcome='failed' if failed else 'retry')
+                    if failed:
+                        logger.error(f"Stripe event {event_id} failed after {attempts} attempts: {e}")
+                    else:
+                        logger.warning(f"Stripe event {event_id} attempt {attempts} failed, retrying: {e}")
+                    continue
+                conn.execute(
+                    'UPDATE stripe_events SET status = ?, processed_at = ?, last_error = NULL WHERE event_id = ?',
+                    (outcome, self.clock(), event_id)
+                )
+                conn.commit()
+                stripe_events_total.inc(type=event['type'], outcome=outcome)
+        finally:
+            conn.close()
+        return attempted
+
+    def _next_wait(self) -> float:
+        conn = _connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM stripe_events WHERE status IN ('pending', 'processing')").fetchone()
+        finally:
+            conn.close()
+        if row[0] is None:
+            return POLL_SECONDS
+        return min(POLL_SECONDS, max(0.0, row[0] - self.clock()))
+
+    def _loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            try:
+                timeout = self._next_wait()
+            except sqlite3.Error:
+                timeout = POLL_SECONDS
+            self._wake.wait(timeout)
+            self._wake.clear()
+            try:
+                while self.process_due():
+                    pass
+            except Exception:
+                logger.exception("Stripe inbox processing failed")
+
+    def start(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._wake = threading.Event()
+                    threading.Thread(target=self._loop, name='stripe-inbox', daemon=True).start()
+
+    def notify(self):
+        """Wake the worker (starting it in this process if needed)"""
+        self.start()
+        self._wake.set()
+
+    def backlog(self) -> dict:
+        conn = _connect(self.db_path)
+        try:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM stripe_events GROUP BY status').fetchall())
+        finally:
+            conn.close()
+
+
+inbox_worker = InboxWorker()
@@ -0,0 +1,293 @@
+"""
+Tracing Service
+Lightweight per-request span tracing
+
+Spans are recorded into the active request trace (a context variable) and
+surface in three places:
+- a Server-Timing response header, visible in browser dev tools
+- a rolling in-memory "slowest N requests" view with the full stage breakdown
+- optionally, OTLP/HTTP JSON export to a local collector (OTEL_EXPORTER_OTLP_ENDPOINT)
+
+Outside a request (scripts, tests) span() is a cheap no-op.
+"""
+import os
+import re
+import time
+import queue
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_N = int(os.getenv('TRACE_SLOWEST_N', '20'))
+SLOWEST_WINDOW_SECONDS = int(os.getenv('TRACE_SLOWEST_WINDOW_SECONDS', '3600'))
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', '').rstrip('/')
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'fitsa-web')
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('current_trace', default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+_SERVER_TIMING_TOKEN = re.compile(r'[^A-Za-z0-9_\-.]')
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'start', 'end', 'start_unix_ns', 'attributes')
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.start_unix_ns = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+
+class Trace:
+    def __init__(self, name: str, request_id: Optional[str] = None):
+        self.trace_id = os.urandom(16).hex()
+        self.root_span_id = os.urandom(8).hex()
+        self.name = name
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self.start_unix_ns = time.time_ns()
+        self.end = None
+        self.finished_at = None
+        self.attributes: Dict[str, object] = {}
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def server_timing(self) -> str:
+        """Server-Timing header value; repeated span names are summed"""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for span in self.spans:
+                key = _SERVER_TIMING_TOKEN.sub('_', span.name)
+                totals[key] = totals.get(key, 0.0) + span.duration_ms
+        parts = [f'{name};dur={duration:.1f}' for name, duration in totals.items()]
+        parts.append(f'total;dur={self.duration_ms:.1f}')
+        return ', '.join(parts)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+            return {
+                'trace_id': self.trace_id,
+                'request_id': self.request_id,
+                'name': self.name,
+                'duration_ms': round(self.duration_ms, 2),
+                'finished_at': self.finished_at,
+                'attributes': dict(self.attributes),
+                'spans': [{
+                    'name': s.name,
+                    'offset_ms': round((s.start - self.start) * 1000, 2),
+                    'duration_ms': round(s.duration_ms, 2),
+                    'parent': next((p.name for p in spans if p.span_id == s.parent_id), None),
+                    'attributes': dict(s.attributes),
+                } for s in spans],
+            }
+
+
+# ---- Span API ----
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a span in the current request trace (no-op outside a trace)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent else trace.root_span_id, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.attributes['error'] = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        trace.add(current)
+
+
+def traced(name: str):
+    """Decorator form of span()"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attribute(key: str, value):
+    """Attach an attribute to the current request trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes[key] = value
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def start_trace(name: str, request_id: Optional[str] = None) -> Trace:
+    trace = Trace(name, request_id)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def finish_trace(trace: Trace, status: Optional[int] = None):
+    trace.end = time.perf_counter()
+    trace.finished_at = time.time()
+    if status is not None:
+        trace.attributes['http.status_code'] = status
+    _current_trace.set(None)
+    _current_span.set(None)
+    slowest_traces.add(trace)
+    if exporter is not None:
+        exporter.enqueue(trace)
+
+
+# ---- Slowest-N view ----
+
+class SlowestTraces:
+    """Slowest N traces seen within a rolling time window (per worker)"""
+
+    def __init__(self, size: int = SLOWEST_N, window_seconds: int = SLOWEST_WINDOW_SECONDS):
+        self.size = size
+        self.window_seconds = window_seconds
+        self._traces: List[Trace] = []
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._prune()
+            if len(self._traces) >= self.size and trace.duration_ms <= self._traces[-1].duration_ms:
+                return
+            self._traces.append(trace)
+            self._traces.sort(key=lambda t: t.duration_ms, reverse=True)
+            del self._traces[self.size:]
+
+    def _prune(self):
+        cutoff = time.time() - self.window_seconds
+        self._traces = [t for t in self._traces if t.finished_at >= cutoff]
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            self._prune()
+            return [t.to_dict() for t in self._traces]
+
+
+slowest_traces = SlowestTraces()
+
+
+# ---- Optional OTLP export ----
+
+class OtlpExporter:
+    """Batches finished traces and POSTs them as OTLP/HTTP JSON from a background thread"""
+
+    def __init__(self, endpoint: str, batch_size: int = 50, flush_interval: float = 5.0, max_queue: int = 1000):
+        self.url = f'{endpoint}/v1/traces'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, trace: Trace):
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, name='otlp-export', daemon=True).start()
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            pass  # Never block a request on telemetry
+
+    def _run(self):
+        import requests
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                requests.post(self.url, json=self.encode(batch), timeout=5)
+            except Exception as e:
+                logger.warning(f"OTLP export failed: {e}")
+
+    @staticmethod
+    def encode(traces: List[Trace]) -> dict:
+        spans = []
+        for trace in traces:
+            end_unix_ns = trace.start_unix_ns + int(trace.duration_ms * 1e6)
+            spans.append({
+                'traceId': trace.trace_id,
+                'spanId': trace.root_span_id,
+                'name': trace.name,
+                'kind': 2,  # SERVER
+                'startTimeUnixNano': str(trace.start_unix_ns),
+                'endTimeUnixNano': str(end_unix_ns),
+                'attributes': _otlp_attributes(dict(trace.attributes, request_id=trace.request_id)),
+            })
+            for s in trace.spans:
+                spans.append({
+                    'traceId': trace.trace_id,
+                    'spanId': s.span_id,
+                    'parentSpanId': s.parent_id,
+                    'name': s.name,
+                    'kind': 1,  # INTERNAL
+                    'startTimeUnixNano': str(s.start_unix_ns),
+                    'endTimeUnixNano': str(s.start_unix_ns + int(s.duration_ms * 1e6)),
+                    'attributes': _otlp_attributes(s.attributes),
+                })
+        return {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME})},
+            'scopeSpans': [{'scope': {'name': 'fitsa.tracing'}, 'spans': spans}],
+        }]}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    encoded = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            encoded.append({'key': key, 'value': {'boolValue': value}})
+        elif isinstance(value, int):
+            encoded.append({'key': key, 'value': {'intValue': str(value)}})
+        elif isinstance(value, float):
+            encoded.append({'key': key, 'value': {'doubleValue': value}})
+        else:
+            encoded.append({'key': key, 'value': {'stringValue': str(value)}})
+    return encoded
+
+
+exporter = OtlpExporter(OTLP_ENDPOINT) if OTLP_ENDPOINT else None
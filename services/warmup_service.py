@@ -0,0 +1,99 @@
+"""
+Warm-up Service
+Initializes providers, models and databases in a worker before it takes traffic
+
+Without this, the first fitting request in every gunicorn worker pays for
+importing the AI SDKs and creating the SQLite schemas. gunicorn.conf.py runs warm_up() from post_worker_init, after the app
+is loaded and before the worker accepts connections.
+
+WARMUP_STEPS selects the steps (comma-separated, default: DEFAULT_STEPS);
+WARMUP_STEPS=none disables warm-up entirely. 'rembg' (loading the ONNX
+background-removal model) is opt-in: it adds about 170 MB RSS to every
+worker, while only the fast-mode path that removes backgrounds needs it.
+"""
+import os
+import time
+import logging
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_databases():
+    from services.credits_service import CreditsService
+    from services import saved_fits_service, stripe_inbox_service, catalog_service
+    CreditsService()
+    stripe_inbox_service._connect().close()
+    catalog_service.page_cache.version()  # schema, demo seed and the cache's connection
+    saved_fits_service._connect().close()
+
+
+def _warm_pillow():
+    from PIL import Image
+    # Register every format plugin now instead of on the first Image.open()
+    Image.init()
+
+
+def _warm_providers():
+    import services.gemini_virtual_fitting_service  # noqa: F401  (google-genai)
+    import services.replicate_service  # noqa: F401  (replicate)
+
+
+def _warm_rembg():
+    from services.background_removal_service import get_session
+    get_session()
+
+
+STEPS = {
+    'databases': _warm_databases,
+    'pillow': _warm_pillow,
+    'providers': _warm_providers,
+    'rembg': _warm_rembg,
+}
+DEFAULT_STEPS = ('databases', 'pillow', 'providers')
+
+warmup_state = {'ready': False, 'pid': None, 'steps': {}}
+
+
+def configured_steps():
+    value = os.getenv('WARMUP_STEPS', ','.join(DEFAULT_STEPS)).strip()
+    if value.lower() in ('', 'none', '0', 'false'):
+        return []
+    return [step.strip() for step in value.split(',') if step.strip()]
+
+
+def warm_up() -> Dict[str, dict]:
+    """
+    Run the configured warm-up steps in this process.
+
+    A failing step is logged and recorded but never stops the worker: the
+    request path still initializes everything lazily.
+    """
+    results = {}
+    started = time.perf_counter()
+    for name in configured_steps():
+        step = STEPS.get(name)
+        if step is None:
+            logger.warning(f"Unknown warm-up step '{name}' ignored")
+            continue
+        step_start = time.perf_counter()
+        try:
+            step()
+            results[name] = {'ok': True}
+        except Exception as e:
+            logger.warning(f"Warm-up step '{name}' failed: {e}")
+            results[name] = {'ok': False, 'error': str(e)}
+        results[name]['ms'] = round((time.perf_counter() - step_start) * 1000, 1)
+
+    warmup_state.update(ready=True, pid=os.getpid(), steps=results)
+    logger.info("Worker warm-up finished", extra={
+        'pid': os.getpid(),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'steps': results,
+    })
+    return results
+
+
+def is_warm() -> bool:
+    """True once warm_up() has completed in this process"""
+    return warmup_state['ready'] and warmup_state['pid'] == os.getpid()
@@ -352,6 +352,7 @@ let bottomClothImage = null;
 let dressImage = null;
 let clothingMode = 'separate'; // 'separate' or 'dress'
 let imageLoaded = false; // Track if person image is uploaded
+let luxuryItem = null; // { itemId, type } of a Luxury Hall item in its slot (lets the server use a pre-generated result)
 
 // DOM elements - will be initialized after DOM loads
 let personDropZone, topClothDropZone, bottomClothDropZone, dressDropZone;
@@ -549,6 +550,9 @@ function handleFileSelect(e, type) {
 }
 
 async function handleFile(file, type) {
+    if (luxuryItem && luxuryItem.type === type) {
+        luxuryItem = null; // replaced by another garment
+    }
     try {
         const fileSizeMB = (file.size / 1024 / 1024).toFixed(1);
         
@@ -625,6 +629,9 @@ async function handleFile(file, type) {
 
 function clearImage(type, event) {
     event.stopPropagation();
+    if (luxuryItem && luxuryItem.type === type) {
+        luxuryItem = null;
+    }
     
     const preview = document.getElementById(`${type}Preview`);
     const placeholder = document.getElementById(`${type}Placeholder`);
@@ -713,6 +720,48 @@ function updateUIState() {
     }
 }
 
+// Server checks the user may override after confirming: {field to resend with, question to ask}
+function fittingOverride(status, responseText) {
+    let data;
+    try {
+        data = JSON.parse(responseText);
+    } catch (e) {
+        return null;
+    }
+    if (status === 409 && data.category_mismatch) {
+        return { field: 'confirmCategory', question: `${data.message}\n\n선택한 종류로 그대로 진행할까요?` };
+    }
+    if (status === 422 && data.skippable) {
+        return { field: 'skipQualityCheck', question: `${data.message}\n\n이 사진으로 그대로 진행할까요?` };
+    }
+    return null;
+}
+
+// POST a try-on; when a check the user can override fails, ask and resend with the override
+// Returns { response, text, declined } - declined when the user chose not to continue
+async function postFitting(formData) {
+    while (true) {
+        // Add timeout to prevent infinite loading
+        const controller = new AbortController();
+        const timeoutId = setTimeout(() => controller.abort(), 120000); // 120 seconds timeout
+        const response = await fetch('/api/virtual-fitting', {
+            method: 'POST',
+            body: formData,
+            signal: controller.signal
+        }).finally(() => clearTimeout(timeoutId));
+        // Read text first to avoid consuming body
+        const text = await response.text();
+        const override = fittingOverride(response.status, text);
+        if (!override || formData.has(override.field)) {
+            return { response, text, declined: false };
+        }
+        if (!confirm(override.question)) {
+            return { response, text, declined: true };
+        }
+        formData.set(override.field, 'true');
+    }
+}
+
 async function generateFitting(quality = 'high') {
     console.log('🚀 generateFitting called with quality:', quality);
     console.log('📷 personImage:', personImage ? `${(personImage.size / 1024).toFixed(1)}KB` : 'NULL');
@@ -808,6 +857,13 @@ async function generateFitting(quality = 'high') {
                     topFormData.append('category', 'upper_body');
                     topFormData.append('removeBackground', removeBg.toString());
                     topFormData.append('quality', quality);
+                    if (bottomClothImage) {
+                        // The top result is the person photo for the bottom pass: keep it lossless
+                        topFormData.append('resultFormat', 'png');
+                    }
+                    if (luxuryItem && luxuryItem.type === 'topCloth') {
+                        topFormData.append('catalogItemId', luxuryItem.itemId);
+                    }
                     
                     console.log('✅ FormData prepared:', {
                         personSize: personBlob.size,
@@ -820,19 +876,14 @@ async function generateFitting(quality = 'high') {
                     return;
                 }
                 
-                // Add timeout to prevent infinite loading
-                const controller = new AbortController();
-                const timeoutId = setTimeout(() => controller.abort(), 120000); // 120 seconds timeout
-                
-                const topResponse = await fetch('/api/virtual-fitting', {
-                    method: 'POST',
-                    body: topFormData,
-                    signal: controller.signal
-                }).finally(() => clearTimeout(timeoutId));
-                
-                // Handle error responses - read text first to avoid consuming body
-                const topResponseText = await topResponse.text();
+                const { response: topResponse, text: topResponseText, declined: topDeclined } =
+                    await postFitting(topFormData);
+                if (topDeclined) {
+                    setState('uploaded'); // The user chose to change the photo instead
+                    return;
+                }
                 
+                // Handle error responses
                 if (!topResponse.ok) {
                     let errorMsg = '서버 오류가 발생했습니다.';
                     try {
@@ -920,6 +971,9 @@ async function generateFitting(quality = 'high') {
                 bottomFormData.append('category', 'lower_body');
                 bottomFormData.append('removeBackground', removeBg.toString());
                 bottomFormData.append('quality', quality);
+                if (luxuryItem && luxuryItem.type === 'bottomCloth') {
+                    bottomFormData.append('catalogItemId', luxuryItem.itemId);
+                }
                 
                 console.log('✅ FormData prepared:', {
                     personSize: personBlob.size,
@@ -927,19 +981,14 @@ async function generateFitting(quality = 'high') {
                     category: 'lower_body'
                 });
                 
-                // Add timeout to prevent infinite loading
-                const controller2 = new AbortController();
-                const timeoutId2 = setTimeout(() => controller2.abort(), 120000); // 120 seconds timeout
-                
-                const bottomResponse = await fetch('/api/virtual-fitting', {
-                    method: 'POST',
-                    body: bottomFormData,
-                    signal: controller2.signal
-                }).finally(() => clearTimeout(timeoutId2));
-                
-                // Handle error responses - read text first to avoid consuming body
-                const bottomResponseText = await bottomResponse.text();
+                const { response: bottomResponse, text: bottomResponseText, declined: bottomDeclined } =
+                    await postFitting(bottomFormData);
+                if (bottomDeclined) {
+                    setState('uploaded'); // The user chose to change the photo instead
+                    return;
+                }
                 
+                // Handle error responses
                 if (!bottomResponse.ok) {
                     let errorMsg = '서버 오류가 발생했습니다.';
                     try {
@@ -1032,6 +1081,9 @@ async function generateFitting(quality = 'high') {
             dressFormData.append('category', 'dress');
             dressFormData.append('removeBackground', removeBg.toString());
             dressFormData.append('quality', quality);
+            if (luxuryItem && luxuryItem.type === 'dress') {
+                dressFormData.append('catalogItemId', luxuryItem.itemId);
+            }
             
             console.log('✅ FormData prepared:', {
                 personSize: personBlob.size,
@@ -1039,19 +1091,14 @@ async function generateFitting(quality = 'high') {
                 category: 'dress'
             });
             
-            // Add timeout to prevent infinite loading
-            const controller = new AbortController();
-            const timeoutId = setTimeout(() => controller.abort(), 120000); // 120 seconds timeout
-            
-            const dressResponse = await fetch('/api/virtual-fitting', {
-                method: 'POST',
-                body: dressFormData,
-                signal: controller.signal
-            }).finally(() => clearTimeout(timeoutId));
-            
-            // Handle error responses - read text first to avoid consuming body
-            const dressResponseText = await dressResponse.text();
+            const { response: dressResponse, text: dressResponseText, declined: dressDeclined } =
+                await postFitting(dressFormData);
+            if (dressDeclined) {
+                setState('uploaded'); // The user chose to change the photo instead
+                return;
+            }
             
+            // Handle error responses
             if (!dressResponse.ok) {
                 let errorMsg = '서버 오류가 발생했습니다.';
                 try {
@@ -1227,6 +1274,13 @@ async function addWatermark(imageUrl) {
     });
 }
 
+// Save name for a result blob: the extension follows its type (results may be AVIF, WebP, JPEG or PNG)
+function resultFileName(type) {
+    const subtype = (type || '').split('/')[1];
+    const extension = subtype === 'jpeg' ? 'jpg' : (subtype || 'png');
+    return `FITSA-가상피팅-${Date.now()}.${extension}`;
+}
+
 async function downloadResult() {
     const resultImage = document.getElementById('resultImage');
     
@@ -1253,7 +1307,7 @@ async function downloadResult() {
         const url = URL.createObjectURL(blob);
         const link = document.createElement('a');
         link.href = url;
-        link.download = `FITSA-가상피팅-${Date.now()}.png`;
+        link.download = resultFileName(blob.type);
         link.click();
         URL.revokeObjectURL(url);
         
@@ -1283,7 +1337,7 @@ async function shareToSNS(platform = 'general') {
         try {
             // Try to add watermark
             const watermarkedBlob = await addWatermark(resultImage.src);
-            file = new File([watermarkedBlob], `FITSA-가상피팅-${Date.now()}.png`, { 
+            file = new File([watermarkedBlob], resultFileName('image/png'), { 
                 type: 'image/png' 
             });
         } catch (watermarkError) {
@@ -1291,7 +1345,7 @@ async function shareToSNS(platform = 'general') {
             console.warn('Watermark failed, using original image:', watermarkError);
             const response = await fetch(resultImage.src);
             const blob = await response.blob();
-            file = new File([blob], `FITSA-가상피팅-${Date.now()}.png`, { 
+            file = new File([blob], resultFileName(blob.type), { 
                 type: blob.type || 'image/png' 
             });
         }
@@ -1322,7 +1376,7 @@ async function shareToSNS(platform = 'general') {
         const url = URL.createObjectURL(file);
         const link = document.createElement('a');
         link.href = url;
-        link.download = `FITSA-가상피팅-${Date.now()}.png`;
+        link.download = file.name;
         link.click();
         URL.revokeObjectURL(url);
         
@@ -2046,7 +2100,7 @@ async function loadLuxuryClothing() {
         const luxuryData = localStorage.getItem('luxuryClothing');
         if (!luxuryData) return;
         
-        const { imageUrl, category } = JSON.parse(luxuryData);
+        const { imageUrl, category, itemId } = JSON.parse(luxuryData);
         console.log('🏛️ Loading luxury clothing:', { imageUrl, category });
         
         // Fetch image and convert to File
@@ -2075,6 +2129,10 @@ async function loadLuxuryClothing() {
                 await handleFile(file, 'dress');
                 break;
         }
+        if (itemId) {
+            const slots = { upper_body: 'topCloth', lower_body: 'bottomCloth', dress: 'dress' };
+            luxuryItem = { itemId: itemId, type: slots[category] };
+        }
         
         // Update state
         checkCanGenerate();
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script for admission control
+Tests per-user / global token buckets and the in-flight cap in front of /api/virtual-fitting,
+and that a cookieless client can't pick its own id through X-Forwarded-For
+"""
+import sys
+from services.admission_service import AdmissionController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_user_bucket_limits_single_user():
+    clock = FakeClock()
+    controller = AdmissionController(user_rate_per_min=6, user_burst=2,
+                                     global_rate_per_min=600, global_burst=100,
+                                     max_in_flight=100, clock=clock)
+
+    # Burst of 2 is admitted, 3rd is rejected with 429 and a Retry-After
+    for _ in range(2):
+        allowed, _ = controller.try_admit('user:a')
+        assert allowed
+        controller.release()
+    allowed, rejection = controller.try_admit('user:a')
+    assert not allowed
+    assert rejection['status'] == 429
+    assert rejection['retry_after'] == 10, rejection  # 6/min -> 1 token per 10s
+
+    # Another user is unaffected
+    allowed, _ = controller.try_admit('user:b')
+    assert allowed
+    controller.release()
+
+    # Token refills after 10 seconds
+    clock.now += 10
+    allowed, _ = controller.try_admit('user:a')
+    assert allowed
+    controller.release()
+
+
+def test_global_bucket_sheds_with_503():
+    clock = FakeClock()
+    controller = AdmissionController(user_rate_per_min=60, user_burst=5,
+                                     global_rate_per_min=60, global_burst=3,
+                                     max_in_flight=100, clock=clock)
+    for i in range(3):
+        allowed, _ = controller.try_admit(f'user:{i}')
+        assert allowed
+        controller.release()
+
+    allowed, rejection = controller.try_admit('user:new')
+    assert not allowed
+    assert rejection['status'] == 503
+    assert rejection['reason'] == 'global_rate'
+
+    # Rejection by the global bucket must not burn the user's own token
+    assert controller.user_buckets['user:new'].tokens == 5
+
+
+def test_in_flight_cap():
+    clock = FakeClock()
+    controller = AdmissionController(user_rate_per_min=600, user_burst=10,
+                                     global_rate_per_min=600, global_burst=10,
+                                     max_in_flight=2, clock=clock)
+    assert controller.try_admit('user:a')[0]
+    assert controller.try_admit('user:b')[0]
+
+    allowed, rejection = controller.try_admit('user:c')
+    assert not allowed
+    assert rejection['status'] == 503
+    assert rejection['reason'] == 'in_flight'
+
+    controller.release()
+    assert controller.try_admit('user:c')[0]
+    assert controller.snapshot()['in_flight'] == 2
+
+
+def test_client_id_ignores_spoofed_forwarded_for():
+    from flask import Flask
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    from services.admission_service import get_client_id
+    app = Flask(__name__)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+    app.add_url_rule('/whoami', 'whoami', get_client_id)
+    client = app.test_client()
+
+    # The proxy appends the real peer; whatever the client sent before it is ignored
+    for spoofed in ('1.1.1.1', '2.2.2.2, 3.3.3.3'):
+        response = client.get('/whoami', headers={'X-Forwarded-For': f'{spoofed}, 203.0.113.9'},
+                              environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        assert response.get_data(as_text=True) == 'ip:203.0.113.9'
+    client.set_cookie('user_key', 'abc')
+    assert client.get('/whoami', headers={'X-Forwarded-For': '1.1.1.1'}).get_data(as_text=True) == 'user:abc'
+
+
+if __name__ == "__main__":
+    try:
+        test_user_bucket_limits_single_user()
+        test_global_bucket_sheds_with_503()
+        test_in_flight_cap()
+        test_client_id_ignores_spoofed_forwarded_for()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
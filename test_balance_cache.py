@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script for the balance cache
+Tests that every credit mutation (in this or another process) invalidates the
+cached balance, that reads never write, and ETag/304 on /stripe/user-status
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+from flask import Flask
+from services.balance_cache import get_balance_cache
+from services.credits_service import CreditsService
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_service():
+    return CreditsService(db_path=os.path.join(tempfile.mkdtemp(), 'credits.db'))
+
+
+def test_mutations_invalidate_cached_balance():
+    service = make_service()
+    cache = get_balance_cache(service.db_path)
+    assert service.get_balance('user_a') == {'remaining_free': 3, 'credits': 0}
+    assert 'user_a' in cache._entries
+
+    service.check_and_consume('user_a')
+    assert service.get_balance('user_a') == {'remaining_free': 2, 'credits': 0}
+    service.add_credits('user_a', 10)
+    assert service.get_balance('user_a') == {'remaining_free': 2, 'credits': 10}
+    service.refund_credit('user_a', used_type='free')
+    assert service.get_balance('user_a') == {'remaining_free': 3, 'credits': 10}
+    service.reward_share('user_a', 'kakao')
+    assert service.get_balance('user_a') == {'remaining_free': 3, 'credits': 15}
+
+    # Unrelated users stay cached
+    service.get_balance('user_b')
+    service.add_credits('user_a', 1)
+    service.get_balance('user_a')
+    assert 'user_b' in cache._entries
+
+
+def test_other_process_invalidates():
+    service = make_service()
+    service.add_credits('user_c', 1)
+    assert service.get_balance('user_c')['credits'] == 1
+    subprocess.run([sys.executable, '-c',
+                    'import sys; from services.credits_service import CreditsService; '
+                    'CreditsService(sys.argv[1]).add_credits("user_c", 10)', service.db_path],
+                   cwd=REPO_ROOT, check=True)
+    assert service.get_balance('user_c')['credits'] == 11
+
+
+def test_daily_reset_applied_on_read_without_write():
+    service = make_service()
+    yesterday = (datetime.now() - timedelta(days=1)).isoformat()
+    conn = sqlite3.connect(service.db_path)
+    conn.execute("INSERT INTO users (user_key, free_used_today, credits, last_reset) VALUES ('user_d', 3, 0, ?)",
+                 (yesterday,))
+    conn.commit()
+    assert service.get_balance('user_d') == {'remaining_free': 3, 'credits': 0}
+    assert conn.execute("SELECT free_used_today FROM users WHERE user_key = 'user_d'").fetchone()[0] == 3
+    conn.close()
+
+
+def test_user_status_etag():
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())  # routes use ./credits.db
+    try:
+        from routes.stripe_routes import stripe_bp
+        app = Flask(__name__)
+        app.register_blueprint(stripe_bp, url_prefix='/stripe')
+        client = app.test_client()
+        client.set_cookie('user_key', 'user_e')
+
+        response = client.get('/stripe/user-status')
+        etag = response.headers['ETag']
+        assert response.status_code == 200 and response.get_json() == {'remaining_free': 3, 'credits': 0}
+        assert client.get('/stripe/user-status', headers={'If-None-Match': etag}).status_code == 304
+
+        CreditsService().add_credits('user_e', 10)
+        response = client.get('/stripe/user-status', headers={'If-None-Match': etag})
+        assert response.status_code == 200 and response.get_json()['credits'] == 10
+        assert response.headers['ETag'] != etag
+    finally:
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    try:
+        test_mutations_invalidate_cached_balance()
+        test_other_process_invalidates()
+        test_daily_reset_applied_on_read_without_write()
+        test_user_status_etag()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Test script for the Luxury Hall catalog store
+Tests the demo seed, pagination, imports, and that cached pages are
+invalidated (with new ETags) when the catalog changes
+"""
+import os
+import sys
+import tempfile
+import subprocess
+from flask import Flask
+import services.catalog_service as catalog
+from services.static_assets import asset_url
+from services.image_variants import image_srcset, image_variant_url
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def use_temp_catalog():
+    catalog.DB_PATH = os.path.join(tempfile.mkdtemp(), 'catalog.db')
+    catalog.page_cache.clear()
+    return catalog.DB_PATH
+
+
+def make_client():
+    from routes.luxury_hall import luxury_hall_bp
+    app = Flask(__name__)
+    app.jinja_env.globals.update(asset_url=asset_url, image_srcset=image_srcset, image_variant_url=image_variant_url)
+    app.register_blueprint(luxury_hall_bp)
+    return app.test_client()
+
+
+def partner_catalog(count):
+    return {'brands': [{'brand_id': 'partner', 'name': 'Partner', 'style': 'modern', 'theme_color': '#000000',
+                        'items': [{'sku': f'SKU-{i:05d}', 'category_id': 'tops', 'name': f'셔츠 {i}',
+                                   'display_category': '상의', 'image_url': f'/img/{i}.png', 'sort_order': i,
+                                   'images': [{'variant': 'thumb', 'url': f'/img/{i}_thumb.webp', 'width': 300}]}
+                                  for i in range(count)]}]}
+
+
+def test_demo_seed_matches_brand_api():
+    use_temp_catalog()
+    brands = catalog.list_brands()
+    assert len(brands) == 9
+    assert brands['hermes'] == {'name': 'Hermès', 'description': '프랑스 최고급 가죽 명가',
+                                'category': 'classic', 'theme_color': '#8B7355'}
+    assert list(catalog.list_brands('youth')) == ['miu_miu', 'off_white', 'diesel']
+    page = catalog.get_items('dior', 'bottoms')
+    assert [item['name'] for item in page['items']] == ['테일러드 팬츠', '슬랙스 팬츠', '데님 진']
+    assert page['items'][0]['fitting_category'] == 'lower_body'
+
+
+def test_import_and_pagination():
+    use_temp_catalog()
+    assert catalog.import_catalog(partner_catalog(250))['items'] == 250
+    page = catalog.get_items('partner', 'tops', page=3, per_page=100)
+    assert page['total'] == 250 and page['total_pages'] == 3 and len(page['items']) == 50
+    assert page['items'][0]['sku'] == 'SKU-00200'
+    assert page['items'][0]['images'] == [{'variant': 'thumb', 'url': '/img/200_thumb.webp', 'width': 300, 'height': None}]
+    # Re-importing upserts by sku instead of duplicating
+    catalog.import_catalog(partner_catalog(250))
+    assert catalog.get_items('partner')['total'] == 250
+
+
+def test_pages_cached_until_catalog_changes():
+    path = use_temp_catalog()
+    client = make_client()
+
+    response = client.get('/room/dior')
+    assert response.status_code == 200 and '엘레강스 블라우스'.encode() in response.data
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    assert client.get('/room/dior', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/room/nope').status_code == 404
+
+    items = client.get('/api/luxury/brand/dior/items?category=tops&per_page=2').get_json()
+    assert items['total'] == 3 and items['total_pages'] == 2
+
+    # Another process (e.g. the import CLI) changes the catalog
+    subprocess.run([sys.executable, '-c',
+                    'import sys, services.catalog_service as c; c.DB_PATH = sys.argv[1]; '
+                    'c.import_catalog({"brands": [{"brand_id": "dior", "name": "Dior", "style": "modern", '
+                    '"items": [{"category_id": "tops", "name": "바 재킷", "image_url": "/img/bar.png"}]}]})', path],
+                   cwd=REPO_ROOT, check=True)
+    response = client.get('/room/dior', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and '바 재킷'.encode() in response.data
+    assert client.get('/api/luxury/brand/dior/items?category=tops&per_page=2').get_json()['total'] == 4
+
+
+if __name__ == "__main__":
+    try:
+        test_demo_seed_matches_brand_api()
+        test_import_and_pagination()
+        test_pages_cached_until_catalog_changes()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
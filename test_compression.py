@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test script for the response compression middleware
+"""
+import sys
+import gzip
+from flask import Flask, Response, jsonify
+from services.compression_service import init_compression, brotli
+
+
+def make_app():
+    app = Flask(__name__)
+    init_compression(app)
+
+    @app.route('/big')
+    def big():
+        response = jsonify({'items': [{'url': f'https://example.com/fit/{i}.png'} for i in range(200)]})
+        response.set_etag('abc')
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/image')
+    def image():
+        return Response(b'\x89PNG' * 1000, mimetype='image/png')
+
+    @app.route('/stream')
+    def stream():
+        return Response((f'{{"i": {i}}}\n' for i in range(500)), mimetype='application/x-ndjson')
+
+    return app
+
+
+def test_buffered_json_is_compressed():
+    client = make_app().test_client()
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.headers['ETag'] == '"abc-gzip"'
+    assert b'example.com/fit/199.png' in gzip.decompress(response.data)
+    assert int(response.headers['Content-Length']) == len(response.data)
+
+    if brotli is not None:
+        response = client.get('/big', headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert b'fit/199.png' in brotli.decompress(response.data)
+
+
+def test_skipped_responses():
+    client = make_app().test_client()
+    assert 'Content-Encoding' not in client.get('/big').headers
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/image', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_streamed_response_is_compressed():
+    client = make_app().test_client()
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert len(lines) == 500 and lines[-1] == '{"i": 499}'
+
+
+if __name__ == "__main__":
+    try:
+        test_buffered_json_is_compressed()
+        test_skipped_responses()
+        test_streamed_response_is_compressed()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
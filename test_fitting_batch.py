@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Test script for batch try-ons
+Tests per-item credit settlement (charged only for successes), rejected and
+catalog garments, payment_required once the balance runs out, stopping on
+client disconnect, in-flight slots per running item, and the NDJSON
+/api/virtual-fitting/batch endpoint
+"""
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from flask import Flask
+from PIL import Image, ImageDraw
+import services.catalog_service as catalog
+import services.fitting_pipeline as pipeline
+from services.fitting_batch import run_batch, load_catalog_garment
+from services.credits_service import CreditsService
+from services.image_utils import to_data_uri
+
+DRESS = [(125, 20), (175, 20), (185, 140), (245, 380), (55, 380), (115, 140)]
+PANTS = [(90, 30), (210, 30), (225, 370), (165, 370), (150, 140), (135, 370), (75, 370)]
+
+
+def garment_png(shape):
+    img = Image.new('RGBA', (300, 400), (0, 0, 0, 0))
+    ImageDraw.Draw(img).polygon(shape, fill=(30, 30, 60))
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class FakeGenerate:
+    """Succeeds for every category but `failing`; `held` categories run until stopped"""
+
+    def __init__(self, failing=(), held=()):
+        self.failing = failing
+        self.held = held
+        self.calls = 0
+        self.stopped = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, user_photo_bytes, clothing_bytes, category, quality='high', should_stop=None, **config):
+        with self.lock:
+            self.calls += 1
+        while category in self.held:
+            if should_stop and should_stop():
+                with self.lock:
+                    self.stopped += 1
+                return None
+            time.sleep(0.02)
+        if category in self.failing:
+            return None
+        buffer = io.BytesIO()
+        Image.new('RGB', (60, 80), (0, 0, 200)).save(buffer, format='PNG')
+        return {'result': to_data_uri(buffer.getvalue()), 'method': 'fake'}
+
+
+@contextmanager
+def scratch(fake):
+    """Credits and catalog databases in a scratch directory, providers replaced by `fake`"""
+    cwd, catalog_path, generate = os.getcwd(), catalog.DB_PATH, pipeline.generate
+    os.chdir(tempfile.mkdtemp())
+    catalog.DB_PATH = os.path.join(os.getcwd(), 'catalog.db')
+    pipeline.generate = fake
+    try:
+        yield CreditsService()
+    finally:
+        os.chdir(cwd)
+        catalog.DB_PATH, pipeline.generate = catalog_path, generate
+
+
+def upload(index, shape, category):
+    return {'index': index, 'category': category, 'clothing_bytes': garment_png(shape)}
+
+
+def test_credits_per_successful_item():
+    with scratch(FakeGenerate(failing=('lower_body',))) as service:
+        items = [upload(0, DRESS, 'dress'), upload(1, PANTS, 'lower_body'), upload(2, DRESS, 'upper_body'),
+                 {'index': 3, 'category': None, 'rejected': {'error': 'Item not found'}}]
+        items[2]['clothing_bytes'] += b'\0'  # not a refit of item 0
+        events = list(run_batch(b'person', items, {'ip': 'user_a', 'user_agent': ''}, result_format='jpeg'))
+
+        assert events[0]['type'] == 'accepted' and events[0]['items'][3]['status'] == 'rejected'
+        by_index = {e['index']: e for e in events if e['type'] == 'item'}
+        assert by_index[0]['status'] == 'completed' and by_index[0]['resultUrl'].startswith('data:image/jpeg')
+        assert by_index[1]['status'] == 'failed' and by_index[3]['status'] == 'rejected'
+        done = events[-1]
+        assert done['type'] == 'done' and done['completed'] == 2 and done['failed'] == 2
+        # Three free tries: two successes charged, the failure refunded
+        assert done['credits_info']['remaining_free'] == 1
+        assert service.get_balance('user_a')['remaining_free'] == 1
+
+
+def test_payment_required_when_balance_runs_out():
+    with scratch(FakeGenerate()):
+        items = [upload(i, DRESS, 'dress') for i in range(4)]
+        for i, item in enumerate(items):
+            item['clothing_bytes'] += bytes([i])  # distinct hashes, no refitting
+        events = list(run_batch(b'person', items, {'ip': 'user_b', 'user_agent': ''}, concurrency=1))
+        statuses = sorted(e['status'] for e in events if e['type'] == 'item')
+        assert statuses == ['completed', 'completed', 'completed', 'payment_required'], statuses
+
+
+def test_disconnect_stops_and_refunds():
+    fake = FakeGenerate(held=('dress',))
+    with scratch(fake) as service:
+        items = [upload(0, DRESS, 'upper_body')] + [upload(i, DRESS, 'dress') for i in (1, 2, 3)]
+        for i, item in enumerate(items):
+            item['clothing_bytes'] += bytes([i])
+        events = run_batch(b'person', items, {'ip': 'user_c', 'user_agent': ''}, concurrency=2)
+        assert next(events)['type'] == 'accepted'
+        assert next(events)['index'] == 0  # item 1 is still running, 2 and 3 are queued
+
+        events.close()  # what a dropped connection does
+        deadline = time.time() + 5
+        while fake.stopped < 1 and time.time() < deadline:
+            time.sleep(0.02)
+        time.sleep(0.2)  # the refund follows the stop
+        assert fake.calls == 2 and fake.stopped == 1  # the queued items never started
+        assert service.get_balance('user_c')['remaining_free'] == 2  # only the delivered item is charged
+
+
+def test_items_take_admission_slots():
+    from services.admission_service import admission_controller
+    running, peak = [0], [0]
+    lock = threading.Lock()
+    base = FakeGenerate()
+
+    def tracked(*args, **kwargs):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        try:
+            return base(*args, **kwargs)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    with scratch(tracked):
+        items = [upload(i, DRESS, 'dress') for i in range(3)]
+        for i, item in enumerate(items):
+            item['clothing_bytes'] += bytes([i])
+        before = admission_controller.in_flight
+        # One spare slot on the worker: the batch runs its own item plus one more, not three
+        admission_controller.in_flight = admission_controller.max_in_flight - 1
+        try:
+            events = list(run_batch(b'person', items, {'ip': 'user_s', 'user_agent': ''}, concurrency=3))
+            assert [e['status'] for e in events if e['type'] == 'item'] == ['completed'] * 3
+            assert peak[0] == 2, peak
+            assert admission_controller.in_flight == admission_controller.max_in_flight - 1  # extra slots returned
+        finally:
+            admission_controller.in_flight = before
+
+
+def test_catalog_garments():
+    with scratch(FakeGenerate()):
+        tops = catalog.get_items('dior', 'tops')['items']
+        garment = load_catalog_garment(tops[0]['item_id'])
+        assert garment['category'] == 'upper_body' and garment['clothing_bytes']
+        placeholder = load_catalog_garment(tops[-1]['item_id'])  # "coming soon" remote image
+        assert placeholder['clothing_bytes'] is None
+        assert load_catalog_garment(999999) is None and load_catalog_garment('x') is None
+
+
+def test_batch_endpoint_streams_ndjson():
+    import routes.api as api
+    from routes.api import api_bp
+    from services.admission_service import admission_controller
+    enabled, api.GARMENT_CATEGORY_CHECK = api.GARMENT_CATEGORY_CHECK, True  # off by default
+    try:
+        with scratch(FakeGenerate()):
+            app = Flask(__name__)
+            app.config.update(GEMINI_API_KEY=None, REPLICATE_API_TOKEN=None)
+            app.register_blueprint(api_bp, url_prefix='/api')
+            client = app.test_client()
+            client.set_cookie('user_key', 'user_d')
+
+            photo = io.BytesIO()
+            Image.effect_noise((400, 500), 40).convert('RGB').save(photo, format='JPEG')
+            tops = catalog.get_items('dior', 'tops')['items']
+            response = client.post('/api/virtual-fitting/batch', content_type='multipart/form-data', data={
+                'userPhoto': (io.BytesIO(photo.getvalue()), 'me.jpg'),
+                'clothingPhoto': [(io.BytesIO(garment_png(DRESS)), 'dress.png'),
+                                  (io.BytesIO(garment_png(PANTS)), 'pants.png')],
+                'categories': ['dress', 'upper_body'],
+                'itemId': f"{tops[0]['item_id']},{tops[-1]['item_id']}",
+                'skipQualityCheck': 'true',
+            })
+            assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+            events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+            by_index = {e['index']: e for e in events if e['type'] == 'item'}
+            assert by_index[0]['status'] == 'completed'
+            assert by_index[1]['status'] == 'rejected' and by_index[1]['category_mismatch']
+            assert by_index[2]['status'] == 'completed' and by_index[2]['item_id'] == tops[0]['item_id']
+            assert by_index[3]['status'] == 'rejected'
+            assert events[-1]['completed'] == 2 and events[-1]['credits_info']['remaining_free'] == 1
+            assert admission_controller.in_flight == 0  # the slot was given back when the stream ended
+
+            too_many = client.post('/api/virtual-fitting/batch', content_type='multipart/form-data', data={
+                'userPhoto': (io.BytesIO(photo.getvalue()), 'me.jpg'), 'itemId': ','.join(['1'] * 9),
+                'skipQualityCheck': 'true'})
+            assert too_many.status_code == 400
+    finally:
+        api.GARMENT_CATEGORY_CHECK = enabled
+
+
+if __name__ == "__main__":
+    try:
+        test_credits_per_successful_item()
+        test_payment_required_when_balance_runs_out()
+        test_disconnect_stops_and_refunds()
+        test_items_take_admission_slots()
+        test_catalog_garments()
+        test_batch_endpoint_streams_ndjson()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
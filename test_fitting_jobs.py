@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Test script for progressive fitting jobs
+Tests preview-then-final delivery, the long-poll cap, degraded completion,
+refunds when nothing is produced or the job crashes, cancellation, and the
+/api/fitting-jobs endpoints
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from flask import Flask
+from PIL import Image
+import services.fitting_jobs as jobs
+import services.fitting_pipeline as pipeline
+from services.image_utils import to_data_uri
+from services.credits_service import CreditsService
+
+
+def png_uri(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (60, 80), color).save(buffer, format='PNG')
+    return to_data_uri(buffer.getvalue())
+
+
+class FakeGenerate:
+    """Stands in for the provider calls: per-quality outcome, optionally held until released"""
+
+    def __init__(self, preview=True, final=True):
+        self.outcomes = {'fast': preview, 'high': final}
+        self.release = {'fast': threading.Event(), 'high': threading.Event()}
+        for event in self.release.values():
+            event.set()
+        self.stopped = []
+
+    def __call__(self, user_photo_bytes, clothing_bytes, category, quality='high', should_stop=None, **config):
+        while not self.release[quality].wait(0.02):
+            if should_stop and should_stop():
+                self.stopped.append(quality)
+                return None
+        if not self.outcomes[quality]:
+            return None
+        color = (200, 0, 0) if quality == 'fast' else (0, 0, 200)
+        return {'result': png_uri(color), 'method': f'fake-{quality}'}
+
+
+@contextmanager
+def scratch(fake):
+    """Jobs and credits databases in a scratch directory, providers replaced by `fake`"""
+    cwd, db_path, generate = os.getcwd(), jobs.DB_PATH, pipeline.generate
+    os.chdir(tempfile.mkdtemp())
+    jobs.DB_PATH = 'fitting_jobs.db'
+    pipeline.generate = fake
+    try:
+        service = CreditsService()
+        allowed, info = service.check_and_consume('user_a', '')
+        assert allowed and info['remaining_free'] == 2
+        yield service, {'ip': 'user_a', 'user_agent': '', 'used_type': info['used_type'], 'is_refitting': False}
+    finally:
+        os.chdir(cwd)
+        jobs.DB_PATH, pipeline.generate = db_path, generate
+
+
+def start(charge, released=None):
+    return jobs.start_progressive_job(
+        'client', charge, release=(released.set if released else lambda: None),
+        user_photo_bytes=b'person', clothing_bytes=b'garment', category='upper_body', remove_bg=False,
+        accept='', result_format='jpeg', provider_config={})['job_id']
+
+
+def wait_finished(job_id):
+    job = jobs.wait_for_job(job_id, 'client', timeout=5)
+    deadline = time.time() + 5
+    while job['status'] == 'running' and time.time() < deadline:
+        job = jobs.wait_for_job(job_id, 'client', since=job['version'], timeout=5)
+    return job
+
+
+def test_preview_then_final():
+    fake = FakeGenerate()
+    fake.release['high'].clear()
+    with scratch(fake) as (service, charge):
+        released = threading.Event()
+        job_id = start(charge, released)
+
+        job = jobs.wait_for_job(job_id, 'client', since=0, timeout=5)
+        assert job['status'] == 'running' and job['preview'].startswith('data:image/jpeg')
+        assert job['result'] is None and job['preview_method'] == 'fake-fast'
+
+        fake.release['high'].set()
+        job = wait_finished(job_id)
+        assert job['status'] == 'completed' and job['method'] == 'fake-high' and not job['degraded']
+        assert job['result'] != job['preview']
+        assert released.wait(5)
+        assert service.get_balance('user_a')['remaining_free'] == 2  # one credit for both
+
+
+def test_long_poll_is_capped():
+    fake = FakeGenerate()
+    fake.release['fast'].clear()
+    fake.release['high'].clear()
+    with scratch(fake) as (service, charge):
+        job_id = start(charge)
+        version = jobs.get_job(job_id)['version']
+        started = time.monotonic()
+        job = jobs.wait_for_job(job_id, 'client', since=version, timeout=60)
+        assert job['status'] == 'running'
+        assert time.monotonic() - started < jobs.MAX_WAIT_SECONDS + 1  # a request thread isn't held for 60s
+        jobs.cancel_job(job_id, 'client')
+        wait_finished(job_id)
+
+
+def test_final_failure_falls_back_to_preview():
+    with scratch(FakeGenerate(final=False)) as (service, charge):
+        job = wait_finished(start(charge))
+        assert job['status'] == 'completed' and job['degraded'] and job['method'] == 'fake-fast'
+        assert service.get_balance('user_a')['remaining_free'] == 2
+
+
+def test_nothing_generated_refunds():
+    with scratch(FakeGenerate(preview=False, final=False)) as (service, charge):
+        job = wait_finished(start(charge))
+        assert job['status'] == 'failed' and job['error']
+        assert service.get_balance('user_a')['remaining_free'] == 3
+
+
+def test_crash_refunds():
+    with scratch(FakeGenerate()) as (service, charge):
+        run_progressive_job = jobs.run_progressive_job
+
+        def crash(job_id, charge, **job_args):
+            raise RuntimeError('boom')
+        jobs.run_progressive_job = crash
+        try:
+            job = wait_finished(start(charge))
+        finally:
+            jobs.run_progressive_job = run_progressive_job
+        assert job['status'] == 'failed' and job['error'] == 'internal error'
+        assert service.get_balance('user_a')['remaining_free'] == 3
+
+
+def test_cancel_stops_and_refunds():
+    fake = FakeGenerate()
+    fake.release['fast'].clear()
+    fake.release['high'].clear()
+    with scratch(fake) as (service, charge):
+        job_id = start(charge)
+        assert jobs.cancel_job(job_id, 'someone else') is None
+        assert jobs.cancel_job(job_id, 'client')['cancel_requested'] == 1
+
+        job = wait_finished(job_id)
+        assert job['status'] == 'cancelled'
+        assert 'fast' in fake.stopped  # the final may be skipped before it even starts
+        assert service.get_balance('user_a')['remaining_free'] == 3
+
+
+def test_job_endpoints():
+    from routes.api import api_bp
+    from services.admission_service import admission_controller
+    fake = FakeGenerate()
+    with scratch(fake):
+        app = Flask(__name__)
+        app.config.update(GEMINI_API_KEY=None, REPLICATE_API_TOKEN=None)
+        app.register_blueprint(api_bp, url_prefix='/api')
+        client = app.test_client()
+        client.set_cookie('user_key', 'user_b')
+
+        photo = io.BytesIO()
+        Image.effect_noise((400, 500), 40).convert('RGB').save(photo, format='JPEG')
+        response = client.post('/api/virtual-fitting', content_type='multipart/form-data', data={
+            'userPhoto': (io.BytesIO(photo.getvalue()), 'me.jpg'),
+            'clothingPhoto': (io.BytesIO(photo.getvalue()), 'garment.jpg'),
+            'progressive': 'true', 'skipQualityCheck': 'true', 'confirmCategory': 'true',
+        })
+        data = response.get_json()
+        assert response.status_code == 202, data
+        assert data['status'] == 'running' and data['credits_info']['remaining_free'] == 2
+
+        status = client.get(f"{data['status_url']}?since=-1&wait=5").get_json()
+        deadline = time.time() + 5
+        while status['status'] == 'running' and time.time() < deadline:
+            status = client.get(f"{data['status_url']}?since={status['version']}&wait=5").get_json()
+        assert status['status'] == 'completed' and status['resultUrl'].startswith('data:image/')
+
+        other = app.test_client()
+        assert other.get(data['status_url']).status_code == 404
+        assert client.post(f"{data['status_url']}/cancel").status_code == 202
+        deadline = time.time() + 5
+        while admission_controller.in_flight and time.time() < deadline:
+            time.sleep(0.02)
+        assert admission_controller.in_flight == 0  # the job gave its slot back
+
+
+if __name__ == "__main__":
+    try:
+        test_preview_then_final()
+        test_long_poll_is_capped()
+        test_final_failure_falls_back_to_preview()
+        test_nothing_generated_refunds()
+        test_crash_refunds()
+        test_cancel_stops_and_refunds()
+        test_job_endpoints()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
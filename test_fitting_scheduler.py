@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Test script for the fitting scheduler
+Tests lane priority, round-robin between users within a lane, queue
+position estimates, cancelling a queued ticket, and /api/fitting-queue
+"""
+import sys
+import time
+import threading
+from services.fitting_scheduler import FairScheduler, QueueCancelled, lane_for
+from services.metrics_service import registry
+
+
+def hold_slot(scheduler, lane, user_key, order, release, started=None):
+    """Thread that takes a slot, records its name in `order` and holds it until `release` is set"""
+    def run():
+        with scheduler.slot(lane, user_key):
+            order.append(f'{lane}:{user_key}')
+            if started:
+                started.set()
+            release.wait(5)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_queued(scheduler, count, timeout=2):
+    deadline = time.time() + timeout
+    while sum(scheduler.snapshot()['waiting'].values()) < count:
+        assert time.time() < deadline, 'tickets did not queue'
+        time.sleep(0.01)
+
+
+def drain(blocker_release, threads, release=None):
+    """Free the first slot (and every queued holder's, if `release` is given) and wait for all of them"""
+    blocker_release.set()
+    if release:
+        release.set()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_lane_for():
+    assert lane_for('credit') == 'paid'
+    assert lane_for('free') == 'free'
+    assert lane_for('refitting') == 'free'
+
+
+def test_paid_before_free_before_speculative():
+    scheduler = FairScheduler(slots=1)
+    order = []
+    blocker = threading.Event()
+    started = threading.Event()
+    threads = [hold_slot(scheduler, 'free', 'blocker', order, blocker, started)]
+    started.wait(2)
+    release = threading.Event()
+    release.set()
+    for lane, user in (('speculative', 's'), ('free', 'f'), ('paid', 'p')):
+        threads.append(hold_slot(scheduler, lane, user, order, release))
+        wait_queued(scheduler, len(threads) - 1)
+    drain(blocker, threads)
+    assert order == ['free:blocker', 'paid:p', 'free:f', 'speculative:s'], order
+
+
+def test_round_robin_between_users():
+    scheduler = FairScheduler(slots=1)
+    order = []
+    blocker = threading.Event()
+    started = threading.Event()
+    threads = [hold_slot(scheduler, 'free', 'blocker', order, blocker, started)]
+    started.wait(2)
+    release = threading.Event()
+    release.set()
+    # One user fires three requests before a second user sends one
+    for user in ('heavy', 'heavy', 'heavy', 'light'):
+        threads.append(hold_slot(scheduler, 'free', user, order, release))
+        wait_queued(scheduler, len(threads) - 1)
+    drain(blocker, threads)
+    assert order[1:] == ['free:heavy', 'free:light', 'free:heavy', 'free:heavy'], order
+
+
+def test_position_estimates():
+    scheduler = FairScheduler(slots=1, expected_seconds=10)
+    assert scheduler.estimate('free', 'nobody') == {'lane': 'free', 'position': 0, 'estimated_wait_seconds': 0.0}
+    order = []
+    blocker = threading.Event()
+    started = threading.Event()
+    threads = [hold_slot(scheduler, 'free', 'blocker', order, blocker, started)]
+    started.wait(2)
+    release = threading.Event()
+    for user in ('a', 'a', 'b'):
+        threads.append(hold_slot(scheduler, 'free', user, order, release))
+        wait_queued(scheduler, len(threads) - 1)
+
+    # A new user joins the end of the round: a and b get one turn each first
+    assert scheduler.estimate('free', 'c')['position'] == 2
+    # a's third ticket goes after a's second, and b's turn comes first
+    assert scheduler.estimate('free', 'a')['position'] == 3
+    # Paid skips the whole free lane
+    assert scheduler.estimate('paid', 'c') == {'lane': 'paid', 'position': 0, 'estimated_wait_seconds': 10.0}
+    assert scheduler.estimate('speculative', 'c')['position'] == 3
+    assert scheduler.estimate('free', 'c')['estimated_wait_seconds'] == 30.0
+    drain(blocker, threads, release)
+
+
+def test_cancel_while_queued():
+    scheduler = FairScheduler(slots=1)
+    blocker = threading.Event()
+    started = threading.Event()
+    thread = hold_slot(scheduler, 'free', 'blocker', [], blocker, started)
+    started.wait(2)
+    stop = threading.Event()
+    updates = []
+    outcome = {}
+
+    def queued():
+        try:
+            with scheduler.slot('free', 'x', should_stop=stop.is_set, on_wait=updates.append):
+                outcome['granted'] = True
+        except QueueCancelled:
+            outcome['cancelled'] = True
+
+    waiter = threading.Thread(target=queued, daemon=True)
+    waiter.start()
+    wait_queued(scheduler, 1)
+    stop.set()
+    waiter.join(2)
+    assert outcome == {'cancelled': True}
+    assert updates and updates[0]['position'] == 0 and updates[0]['lane'] == 'free'
+    assert scheduler.snapshot()['waiting']['free'] == 0
+    blocker.set()
+    thread.join(2)
+    assert scheduler.snapshot()['running'] == 0
+
+
+def test_grant_reports_wait():
+    scheduler = FairScheduler(slots=1)
+    blocker = threading.Event()
+    started = threading.Event()
+    thread = hold_slot(scheduler, 'free', 'blocker', [], blocker, started)
+    started.wait(2)
+    updates = []
+    granted = {}
+
+    def queued():
+        with scheduler.slot('paid', 'x', on_wait=updates.append) as queue:
+            granted.update(queue)
+
+    waiter = threading.Thread(target=queued, daemon=True)
+    waiter.start()
+    wait_queued(scheduler, 1)
+    time.sleep(0.1)
+    blocker.set()
+    waiter.join(2)
+    thread.join(2)
+    assert granted['lane'] == 'paid' and granted['waited_seconds'] >= 0.1
+    assert updates[-1] == {'lane': 'paid', 'position': 0, 'estimated_wait_seconds': 0.0}
+    assert 'fitsa_fitting_queue_wait_seconds_count{lane="paid"}' in registry.render()
+
+
+def test_queue_route():
+    import os
+    import tempfile
+    from flask import Flask
+    from routes.api import api_bp
+    from services.credits_service import CreditsService
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        app = Flask(__name__)
+        app.register_blueprint(api_bp, url_prefix='/api')
+        client = app.test_client()
+        client.set_cookie('user_key', 'queue_user')
+        data = client.get('/api/fitting-queue').get_json()
+        assert data['lane'] == 'free' and data['position'] == 0, data
+        assert set(data['scheduler']['waiting']) == {'paid', 'free', 'speculative'}
+
+        # Free tries used up, paid credits left: the next try-on queues as paid
+        credits_service = CreditsService()
+        credits_service.add_credits('queue_user', 5)
+        for index in range(3):
+            credits_service.check_and_consume('queue_user', '', f'hash-{index}')
+        assert client.get('/api/fitting-queue').get_json()['lane'] == 'paid'
+    finally:
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    try:
+        test_lane_for()
+        test_paid_before_free_before_speculative()
+        test_round_robin_between_users()
+        test_position_estimates()
+        test_cancel_while_queued()
+        test_grant_reports_wait()
+        test_queue_route()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Test script for the garment category classifier
+Tests silhouette classification of cut-outs and plain-background photos,
+abstaining on unusable images, and that /api/virtual-fitting flags a
+mismatched category before any credit is consumed
+"""
+import io
+import os
+import sys
+import sqlite3
+import tempfile
+from flask import Flask
+from PIL import Image, ImageDraw
+from services.garment_classifier import classify, check_category
+
+# Garment outlines on a 300x400 canvas
+SHAPES = {
+    'upper_body': [(110, 40), (190, 40), (270, 110), (285, 250), (245, 255), (230, 150), (230, 300),
+                   (70, 300), (70, 150), (55, 255), (15, 250), (30, 110)],
+    'lower_body': [(90, 30), (210, 30), (225, 370), (165, 370), (150, 140), (135, 370), (75, 370)],
+    'dress': [(125, 20), (175, 20), (185, 140), (245, 380), (55, 380), (115, 140)],
+}
+
+
+def garment_png(category, transparent=True, color=(30, 30, 60)):
+    img = Image.new('RGBA' if transparent else 'RGB', (300, 400), (0, 0, 0, 0) if transparent else (245, 245, 245))
+    ImageDraw.Draw(img).polygon(SHAPES[category], fill=color)
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_classifies_silhouettes():
+    for category in SHAPES:
+        for transparent in (True, False):
+            result = classify(garment_png(category, transparent))
+            assert result['category'] == category, (category, transparent, result)
+            assert result['confidence'] >= 0.85, result
+
+
+def test_abstains_without_garment():
+    blank = io.BytesIO()
+    Image.new('RGB', (300, 400), (250, 250, 250)).save(blank, format='PNG')
+    assert classify(blank.getvalue())['category'] is None
+    assert classify(b'not an image')['reason'] == 'unreadable'
+    assert check_category(blank.getvalue(), 'dress')['mismatch'] is False
+
+
+def test_mismatch_flag():
+    assert check_category(garment_png('lower_body'), 'upper_body')['mismatch'] is True
+    assert check_category(garment_png('lower_body'), 'lower_body')['mismatch'] is False
+    # Below the threshold it's only a hint
+    assert check_category(garment_png('lower_body'), 'upper_body', threshold=1.01)['mismatch'] is False
+
+
+def test_route_rejects_mismatch_before_credits():
+    import routes.api as api
+    cwd, enabled = os.getcwd(), api.GARMENT_CATEGORY_CHECK
+    os.chdir(tempfile.mkdtemp())  # credits service uses ./credits.db
+    api.GARMENT_CATEGORY_CHECK = True  # off by default
+    try:
+        from routes.api import api_bp
+        app = Flask(__name__)
+        app.register_blueprint(api_bp, url_prefix='/api')
+        client = app.test_client()
+
+        def post(category, garment='lower_body'):
+            return client.post('/api/virtual-fitting', content_type='multipart/form-data', data={
+                'userPhoto': (io.BytesIO(garment_png('dress', transparent=False)), 'me.png'),
+                'clothingPhoto': (io.BytesIO(garment_png(garment)), 'garment.png'),
+                'category': category,
+                'skipQualityCheck': 'true',  # the synthetic person photo has no person in it
+            })
+
+        response = post('upper_body')
+        data = response.get_json()
+        assert response.status_code == 409, data
+        assert data['category_mismatch'] and data['detected_category'] == 'lower_body'
+        assert post('shoes').status_code == 400
+
+        # Nothing was consumed (no credits db written)
+        if os.path.exists('credits.db'):
+            conn = sqlite3.connect('credits.db')
+            assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
+            conn.close()
+    finally:
+        os.chdir(cwd)
+        api.GARMENT_CATEGORY_CHECK = enabled
+
+
+if __name__ == "__main__":
+    try:
+        test_classifies_silhouettes()
+        test_abstains_without_garment()
+        test_mismatch_flag()
+        test_route_rejects_mismatch_before_credits()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test script for liveness/readiness checks
+Tests provider circuit state, how cached checks map to readiness status,
+and shedding load on the in-flight cap or a fitting scheduler backlog
+"""
+import sys
+import services.health_service as health
+from services.health_service import ProviderCircuits, ReadinessChecker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_provider_circuit_opens_and_expires():
+    clock = FakeClock()
+    circuits = ProviderCircuits(window=10, window_seconds=60, min_failures=3, failure_ratio=0.5, clock=clock)
+    assert circuits.state('gemini')['state'] == 'unknown'
+
+    circuits.record('gemini', 'success')
+    circuits.record('gemini', 'failure')
+    circuits.record('gemini', 'timeout')
+    assert circuits.state('gemini')['state'] == 'closed'  # only 2 failures
+    circuits.record('gemini', 'failure')
+    assert circuits.state('gemini') == {'state': 'open', 'recent_calls': 4, 'recent_failures': 3}
+
+    # Outcomes older than the window no longer count
+    clock.now += 61
+    assert circuits.state('gemini')['state'] == 'unknown'
+
+
+def test_readiness_status():
+    results = {'sqlite_credits': {'ok': True}, 'config': {'ok': True, 'degraded': False}}
+    original_checker, original_load = health.readiness_checker, health.shed_load_state
+    load = {'shed_load': False, 'draining': False, 'queue': {'fittings_in_flight': 0, 'max_in_flight': 4}}
+    health.readiness_checker = ReadinessChecker(interval=3600, checks=lambda: dict(results))
+    health.shed_load_state = lambda: dict(load)
+    try:
+        assert health.readiness()[1] == 200
+        assert health.readiness()[0]['status'] == 'ready'
+
+        load['shed_load'] = True
+        body, status = health.readiness()
+        assert (body['status'], status) == ('shedding', 503)
+
+        load['shed_load'] = False
+        results['sqlite_credits'] = {'ok': False, 'error': 'database is locked'}
+        health.readiness_checker._refresh()
+        body, status = health.readiness()
+        assert (body['status'], status) == ('not_ready', 503)
+    finally:
+        health.readiness_checker, health.shed_load_state = original_checker, original_load
+
+
+def test_shed_load_on_scheduler_backlog():
+    from services.admission_service import admission_controller
+    from services.fitting_scheduler import fitting_scheduler
+    original_admission, original_scheduler = admission_controller.snapshot, fitting_scheduler.snapshot
+    original_depth, original_file = health.SHED_QUEUE_DEPTH, health.SHED_LOAD_FILE
+    waiting = {'paid': 0, 'free': 0, 'speculative': 20}
+    admission_controller.snapshot = lambda: {'in_flight': 1, 'max_in_flight': 4}
+    fitting_scheduler.snapshot = lambda: {'slots': 2, 'running': 2, 'waiting': dict(waiting), 'service_seconds': 0}
+    health.SHED_QUEUE_DEPTH, health.SHED_LOAD_FILE = 3, ''
+    try:
+        # Queued speculative work alone never sheds
+        assert health.shed_load_state()['shed_load'] is False
+        waiting.update(paid=1, free=2)
+        assert health.shed_load_state()['shed_load'] is False
+        waiting['free'] = 3
+        state = health.shed_load_state()
+        assert state['shed_load'] is True and state['queue']['fittings_waiting'] == 4, state
+        assert state['queue']['fittings_in_flight'] == 1  # under the in-flight cap
+        health.SHED_QUEUE_DEPTH = 0  # disabled
+        assert health.shed_load_state()['shed_load'] is False
+    finally:
+        admission_controller.snapshot, fitting_scheduler.snapshot = original_admission, original_scheduler
+        health.SHED_QUEUE_DEPTH, health.SHED_LOAD_FILE = original_depth, original_file
+
+
+if __name__ == "__main__":
+    try:
+        test_provider_circuit_opens_and_expires()
+        test_readiness_status()
+        test_shed_load_on_scheduler_backlog()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
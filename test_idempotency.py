@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Test script for Idempotency-Key replay and in-flight coalescing
+Tests that a retried key replays the stored response without a second
+charge or provider call (with the image kept out of the stored body), key
+reuse with a different request, retries while the first request runs, that
+errors are not stored, and that identical concurrent requests share one
+provider execution (with a bounded wait for the followers)
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from flask import Flask
+from PIL import Image
+import services.fitting_pipeline as pipeline
+import services.idempotency_service as idempotency
+from services.image_utils import to_data_uri
+
+
+class FakeGenerate:
+    def __init__(self, succeed=True, delay=0):
+        self.calls = 0
+        self.succeed = succeed
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, user_photo_bytes, clothing_bytes, category, quality='high', should_stop=None, **config):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if not self.succeed:
+            return None
+        buffer = io.BytesIO()
+        Image.new('RGB', (60, 80), (0, 0, 120)).save(buffer, format='PNG')
+        return {'result': to_data_uri(buffer.getvalue()), 'method': 'fake'}
+
+
+@contextmanager
+def scratch(fake):
+    """Credits and idempotency databases in a scratch directory, providers replaced by `fake`"""
+    from routes.api import api_bp
+    cwd, db_path, generate = os.getcwd(), idempotency.DB_PATH, pipeline.generate
+    os.chdir(tempfile.mkdtemp())
+    idempotency.DB_PATH = 'idempotency.db'
+    pipeline.generate = fake
+    try:
+        app = Flask(__name__)
+        app.config.update(GEMINI_API_KEY=None, REPLICATE_API_TOKEN=None)
+        app.register_blueprint(api_bp, url_prefix='/api')
+        yield app
+    finally:
+        os.chdir(cwd)
+        idempotency.DB_PATH, pipeline.generate = db_path, generate
+
+
+def image_bytes(size, color=None):
+    buffer = io.BytesIO()
+    image = Image.new('RGB', size, color) if color else Image.effect_noise(size, 40).convert('RGB')
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+PERSON = image_bytes((400, 500))
+GARMENT = image_bytes((300, 300), (180, 30, 30))
+
+
+def fitting(client, key=None, person=PERSON):
+    return client.post('/api/virtual-fitting', content_type='multipart/form-data',
+                       headers={'Idempotency-Key': key} if key else {}, data={
+                           'userPhoto': (io.BytesIO(person), 'person.jpg'),
+                           'clothingPhoto': (io.BytesIO(GARMENT), 'top.jpg'),
+                           'category': 'upper_body', 'skipQualityCheck': 'true', 'confirmCategory': 'true'})
+
+
+def balance(user):
+    from services.credits_service import CreditsService
+    return CreditsService().get_balance(user)['remaining_free']
+
+
+def test_retry_replays_stored_response():
+    fake = FakeGenerate()
+    with scratch(fake) as app:
+        client = app.test_client()
+        client.set_cookie('user_key', 'idem_a')
+        first = fitting(client, 'tap-1')
+        assert first.status_code == 200, first.get_json()
+        retry = fitting(client, 'tap-1')
+        assert retry.status_code == 200
+        assert retry.headers.get('Idempotent-Replayed') == 'true'
+        assert retry.get_json() == first.get_json()
+        assert fake.calls == 1 and balance('idem_a') == 2
+        # Only a reference to the image is stored with the key
+        stored = idempotency._connect().execute('SELECT body FROM idempotency_keys').fetchone()['body']
+        assert b'data:' not in stored and b'"resultRef"' in stored, stored[:200]
+
+        # Same key from another client is a different request
+        other = app.test_client()
+        other.set_cookie('user_key', 'idem_b')
+        assert 'Idempotent-Replayed' not in fitting(other, 'tap-1').headers
+        assert fake.calls == 2
+
+
+def test_key_reused_for_other_request():
+    with scratch(FakeGenerate()) as app:
+        client = app.test_client()
+        client.set_cookie('user_key', 'idem_c')
+        assert fitting(client, 'k').status_code == 200
+        response = fitting(client, 'k', person=image_bytes((400, 500)))
+        assert response.status_code == 422
+        assert fitting(client, 'x' * 256).status_code == 400
+
+
+def test_retry_while_in_progress():
+    with scratch(FakeGenerate()) as app:
+        client = app.test_client()
+        client.set_cookie('user_key', 'idem_d')
+        # The first request is still running (on this or another worker)
+        with app.test_request_context('/', data={
+                'userPhoto': (io.BytesIO(PERSON), 'person.jpg'), 'clothingPhoto': (io.BytesIO(GARMENT), 'top.jpg'),
+                'category': 'upper_body', 'skipQualityCheck': 'true', 'confirmCategory': 'true'}):
+            fingerprint = idempotency.request_fingerprint()
+        assert idempotency.begin('virtual_fitting', 'user:idem_d', 'slow', fingerprint) == ('new', None)
+        response = fitting(client, 'slow')
+        assert response.status_code == 409 and response.headers['Retry-After']
+
+
+def test_failure_is_not_stored():
+    fake = FakeGenerate(succeed=False)
+    with scratch(fake) as app:
+        client = app.test_client()
+        client.set_cookie('user_key', 'idem_e')
+        assert fitting(client, 'fails').status_code == 500
+        fake.succeed = True
+        retry = fitting(client, 'fails')
+        assert retry.status_code == 200 and 'Idempotent-Replayed' not in retry.headers
+        assert fake.calls == 2
+
+
+def test_errors_are_not_stored():
+    from services.credits_service import CreditsService
+    fake = FakeGenerate()
+    with scratch(fake) as app:
+        client = app.test_client()
+        client.set_cookie('user_key', 'idem_g')
+        credits_service = CreditsService()
+        for index in range(3):
+            credits_service.check_and_consume('idem_g', '', f'hash-{index}')
+        assert fitting(client, 'pay-first').status_code == 402
+        # Paying and retrying with the same key runs the try-on instead of replaying the 402
+        credits_service.add_credits('idem_g', 1)
+        retry = fitting(client, 'pay-first')
+        assert retry.status_code == 200 and 'Idempotent-Replayed' not in retry.headers
+        assert fake.calls == 1
+
+
+def test_identical_in_flight_requests_coalesce():
+    fake = FakeGenerate(delay=0.5)
+    with scratch(fake) as app:
+        responses = []
+
+        def tap():
+            client = app.test_client()
+            client.set_cookie('user_key', 'idem_f')
+            responses.append(fitting(client))
+
+        threads = [threading.Thread(target=tap) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.1)
+        for thread in threads:
+            thread.join(5)
+        assert [response.status_code for response in responses] == [200, 200]
+        assert fake.calls == 1
+        # The duplicate was a free refit: one try-on charged
+        assert balance('idem_f') == 2
+
+
+def test_coalescer_shares_errors():
+    coalescer = idempotency.InFlightCoalescer()
+    started = threading.Event()
+    errors = []
+
+    def boom():
+        started.set()
+        time.sleep(0.2)
+        raise RuntimeError('provider down')
+
+    def call():
+        try:
+            coalescer.run(('k',), boom)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(2)
+    follower = threading.Thread(target=call)
+    follower.start()
+    leader.join(2)
+    follower.join(2)
+    assert errors == ['provider down', 'provider down']
+    assert coalescer.run(('k',), lambda: {'result': 'ok'}) == {'result': 'ok'}
+
+
+def test_follower_wait_is_bounded():
+    coalescer = idempotency.InFlightCoalescer(max_wait=0.1)
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return {'result': 'late'}
+
+    leader = threading.Thread(target=coalescer.run, args=(('k',), slow))
+    leader.start()
+    started.wait(2)
+    begun = time.monotonic()
+    try:
+        coalescer.run(('k',), slow)
+        assert False, 'expected CoalesceTimeout'
+    except idempotency.CoalesceTimeout as e:
+        assert e.retry_after > 0
+    assert time.monotonic() - begun < 1
+    release.set()
+    leader.join(2)
+
+
+def test_coalesce_timeout_answers_503():
+    fake = FakeGenerate(delay=0.5)
+    coalescer = idempotency.fitting_coalescer
+    with scratch(fake) as app:
+        coalescer.max_wait = 0.1
+        responses = []
+
+        def tap():
+            client = app.test_client()
+            client.set_cookie('user_key', 'idem_h')
+            responses.append(fitting(client))
+
+        try:
+            threads = [threading.Thread(target=tap) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+                time.sleep(0.1)
+            for thread in threads:
+                thread.join(5)
+        finally:
+            coalescer.max_wait = idempotency.COALESCE_WAIT_SECONDS
+        assert sorted(response.status_code for response in responses) == [200, 503]
+        assert [response for response in responses if response.status_code == 503][0].headers['Retry-After']
+        assert fake.calls == 1 and balance('idem_h') == 2
+
+
+if __name__ == "__main__":
+    try:
+        test_retry_replays_stored_response()
+        test_key_reused_for_other_request()
+        test_retry_while_in_progress()
+        test_failure_is_not_stored()
+        test_errors_are_not_stored()
+        test_identical_in_flight_requests_coalesce()
+        test_coalescer_shares_errors()
+        test_follower_wait_is_bounded()
+        test_coalesce_timeout_answers_503()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
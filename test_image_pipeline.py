@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared image pipeline helpers and the benchmark regression check
+"""
+import io
+import sys
+from PIL import Image
+from services.image_utils import fit_to_size, shrink_to_max_side, resize_for_fast_mode, to_data_uri, from_data_uri
+from benchmarks.image_pipeline_bench import compare
+
+
+def test_fit_to_size_pads_to_target():
+    # Wide result into a tall target: fit to width, white bars top and bottom
+    result = fit_to_size(Image.new('RGB', (200, 100), (0, 0, 0)), (100, 200))
+    assert result.size == (100, 200)
+    assert result.getpixel((50, 0)) == (255, 255, 255)
+    assert result.getpixel((50, 100)) == (0, 0, 0)
+
+
+def test_shrink_and_fast_mode_resize():
+    assert shrink_to_max_side(Image.new('RGB', (1600, 1200)), 800).size == (800, 600)
+    assert shrink_to_max_side(Image.new('RGB', (400, 300)), 800).size == (400, 300)
+
+    buffer = io.BytesIO()
+    Image.new('RGBA', (1200, 1600)).save(buffer, format='PNG')
+    resized = Image.open(io.BytesIO(resize_for_fast_mode(buffer.getvalue())))
+    assert resized.format == 'JPEG' and resized.size == (600, 800)
+
+
+def test_data_uri_round_trip():
+    assert from_data_uri(to_data_uri(b'\x89PNG')) == b'\x89PNG'
+
+
+def test_benchmark_regression_threshold():
+    baseline = {'memory_method': 'peak_rss', 'results': {'resize/img': {'min_ms': 100.0, 'peak_mb': 50.0}}}
+    within = {'memory_method': 'peak_rss', 'results': {'resize/img': {'min_ms': 110.0, 'peak_mb': 52.0}}}
+    slower = {'memory_method': 'peak_rss', 'results': {'resize/img': {'min_ms': 140.0, 'peak_mb': 80.0}}}
+    assert compare(within, baseline, 0.25, 0.25, 2.0, 5.0) == []
+    assert len(compare(slower, baseline, 0.25, 0.25, 2.0, 5.0)) == 2
+
+
+if __name__ == "__main__":
+    try:
+        test_fit_to_size_pads_to_target()
+        test_shrink_and_fast_mode_resize()
+        test_data_uri_round_trip()
+        test_benchmark_regression_threshold()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
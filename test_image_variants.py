@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for responsive image variants
+Tests format negotiation, immutable versioned URLs, stale-version redirects
+and the LRU size limit of the disk cache
+"""
+import io
+import os
+import sys
+import tempfile
+from PIL import Image
+import services.image_variants as variants
+from services.image_variants import VariantCache, negotiate_format
+
+SAMPLE = 'generated_images/black_evening_dress_complete_62275feb.png'
+CHROME_ACCEPT = 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8'
+
+
+def get_client():
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())  # the app creates its databases in the working directory
+    try:
+        from app import app
+    finally:
+        os.chdir(cwd)
+    return app.test_client()
+
+
+def test_negotiate_format():
+    assert negotiate_format('*/*', 'PNG') == 'PNG'
+    assert negotiate_format('image/webp,*/*', 'PNG') == 'WEBP'
+    assert negotiate_format('image/avif;q=0,image/webp', 'JPEG') == 'WEBP'
+    assert negotiate_format(CHROME_ACCEPT, 'PNG') == variants.NEGOTIABLE_FORMATS[0]
+
+
+def test_variant_endpoint():
+    original_cache = variants.variant_cache
+    variants.variant_cache = VariantCache(tempfile.mkdtemp())
+    try:
+        client = get_client()
+        url = variants.variant_url(SAMPLE, 320)
+        assert url.startswith('/img/320/')
+
+        response = client.get(url, headers={'Accept': 'image/webp,*/*'})
+        assert response.status_code == 200 and response.mimetype == 'image/webp'
+        assert 'immutable' in response.headers['Cache-Control'] and 'Accept' in response.headers['Vary']
+        assert Image.open(io.BytesIO(response.data)).width == 320
+        original_size = os.path.getsize(os.path.join(variants.SOURCE_DIR, SAMPLE))
+        assert len(response.data) < original_size / 4
+
+        # Second request is served from the disk cache
+        files = variants.variant_cache._scan()
+        client.get(url, headers={'Accept': 'image/webp,*/*'})
+        assert variants.variant_cache._scan()[0][1:] == files[0][1:]
+
+        response = client.get(url, headers={'Accept': '*/*'})
+        assert response.mimetype == 'image/png'
+
+        stale = client.get(f'/img/320/0000000000/{SAMPLE}')
+        assert stale.status_code == 302 and stale.headers['Location'].endswith(url)
+        assert client.get(url.replace('/320/', '/333/')).status_code == 404
+        assert client.get(f'/img/320/x/../../app.py').status_code == 404
+    finally:
+        variants.variant_cache = original_cache
+
+
+def test_cache_evicts_least_recently_used():
+    cache = VariantCache(tempfile.mkdtemp(), max_bytes=2500)
+    paths = [cache.get_or_render(f'{i:02d}' + 'a' * 30, 'PNG', lambda: b'x' * 1000) for i in range(2)]
+    os.utime(paths[0], (1, 1))  # first one is least recently used
+    os.utime(paths[1], (2, 2))
+    cache.get_or_render('02' + 'a' * 30, 'PNG', lambda: b'x' * 1000)
+    assert not os.path.exists(paths[0]) and os.path.exists(paths[1])
+
+
+if __name__ == "__main__":
+    try:
+        test_negotiate_format()
+        test_variant_endpoint()
+        test_cache_evicts_least_recently_used()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
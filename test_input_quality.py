@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test script for the input quality gate
+Tests the resolution, blur, exposure and person/garment presence checks and
+that /api/virtual-fitting rejects hopeless uploads before any credit is consumed
+"""
+import io
+import os
+import sys
+import tempfile
+from flask import Flask
+from PIL import Image, ImageDraw, ImageFilter
+from services.input_quality import check_image, check_inputs
+
+
+def encode(img, fmt='JPEG'):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, quality=90)
+    return buffer.getvalue()
+
+
+def person_photo(size=(600, 800), brightness=1.0):
+    """Textured background with a skin-toned face and a shirt"""
+    w, h = size
+    img = Image.merge('RGB', [Image.effect_noise(size, 30).point(lambda v: int(v * 0.6 + 60))] * 3)
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((w * 0.38, h * 0.08, w * 0.62, h * 0.3), fill=(224, 172, 140))
+    draw.rectangle((w * 0.25, h * 0.32, w * 0.75, h * 0.9), fill=(40, 60, 120))
+    if brightness != 1.0:
+        img = img.point(lambda v: min(255, int(v * brightness)))
+    return img
+
+
+def garment_photo(size=(400, 500)):
+    img = Image.new('RGB', size, (245, 245, 245))
+    ImageDraw.Draw(img).rectangle((80, 60, 320, 440), fill=(30, 30, 60))
+    return img
+
+
+def codes(issues):
+    return [issue['code'] for issue in issues]
+
+
+def test_good_inputs_pass():
+    assert check_inputs(encode(person_photo()), encode(garment_photo())) == []
+
+
+def test_each_check():
+    assert codes(check_image(encode(person_photo((150, 200))), 'person')) == ['too_small']
+    blurred = person_photo().filter(ImageFilter.GaussianBlur(8))
+    assert codes(check_image(encode(blurred), 'person')) == ['blurry']
+    assert codes(check_image(encode(person_photo(brightness=0.15)), 'person')) == ['too_dark']
+    assert codes(check_image(encode(Image.new('RGB', (600, 800), (255, 255, 255))), 'person'))[0] in ('blurry', 'overexposed')
+    no_person = Image.merge('RGB', [Image.effect_noise((600, 800), 40).point(lambda v: int(v * 0.5 + 40))] * 3)
+    assert codes(check_image(encode(no_person), 'person')) == ['no_person']
+    assert codes(check_image(encode(Image.new('RGB', (400, 500), (200, 200, 200))), 'garment')) == ['no_garment']
+
+    issue = check_image(encode(blurred), 'person')[0]
+    assert issue['image'] == 'userPhoto' and '흐립니다' in issue['message']
+
+
+def test_skip_heuristics_keeps_hard_failures():
+    blurred = encode(person_photo().filter(ImageFilter.GaussianBlur(8)))
+    assert check_inputs(blurred, encode(garment_photo()), skip_heuristics=True) == []
+    tiny = encode(person_photo((150, 200)))
+    assert codes(check_inputs(tiny, encode(garment_photo()), skip_heuristics=True)) == ['too_small']
+
+
+def test_route_rejects_before_credits():
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())  # credits service uses ./credits.db
+    try:
+        from routes.api import api_bp
+        app = Flask(__name__)
+        app.register_blueprint(api_bp, url_prefix='/api')
+        client = app.test_client()
+        client.set_cookie('user_key', 'quality_user')
+
+        response = client.post('/api/virtual-fitting', content_type='multipart/form-data', data={
+            'userPhoto': (io.BytesIO(encode(person_photo(brightness=0.15))), 'me.jpg'),
+            'clothingPhoto': (io.BytesIO(encode(garment_photo())), 'garment.jpg'),
+        })
+        data = response.get_json()
+        assert response.status_code == 422, data
+        assert codes(data['quality_issues']) == ['too_dark'] and data['message']
+        assert data['skippable'] is True
+        assert not os.path.exists('credits.db')
+
+        # A photo that is too small can't be sent anyway
+        response = client.post('/api/virtual-fitting', content_type='multipart/form-data', data={
+            'userPhoto': (io.BytesIO(encode(person_photo((150, 200)))), 'me.jpg'),
+            'clothingPhoto': (io.BytesIO(encode(garment_photo())), 'garment.jpg'),
+        })
+        assert response.status_code == 422 and response.get_json()['skippable'] is False
+    finally:
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    try:
+        test_good_inputs_pass()
+        test_each_check()
+        test_skip_heuristics_keeps_hard_failures()
+        test_route_rejects_before_credits()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test script for structured logging
+Tests the JSON record format, `extra` fields and the request id, and that
+the queue listener is restarted in a forked worker
+"""
+import os
+import re
+import sys
+import json
+import logging
+import tempfile
+import warnings
+from services.logging_service import JsonFormatter, RequestIdFilter, _ProcessLocalQueueHandler, request_id_var
+
+
+def make_logger(name, path):
+    """Logger writing JSON lines to `path` through the queue-backed handler"""
+    target = logging.FileHandler(path)
+    target.setFormatter(JsonFormatter())
+    handler = _ProcessLocalQueueHandler(target)
+    handler.addFilter(RequestIdFilter())
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger, handler
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_json_record_format():
+    record = logging.LogRecord('services.fitting', logging.WARNING, __file__, 1, 'took %d ms', (42,), None)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['msg'] == 'took 42 ms' and entry['level'] == 'WARNING' and entry['logger'] == 'services.fitting'
+    assert re.fullmatch(r'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}Z', entry['ts']), entry['ts']
+    assert 'request_id' not in entry and 'exc' not in entry
+
+    try:
+        raise ValueError('bad image')
+    except ValueError:
+        record = logging.LogRecord('app', logging.ERROR, __file__, 1, 'failed', None, sys.exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert 'ValueError: bad image' in entry['exc']
+
+
+def test_extra_fields_and_request_id():
+    path = os.path.join(tempfile.mkdtemp(), 'log.jsonl')
+    logger, handler = make_logger('test_logging.extra', path)
+    token = request_id_var.set('req-42')
+    try:
+        logger.info("request finished", extra={'status': 200, 'elapsed_ms': 1.5, 'method': 'GET',
+                                               'path': object()})
+    finally:
+        request_id_var.reset(token)
+    logger.info("no request")
+    handler.stop()  # drains the queue
+
+    first, second = read_lines(path)
+    assert first['msg'] == 'request finished' and first['request_id'] == 'req-42'
+    assert (first['status'], first['elapsed_ms'], first['method']) == (200, 1.5, 'GET')
+    assert first['path'].startswith('<object')  # not JSON-serializable: falls back to str()
+    # Standard LogRecord attributes stay out of the line
+    assert not {'args', 'levelno', 'pathname', 'thread', 'msecs'} & set(first)
+    assert 'request_id' not in second
+
+
+def test_listener_restarts_after_fork():
+    if not hasattr(os, 'fork'):
+        return
+    path = os.path.join(tempfile.mkdtemp(), 'log.jsonl')
+    logger, handler = make_logger('test_logging.fork', path)
+    logger.info("from parent")
+    parent_listener = handler._listener
+    assert handler._pid == os.getpid()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)  # forking with threads running
+        pid = os.fork()
+    if pid == 0:
+        # The parent's listener thread doesn't exist here: the first record must start a new one
+        try:
+            logger.info("from child")
+            ok = handler._pid == os.getpid() and handler._listener is not parent_listener
+            handler.stop()
+        except BaseException:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    logger.info("parent again")
+    handler.stop()
+
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0, status
+    assert sorted(line['msg'] for line in read_lines(path)) == ['from child', 'from parent', 'parent again']
+
+
+if __name__ == "__main__":
+    try:
+        test_json_record_format()
+        test_extra_fields_and_request_id()
+        test_listener_restarts_after_fork()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
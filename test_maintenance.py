@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for SQLite maintenance
+Tests that retention deletes in batches, keeps paying users and reports what it did
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+import services.maintenance_service as maintenance
+from services.maintenance_service import RetentionPolicy, maintain_database
+
+
+def make_db():
+    path = os.path.join(tempfile.mkdtemp(), 'credits.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE users (user_key TEXT PRIMARY KEY, credits INTEGER DEFAULT 0, '
+                 'last_reset TEXT, completed_sessions TEXT DEFAULT NULL)')
+    conn.execute('CREATE TABLE share_log (id INTEGER PRIMARY KEY AUTOINCREMENT, user_key TEXT, '
+                 'platform TEXT, shared_at TEXT)')
+    old = (datetime.now() - timedelta(days=200)).isoformat()
+    recent = datetime.now().isoformat()
+    conn.executemany('INSERT INTO share_log (user_key, platform, shared_at) VALUES (?, ?, ?)',
+                     [(f'u{i}', 'kakao', old if i < 25 else recent) for i in range(30)])
+    conn.executemany('INSERT INTO users VALUES (?, ?, ?, ?)', [
+        ('idle_free', 0, old, None),
+        ('idle_paid', 5, old, None),
+        ('idle_spent_purchase', 0, old, '["cs_123"]'),
+        ('active_free', 0, recent, None),
+    ])
+    conn.commit()
+    conn.close()
+    return path
+
+
+POLICIES = [
+    RetentionPolicy('share_log', 'share_log', 'shared_at < ?', 90),
+    RetentionPolicy('stale_users', 'users',
+                    'last_reset < ? AND COALESCE(credits, 0) = 0 AND completed_sessions IS NULL', 30),
+]
+
+
+def test_dry_run_counts_without_deleting():
+    path = make_db()
+    report = maintain_database(path, POLICIES, dry_run=True)
+    assert report['retention']['share_log']['would_delete'] == 25
+    assert report['retention']['stale_users']['would_delete'] == 1
+    assert sqlite3.connect(path).execute('SELECT COUNT(*) FROM share_log').fetchone()[0] == 30
+
+
+def test_retention_in_batches_keeps_paying_users():
+    path = make_db()
+    original = maintenance.BATCH_SIZE, maintenance.BATCH_PAUSE_SECONDS
+    maintenance.BATCH_SIZE, maintenance.BATCH_PAUSE_SECONDS = 10, 0
+    try:
+        report = maintain_database(path, POLICIES, enable_incremental_vacuum=True)
+    finally:
+        maintenance.BATCH_SIZE, maintenance.BATCH_PAUSE_SECONDS = original
+
+    assert report['retention']['share_log'] == {'deleted': 25, 'batches': 3, 'cutoff': POLICIES[0].cutoff(datetime.now()),
+                                                'complete': True}
+    conn = sqlite3.connect(path)
+    users = {row[0] for row in conn.execute('SELECT user_key FROM users')}
+    assert users == {'idle_paid', 'idle_spent_purchase', 'active_free'}
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    assert 'bytes_reclaimed' in report
+
+
+if __name__ == "__main__":
+    try:
+        test_dry_run_counts_without_deleting()
+        test_retention_in_batches_keeps_paying_users()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test script for the /metrics registry
+Tests that snapshots from several gunicorn workers are merged correctly
+"""
+import os
+import sys
+import json
+import tempfile
+from services.metrics_service import MetricsRegistry
+
+
+def make_registry(directory):
+    registry = MetricsRegistry(directory=directory)
+    requests_total = registry.counter('test_requests_total', 'requests')
+    in_flight = registry.gauge('test_in_flight', 'in flight')
+    latency = registry.histogram('test_latency_seconds', 'latency', buckets=(0.1, 1))
+    return registry, requests_total, in_flight, latency
+
+
+def test_merge_across_workers():
+    directory = tempfile.mkdtemp()
+    registry, requests_total, in_flight, latency = make_registry(directory)
+
+    requests_total.inc(provider='gemini', outcome='success')
+    in_flight.inc()
+    latency.observe(0.05, stage='gemini')
+    latency.observe(0.5, stage='gemini')
+
+    # Snapshot left behind by a worker that has exited (pid cannot exist)
+    dead_pid = 4194304 + 1
+    with open(os.path.join(directory, f'{dead_pid}.json'), 'w') as f:
+        json.dump({
+            'test_requests_total': [[[['outcome', 'success'], ['provider', 'gemini']], 2]],
+            'test_in_flight': [[[], 7]],
+            'test_latency_seconds': [[[['stage', 'gemini']], {'buckets': [0, 1], 'sum': 0.7, 'count': 1}]],
+        }, f)
+
+    text = registry.render()
+
+    # Counters from exited workers are kept, gauges are not
+    assert 'test_requests_total{outcome="success",provider="gemini"} 3' in text, text
+    assert 'test_in_flight 1' in text, text
+    # Histogram buckets are cumulative and summed across workers
+    assert 'test_latency_seconds_bucket{stage="gemini",le="0.1"} 1' in text, text
+    assert 'test_latency_seconds_bucket{stage="gemini",le="1"} 3' in text, text
+    assert 'test_latency_seconds_bucket{stage="gemini",le="+Inf"} 3' in text, text
+    assert 'test_latency_seconds_count{stage="gemini"} 3' in text, text
+
+
+if __name__ == "__main__":
+    try:
+        test_merge_across_workers()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Test script for provider quota pacing
+Tests the shared RPM bucket and concurrency leases (two instances standing
+in for two workers), waiting for a token, backing off after a rate limit,
+that polling a spent budget takes no write lock, and that the pipeline
+routes to IDM-VTON when Gemini's budget is spent
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+import services.provider_quota as quota
+from services.metrics_service import classify_provider_error, registry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@contextmanager
+def scratch():
+    cwd, db_path = os.getcwd(), quota.DB_PATH
+    os.chdir(tempfile.mkdtemp())
+    quota.DB_PATH = 'provider_quota.db'
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        quota.DB_PATH = db_path
+
+
+def worker(clock, **limits):
+    return quota.ProviderQuota({'gemini': quota.ProviderLimits(**limits)}, clock=clock, sleep=clock.sleep)
+
+
+def test_rpm_bucket_shared_between_workers():
+    clock = FakeClock()
+    with scratch():
+        first, second = (worker(clock, rpm=60, burst=2, concurrency=0, max_wait=0) for _ in range(2))
+        leases = [first.acquire('gemini'), second.acquire('gemini')]
+        assert all(leases)
+        # The burst is used up across both workers
+        try:
+            first.acquire('gemini')
+            assert False, 'expected QuotaExhausted'
+        except quota.QuotaExhausted as e:
+            assert 0 < e.retry_after <= 1
+        clock.now += 1  # 60 rpm: one token per second
+        assert second.acquire('gemini')
+        assert 'fitsa_provider_quota_throttled_total{provider="gemini"}' in registry.render()
+
+
+def test_waits_briefly_for_a_token():
+    clock = FakeClock()
+    with scratch():
+        pacer = worker(clock, rpm=30, burst=1, concurrency=0, max_wait=5)
+        assert pacer.acquire('gemini')
+        assert pacer.acquire('gemini')  # next token in 2s, within the max wait
+        assert 1.9 < sum(clock.slept) < 2.5, clock.slept
+        try:
+            pacer.acquire('gemini', max_wait=0.5)
+            assert False, 'expected QuotaExhausted'
+        except quota.QuotaExhausted:
+            pass
+
+
+def test_concurrency_leases():
+    clock = FakeClock()
+    with scratch():
+        first, second = (worker(clock, rpm=0, burst=1, concurrency=1, max_wait=0) for _ in range(2))
+        lease = first.acquire('gemini')
+        try:
+            second.acquire('gemini')
+            assert False, 'expected QuotaExhausted'
+        except quota.QuotaExhausted:
+            pass
+        first.release(lease)
+        lease = second.acquire('gemini')
+        assert lease
+        # A lease of a worker that died stops counting after LEASE_SECONDS
+        clock.now += quota.LEASE_SECONDS + 1
+        assert first.acquire('gemini')
+        assert first.snapshot()['gemini']['running'] == 1
+
+
+def test_penalize_after_rate_limit():
+    clock = FakeClock()
+    with scratch():
+        pacer = worker(clock, rpm=600, burst=5, concurrency=0, max_wait=2)
+        assert classify_provider_error(Exception('429 RESOURCE_EXHAUSTED: quota exceeded')) == 'rate_limited'
+        assert classify_provider_error(Exception('Rate limit exceeded')) == 'rate_limited'
+        assert classify_provider_error(Exception('bad image')) == 'failure'
+        pacer.penalize('gemini', cooldown=30)
+        assert pacer.snapshot()['gemini']['blocked_for'] == 30
+        try:
+            pacer.acquire('gemini')
+            assert False, 'expected QuotaExhausted'
+        except quota.QuotaExhausted as e:
+            assert e.retry_after == 30
+        assert clock.slept == []  # didn't wait for a budget that can't recover in time
+        clock.now += 30
+        assert pacer.acquire('gemini')
+
+
+def test_spent_budget_is_polled_read_only():
+    clock = FakeClock()
+    with scratch():
+        pacer = worker(clock, rpm=60, burst=1, concurrency=1, max_wait=0)
+        lease = pacer.acquire('gemini')
+        # Another worker holds the write lock: checking a spent budget must not wait for it
+        blocker = quota._connect()
+        blocker.execute('BEGIN IMMEDIATE')
+        try:
+            for _ in range(3):
+                lease_id, wait = pacer._take('gemini', pacer.limits['gemini'])
+                assert lease_id is None and wait > 0
+        finally:
+            blocker.rollback()
+            blocker.close()
+        # A lease left by a dead worker is cleaned up once it expires
+        clock.now += quota.LEASE_SECONDS + 1
+        assert pacer.acquire('gemini')
+        conn = quota._connect()
+        try:
+            assert conn.execute('SELECT COUNT(*) FROM provider_leases WHERE lease_id = ?', (lease,)).fetchone()[0] == 0
+        finally:
+            conn.close()
+
+
+def test_pipeline_routes_to_replicate_when_gemini_is_spent():
+    from benchmarks import stub_providers
+    import services
+    import services.fitting_pipeline as pipeline
+    names = ('services.gemini_virtual_fitting_service', 'services.replicate_service',
+             'services.background_removal_service')
+    saved_modules = {name: sys.modules.get(name) for name in names}
+    saved_env = {name: os.environ.get(name) for name in
+                 ('STUB_GEMINI_LATENCY', 'STUB_REPLICATE_LATENCY', 'GEMINI_API_KEY', 'REPLICATE_API_TOKEN')}
+    saved_limits = quota.provider_quota.limits
+    os.environ['STUB_GEMINI_LATENCY'] = os.environ['STUB_REPLICATE_LATENCY'] = 'fixed:0'
+    stub_providers.install_stubs()
+    quota.provider_quota.limits = {
+        'gemini': quota.ProviderLimits(rpm=1, burst=1, concurrency=0, max_wait=0),
+        'replicate': quota.ProviderLimits(rpm=0, burst=1, concurrency=2, max_wait=1),
+    }
+    try:
+        with scratch():
+            from services.image_utils import encode_png
+            from PIL import Image
+            photo = encode_png(Image.new('RGB', (60, 80), (10, 10, 10)))
+            first = pipeline.generate(photo, photo, 'upper_body', gemini_api_key='stub', replicate_api_token='stub')
+            second = pipeline.generate(photo, photo, 'upper_body', gemini_api_key='stub', replicate_api_token='stub')
+            assert first['method'] == 'Gemini 2.5 Flash Image', first['method']
+            assert second['method'] == 'Replicate IDM-VTON', second['method']
+            assert quota.provider_quota.snapshot()['replicate']['running'] == 0  # lease released
+    finally:
+        quota.provider_quota.limits = saved_limits
+        for name, module in saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+                if hasattr(services, name.rsplit('.', 1)[1]):
+                    delattr(services, name.rsplit('.', 1)[1])
+            else:
+                sys.modules[name] = module
+                setattr(services, name.rsplit('.', 1)[1], module)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+if __name__ == "__main__":
+    try:
+        test_rpm_bucket_shared_between_workers()
+        test_waits_briefly_for_a_token()
+        test_concurrency_leases()
+        test_penalize_after_rate_limit()
+        test_spent_budget_is_polled_read_only()
+        test_pipeline_routes_to_replicate_when_gemini_is_spent()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Test script for refit limit enforcement
-Tests that users can only refit 5 times per hour with the same photos
+Tests that users can only refit 5 times per hour with the same photos, and
+that concurrent check_and_consume calls spend a balance exactly once
 """
 import os
 import sys
@@ -98,9 +99,51 @@ def test_refit_limit():
     print("- Changing photos resets the refit counter")
     print("- Limit applies to both free and paid users")
 
+def test_concurrent_consume_is_atomic():
+    """Concurrent requests for the last credit (after a daily reset) spend it exactly once"""
+    import sqlite3
+    import tempfile
+    import threading
+    from datetime import datetime, timedelta
+    test_db = os.path.join(tempfile.mkdtemp(), 'credits.db')
+    credits_service = CreditsService(db_path=test_db)
+    credits_service.add_credits('racer', 1)
+    conn = sqlite3.connect(test_db)
+    # Free tries used up yesterday: today's reset gives 3 back, plus the 1 paid credit
+    conn.execute('UPDATE users SET free_used_today = 3, last_reset = ? WHERE user_key = ?',
+                 ((datetime.now() - timedelta(days=1)).isoformat(), 'racer'))
+    conn.commit()
+    conn.close()
+
+    results = []
+    barrier = threading.Barrier(8)
+
+    def consume(index):
+        barrier.wait()
+        results.append(credits_service.check_and_consume('racer', '', f'photo-{index}'))
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    allowed = [info['used_type'] for ok, info in results if ok]
+    assert sorted(allowed) == ['credit', 'free', 'free', 'free'], allowed
+    balance = credits_service.get_balance('racer')
+    assert (balance['remaining_free'], balance['credits']) == (0, 0), balance
+
+    # Refused for lack of credits: the photos aren't remembered, so after paying they are charged, not refit
+    ok, info = credits_service.check_and_consume('racer', '', 'after-payment')
+    assert not ok and info['needs_payment']
+    credits_service.add_credits('racer', 1)
+    ok, info = credits_service.check_and_consume('racer', '', 'after-payment')
+    assert ok and info['used_type'] == 'credit', info
+
+
 if __name__ == "__main__":
     try:
         test_refit_limit()
+        test_concurrent_consume_is_atomic()
     except AssertionError as e:
         print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
         sys.exit(1)
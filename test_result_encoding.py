@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test script for try-on result encoding
+Tests format negotiation (resultFormat, Accept, default), alpha handling,
+the encoded-result cache and the bytes-saved metric
+"""
+import io
+import sys
+from PIL import Image
+import services.result_encoding as encoding
+from services.image_utils import from_data_uri, to_data_uri
+from services.metrics_service import result_image_bytes_total
+
+
+def photo_result(mode='RGB'):
+    img = Image.merge('RGB', [Image.linear_gradient('L').resize((600, 800)), Image.effect_noise((600, 800), 30),
+                              Image.linear_gradient('L').rotate(90).resize((600, 800))])
+    if mode == 'RGBA':
+        img = img.convert('RGBA')
+        img.putalpha(Image.linear_gradient('L').resize((600, 800)))
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return to_data_uri(buffer.getvalue())
+
+
+def test_negotiation():
+    assert encoding.choose_format('') == 'WEBP'
+    assert encoding.choose_format('application/json, */*') == 'WEBP'
+    assert encoding.choose_format('image/avif,image/webp,*/*') == 'AVIF'
+    assert encoding.choose_format('image/jpeg') == 'JPEG'
+    assert encoding.choose_format('image/avif;q=0, image/jpeg') == 'JPEG'
+    assert encoding.choose_format('image/avif', requested='jpg') == 'JPEG'
+    assert encoding.choose_format('', requested='bmp') == 'WEBP'
+    # PNG only when alpha is needed and the chosen format can't carry it
+    assert encoding.choose_format('image/jpeg', has_alpha=True) == 'PNG'
+    assert encoding.choose_format('', has_alpha=True) == 'WEBP'
+
+
+def test_encodes_smaller_and_caches():
+    encoding.encoded_cache.clear()
+    source = photo_result()
+    before = result_image_bytes_total.values.copy()
+
+    data_uri, info = encoding.encode_result(source, 'image/jpeg')
+    assert data_uri.startswith('data:image/jpeg;base64,')
+    assert info['format'] == 'jpeg' and info['bytes'] < info['source_bytes']
+    assert Image.open(io.BytesIO(from_data_uri(data_uri))).size == (600, 800)
+
+    again, _ = encoding.encode_result(source, 'image/jpeg')
+    assert again is data_uri  # served from the cache
+    counted_in = sum(v - before.get(k, 0) for k, v in result_image_bytes_total.values.items() if ('stage', 'in') in k)
+    assert counted_in == info['source_bytes']  # counted once
+
+    webp, info = encoding.encode_result(source)
+    assert info['format'] == 'webp' and webp.startswith('data:image/webp')
+
+
+def test_alpha_and_passthrough():
+    uri, info = encoding.encode_result(photo_result('RGBA'), 'image/jpeg')
+    assert info['format'] == 'png' and Image.open(io.BytesIO(from_data_uri(uri))).mode == 'RGBA'
+    # Remote URLs are left alone
+    assert encoding.encode_result('https://example.com/result.png') == ('https://example.com/result.png', {})
+    # An already-lossy result in the chosen format is not re-encoded
+    jpeg, _ = encoding.encode_result(photo_result(), requested='jpeg')
+    assert encoding.encode_result(jpeg, requested='jpeg')[0] == jpeg
+
+
+def test_cache_is_byte_limited():
+    cache = encoding.EncodedResultCache(max_bytes=10)
+    cache.put(('a',), '123456')
+    cache.put(('b',), '123456')
+    assert cache.get(('a',)) is None and cache.get(('b',)) == '123456'
+    cache.put(('c',), 'x' * 11)
+    assert cache.get(('c',)) is None
+
+
+if __name__ == "__main__":
+    try:
+        test_negotiation()
+        test_encodes_smaller_and_caches()
+        test_alpha_and_passthrough()
+        test_cache_is_byte_limited()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
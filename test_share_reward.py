@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test script for SNS share rewards
+Tests that a share is rewarded once per platform per day, atomically with the credit grant
+"""
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+from services.credits_service import CreditsService
+
+
+def make_service():
+    return CreditsService(db_path=os.path.join(tempfile.mkdtemp(), 'credits.db'))
+
+
+def credits_of(service, user_key):
+    row = sqlite3.connect(service.db_path).execute(
+        'SELECT credits FROM users WHERE user_key = ?', (user_key,)).fetchone()
+    return row[0] if row else None
+
+
+def test_reward_once_per_platform_per_day():
+    service = make_service()
+    assert service.reward_share('user_a', 'kakao') is True
+    assert service.reward_share('user_a', 'kakao') is False
+    assert service.reward_share('user_a', 'instagram') is True
+    assert credits_of(service, 'user_a') == 10
+
+    log = sqlite3.connect(service.db_path).execute('SELECT platform, share_day FROM share_log').fetchall()
+    assert len(log) == 2
+
+
+def test_concurrent_shares_rewarded_once():
+    service = make_service()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(CreditsService(service.db_path).reward_share('user_b', 'general')))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results.count(True) == 1, results
+    assert credits_of(service, 'user_b') == 5
+
+
+def test_existing_share_log_is_migrated():
+    path = os.path.join(tempfile.mkdtemp(), 'credits.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE share_log (id INTEGER PRIMARY KEY AUTOINCREMENT, user_key TEXT NOT NULL,
+                    platform TEXT NOT NULL, shared_at TEXT NOT NULL, credits_rewarded INTEGER DEFAULT 5)''')
+    conn.executemany('INSERT INTO share_log (user_key, platform, shared_at) VALUES (?, ?, ?)', [
+        ('user_c', 'kakao', '2024-01-01T10:00:00'),
+        ('user_c', 'kakao', '2024-01-01T11:00:00'),
+        ('user_c', 'kakao', '2024-01-02T09:00:00'),
+    ])
+    conn.commit()
+    conn.close()
+
+    CreditsService(db_path=path)
+    rows = sqlite3.connect(path).execute('SELECT share_day FROM share_log ORDER BY id').fetchall()
+    assert rows == [('2024-01-01',), ('2024-01-02',)], rows
+
+
+if __name__ == "__main__":
+    try:
+        test_reward_once_per_platform_per_day()
+        test_concurrent_shares_rewarded_once()
+        test_existing_share_log_is_migrated()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
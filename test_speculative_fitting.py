@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Test script for speculative brand room fittings
+Tests room item selection, pre-generation and one-time claims, the per-user
+and deployment-wide hourly budgets, dropping work while the worker is busy,
+the maintenance sweep of expired results, and that /api/virtual-fitting
+serves a claimed result (charged as usual) without calling a provider
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from flask import Flask
+from PIL import Image
+import services.catalog_service as catalog
+import services.fitting_pipeline as pipeline
+import services.speculative_fitting as speculative
+from services.admission_service import admission_controller
+from services.image_utils import to_data_uri
+
+
+class FakeGenerate:
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, user_photo_bytes, clothing_bytes, category, quality='high', should_stop=None, **config):
+        with self.lock:
+            self.calls += 1
+        buffer = io.BytesIO()
+        Image.new('RGB', (60, 80), (0, 120, 0)).save(buffer, format='PNG')
+        return {'result': to_data_uri(buffer.getvalue()), 'method': 'fake'}
+
+
+@contextmanager
+def scratch(fake, **settings):
+    """Catalog, credits and speculative databases in a scratch directory, providers replaced by `fake`"""
+    settings.setdefault('ENABLED', True)
+    saved = {name: getattr(speculative, name) for name in settings}
+    cwd, catalog_path, speculative_path, generate = os.getcwd(), catalog.DB_PATH, speculative.DB_PATH, pipeline.generate
+    os.chdir(tempfile.mkdtemp())
+    catalog.DB_PATH = os.path.join(os.getcwd(), 'catalog.db')
+    speculative.DB_PATH = 'speculative.db'
+    pipeline.generate = fake
+    for name, value in settings.items():
+        setattr(speculative, name, value)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        catalog.DB_PATH, speculative.DB_PATH, pipeline.generate = catalog_path, speculative_path, generate
+        for name, value in saved.items():
+            setattr(speculative, name, value)
+
+
+def person_photo():
+    buffer = io.BytesIO()
+    Image.effect_noise((400, 500), 40).convert('RGB').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def wait_settled(client_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        conn = speculative._connect()
+        pending = conn.execute("SELECT COUNT(*) FROM speculative_fittings WHERE client_id = ? AND status = 'pending'",
+                               (client_id,)).fetchone()[0]
+        conn.close()
+        if not pending:
+            return
+        time.sleep(0.05)
+    raise AssertionError('speculative work did not finish')
+
+
+def test_room_items_take_one_per_section():
+    with scratch(FakeGenerate()):
+        items = speculative.room_items('dior', 3)
+        assert [item['fitting_category'] for item in items] == ['upper_body', 'lower_body', 'dress']
+        assert all(item['image'].startswith('/attached_assets/') for item in items)
+
+
+def test_pregenerate_and_claim_once():
+    fake = FakeGenerate()
+    with scratch(fake):
+        photo = person_photo()
+        result = speculative.schedule('user:a', photo, 'dior', {})
+        assert len(result['scheduled']) == 3
+        wait_settled('user:a')
+        assert fake.calls == 3
+
+        item_id = result['scheduled'][0]
+        assert speculative.claim('user:b', photo, item_id, 'upper_body', 'high') is None  # another client
+        assert speculative.claim('user:a', photo + b'x', item_id, 'upper_body', 'high') is None  # another photo
+        assert speculative.claim('user:a', photo, item_id, 'dress', 'high') is None  # another category
+        claimed = speculative.claim('user:a', photo, item_id, 'upper_body', 'high')
+        assert claimed and claimed['method'] == 'fake'
+        assert speculative.claim('user:a', photo, item_id, 'upper_body', 'high') is None  # served once
+
+        # Already generated for this photo: nothing new to schedule
+        assert speculative.schedule('user:a', photo, 'dior', {})['scheduled'] == []
+
+
+def test_hourly_budget():
+    with scratch(FakeGenerate(), BUDGET_PER_HOUR=4):
+        photo = person_photo()
+        assert len(speculative.schedule('user:c', photo, 'dior', {})['scheduled']) == 3
+        second = speculative.schedule('user:c', photo, 'gucci', {})
+        assert len(second['scheduled']) == 1 and second['budget_remaining'] == 0
+        assert speculative.schedule('user:c', photo, 'chanel', {})['scheduled'] == []
+        wait_settled('user:c')
+
+
+def test_global_hourly_budget():
+    with scratch(FakeGenerate(), GLOBAL_BUDGET_PER_HOUR=4):
+        photo = person_photo()
+        assert len(speculative.schedule('user:g1', photo, 'dior', {})['scheduled']) == 3
+        # Another client id doesn't get a fresh budget beyond the deployment's
+        second = speculative.schedule('user:g2', photo, 'dior', {})
+        assert len(second['scheduled']) == 1 and second['budget_remaining'] == 0
+        assert speculative.schedule('user:g3', photo, 'dior', {})['scheduled'] == []
+        wait_settled('user:g1')
+        wait_settled('user:g2')
+
+
+def test_maintenance_drops_expired_results():
+    from services.maintenance_service import default_policies, maintain_database
+    with scratch(FakeGenerate(), TTL_SECONDS=-86400 * 2):
+        speculative.schedule('user:m', person_photo(), 'dior', {})
+        wait_settled('user:m')
+        policies = default_policies()[speculative.DB_PATH]
+        report = maintain_database(speculative.DB_PATH, policies)
+        assert report['retention']['speculative_expired']['deleted'] == 3, report['retention']
+
+
+def test_busy_worker_drops_speculation():
+    fake = FakeGenerate()
+    with scratch(fake, IDLE_WAIT_SECONDS=0.2, IDLE_POLL=0.05):
+        admission_controller.in_flight += 1
+        try:
+            speculative.schedule('user:d', person_photo(), 'dior', {})
+            wait_settled('user:d')
+        finally:
+            admission_controller.release()
+        assert fake.calls == 0
+        # Dropped work doesn't use up the budget
+        assert len(speculative.schedule('user:d', person_photo(), 'gucci', {})['scheduled']) == 3
+        wait_settled('user:d')
+
+
+def test_fitting_route_serves_claimed_result():
+    from routes.api import api_bp
+    from services.credits_service import CreditsService
+    fake = FakeGenerate()
+    with scratch(fake):
+        app = Flask(__name__)
+        app.config.update(GEMINI_API_KEY=None, REPLICATE_API_TOKEN=None)
+        app.register_blueprint(api_bp, url_prefix='/api')
+        client = app.test_client()
+        client.set_cookie('user_key', 'user_e')
+        photo = person_photo()
+
+        response = client.post('/api/speculative-fittings', content_type='multipart/form-data', data={
+            'userPhoto': (io.BytesIO(photo), 'person.jpg'), 'brandId': 'dior'})
+        assert response.status_code == 202, response.get_json()
+        wait_settled('user:user_e')
+        calls = fake.calls
+        assert calls == 3
+
+        top = speculative.room_items('dior', 1)[0]
+        garment = catalog_image(top['image'])
+        response = client.post('/api/virtual-fitting', content_type='multipart/form-data', data={
+            'userPhoto': (io.BytesIO(photo), 'person.jpg'),
+            'clothingPhoto': (io.BytesIO(garment), 'top.png'),
+            'category': 'upper_body', 'catalogItemId': str(top['item_id']),
+            'skipQualityCheck': 'true', 'confirmCategory': 'true',
+        })
+        data = response.get_json()
+        assert response.status_code == 200, data
+        assert data['method'] == 'fake' and fake.calls == calls  # no provider call
+        assert CreditsService().get_balance('user_e')['remaining_free'] == 2  # charged like any try-on
+
+        unknown = client.post('/api/speculative-fittings', content_type='multipart/form-data', data={
+            'userPhoto': (io.BytesIO(photo), 'person.jpg'), 'brandId': 'nope'})
+        assert unknown.status_code == 404
+
+    with scratch(fake, ENABLED=False):
+        client.set_cookie('user_key', 'user_e2')  # user_e has used up its admission burst
+        disabled = client.post('/api/speculative-fittings', content_type='multipart/form-data', data={
+            'userPhoto': (io.BytesIO(photo), 'person.jpg'), 'brandId': 'dior'})
+        assert disabled.status_code == 404
+
+
+def catalog_image(url):
+    from services.image_variants import source_path, SOURCE_URL_PREFIX
+    with open(source_path(url[len(SOURCE_URL_PREFIX):]), 'rb') as f:
+        return f.read()
+
+
+if __name__ == "__main__":
+    try:
+        test_room_items_take_one_per_section()
+        test_pregenerate_and_claim_once()
+        test_hourly_budget()
+        test_global_hourly_budget()
+        test_maintenance_drops_expired_results()
+        test_busy_worker_drops_speculation()
+        test_fitting_route_serves_claimed_result()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
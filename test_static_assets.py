@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test script for the static asset build (minify, fingerprint, precompress, manifest)
+"""
+import os
+import sys
+import gzip
+import tempfile
+from services.static_assets import minify_js, minify_css, negotiate_encoding, build
+
+
+def test_minify_js_keeps_strings_and_line_breaks():
+    src = (
+        "// header comment\n"
+        "const url = 'https://example.com/a'  // trailing\n"
+        "const html = `\n    <div>  ${ items.map(i => `<b>${i}</b>`).join('') }  </div>\n`\n"
+        "/* block */\n"
+        "const re = /\\/\\/ not a comment/g\n"
+        "let a = b\n"
+        "(c || d).run()\n"
+    )
+    out = minify_js(src)
+    assert 'header comment' not in out and 'block' not in out and 'trailing' not in out
+    assert "'https://example.com/a'" in out
+    assert "`\n    <div>  ${ items.map(i => `<b>${i}</b>`).join('') }  </div>\n`" in out
+    assert '/\\/\\/ not a comment/g' in out
+    # Newlines are kept so automatic semicolon insertion is unchanged
+    assert 'let a = b\n(c || d).run()' in out
+
+
+def test_minify_css():
+    out = minify_css("/* c */\n.btn ,\n.a:hover {\n  color: red ;\n  content: ' { x } ';\n}\n")
+    assert out == ".btn,.a:hover{color: red;content: ' { x } '}\n", out
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding('gzip, deflate, br') == 'br'
+    assert negotiate_encoding('br;q=0, gzip') == 'gzip'
+    assert negotiate_encoding('identity') is None
+    assert negotiate_encoding('*') == 'br'
+    assert negotiate_encoding('gzip, br', available=['gzip']) == 'gzip'
+
+
+def test_build_writes_hashed_assets_and_rewrites_html():
+    static_dir = tempfile.mkdtemp()
+    out_dir = os.path.join(static_dir, 'dist')
+    with open(os.path.join(static_dir, 'app.js'), 'w') as f:
+        f.write('// comment\nconsole.log("hi")\n')
+    with open(os.path.join(static_dir, 'index.html'), 'w') as f:
+        f.write('<script src="/app.js"></script><a href="/other">x</a>')
+
+    manifest = build(static_dir, out_dir)
+    hashed = manifest['assets']['app.js']
+    assert hashed.startswith('app.') and hashed.endswith('.js') and hashed != 'app.js'
+    with open(os.path.join(out_dir, hashed + '.gz'), 'rb') as f:
+        assert gzip.decompress(f.read()) == b'console.log("hi")\n'
+    with open(os.path.join(out_dir, 'index.html')) as f:
+        html = f.read()
+    assert f'src="/assets/{hashed}"' in html and 'href="/other"' in html
+    assert manifest['pages'] == ['index.html']
+
+
+if __name__ == "__main__":
+    try:
+        test_minify_js_keeps_strings_and_line_breaks()
+        test_minify_css()
+        test_negotiate_encoding()
+        test_build_writes_hashed_assets_and_rewrites_html()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
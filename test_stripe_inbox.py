@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Test script for the Stripe webhook inbox
+Tests signature checks, idempotent intake and fulfillment, retries, and that
+/complete-purchase answers from the local session table (with a local Stripe stand-in)
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import tempfile
+import stripe
+from flask import Flask
+import services.stripe_inbox_service as stripe_inbox
+from services.stripe_inbox_service import InboxWorker, construct_event, fulfill_checkout_session, record_event
+
+SECRET = 'whsec_test_secret'
+
+
+class RecordingWorker(InboxWorker):
+    """Inbox worker that only records wake-ups; the test processes events itself"""
+
+    def notify(self):
+        self.notified = getattr(self, 'notified', 0) + 1
+
+
+class FakeStripe:
+    """Local stand-in for Stripe: signs webhook payloads and serves checkout sessions"""
+
+    def __init__(self, secret=SECRET):
+        self.secret = secret
+        self.sessions = {}
+        self.retrieve_calls = 0
+
+    def create_session(self, user_key, payment_status='paid'):
+        session_id = f'cs_test_{uuid.uuid4().hex[:12]}'
+        self.sessions[session_id] = {'id': session_id, 'client_reference_id': user_key,
+                                     'payment_status': payment_status, 'status': 'complete'}
+        return session_id
+
+    def retrieve(self, session_id):
+        self.retrieve_calls += 1
+        return dict(self.sessions[session_id])
+
+    def event(self, session_id, event_type='checkout.session.completed'):
+        return {'id': f'evt_{uuid.uuid4().hex[:12]}', 'type': event_type,
+                'data': {'object': dict(self.sessions[session_id])}}
+
+    def sign(self, payload: bytes, timestamp=None) -> str:
+        timestamp = int(timestamp or time.time())
+        signature = hmac.new(self.secret.encode(), f'{timestamp}.'.encode() + payload, hashlib.sha256).hexdigest()
+        return f't={timestamp},v1={signature}'
+
+
+def temp_db():
+    return os.path.join(tempfile.mkdtemp(), 'credits.db')
+
+
+def credits_of(db_path, user_key):
+    row = sqlite3.connect(db_path).execute('SELECT credits FROM users WHERE user_key = ?', (user_key,)).fetchone()
+    return row[0] if row else 0
+
+
+def test_signature_verification():
+    fake = FakeStripe()
+    payload = json.dumps({'id': 'evt_1', 'type': 'checkout.session.completed'}).encode()
+    original = os.environ.get('STRIPE_WEBHOOK_SECRET')
+    os.environ['STRIPE_WEBHOOK_SECRET'] = SECRET
+    try:
+        assert construct_event(payload, fake.sign(payload))['id'] == 'evt_1'
+        for bad_header in (FakeStripe('whsec_other').sign(payload), fake.sign(payload, time.time() - 3600), None):
+            try:
+                construct_event(payload, bad_header)
+                assert False, f'accepted {bad_header}'
+            except stripe.SignatureVerificationError:
+                pass
+        del os.environ['STRIPE_WEBHOOK_SECRET']
+        try:
+            construct_event(payload, None)
+            assert False, 'accepted an unsigned payload without a secret'
+        except stripe_inbox.WebhookNotConfigured:
+            pass
+    finally:
+        if original is None:
+            os.environ.pop('STRIPE_WEBHOOK_SECRET', None)
+        else:
+            os.environ['STRIPE_WEBHOOK_SECRET'] = original
+
+
+def test_redelivered_event_credits_once():
+    db_path, fake = temp_db(), FakeStripe()
+    session_id = fake.create_session('user_a')
+    event = fake.event(session_id)
+    assert record_event(event, db_path) is True
+    assert record_event(event, db_path) is False  # Stripe redelivery
+
+    worker = InboxWorker(db_path)
+    assert worker.process_due() == 1
+    assert worker.process_due() == 0
+    # A second event for the same session (e.g. async_payment_succeeded) doesn't credit again
+    record_event(fake.event(session_id, 'checkout.session.async_payment_succeeded'), db_path)
+    worker.process_due()
+    assert credits_of(db_path, 'user_a') == 10
+    assert worker.backlog() == {'processed': 2}
+
+    # The /success page gets there second
+    assert fulfill_checkout_session(fake.retrieve(session_id), db_path) is False
+    assert credits_of(db_path, 'user_a') == 10
+
+
+def test_failed_events_are_retried_with_backoff():
+    db_path, fake = temp_db(), FakeStripe()
+    record_event(fake.event(fake.create_session('user_b')), db_path)
+    clock = [0.0]
+    calls = []
+
+    def flaky(event, path):
+        calls.append(clock[0])
+        if len(calls) < 3:
+            raise sqlite3.OperationalError('database is locked')
+        return stripe_inbox.process_event(event, path)
+
+    worker = InboxWorker(db_path, handler=flaky, clock=lambda: clock[0])
+    # Received "now" by the real clock; move the fake clock past it
+    clock[0] = time.time()
+    assert worker.process_due() == 1
+    assert worker.process_due() == 0  # backing off
+    clock[0] += stripe_inbox.retry_delay(1)
+    assert worker.process_due() == 1
+    clock[0] += stripe_inbox.retry_delay(2)
+    assert worker.process_due() == 1
+    assert len(calls) == 3
+    assert credits_of(db_path, 'user_b') == 10
+    assert worker.backlog() == {'processed': 1}
+
+
+def test_webhook_and_complete_purchase_routes():
+    fake = FakeStripe()
+    cwd, original_retrieve, original_worker = os.getcwd(), stripe_inbox.retrieve_checkout_session, stripe_inbox.inbox_worker
+    original_secret = os.environ.get('STRIPE_WEBHOOK_SECRET')
+    os.chdir(tempfile.mkdtemp())  # routes use ./credits.db
+    from routes.stripe_routes import stripe_bp
+    app = Flask(__name__)
+    app.register_blueprint(stripe_bp, url_prefix='/stripe')
+    client = app.test_client()
+    stripe_inbox.retrieve_checkout_session = fake.retrieve
+    stripe_inbox.inbox_worker = worker = RecordingWorker()
+    os.environ['STRIPE_WEBHOOK_SECRET'] = SECRET
+    try:
+        # Webhook first: acknowledged, processed by the inbox, then /success is a local lookup
+        session_id = fake.create_session('user_c')
+        payload = json.dumps(fake.event(session_id)).encode()
+        response = client.post('/stripe/webhook', data=payload, headers={'Stripe-Signature': 'bogus'})
+        assert response.status_code == 400
+        response = client.post('/stripe/webhook', data=payload, headers={'Stripe-Signature': fake.sign(payload)})
+        assert response.status_code == 200 and response.get_json() == {'status': 'received', 'duplicate': False}
+        assert client.post('/stripe/webhook', data=payload, headers={'Stripe-Signature': fake.sign(payload)}).get_json()['duplicate']
+        assert worker.notified == 1
+        worker.process_due()
+        for _ in range(3):
+            data = client.post('/stripe/complete-purchase', json={'session_id': session_id}).get_json()
+            assert data['success'] and data['credits_added'] == 0 and data['new_balance']['credits'] == 10
+        assert fake.retrieve_calls == 0
+
+        # /success before the webhook: one Stripe call, credits once
+        session_id = fake.create_session('user_d')
+        data = client.post('/stripe/complete-purchase', json={'session_id': session_id}).get_json()
+        assert data['credits_added'] == 10
+        data = client.post('/stripe/complete-purchase', json={'session_id': session_id}).get_json()
+        assert data['credits_added'] == 0 and data['new_balance']['credits'] == 10
+        assert fake.retrieve_calls == 1
+    finally:
+        os.chdir(cwd)
+        stripe_inbox.retrieve_checkout_session = original_retrieve
+        stripe_inbox.inbox_worker = original_worker
+        if original_secret is None:
+            os.environ.pop('STRIPE_WEBHOOK_SECRET', None)
+        else:
+            os.environ['STRIPE_WEBHOOK_SECRET'] = original_secret
+
+
+if __name__ == "__main__":
+    try:
+        test_signature_verification()
+        test_redelivered_event_credits_once()
+        test_failed_events_are_retried_with_backoff()
+        test_webhook_and_complete_purchase_routes()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test script for request tracing
+Tests span nesting, the Server-Timing header, the slowest-traces ring and
+that /debug/traces/slowest stays closed without TRACE_VIEW_TOKEN
+"""
+import os
+import sys
+import time
+import tempfile
+import services.tracing_service as tracing
+from services.tracing_service import SlowestTraces, Trace, finish_trace, span, start_trace
+
+
+def get_client():
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp())  # the app creates its databases in the working directory
+    try:
+        from app import app
+    finally:
+        os.chdir(cwd)
+    return app.test_client()
+
+
+def finished_trace(name, duration_ms, finished_at=None):
+    trace = Trace(name)
+    trace.end = trace.start + duration_ms / 1000
+    trace.finished_at = time.time() if finished_at is None else finished_at
+    return trace
+
+
+def test_span_nesting():
+    with span('outside') as current:
+        assert current is None  # no trace: no-op
+
+    original_ring = tracing.slowest_traces
+    tracing.slowest_traces = SlowestTraces()
+    try:
+        trace = start_trace('POST api.virtual_fitting', request_id='req-1')
+        with span('preprocess', category='upper_body'):
+            with span('resize'):
+                pass
+        try:
+            with span('provider'):
+                raise ValueError('bad image')
+        except ValueError:
+            pass
+        finish_trace(trace, 200)
+    finally:
+        tracing.slowest_traces = original_ring
+
+    data = trace.to_dict()
+    spans = {s['name']: s for s in data['spans']}
+    assert spans['resize']['parent'] == 'preprocess'
+    assert spans['preprocess']['parent'] is None and spans['provider']['parent'] is None
+    assert spans['preprocess']['attributes'] == {'category': 'upper_body'}
+    assert spans['provider']['attributes'] == {'error': 'ValueError'}
+    assert data['request_id'] == 'req-1' and data['attributes']['http.status_code'] == 200
+    assert [s['name'] for s in data['spans']] == ['preprocess', 'resize', 'provider']
+    assert tracing.current_trace() is None
+
+
+def test_server_timing():
+    trace = Trace('GET test')
+    for name, duration in (('db:credits', 2.0), ('db:credits', 3.0), ('provider gemini', 10.0)):
+        item = tracing.Span(name, trace.root_span_id, {})
+        item.end = item.start + duration / 1000
+        trace.add(item)
+    trace.end = trace.start + 0.02
+    header = trace.server_timing()
+    parts = dict(part.split(';dur=') for part in header.split(', '))
+    # Repeated names are summed and names are made header-safe
+    assert float(parts['db_credits']) == 5.0, header
+    assert float(parts['provider_gemini']) == 10.0
+    assert float(parts['total']) == 20.0
+
+
+def test_slowest_ring():
+    ring = SlowestTraces(size=2, window_seconds=60)
+    for name, duration in (('a', 30), ('b', 10), ('c', 20), ('d', 5)):
+        ring.add(finished_trace(name, duration))
+    assert [t['name'] for t in ring.snapshot()] == ['a', 'c']
+
+    # Traces older than the window drop out, even slow ones
+    ring = SlowestTraces(size=2, window_seconds=60)
+    ring.add(finished_trace('old', 500, finished_at=time.time() - 120))
+    ring.add(finished_trace('new', 1))
+    assert [t['name'] for t in ring.snapshot()] == ['new']
+
+
+def test_slowest_endpoint_needs_token():
+    original = os.environ.pop('TRACE_VIEW_TOKEN', None)
+    try:
+        client = get_client()
+        response = client.get('/api/health')
+        assert 'total;dur=' in response.headers['Server-Timing']
+
+        assert client.get('/debug/traces/slowest').status_code == 403
+        os.environ['TRACE_VIEW_TOKEN'] = 'secret'
+        assert client.get('/debug/traces/slowest').status_code == 403
+        assert client.get('/debug/traces/slowest?token=wrong').status_code == 403
+        response = client.get('/debug/traces/slowest?token=secret')
+        assert response.status_code == 200
+        assert 'GET api.health' in [t['name'] for t in response.get_json()['traces']]
+    finally:
+        os.environ.pop('TRACE_VIEW_TOKEN', None)
+        if original is not None:
+            os.environ['TRACE_VIEW_TOKEN'] = original
+
+
+if __name__ == "__main__":
+    try:
+        test_span_nesting()
+        test_server_timing()
+        test_slowest_ring()
+        test_slowest_endpoint_needs_token()
+        print("✅ ALL TESTS PASSED!")
+    except AssertionError as e:
+        print(f"\n❌ TEST FAILED: {e}", file=sys.stderr)
+        sys.exit(1)